@@ -202,6 +202,7 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-csrftoken',
+    'x-kiosko-id',
     'x-requested-with',
 ]
 
@@ -217,9 +218,12 @@ REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_PAGINATION_CLASS': 'totem.pagination.StandardResultsSetPagination',
     'EXCEPTION_HANDLER': 'totem.exceptions.custom_exception_handler',
+    # Trusted reverse proxies in front of Django; 0 = client IP is REMOTE_ADDR
+    # (X-Forwarded-For is ignored, so it cannot be spoofed to dodge throttles)
+    'NUM_PROXIES': get_env_int('NUM_PROXIES', 0),
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.AnonRateThrottle',
-        'rest_framework.throttling.UserRateThrottle',
+        'totem.throttling.AnonGCRAThrottle',
+        'totem.throttling.UserGCRAThrottle',
     ],
     'DEFAULT_THROTTLE_RATES': {
         'anon': '100/hour',
@@ -232,6 +236,10 @@ REST_FRAMEWORK = {
         'stock_movement': '50/hour',  # Movimientos de stock
         'burst': '60/minute',  # Límite de ráfaga
         'sustained': '1000/hour',  # Límite sostenido
+        'kiosko': '30/minute',  # Endpoints públicos del tótem, por dispositivo
+        'kiosko_ticket': '10/minute',  # Creación de tickets desde el tótem
+        'kiosko_agendamiento': '10/minute',  # Agendamientos desde el tótem
+        'kiosko_qr': '120/minute',  # Polling del QR del ticket
     },
 }
 
@@ -322,6 +330,19 @@ try:
             'task': 'totem.tasks.marcar_agendamientos_vencidos',
             'schedule': crontab(hour=0, minute=0),
         },
+        'limpiar-imagenes-qr-diariamente': {
+            'task': 'totem.tasks.limpiar_imagenes_qr',
+            'schedule': crontab(hour=3, minute=30),
+        },
+        'compactar-estadisticas-cada-15-minutos': {
+            'task': 'totem.tasks.compactar_estadisticas_diarias',
+            'schedule': crontab(minute='*/15'),
+        },
+        'compactar-estadisticas-completo-diariamente': {
+            'task': 'totem.tasks.compactar_estadisticas_diarias',
+            'schedule': crontab(hour=2, minute=15),
+            'kwargs': {'completo': True},
+        },
     }
 except ImportError:
     # Celery not installed, skip configuration
@@ -331,10 +352,79 @@ except ImportError:
 QR_HMAC_SECRET = get_env('QR_HMAC_SECRET', 'change-me-in-production')
 QR_TTL_MINUTES = get_env_int('QR_TTL_MINUTES', 30)
 
+# QR replay nonces (NonceStore): local Bloom-filter front sized per process
+NONCE_BLOOM_ACTIVO = get_env_bool('NONCE_BLOOM_ACTIVO', True)
+NONCE_BLOOM_CAPACIDAD = get_env_int('NONCE_BLOOM_CAPACIDAD', 200000)
+NONCE_BLOOM_TASA_FP = float(get_env('NONCE_BLOOM_TASA_FP', '1e-6'))
+NONCE_LIBERADOS_MAX = get_env_int('NONCE_LIBERADOS_MAX', 10000)  # released nonces tracked before the filter is dropped
+
+# QR image rendering: 'celery' | 'local' (thread pool) | 'sync'
+QR_RENDER_MODE = get_env('QR_RENDER_MODE', 'celery')
+QR_RENDER_WORKERS = get_env_int('QR_RENDER_WORKERS', 2)
+QR_RENDER_CACHE_SIZE = get_env_int('QR_RENDER_CACHE_SIZE', 256)
+QR_THERMAL_BOX_SIZE = get_env_int('QR_THERMAL_BOX_SIZE', 4)
+
+# Ticket Expiry (expirar_tickets / expirar_tickets_automatico)
+TICKET_EXPIRY_BATCH_SIZE = get_env_int('TICKET_EXPIRY_BATCH_SIZE', 1000)
+TICKET_EXPIRY_MAX_SECONDS = get_env_int('TICKET_EXPIRY_MAX_SECONDS', 60)
+
+# Stock dashboard (StockService.obtener_resumen_stock): seconds the summary is cached
+STOCK_RESUMEN_CACHE_TTL = get_env_int('STOCK_RESUMEN_CACHE_TTL', 10)
+
+# Kiosk benefit lookup (TrabajadorService.obtener_beneficio_kiosko): seconds per cached RUT
+KIOSKO_CACHE_TTL = get_env_int('KIOSKO_CACHE_TTL', 300)
+
+# Cache stampede protection (CacheManager.get_or_set / cache_response)
+CACHE_STALE_TTL = get_env_int('CACHE_STALE_TTL', 60)  # seconds a stale value is still served while one process recomputes
+CACHE_LOCK_TIMEOUT = get_env_int('CACHE_LOCK_TIMEOUT', 30)  # recompute lock lifetime
+CACHE_LOCK_WAIT_MS = get_env_int('CACHE_LOCK_WAIT_MS', 500)  # how long a cold miss waits for the lock holder
+CACHE_EARLY_EXPIRATION_BETA = float(get_env('CACHE_EARLY_EXPIRATION_BETA', '1.0'))  # 0 disables early recompute
+# Keys refreshed by Celery (refrescar_cache_caliente) instead of inline:
+# {'key': {'callback': 'dotted.path', 'cache_type': 'stock', 'tags': [...]}}
+CACHE_HOT_KEYS = {}
+
+# Two-tier config cache (get_config): per-process LRU in front of Redis,
+# invalidated across workers over Redis pub/sub
+CONFIG_CACHE_TTL = get_env_int('CONFIG_CACHE_TTL', 3600)  # Redis tier
+CONFIG_LOCAL_TTL = get_env_int('CONFIG_LOCAL_TTL', 60)  # caps staleness if a pub/sub message is missed
+CONFIG_LOCAL_MAXSIZE = get_env_int('CONFIG_LOCAL_MAXSIZE', 256)
+
+# Guard dashboard event stream (GET /api/guardia/eventos/, text/event-stream).
+# Each open connection holds a worker thread: run gunicorn with gthread/gevent workers.
+EVENTOS_BUFFER_SIZE = get_env_int('EVENTOS_BUFFER_SIZE', 500)  # events kept for Last-Event-ID replay
+EVENTOS_SSE_MAX_SECONDS = get_env_int('EVENTOS_SSE_MAX_SECONDS', 300)  # connection lifetime; clients reconnect
+EVENTOS_SSE_HEARTBEAT_SECONDS = get_env_int('EVENTOS_SSE_HEARTBEAT_SECONDS', 15)  # keeps proxies from closing idle streams
+EVENTOS_SSE_RETRY_MS = get_env_int('EVENTOS_SSE_RETRY_MS', 3000)
+
+# Offline guard scan sync (POST /api/guardia/sincronizar/)
+GUARDIA_SYNC_MAX_ESCANEOS = get_env_int('GUARDIA_SYNC_MAX_ESCANEOS', 500)  # per request
+GUARDIA_SYNC_CHUNK_SIZE = get_env_int('GUARDIA_SYNC_CHUNK_SIZE', 50)  # scans per transaction
+GUARDIA_SYNC_MAX_OFFLINE_SECONDS = get_env_int('GUARDIA_SYNC_MAX_OFFLINE_SECONDS', 86400)  # oldest escaneado_at accepted
+
+# Rate limiting (GCRA, totem/throttling.py)
+THROTTLE_SHADOW_SCOPES = get_env_list('THROTTLE_SHADOW_SCOPES', [])  # log-only scopes; '*' = all
+THROTTLE_KIOSKO_HEADER = 'HTTP_X_KIOSKO_ID'  # device id sent by each totem
+THROTTLE_KIOSKO_IP_FACTOR = get_env_int('THROTTLE_KIOSKO_IP_FACTOR', 20)  # per-IP ceiling = scope rate x devices behind one NAT; 0 = off
+
 # Operational Settings
 MAX_AGENDAMIENTOS_PER_DAY = get_env_int('MAX_AGENDAMIENTOS_PER_DAY', 50)
 MAX_AGENDAMIENTOS_PER_WORKER = get_env_int('MAX_AGENDAMIENTOS_PER_WORKER', 1)
 
+# Nómina import (cargar_nomina / NominaService)
+NOMINA_BATCH_SIZE = get_env_int('NOMINA_BATCH_SIZE', 1000)
+NOMINA_PREVIEW_TTL = get_env_int('NOMINA_PREVIEW_TTL', 900)  # segundos que se conserva el detalle del preview
+
+# Mass benefit assignment (AsignacionMasivaService): rows per bulk_create transaction
+BENEFICIOS_ASIGNACION_BATCH_SIZE = get_env_int('BENEFICIOS_ASIGNACION_BATCH_SIZE', 1000)
+# Minimum batch size before BeneficioService.firmar_lote fans out to a process pool
+BENEFICIOS_HMAC_POOL_MIN = get_env_int('BENEFICIOS_HMAC_POOL_MIN', 50000)
+
+# RRHH exports (CSV/XLSX streaming): rows fetched per DB round-trip
+EXPORT_CHUNK_SIZE = get_env_int('EXPORT_CHUNK_SIZE', 2000)
+
+# Daily statistics rollup (EstadisticaDiaria): days recomputed by each compaction run
+ESTADISTICAS_VENTANA_DIAS = get_env_int('ESTADISTICAS_VENTANA_DIAS', 7)
+
 # Session Security
 SESSION_COOKIE_SECURE = False  # Override in production
 SESSION_COOKIE_HTTPONLY = True
@@ -358,6 +448,12 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
 FILE_UPLOAD_PERMISSIONS = 0o644
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif']
 
+# Audit pipeline (AuditLoggingMiddleware -> totem.audit.AuditQueueHandler)
+AUDIT_QUEUE_SIZE = get_env_int('AUDIT_QUEUE_SIZE', 10000)  # records beyond this are dropped and counted
+AUDIT_BATCH_SIZE = get_env_int('AUDIT_BATCH_SIZE', 200)
+AUDIT_FLUSH_INTERVAL_MS = get_env_int('AUDIT_FLUSH_INTERVAL_MS', 1000)
+AUDIT_DB_ENABLED = get_env_bool('AUDIT_DB_ENABLED', False)  # also bulk-insert batches into AuditLog
+
 # Logging Configuration (Structured Logging)
 LOGGING = {
     'version': 1,
@@ -399,12 +495,16 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'audit_file': {
+            # Non-blocking: bounded queue + batching writer thread (see totem/audit.py)
             'level': 'INFO',
-            'class': 'logging.handlers.RotatingFileHandler',
+            'class': 'totem.audit.AuditQueueHandler',
             'filename': BASE_DIR / 'logs' / 'audit.log',
             'maxBytes': 1024 * 1024 * 10,  # 10MB
             'backupCount': 10,
-            'formatter': 'json',
+            'queue_size': AUDIT_QUEUE_SIZE,
+            'batch_size': AUDIT_BATCH_SIZE,
+            'flush_interval': AUDIT_FLUSH_INTERVAL_MS / 1000,
+            'ship_to_db': AUDIT_DB_ENABLED,
         },
         'security_file': {
             'level': 'WARNING',
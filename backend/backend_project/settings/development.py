@@ -57,6 +57,7 @@ CORS_ALLOW_HEADERS = [
     'origin',
     'user-agent',
     'x-csrftoken',
+    'x-kiosko-id',
     'x-requested-with',
 ]
 
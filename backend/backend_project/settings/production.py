@@ -29,6 +29,7 @@ DATABASES = {
 # Security Settings
 SECURE_SSL_REDIRECT = True
 SECURE_PROXY_SSL_HEADER = ('HTTP_X_FORWARDED_PROTO', 'https')
+REST_FRAMEWORK['NUM_PROXIES'] = get_env_int('NUM_PROXIES', 1)  # reverse proxy appends the client IP to X-Forwarded-For
 SECURE_HSTS_SECONDS = 31536000  # 1 year
 SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 SECURE_HSTS_PRELOAD = True
@@ -9,6 +9,24 @@ from rest_framework.test import APIClient
 Usuario = get_user_model()
 
 
+@pytest.fixture(autouse=True)
+def reiniciar_nonce_store():
+    """El filtro Bloom de nonces vive en el proceso: aislarlo entre tests."""
+    from totem.nonce_store import NonceStore
+    NonceStore.reiniciar()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def reiniciar_cache_config():
+    """La configuración cacheada vive en el proceso y en la caché compartida: aislarla entre tests."""
+    from django.core.cache import cache
+    from totem.cache import reset_local_config
+    reset_local_config()
+    cache.clear()
+    yield
+
+
 @pytest.fixture
 def api_client():
     """Fixture para APIClient de DRF."""
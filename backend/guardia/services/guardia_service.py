@@ -2,23 +2,45 @@
 Servicio de Guardia para validación de tickets.
 """
 import logging
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
 from django.db import transaction
+from django.db.models import Count, Q
+from django.db.models.functions import TruncHour
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
-from totem.models import Ticket, TicketEvent, CajaFisica
+from totem.cache import CacheManager
+from totem.eventos import ultimo_evento_id
+from totem.models import Incidencia, Ticket, TicketEvent
 from totem.security import QRSecurity
-from totem.validators import TicketValidator
+from totem.services.ticket_service import TicketService
 from totem.exceptions import (
     QRInvalidException,
     TicketNotFoundException,
-    TicketExpiredException,
     TicketInvalidStateException,
-    NoStockException,
+    TotemBaseException,
 )
 
 logger = logging.getLogger(__name__)
 
 
+def _rango_del_dia(fecha):
+    """[inicio, fin) del día en la zona local, como datetimes aware."""
+    inicio = timezone.make_aware(datetime.combine(fecha, time.min))
+    fin = timezone.make_aware(datetime.combine(fecha + timedelta(days=1), time.min))
+    return inicio, fin
+
+
+def _momento_escaneo(valor):
+    """escaneado_at (ISO 8601) como datetime aware; None si no es válido."""
+    momento = parse_datetime(valor) if isinstance(valor, str) else None
+    if momento is not None and timezone.is_naive(momento):
+        momento = timezone.make_aware(momento)
+    return momento
+
+
 class GuardiaService:
     """
     Servicio para operaciones de Guardia (portería).
@@ -27,7 +49,6 @@ class GuardiaService:
     def __init__(self):
         self.qr_security = QRSecurity()
     
-    @transaction.atomic
     def validar_y_entregar_ticket(
         self,
         qr_payload: str,
@@ -60,125 +81,236 @@ class GuardiaService:
             logger.warning(f"QR inválido detectado: {resultado}")
             raise QRInvalidException(resultado)
         
-        ticket_uuid = resultado
+        # 2. Entrega: UPDATE condicionales + eventos en lote (ver TicketService.entregar_ticket)
+        return TicketService().entregar_ticket(resultado, caja_codigo, guardia_username)
+    
+    # Tolerancia de reloj de la estación de guardia al sincronizar
+    DESFASE_RELOJ = timedelta(minutes=5)
+    
+    def sincronizar_escaneos(self, escaneos: list, guardia_username: str = None) -> dict:
+        """
+        Aplica en lote los escaneos acumulados por una estación sin conexión.
         
-        # 2. Obtener ticket con lock para evitar condiciones de carrera
-        try:
-            ticket = Ticket.objects.select_for_update().get(uuid=ticket_uuid)
-        except Ticket.DoesNotExist:
-            logger.warning(f"Ticket no encontrado: {ticket_uuid}")
-            raise TicketNotFoundException()
+        Las firmas se validan juntas (QRSecurity.validar_payloads, un viaje a
+        Redis) midiendo la antigüedad del QR a la hora del escaneo. Luego se
+        aplican en orden cronológico (escaneado_at, orden de envío) con
+        TicketService.entregar_ticket, en una transacción por bloque de
+        GUARDIA_SYNC_CHUNK_SIZE escaneos y un savepoint por escaneo. El primer
+        escaneo que entrega el ticket gana; los siguientes quedan como
+        'duplicado' con un evento intento_duplicado. Un ticket que la
+        expiración automática marcó 'expirado' después de un escaneo anterior
+        a su TTL se entrega igual; uno anulado queda 'rechazado'. Reenviar el
+        mismo lote (con id_local) es idempotente.
         
-        # 3. Validar TTL
-        es_valido, error = TicketValidator.validar_ttl(ticket.ttl_expira_at)
-        if not es_valido:
-            ticket.estado = 'expirado'
-            ticket.save()
-            TicketEvent.objects.create(
-                ticket=ticket,
-                tipo='expirado',
-                metadata={'validado_por_guardia': guardia_username or 'unknown'}
-            )
-            logger.warning(f"Ticket {ticket_uuid} expirado")
-            raise TicketExpiredException()
-        
-        # 4. Validar estado
-        es_valido, error = TicketValidator.validar_estado(ticket.estado, ['pendiente'])
-        if not es_valido:
-            logger.warning(f"Intento de validar ticket {ticket_uuid} en estado {ticket.estado}")
-            TicketEvent.objects.create(
-                ticket=ticket,
-                tipo='intento_duplicado',
-                metadata={
-                    'estado_actual': ticket.estado,
-                    'guardia': guardia_username or 'unknown'
-                }
-            )
-            raise TicketInvalidStateException(error)
+        Args:
+            escaneos: Lista de {'qr_payload', 'codigo_caja', 'escaneado_at', 'id_local'}
+            guardia_username: Usuario guardia que sincroniza
+            
+        Returns:
+            {'resultados': [...] (mismo orden que escaneos), 'resumen': {estado: cantidad}}
+        """
+        guardia = guardia_username or 'unknown'
+        ahora = timezone.now()
+        antiguedad_maxima = timedelta(seconds=getattr(settings, 'GUARDIA_SYNC_MAX_OFFLINE_SECONDS', 86400))
+        resultados = [None] * len(escaneos)
         
-        # 5. Verificar y asignar caja física con lock
-        try:
-            caja = CajaFisica.objects.select_for_update().get(
-                codigo=caja_codigo,
-                usado=False
-            )
-        except CajaFisica.DoesNotExist:
-            logger.error(f"Caja {caja_codigo} no disponible")
-            raise NoStockException("Caja física no disponible o ya usada")
-        
-        # 6. Marcar caja como usada
-        caja.usado = True
-        caja.asignada_ticket = ticket
-        caja.save()
-        
-        # 7. Actualizar ticket a entregado
-        ticket.estado = 'entregado'
-        ticket.save()
-        
-        # 8. Registrar eventos
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='validado_guardia',
-            metadata={'guardia': guardia_username or 'unknown'}
-        )
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='caja_verificada',
-            metadata={
-                'caja_codigo': caja_codigo,
-                'caja_tipo': caja.tipo,
-                'guardia': guardia_username or 'unknown'
+        def resultado(i, estado, code=None, message=None, ticket_uuid=None):
+            resultados[i] = {
+                'indice': i,
+                'id_local': escaneos[i].get('id_local'),
+                'estado': estado,
+                'code': code,
+                'message': message,
+                'ticket_uuid': ticket_uuid,
             }
-        )
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='entregado',
-            metadata={'guardia': guardia_username or 'unknown'}
-        )
         
-        logger.info(
-            f"Ticket {ticket_uuid} validado y entregado por guardia {guardia_username or 'unknown'}"
+        # 1. Hora de escaneo y orden determinista
+        orden = []
+        for i, escaneo in enumerate(escaneos):
+            momento = _momento_escaneo(escaneo.get('escaneado_at'))
+            if momento is None or not isinstance(escaneo.get('qr_payload'), str):
+                resultado(i, 'rechazado', 'escaneo_invalido', 'qr_payload y escaneado_at (ISO 8601) son requeridos')
+            elif momento > ahora + self.DESFASE_RELOJ or momento < ahora - antiguedad_maxima:
+                resultado(i, 'rechazado', 'escaneo_fuera_de_rango', 'escaneado_at fuera del rango aceptado')
+            else:
+                orden.append((momento, i))
+        orden.sort()
+        
+        # 2. Firmas en lote. Un nonce ya registrado (QR validado online o en un
+        #    envío anterior) no descarta el escaneo: la entrega solo procede si el
+        #    ticket sigue pendiente, así que un reintento termina como duplicado.
+        firmas = QRSecurity.validar_payloads(
+            [escaneos[i]['qr_payload'] for _, i in orden],
+            momentos=[momento.timestamp() for momento, _ in orden],
         )
-        return ticket
+        validos = []
+        for (momento, i), (es_valido, uuid_o_error) in zip(orden, firmas):
+            if es_valido:
+                validos.append((momento, i, uuid_o_error))
+            elif uuid_o_error == QRSecurity.MENSAJE_REPLAY:
+                # La firma ya se verificó antes de mirar el nonce: el UUID es auténtico
+                validos.append((momento, i, QRSecurity.extraer_uuid(escaneos[i]['qr_payload'])))
+            else:
+                resultado(i, 'rechazado', 'qr_invalid', uuid_o_error)
+        
+        # 3. Aplicación por bloques, una transacción por bloque
+        ticket_service = TicketService()
+        tamano = max(getattr(settings, 'GUARDIA_SYNC_CHUNK_SIZE', 50), 1)
+        for inicio in range(0, len(validos), tamano):
+            with transaction.atomic():
+                por_estado = []
+                for momento, i, ticket_uuid in validos[inicio:inicio + tamano]:
+                    id_local = escaneos[i].get('id_local')
+                    try:
+                        # entregar_ticket es atomic: savepoint por escaneo dentro del bloque
+                        ticket_service.entregar_ticket(
+                            ticket_uuid,
+                            escaneos[i].get('codigo_caja'),
+                            guardia,
+                            escaneado_at=momento,
+                            metadata={'origen': 'sincronizacion', 'id_local': id_local},
+                            aceptar_expirado=True,
+                        )
+                        resultado(i, 'entregado', ticket_uuid=ticket_uuid)
+                    except TicketInvalidStateException as e:
+                        # Entregado (duplicado) o anulado: se distingue con el estado actual
+                        por_estado.append((momento, i, ticket_uuid, id_local, e))
+                    except TotemBaseException as e:
+                        resultado(i, 'rechazado', e.default_code, str(e.detail), ticket_uuid)
+                if por_estado:
+                    self._clasificar_por_estado(por_estado, guardia, resultado)
+        
+        resumen = {}
+        for r in resultados:
+            resumen[r['estado']] = resumen.get(r['estado'], 0) + 1
+        logger.info(f"Sincronización de guardia {guardia}: {len(escaneos)} escaneos, {resumen}")
+        return {'resultados': resultados, 'resumen': resumen}
+    
+    @staticmethod
+    def _clasificar_por_estado(por_estado, guardia, resultado):
+        """
+        Clasifica los escaneos rechazados por estado del ticket: solo un ticket
+        ya entregado es 'duplicado' (con intento_duplicado, en un bulk_create);
+        cualquier otro estado (anulado) es 'rechazado' con el código del error.
+        """
+        tickets = {
+            t['uuid']: t for t in Ticket.objects.filter(
+                uuid__in={uuid for _, _, uuid, _, _ in por_estado}
+            ).values('id', 'uuid', 'estado')
+        }
+        ya_aplicados = set()
+        con_id_local = [id_local for _, _, _, id_local, _ in por_estado if id_local]
+        if con_id_local:
+            ya_aplicados = set(TicketEvent.objects.filter(
+                ticket_id__in=[t['id'] for t in tickets.values()],
+                tipo='entregado',
+                metadata__id_local__in=con_id_local,
+            ).values_list('metadata__id_local', flat=True))
+        
+        eventos = []
+        for momento, i, ticket_uuid, id_local, error in por_estado:
+            ticket = tickets[ticket_uuid]
+            if id_local and id_local in ya_aplicados:
+                # Reenvío de un escaneo que ya se aplicó (respuesta perdida)
+                resultado(i, 'entregado', ticket_uuid=ticket_uuid)
+                continue
+            if ticket['estado'] != 'entregado':
+                resultado(i, 'rechazado', error.default_code, str(error.detail), ticket_uuid)
+                continue
+            resultado(i, 'duplicado', 'ticket_already_used', str(error.detail), ticket_uuid)
+            eventos.append(TicketEvent(
+                ticket_id=ticket['id'],
+                tipo='intento_duplicado',
+                timestamp=momento,
+                metadata={
+                    'estado_actual': ticket['estado'],
+                    'guardia': guardia,
+                    'origen': 'sincronizacion',
+                    'id_local': id_local,
+                    'escaneado_at': momento.isoformat(),
+                },
+            ))
+        TicketEvent.objects.bulk_create(eventos)
     
-    def obtener_metricas(self, sucursal_id: int = None) -> dict:
+    ESTADOS_METRICAS = ('pendiente', 'entregado', 'expirado', 'anulado')
+    
+    def obtener_metricas(self, sucursal_id: int = None, fecha=None, fresco: bool = False) -> dict:
         """
-        Obtiene métricas de portería.
+        Obtiene métricas de portería del día (cacheadas por sucursal, TTL corto).
+        
+        El resultado incluye `evento_id`, el último evento SSE ya reflejado en
+        los conteos: el panel aplica encima solo los eventos posteriores.
         
         Args:
             sucursal_id: Filtrar por sucursal (opcional)
+            fecha: Día a consultar (default: hoy, zona local)
+            fresco: Recalcular ignorando la caché (resincronización del panel)
             
         Returns:
-            Diccionario con métricas
+            Diccionario con métricas, desglose por sucursal y por hora
         """
-        from django.db.models import Count, Q
-        
-        filtros = Q(created_at__date=timezone.now().date())
+        fecha = fecha or timezone.localdate()
+        clave = f"guardia:metricas:{sucursal_id or 'todas'}:{fecha.isoformat()}"
+        if fresco:
+            metricas = self._calcular_metricas(fecha, sucursal_id)
+            CacheManager.set(clave, metricas, cache_type='metricas')
+            return metricas
+        return CacheManager.get_or_set(
+            clave, lambda: self._calcular_metricas(fecha, sucursal_id), cache_type='metricas'
+        )
+    
+    def _calcular_metricas(self, fecha, sucursal_id=None) -> dict:
+        """
+        Una sola consulta agrupada por (sucursal, hora) con conteos condicionales
+        sobre el rango [00:00, 00:00 del día siguiente): a diferencia de
+        created_at__date, el rango semiabierto usa ticket_created_idx.
+        """
+        # Se lee antes de consultar: los eventos publican tras el commit, así
+        # que todo evento con ID <= evento_id ya es visible en la consulta
+        evento_id = ultimo_evento_id()
+        inicio, fin = _rango_del_dia(fecha)
+        tickets = Ticket.objects.filter(created_at__gte=inicio, created_at__lt=fin)
         if sucursal_id:
-            filtros &= Q(sucursal_id=sucursal_id)
+            tickets = tickets.filter(sucursal_id=sucursal_id)
         
-        tickets_hoy = Ticket.objects.filter(filtros)
+        conteos = {'total': Count('id')}
+        conteos.update({
+            estado: Count('id', filter=Q(estado=estado)) for estado in self.ESTADOS_METRICAS
+        })
+        filas = tickets.order_by().values('sucursal_id', hora=TruncHour('created_at')).annotate(**conteos)
         
-        metricas = {
-            'fecha': timezone.now().date(),
-            'total_tickets_hoy': tickets_hoy.count(),
-            'pendientes': tickets_hoy.filter(estado='pendiente').count(),
-            'entregados': tickets_hoy.filter(estado='entregado').count(),
-            'expirados': tickets_hoy.filter(estado='expirado').count(),
-            'anulados': tickets_hoy.filter(estado='anulado').count(),
-        }
+        claves = ['total', *self.ESTADOS_METRICAS]
+        totales = dict.fromkeys(claves, 0)
+        por_sucursal = {}
+        por_hora = {}
+        for fila in filas:
+            sucursal = por_sucursal.setdefault(fila['sucursal_id'], dict.fromkeys(claves, 0))
+            hora = por_hora.setdefault(fila['hora'], dict.fromkeys(claves, 0))
+            for c in claves:
+                totales[c] += fila[c]
+                sucursal[c] += fila[c]
+                hora[c] += fila[c]
         
-        # Contar incidencias del día si existen
-        try:
-            from totem.models import Incidencia
-            metricas['incidencias_hoy'] = Incidencia.objects.filter(
-                created_at__date=timezone.now().date(),
-                creada_por='guardia'
-            ).count()
-        except ImportError:
-            pass
-        
-        return metricas
+        return {
+            'fecha': fecha,
+            'evento_id': evento_id,
+            'total_tickets_hoy': totales['total'],
+            'pendientes': totales['pendiente'],
+            'entregados': totales['entregado'],
+            'expirados': totales['expirado'],
+            'anulados': totales['anulado'],
+            'incidencias_hoy': Incidencia.objects.filter(
+                created_at__gte=inicio, created_at__lt=fin, creada_por='guardia'
+            ).count(),
+            'por_sucursal': [
+                {'sucursal_id': sid, **valores}
+                for sid, valores in sorted(por_sucursal.items(), key=lambda item: item[0] or 0)
+            ],
+            'por_hora': [
+                {'hora': timezone.localtime(hora).hour, **valores}
+                for hora, valores in sorted(por_hora.items())
+            ],
+        }
     
     def obtener_tickets_pendientes(self, sucursal_id: int = None, limit: int = 50):
         """
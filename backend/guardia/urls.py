@@ -12,10 +12,16 @@ urlpatterns = [
     path('tickets/<str:uuid>/tiempo-restante/', views.verificar_tiempo_restante, name='tiempo_restante'),
     path('tickets/pendientes/', views.tickets_pendientes, name='tickets_pendientes'),
     
+    # Sincronización de escaneos offline (lote)
+    path('sincronizar/', views.sincronizar_escaneos, name='sincronizar_escaneos'),
+    
     # Validación de beneficios (NEW)
     path('beneficios/<int:beneficio_id>/validar/', views.validar_beneficio, name='validar_beneficio'),
     path('beneficios/<int:beneficio_id>/confirmar-entrega/', views.confirmar_entrega, name='confirmar_entrega'),
     
     # Métricas
     path('metricas/', views.metricas_guardia, name='metricas'),
+    
+    # Eventos en tiempo real (SSE)
+    path('eventos/', views.eventos_guardia, name='eventos'),
 ]
@@ -1,14 +1,18 @@
 """Vistas del módulo Guardia: validación de tickets y métricas de portería.
 Separadas de totem/views.py para modularización por dominio.
 """
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import BaseRenderer, JSONRenderer
 from rest_framework.response import Response
 from rest_framework import status
 from totem.models import Ticket, TicketEvent, CajaFisica, Incidencia
 from totem.serializers import TicketSerializer
 from totem.permissions import IsGuardia, IsGuardiaOrAdmin
 from totem.exceptions import TotemBaseException, QRInvalidException, TicketExpiredException, TicketInvalidStateException, TicketNotFoundException, NoStockException
+from totem.eventos import stream_eventos
 from .services.guardia_service import GuardiaService
 import logging
 
@@ -71,7 +75,7 @@ def validar_ticket_guardia(request, uuid):
         - La validación incluye verificación criptográfica de la firma QR
         - Se registra automáticamente evento de entrega con timestamp
         - TTL (Time To Live) se valida contra hora actual
-        - Operación atómica: se usa select_for_update() para evitar race conditions
+        - Operación atómica: UPDATE condicionales (estado='pendiente', caja libre) evitan entregas duplicadas
         - Si no se especifica codigo_caja, se asigna automáticamente una disponible
     """
     try:
@@ -118,7 +122,9 @@ def metricas_guardia(request):
     PERMISOS: IsGuardiaOrAdmin (Guardia o Administrador autenticado)
     AUTENTICACIÓN: JWT requerido (Bearer token)
     
-    QUERY PARAMETERS: Ninguno
+    QUERY PARAMETERS:
+        sucursal (int): Filtrar por sucursal (opcional)
+        fresco (1): Recalcular sin caché (el panel lo usa al resincronizar)
     
     RESPUESTA EXITOSA (200):
         {
@@ -154,10 +160,19 @@ def metricas_guardia(request):
         - "tickets_hoy" considera desde las 00:00 de hoy
         - "tickets_semana" considera últimos 7 días calendario
         - Tiempo promedio calculado entre creación y entrega del ticket
+        - Cacheadas por sucursal ~15 s; el panel recibe los cambios por /api/guardia/eventos/
+        - "evento_id": último evento SSE incluido en los conteos; aplicar solo los posteriores
+        - Incluye desglose "por_sucursal" y "por_hora" (misma consulta)
     """
     try:
+        sucursal_id = request.query_params.get('sucursal')
+        if sucursal_id is not None and not sucursal_id.isdigit():
+            return Response({'detail': 'sucursal debe ser un entero'}, status=status.HTTP_400_BAD_REQUEST)
         service = GuardiaService()
-        metricas = service.obtener_metricas()
+        metricas = service.obtener_metricas(
+            sucursal_id=int(sucursal_id) if sucursal_id else None,
+            fresco=request.query_params.get('fresco') == '1',
+        )
         return Response(metricas, status=status.HTTP_200_OK)
     except TotemBaseException:
         raise
@@ -486,3 +501,109 @@ def confirmar_entrega(request, beneficio_id):
             {'detail': 'Error interno del servidor'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+
+
+@api_view(['POST'])
+@permission_classes([IsGuardia])
+def sincronizar_escaneos(request):
+    """
+    POST /api/guardia/sincronizar/
+    
+    Sincroniza en un solo request los escaneos de QR acumulados por una
+    estación de guardia que estuvo sin conexión.
+    
+    PERMISOS: IsGuardia
+    AUTENTICACIÓN: JWT requerido (Bearer token)
+    
+    BODY (JSON):
+        {
+            "escaneos": [
+                {
+                    "id_local": "st3-000121",                  # OPCIONAL: ID en la estación (reintentos idempotentes)
+                    "qr_payload": "uuid:timestamp:firma",      # REQUERIDO
+                    "codigo_caja": "CAJA001",                  # REQUERIDO para entregar
+                    "escaneado_at": "2025-11-30T10:45:00-03:00"  # REQUERIDO: hora local del escaneo
+                }
+            ]
+        }
+    
+    RESPUESTA (200):
+        {
+            "resultados": [
+                {"indice": 0, "id_local": "st3-000121", "estado": "entregado", "code": null,
+                 "message": null, "ticket_uuid": "..."},
+                {"indice": 1, "id_local": "st3-000122", "estado": "duplicado",
+                 "code": "ticket_already_used", "message": "...", "ticket_uuid": "..."}
+            ],
+            "resumen": {"entregado": 1, "duplicado": 1}
+        }
+    
+    ERRORES:
+        400: Body inválido o más de GUARDIA_SYNC_MAX_ESCANEOS escaneos
+        401/403: No autenticado / no es Guardia
+    
+    NOTAS:
+        - Se aplican en orden de escaneado_at; el primer escaneo de un ticket gana
+        - Estados por escaneo: entregado, duplicado, rechazado
+        - Una transacción por bloque de GUARDIA_SYNC_CHUNK_SIZE escaneos
+    """
+    escaneos = request.data.get('escaneos') if isinstance(request.data, dict) else None
+    if not isinstance(escaneos, list) or not all(isinstance(e, dict) for e in escaneos):
+        return Response({'detail': 'escaneos debe ser una lista de objetos'}, status=status.HTTP_400_BAD_REQUEST)
+    maximo = getattr(settings, 'GUARDIA_SYNC_MAX_ESCANEOS', 500)
+    if len(escaneos) > maximo:
+        return Response(
+            {'detail': f'Máximo {maximo} escaneos por sincronización'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    service = GuardiaService()
+    resultado = service.sincronizar_escaneos(escaneos, guardia_username=request.user.username)
+    return Response(resultado, status=status.HTTP_200_OK)
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Permite negociar text/event-stream; los errores (401/403) salen como JSON."""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsGuardiaOrAdmin])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def eventos_guardia(request):
+    """
+    GET /api/guardia/eventos/
+    
+    Canal Server-Sent Events para los paneles de guardia: reemplaza el polling
+    de métricas e incidencias por deltas empujados desde los signals.
+    
+    PERMISOS: IsGuardiaOrAdmin
+    AUTENTICACIÓN: JWT requerido (Bearer token)
+    
+    QUERY PARAMS / HEADERS:
+        Last-Event-ID (header) o ultimo_id (query): último evento recibido;
+        se reenvían los posteriores que sigan en el buffer
+    
+    EVENTOS (event: tipo, data: JSON):
+        ticket_creado, ticket_validado, ticket_anulado, ticket_expirado,
+        incidencia_creada, incidencia_resuelta, stock_bajo
+        resync: el buffer ya no cubre Last-Event-ID; recargar por REST
+    
+    La conexión se cierra tras EVENTOS_SSE_MAX_SECONDS y el cliente reconecta
+    con Last-Event-ID.
+    """
+    ultimo_id = request.META.get('HTTP_LAST_EVENT_ID') or request.query_params.get('ultimo_id')
+    try:
+        ultimo_id = int(ultimo_id) if ultimo_id not in (None, '') else None
+    except ValueError:
+        ultimo_id = None
+    
+    response = StreamingHttpResponse(stream_eventos(ultimo_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -3,14 +3,63 @@ Servicio de RRHH para reportes y gestión.
 """
 import logging
 from datetime import date, timedelta
-from typing import List, Dict, Optional
-from django.db.models import Count, Q, Avg, F, ExpressionWrapper, DurationField
+from typing import Iterator, List, Dict, Optional
+from django.conf import settings
+from django.db import connection
+from django.db.models import (
+    Aggregate, Count, Q, Avg, Min, Max, F, ExpressionWrapper, DurationField, OuterRef, Subquery, CharField
+)
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import TruncDate
 from django.utils import timezone
 
-from totem.models import Ticket, Trabajador, Incidencia, StockSucursal, Agendamiento
+from totem.models import Ticket, TicketEvent, Trabajador, Incidencia, StockSucursal, Agendamiento
+from totem.services.estadisticas_service import EstadisticasService
 
 logger = logging.getLogger(__name__)
 
+# Columnas de la exportación de tickets (CSV y XLSX comparten el mismo orden)
+COLUMNAS_EXPORTACION_TICKETS = [
+    'UUID', 'Trabajador RUT', 'Trabajador Nombre', 'Estado',
+    'Fecha Creación', 'TTL Expira', 'Ciclo', 'Sucursal',
+    'Fecha Entrega', 'Validado Por', 'Tiempo Entrega (min)',
+]
+
+# Ancho fijo por columna en XLSX (el modo write-only no permite autoajustar)
+ANCHOS_EXPORTACION_TICKETS = [38, 14, 32, 12, 20, 20, 40, 24, 20, 16, 12]
+
+# Estado de ticket -> columna del reporte de retiros por día
+ESTADOS_REPORTE_DIARIO = {
+    'entregado': 'entregados',
+    'pendiente': 'pendientes',
+    'expirado': 'expirados',
+    'anulado': 'anulados',
+}
+
+# Percentiles del reporte de tiempo de retiro
+PERCENTILES_RETIRO = (50, 90, 99)
+
+
+class _PercentileCont(Aggregate):
+    """percentile_cont(p) WITHIN GROUP (ORDER BY expr) de PostgreSQL."""
+    function = 'percentile_cont'
+    template = '%(function)s(%(percentil)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = DurationField()
+
+    def __init__(self, expression, percentil, **extra):
+        super().__init__(expression, percentil=float(percentil), **extra)
+
+
+def _percentil(valores_ordenados: List[float], percentil: float) -> float:
+    """Percentil con interpolación lineal (mismo criterio que percentile_cont)."""
+    if not valores_ordenados:
+        return 0
+    posicion = (len(valores_ordenados) - 1) * percentil / 100
+    inferior = int(posicion)
+    superior = min(inferior + 1, len(valores_ordenados) - 1)
+    fraccion = posicion - inferior
+    return valores_ordenados[inferior] + (valores_ordenados[superior] - valores_ordenados[inferior]) * fraccion
+
 
 class RRHHService:
     """
@@ -71,19 +120,25 @@ class RRHHService:
         Returns:
             Lista de diccionarios con estadísticas por día
         """
-        fecha_inicio = timezone.now().date() - timedelta(days=dias)
-        
-        tickets_por_dia = Ticket.objects.filter(
-            created_at__date__gte=fecha_inicio
-        ).values('created_at__date').annotate(
-            total=Count('id'),
-            entregados=Count('id', filter=Q(estado='entregado')),
-            pendientes=Count('id', filter=Q(estado='pendiente')),
-            expirados=Count('id', filter=Q(estado='expirado')),
-            anulados=Count('id', filter=Q(estado='anulado'))
-        ).order_by('-created_at__date')
-        
-        return list(tickets_por_dia)
+        fecha_inicio = timezone.localdate() - timedelta(days=dias)
+
+        # Días cerrados desde el rollup EstadisticaDiaria; solo hoy se cuenta en vivo
+        por_dia = {}
+        for fila in EstadisticasService.conteos('ticket', desde=fecha_inicio, por=('fecha', 'estado')):
+            dia = por_dia.setdefault(fila['fecha'], {
+                'created_at__date': fila['fecha'],
+                'total': 0,
+                'entregados': 0,
+                'pendientes': 0,
+                'expirados': 0,
+                'anulados': 0,
+            })
+            dia['total'] += fila['cantidad']
+            columna = ESTADOS_REPORTE_DIARIO.get(fila['estado'])
+            if columna:
+                dia[columna] += fila['cantidad']
+
+        return sorted(por_dia.values(), key=lambda dia: dia['created_at__date'], reverse=True)
     
     def reporte_trabajadores_activos(self, ciclo_id: Optional[int] = None) -> Dict:
         """
@@ -97,7 +152,7 @@ class RRHHService:
         """
         filtros = {}
         if ciclo_id:
-            filtros['ticket__ciclo_id'] = ciclo_id
+            filtros['ciclo_id'] = ciclo_id
         
         stats = {
             'total_trabajadores': Trabajador.objects.count(),
@@ -247,44 +302,134 @@ class RRHHService:
             'cancelados': agendamientos.filter(estado='cancelado').count()
         }
     
-    def reporte_tiempo_promedio_retiro(self, dias: int = 30) -> Dict:
+    def reporte_tiempo_promedio_retiro(
+        self,
+        dias: int = 30,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None
+    ) -> Dict:
         """
-        Calcula tiempo promedio entre generación y entrega de tickets.
+        Calcula tiempo entre generación y entrega de tickets, con percentiles.
+        
+        El instante de entrega sale de una subconsulta sobre TicketEvent
+        (primer evento 'entregado') y la diferencia se calcula en la BD. En
+        PostgreSQL cada agrupación (global, por sucursal, por día) es una
+        consulta agregada con percentile_cont; en otros motores se lee una
+        sola columna de duraciones ordenada y se agrupa en Python.
         
         Args:
-            dias: Días hacia atrás a considerar
+            dias: Días hacia atrás a considerar (si no se indica fecha_desde)
+            fecha_desde: Fecha inicio
+            fecha_hasta: Fecha fin (default: hoy)
             
         Returns:
-            Estadísticas de tiempo
+            Estadísticas de tiempo (minutos): cantidad, promedio, mínimo,
+            máximo y p50/p90/p99, globales y desglosadas por sucursal y día
         """
-        fecha_inicio = timezone.now().date() - timedelta(days=dias)
+        hoy = timezone.localdate()
+        fecha_hasta = fecha_hasta or hoy
+        fecha_desde = fecha_desde or (hoy - timedelta(days=dias))
+        
+        entrega = TicketEvent.objects.filter(
+            ticket=OuterRef('pk'), tipo='entregado'
+        ).order_by('timestamp').values('timestamp')[:1]
         
-        tickets_entregados = Ticket.objects.filter(
+        tiempos = Ticket.objects.filter(
             estado='entregado',
-            created_at__date__gte=fecha_inicio
-        ).prefetch_related('eventos')
+            created_at__date__gte=fecha_desde,
+            created_at__date__lte=fecha_hasta
+        ).annotate(
+            entregado_at=Subquery(entrega)
+        ).filter(
+            entregado_at__isnull=False
+        ).annotate(
+            tiempo=ExpressionWrapper(F('entregado_at') - F('created_at'), output_field=DurationField()),
+            fecha=TruncDate('created_at'),
+        )
         
-        tiempos = []
-        for ticket in tickets_entregados:
-            evento_entrega = ticket.eventos.filter(tipo='entregado').first()
-            if evento_entrega:
-                diferencia = (evento_entrega.timestamp - ticket.created_at).total_seconds()
-                tiempos.append(diferencia / 60)  # Convertir a minutos
-        
-        if not tiempos:
-            return {
-                'cantidad_tickets': 0,
-                'tiempo_promedio_minutos': 0,
-                'tiempo_minimo_minutos': 0,
-                'tiempo_maximo_minutos': 0
-            }
+        if connection.vendor == 'postgresql':
+            reporte = self._tiempos_retiro_agregados(tiempos)
+        else:
+            reporte = self._tiempos_retiro_en_python(tiempos)
         
-        return {
-            'cantidad_tickets': len(tiempos),
-            'tiempo_promedio_minutos': round(sum(tiempos) / len(tiempos), 2),
-            'tiempo_minimo_minutos': round(min(tiempos), 2),
-            'tiempo_maximo_minutos': round(max(tiempos), 2)
+        reporte['periodo'] = {'desde': fecha_desde.isoformat(), 'hasta': fecha_hasta.isoformat()}
+        return reporte
+    
+    @staticmethod
+    def _estadisticas_retiro(cantidad, promedio, minimo, maximo, percentiles) -> Dict:
+        """Formatea estadísticas de tiempo (timedelta o segundos) en minutos."""
+        def _minutos(valor):
+            if valor is None:
+                return 0
+            segundos = valor.total_seconds() if isinstance(valor, timedelta) else valor
+            return round(segundos / 60, 2)
+        
+        estadisticas = {
+            'cantidad_tickets': cantidad,
+            'tiempo_promedio_minutos': _minutos(promedio),
+            'tiempo_minimo_minutos': _minutos(minimo),
+            'tiempo_maximo_minutos': _minutos(maximo),
         }
+        for p, valor in zip(PERCENTILES_RETIRO, percentiles):
+            estadisticas[f'p{p}_minutos'] = _minutos(valor)
+        return estadisticas
+    
+    def _tiempos_retiro_agregados(self, tiempos) -> Dict:
+        """Agregación completa en PostgreSQL: tres consultas, sin leer filas."""
+        agregados = {
+            'cantidad': Count('id'),
+            'promedio': Avg('tiempo'),
+            'minimo': Min('tiempo'),
+            'maximo': Max('tiempo'),
+            **{f'p{p}': _PercentileCont('tiempo', p / 100) for p in PERCENTILES_RETIRO},
+        }
+        
+        def _formatear(fila):
+            return self._estadisticas_retiro(
+                fila['cantidad'], fila['promedio'], fila['minimo'], fila['maximo'],
+                [fila[f'p{p}'] for p in PERCENTILES_RETIRO]
+            )
+        
+        reporte = _formatear(tiempos.aggregate(**agregados))
+        reporte['por_sucursal'] = [
+            {'sucursal': fila['sucursal__nombre'] or 'Sin sucursal', **_formatear(fila)}
+            for fila in tiempos.values('sucursal__nombre').annotate(**agregados).order_by('sucursal__nombre')
+        ]
+        reporte['por_dia'] = [
+            {'fecha': fila['fecha'].isoformat(), **_formatear(fila)}
+            for fila in tiempos.values('fecha').annotate(**agregados).order_by('fecha')
+        ]
+        return reporte
+    
+    def _tiempos_retiro_en_python(self, tiempos) -> Dict:
+        """Una consulta de (sucursal, día, duración) ordenada; percentiles en Python."""
+        todos = []
+        por_sucursal = {}
+        por_dia = {}
+        for sucursal, fecha, tiempo in tiempos.values_list('sucursal__nombre', 'fecha', 'tiempo').order_by('tiempo'):
+            segundos = tiempo.total_seconds()
+            todos.append(segundos)
+            por_sucursal.setdefault(sucursal or 'Sin sucursal', []).append(segundos)
+            por_dia.setdefault(fecha, []).append(segundos)
+        
+        def _formatear(valores):
+            if not valores:
+                return self._estadisticas_retiro(0, None, None, None, [None] * len(PERCENTILES_RETIRO))
+            return self._estadisticas_retiro(
+                len(valores), sum(valores) / len(valores), valores[0], valores[-1],
+                [_percentil(valores, p) for p in PERCENTILES_RETIRO]
+            )
+        
+        reporte = _formatear(todos)
+        reporte['por_sucursal'] = [
+            {'sucursal': sucursal, **_formatear(valores)}
+            for sucursal, valores in sorted(por_sucursal.items())
+        ]
+        reporte['por_dia'] = [
+            {'fecha': fecha.isoformat(), **_formatear(valores)}
+            for fecha, valores in sorted(por_dia.items())
+        ]
+        return reporte
     
     def alertas_stock_bajo(self, umbral: int = 10) -> List[Dict]:
         """
@@ -311,50 +456,141 @@ class RRHHService:
         
         return alertas
     
-    def exportar_tickets_csv(
+    def queryset_exportacion_tickets(
         self,
         fecha_desde: Optional[date] = None,
-        fecha_hasta: Optional[date] = None
-    ) -> str:
+        fecha_hasta: Optional[date] = None,
+        estado: Optional[str] = None
+    ):
         """
-        Genera CSV de tickets para exportación.
+        QuerySet filtrado de tickets a exportar (sin anotaciones ni orden).
         
         Args:
             fecha_desde: Fecha inicio
             fecha_hasta: Fecha fin
+            estado: Filtrar por estado
             
         Returns:
-            String CSV
+            QuerySet de Ticket
+        """
+        queryset = Ticket.objects.all()
+        if fecha_desde:
+            queryset = queryset.filter(created_at__date__gte=fecha_desde)
+        if fecha_hasta:
+            queryset = queryset.filter(created_at__date__lte=fecha_hasta)
+        if estado:
+            queryset = queryset.filter(estado=estado)
+        return queryset
+    
+    def filas_exportacion_tickets(
+        self,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        estado: Optional[str] = None,
+        chunk_size: Optional[int] = None
+    ) -> Iterator[List]:
         """
-        import csv
-        from io import StringIO
+        Recorre los tickets a exportar en memoria constante y sin límite de filas.
+        
+        Una sola consulta con values_list() + iterator(): la entrega (fecha y
+        guardia) sale de subconsultas sobre TicketEvent, sin instanciar
+        modelos ni prefetch por fila.
         
-        tickets = self.listar_tickets(
-            fecha_desde=fecha_desde,
-            fecha_hasta=fecha_hasta,
-            limit=10000
+        Args:
+            fecha_desde: Fecha inicio
+            fecha_hasta: Fecha fin
+            estado: Filtrar por estado
+            chunk_size: Filas por fetch (settings.EXPORT_CHUNK_SIZE)
+            
+        Yields:
+            Lista de valores en el orden de COLUMNAS_EXPORTACION_TICKETS
+        """
+        chunk_size = chunk_size or getattr(settings, 'EXPORT_CHUNK_SIZE', 2000)
+        entrega = TicketEvent.objects.filter(ticket=OuterRef('pk'), tipo='entregado').order_by('timestamp')
+        
+        filas = self.queryset_exportacion_tickets(fecha_desde, fecha_hasta, estado).annotate(
+            entregado_at=Subquery(entrega.values('timestamp')[:1]),
+            validado_por=Subquery(
+                entrega.annotate(guardia=KeyTextTransform('guardia', 'metadata')).values('guardia')[:1],
+                output_field=CharField()
+            ),
+        ).order_by('-created_at').values_list(
+            'uuid', 'trabajador__rut', 'trabajador__nombre', 'estado',
+            'created_at', 'ttl_expira_at', 'ciclo_id', 'ciclo__nombre',
+            'ciclo__fecha_inicio', 'ciclo__fecha_fin', 'sucursal__nombre',
+            'entregado_at', 'validado_por',
         )
         
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Headers
-        writer.writerow([
-            'UUID', 'Trabajador RUT', 'Trabajador Nombre', 'Estado',
-            'Fecha Creación', 'TTL Expira', 'Ciclo', 'Sucursal'
-        ])
-        
-        # Rows
-        for ticket in tickets:
-            writer.writerow([
-                ticket.uuid,
-                ticket.trabajador.rut,
-                ticket.trabajador.nombre,
-                ticket.estado,
-                ticket.created_at.isoformat(),
-                ticket.ttl_expira_at.isoformat() if ticket.ttl_expira_at else '',
-                str(ticket.ciclo) if ticket.ciclo else '',
-                ticket.sucursal.nombre if ticket.sucursal else ''
-            ])
-        
-        return output.getvalue()
+        def _fecha(valor):
+            return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S') if valor else ''
+        
+        for (uuid, rut, nombre, estado_ticket, created_at, ttl_expira_at, ciclo_id, ciclo_nombre,
+             ciclo_inicio, ciclo_fin, sucursal, entregado_at, validado_por) in filas.iterator(chunk_size=chunk_size):
+            if ciclo_id:
+                ciclo = f"{ciclo_nombre or f'Ciclo {ciclo_id}'} ({ciclo_inicio} → {ciclo_fin})"
+            else:
+                ciclo = ''
+            yield [
+                uuid,
+                rut,
+                nombre,
+                estado_ticket,
+                _fecha(created_at),
+                _fecha(ttl_expira_at),
+                ciclo,
+                sucursal or '',
+                _fecha(entregado_at),
+                validado_por or '',
+                round((entregado_at - created_at).total_seconds() / 60) if entregado_at else '',
+            ]
+    
+    def resumen_exportacion_tickets(
+        self,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        estado: Optional[str] = None
+    ) -> Dict:
+        """
+        Conteos por estado de los tickets exportados (una sola consulta agregada).
+        
+        Returns:
+            dict: Etiqueta -> cantidad, listo para la hoja de resumen
+        """
+        conteos = self.queryset_exportacion_tickets(fecha_desde, fecha_hasta, estado).aggregate(
+            total=Count('id'),
+            entregados=Count('id', filter=Q(estado='entregado')),
+            pendientes=Count('id', filter=Q(estado='pendiente')),
+            expirados=Count('id', filter=Q(estado='expirado')),
+            anulados=Count('id', filter=Q(estado='anulado')),
+        )
+        return {
+            'Total Tickets': conteos['total'],
+            'Entregados': conteos['entregados'],
+            'Pendientes': conteos['pendientes'],
+            'Expirados': conteos['expirados'],
+            'Anulados': conteos['anulados'],
+        }
+    
+    def exportar_tickets_csv(
+        self,
+        fecha_desde: Optional[date] = None,
+        fecha_hasta: Optional[date] = None,
+        estado: Optional[str] = None
+    ) -> Iterator[str]:
+        """
+        Genera el CSV de tickets línea a línea, para StreamingHttpResponse.
+        
+        Args:
+            fecha_desde: Fecha inicio
+            fecha_hasta: Fecha fin
+            estado: Filtrar por estado
+            
+        Returns:
+            Iterador de líneas CSV (la primera con BOM UTF-8 y encabezados)
+        """
+        from totem.excel_utils import filas_a_csv
+        
+        return filas_a_csv(
+            COLUMNAS_EXPORTACION_TICKETS,
+            self.filas_exportacion_tickets(fecha_desde, fecha_hasta, estado)
+        )
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de exportación de tickets de RRHH (CSV y XLSX en streaming).
+Ejecutar: pytest rrhh/tests/test_exportaciones.py -v
+"""
+import csv
+import uuid
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from rrhh.services.rrhh_service import RRHHService, COLUMNAS_EXPORTACION_TICKETS
+from totem.models import Ticket, TicketEvent
+
+
+@pytest.fixture
+def tickets(trabajador, ciclo_activo, sucursal):
+    """Tres tickets: uno entregado por guardia1 a los 15 minutos y dos pendientes."""
+    creados = [
+        Ticket.objects.create(
+            trabajador=trabajador, uuid=str(uuid.uuid4()), estado=estado,
+            ciclo=ciclo_activo, sucursal=sucursal,
+        )
+        for estado in ('entregado', 'pendiente', 'pendiente')
+    ]
+    TicketEvent.objects.create(
+        ticket=creados[0], tipo='entregado', metadata={'guardia': 'guardia1'},
+        timestamp=creados[0].created_at + timedelta(minutes=15),
+    )
+    return creados
+
+
+def _leer_csv(response):
+    contenido = b''.join(response.streaming_content).decode('utf-8')
+    assert contenido.startswith('\ufeff')
+    return list(csv.reader(StringIO(contenido.lstrip('\ufeff'))))
+
+
+@pytest.mark.django_db
+class TestExportacionTickets:
+    """Exportaciones sin tope de filas y en memoria constante"""
+
+    def test_csv_en_streaming(self, authenticated_rrhh_client, tickets):
+        """El CSV se entrega como StreamingHttpResponse con la entrega resuelta"""
+        response = authenticated_rrhh_client.get(reverse('rrhh:exportar_tickets_csv'))
+
+        assert response.status_code == 200
+        assert response.streaming
+        filas = _leer_csv(response)
+        assert filas[0] == COLUMNAS_EXPORTACION_TICKETS
+        assert len(filas) == 4
+        entregado = next(f for f in filas[1:] if f[3] == 'entregado')
+        assert entregado[9] == 'guardia1'
+        assert entregado[10] == '15'
+
+    def test_csv_filtra_por_estado(self, authenticated_rrhh_client, tickets):
+        response = authenticated_rrhh_client.get(reverse('rrhh:exportar_tickets_csv'), {'estado': 'pendiente'})
+        assert len(_leer_csv(response)) == 3
+
+    def test_filas_en_una_consulta(self, tickets, django_assert_num_queries):
+        """Las filas salen de una sola consulta, sin consultas por ticket"""
+        with django_assert_num_queries(1):
+            filas = list(RRHHService().filas_exportacion_tickets(chunk_size=2))
+        assert len(filas) == 3
+
+    def test_sin_tope_de_filas(self, trabajador, ciclo_activo):
+        """Se exportan todas las filas, más allá del antiguo límite"""
+        Ticket.objects.bulk_create([
+            Ticket(trabajador=trabajador, uuid=f'T-{i}', ciclo=ciclo_activo, created_at=timezone.now())
+            for i in range(10050)
+        ])
+        lineas = sum(1 for _ in RRHHService().exportar_tickets_csv())
+        assert lineas == 10051
+
+    def test_excel_write_only_con_resumen(self, authenticated_rrhh_client, tickets):
+        """El XLSX trae la hoja de datos y la de resumen"""
+        openpyxl = pytest.importorskip('openpyxl')
+
+        response = authenticated_rrhh_client.get(reverse('rrhh:exportar_tickets_excel'))
+
+        assert response.status_code == 200
+        assert response.streaming
+        wb = openpyxl.load_workbook(BytesIO(b''.join(response.streaming_content)))
+        assert wb.sheetnames == ['Tickets', 'Resumen']
+        assert wb['Tickets'].max_row == 4
+        resumen = {fila[0]: fila[1] for fila in wb['Resumen'].iter_rows(min_row=3, values_only=True)}
+        assert resumen['Total Tickets'] == 3
+        assert resumen['Entregados'] == 1
+
+    def test_fecha_invalida(self, authenticated_rrhh_client):
+        response = authenticated_rrhh_client.get(reverse('rrhh:exportar_tickets_excel'), {'fecha_desde': 'ayer'})
+        assert response.status_code == 400
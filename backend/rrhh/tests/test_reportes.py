@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de reportes agregados de RRHH.
+Ejecutar: pytest rrhh/tests/test_reportes.py -v
+"""
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from rrhh.services.rrhh_service import RRHHService, _percentil
+from totem.models import Sucursal, Ticket, TicketEvent
+
+
+@pytest.fixture
+def entregas(trabajador, ciclo_activo, sucursal):
+    """Tickets entregados a los 5, 10, 15 y 20 minutos en dos sucursales."""
+    otra = Sucursal.objects.create(nombre='Norte', codigo='NO01')
+    creado = timezone.now() - timedelta(hours=2)
+    for minutos, suc in ((5, sucursal), (10, sucursal), (15, otra), (20, otra)):
+        ticket = Ticket.objects.create(
+            trabajador=trabajador, uuid=str(uuid.uuid4()), estado='entregado',
+            ciclo=ciclo_activo, sucursal=suc, created_at=creado,
+        )
+        TicketEvent.objects.create(ticket=ticket, tipo='entregado', timestamp=creado + timedelta(minutes=minutos))
+    # Pendiente y entregado sin evento: no cuentan
+    Ticket.objects.create(trabajador=trabajador, uuid='pendiente', ciclo=ciclo_activo, created_at=creado)
+    Ticket.objects.create(trabajador=trabajador, uuid='sin-evento', estado='entregado', created_at=creado)
+
+
+@pytest.mark.django_db
+class TestReporteTiempoRetiro:
+    """Tiempo de retiro calculado en BD con percentiles"""
+
+    def test_estadisticas_y_percentiles(self, entregas):
+        reporte = RRHHService().reporte_tiempo_promedio_retiro()
+
+        assert reporte['cantidad_tickets'] == 4
+        assert reporte['tiempo_promedio_minutos'] == 12.5
+        assert reporte['tiempo_minimo_minutos'] == 5
+        assert reporte['tiempo_maximo_minutos'] == 20
+        assert reporte['p50_minutos'] == 12.5
+        assert reporte['p90_minutos'] == 18.5
+        assert [s['sucursal'] for s in reporte['por_sucursal']] == ['Casa Matriz', 'Norte']
+        assert reporte['por_sucursal'][1]['p50_minutos'] == 17.5
+        assert sum(d['cantidad_tickets'] for d in reporte['por_dia']) == 4
+
+    def test_una_consulta_sin_importar_tickets(self, entregas, django_assert_max_num_queries):
+        """Las consultas no crecen con la cantidad de tickets entregados"""
+        with django_assert_max_num_queries(3):
+            RRHHService().reporte_tiempo_promedio_retiro()
+
+    def test_sin_entregas(self, db):
+        reporte = RRHHService().reporte_tiempo_promedio_retiro(dias=7)
+        assert reporte['cantidad_tickets'] == 0
+        assert reporte['p99_minutos'] == 0
+        assert reporte['por_dia'] == []
+
+    def test_endpoint_acepta_rango_de_fechas(self, authenticated_rrhh_client, entregas):
+        hoy = timezone.localdate()
+        response = authenticated_rrhh_client.get(
+            reverse('rrhh:tiempo_promedio_retiro'),
+            {'fecha_desde': (hoy - timedelta(days=1)).isoformat(), 'fecha_hasta': hoy.isoformat()}
+        )
+        assert response.status_code == 200
+        assert response.data['cantidad_tickets'] == 4
+
+    def test_endpoint_fecha_invalida(self, authenticated_rrhh_client):
+        response = authenticated_rrhh_client.get(reverse('rrhh:tiempo_promedio_retiro'), {'fecha_desde': '30-11'})
+        assert response.status_code == 400
+
+    def test_percentil_interpolado(self):
+        assert _percentil([1, 2, 3, 4], 50) == 2.5
+        assert _percentil([7], 99) == 7
@@ -6,13 +6,15 @@ from rest_framework.response import Response
 from rest_framework import status
 from datetime import timedelta, date
 from django.utils import timezone
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from totem.models import Ticket
 from totem.serializers import TicketSerializer
 from totem.utils_rut import clean_rut, valid_rut
 from totem.permissions import IsRRHH, IsRRHHOrSupervisor
 from totem.exceptions import TotemBaseException
-from .services.rrhh_service import RRHHService
+from .services.rrhh_service import (
+    RRHHService, COLUMNAS_EXPORTACION_TICKETS, ANCHOS_EXPORTACION_TICKETS
+)
 import logging
 
 logger = logging.getLogger(__name__)
@@ -432,25 +434,34 @@ def tiempo_promedio_retiro(request):
                 "desde": "2025-11-01",
                 "hasta": "2025-11-30"
             },
-            "total_tickets_entregados": 450,
+            "cantidad_tickets": 450,
             "tiempo_promedio_minutos": 12.5,
-            "tiempo_mediano_minutos": 10,
-            "tiempo_minimo_minutos": 2,
-            "tiempo_maximo_minutos": 45,
+            "tiempo_minimo_minutos": 2.1,
+            "tiempo_maximo_minutos": 45.0,
+            "p50_minutos": 10.0,
+            "p90_minutos": 24.3,
+            "p99_minutos": 41.7,
             "por_sucursal": [
                 {
                     "sucursal": "Central",
-                    "promedio_minutos": 11.2,
-                    "tickets": 280
+                    "cantidad_tickets": 280,
+                    "tiempo_promedio_minutos": 11.2,
+                    "tiempo_minimo_minutos": 2.1,
+                    "tiempo_maximo_minutos": 40.0,
+                    "p50_minutos": 9.5,
+                    "p90_minutos": 22.0,
+                    "p99_minutos": 38.8
                 },
                 ...
             ],
-            "distribucion": {
-                "0_5_min": 120,     # Muy rápido
-                "5_15_min": 250,    # Normal
-                "15_30_min": 65,    # Lento
-                "mas_30_min": 15    # Muy lento
-            }
+            "por_dia": [
+                {
+                    "fecha": "2025-11-01",
+                    "cantidad_tickets": 15,
+                    ...mismas métricas...
+                },
+                ...
+            ]
         }
     
     ERRORES:
@@ -460,21 +471,25 @@ def tiempo_promedio_retiro(request):
         500: Error interno del servidor
     
     NOTAS:
-        - Solo considera tickets estado="entregado"
-        - Tiempo calculado: entregado_at - created_at
+        - Solo considera tickets estado="entregado" con evento de entrega
+        - Tiempo calculado en BD: primer evento "entregado" - created_at
+        - Sin fechas: últimos 30 días
+        - Percentiles con interpolación lineal (percentile_cont)
         - Útil para evaluar eficiencia de portería
         - Meta objetivo: <15 minutos promedio
     """
     try:
-        fecha_desde = request.GET.get('fecha_desde')
-        fecha_hasta = request.GET.get('fecha_hasta')
+        fecha_desde_str = request.GET.get('fecha_desde')
+        fecha_hasta_str = request.GET.get('fecha_hasta')
         
         service = RRHHService()
         reporte = service.reporte_tiempo_promedio_retiro(
-            fecha_desde=fecha_desde,
-            fecha_hasta=fecha_hasta
+            fecha_desde=date.fromisoformat(fecha_desde_str) if fecha_desde_str else None,
+            fecha_hasta=date.fromisoformat(fecha_hasta_str) if fecha_hasta_str else None
         )
         return Response(reporte, status=status.HTTP_200_OK)
+    except ValueError:
+        return Response({'detail': 'Formato de fecha inválido. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
     except TotemBaseException:
         raise
     except Exception as e:
@@ -499,15 +514,16 @@ def exportar_tickets_csv(request):
     QUERY PARAMETERS:
         ?fecha_desde=2025-11-01  # OPCIONAL: Fecha inicio (YYYY-MM-DD)
         ?fecha_hasta=2025-11-30  # OPCIONAL: Fecha fin (YYYY-MM-DD)
+        ?estado=entregado        # OPCIONAL: Filtrar por estado
     
     RESPUESTA EXITOSA (200):
         Content-Type: text/csv; charset=utf-8
         Content-Disposition: attachment; filename="tickets_2025-11-30.csv"
         
         Estructura CSV:
-        uuid,trabajador_rut,trabajador_nombre,estado,sucursal,created_at,entregado_at,validado_por,tiempo_entrega_min
-        ABC123,12345678-9,Juan Pérez,entregado,Central,2025-11-30 10:30:00,2025-11-30 10:45:00,guardia1,15
-        DEF456,87654321-K,María González,pendiente,Norte,2025-11-30 11:00:00,,,
+        UUID,Trabajador RUT,Trabajador Nombre,Estado,Fecha Creación,TTL Expira,Ciclo,Sucursal,Fecha Entrega,Validado Por,Tiempo Entrega (min)
+        ABC123,12345678-9,Juan Pérez,entregado,2025-11-30 10:30:00,2025-11-30 11:00:00,Noviembre (2025-11-01 → 2025-11-30),Central,2025-11-30 10:45:00,guardia1,15
+        DEF456,87654321-K,María González,pendiente,2025-11-30 11:00:00,2025-11-30 11:30:00,Noviembre (2025-11-01 → 2025-11-30),Norte,,,
         ...
     
     ERRORES:
@@ -520,9 +536,10 @@ def exportar_tickets_csv(request):
         - Codificación: UTF-8 con BOM para compatibilidad con Excel
         - Delimiter: coma (,)
         - Si no se especifican fechas, exporta todos los tickets
-        - Máximo recomendado: 10,000 registros (usar filtros de fecha)
+        - Sin límite de registros: la respuesta se genera en streaming
+          (memoria constante, lectura por bloques de EXPORT_CHUNK_SIZE filas)
         - Compatible con Excel, Google Sheets, Power BI
-        - Timestamps en formato ISO 8601 local
+        - Timestamps en hora local (YYYY-MM-DD HH:MM:SS)
     """
     try:
         fecha_desde_str = request.GET.get('fecha_desde')
@@ -533,12 +550,13 @@ def exportar_tickets_csv(request):
         fecha_hasta = date.fromisoformat(fecha_hasta_str) if fecha_hasta_str else None
         
         service = RRHHService()
-        csv_content = service.exportar_tickets_csv(
+        lineas = service.exportar_tickets_csv(
             fecha_desde=fecha_desde,
-            fecha_hasta=fecha_hasta
+            fecha_hasta=fecha_hasta,
+            estado=request.GET.get('estado')
         )
         
-        response = HttpResponse(csv_content, content_type='text/csv; charset=utf-8')
+        response = StreamingHttpResponse(lineas, content_type='text/csv; charset=utf-8')
         response['Content-Disposition'] = f'attachment; filename="tickets_{date.today().isoformat()}.csv"'
         return response
     except ValueError as e:
@@ -585,89 +603,32 @@ def exportar_tickets_excel(request):
     
     NOTAS:
         - Requiere: pip install openpyxl
+        - Sin límite de registros: openpyxl en modo write-only (memoria constante)
         - Formato más amigable que CSV para análisis en Excel
-        - Incluye formato de fecha automático
-        - Columnas auto-ajustadas según contenido
+        - Mismas columnas que la exportación CSV, con anchos fijos
         - Encabezados con fondo azul y texto blanco
     """
     try:
-        from totem.excel_utils import exportar_queryset_a_excel, agregar_hoja_resumen
+        from totem.excel_utils import exportar_filas_a_excel
         
         fecha_desde_str = request.GET.get('fecha_desde')
         fecha_hasta_str = request.GET.get('fecha_hasta')
-        estado = request.GET.get('estado')
-        
-        # Construir QuerySet con filtros
-        qs = Ticket.objects.select_related('trabajador', 'ciclo').all()
-        
-        if fecha_desde_str:
-            fecha_desde = date.fromisoformat(fecha_desde_str)
-            qs = qs.filter(created_at__date__gte=fecha_desde)
-        
-        if fecha_hasta_str:
-            fecha_hasta = date.fromisoformat(fecha_hasta_str)
-            qs = qs.filter(created_at__date__lte=fecha_hasta)
-        
-        if estado:
-            qs = qs.filter(estado=estado)
-        
-        qs = qs.order_by('-created_at')
-        
-        # Definir encabezados y campos
-        headers = [
-            'UUID',
-            'RUT Trabajador',
-            'Nombre Trabajador',
-            'Estado',
-            'Sucursal',
-            'Fecha Creación',
-            'Fecha Entrega',
-            'Validado Por',
-            'Tiempo Entrega (min)'
-        ]
-        
-        def calcular_tiempo_entrega(ticket):
-            if ticket.entregado_at and ticket.created_at:
-                diff = ticket.entregado_at - ticket.created_at
-                return round(diff.total_seconds() / 60)
-            return None
-        
-        campos = [
-            'uuid',
-            'trabajador.rut',
-            'trabajador.nombre',
-            'estado',
-            lambda t: t.sucursal or 'N/A',
-            lambda t: t.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            lambda t: t.entregado_at.strftime('%Y-%m-%d %H:%M:%S') if t.entregado_at else '',
-            'validado_por',
-            calcular_tiempo_entrega
-        ]
+        filtros = {
+            'fecha_desde': date.fromisoformat(fecha_desde_str) if fecha_desde_str else None,
+            'fecha_hasta': date.fromisoformat(fecha_hasta_str) if fecha_hasta_str else None,
+            'estado': request.GET.get('estado'),
+        }
         
-        # Generar Excel
-        response = exportar_queryset_a_excel(
-            qs,
+        service = RRHHService()
+        return exportar_filas_a_excel(
+            service.filas_exportacion_tickets(**filtros),
             'tickets',
-            headers,
-            campos,
-            sheet_name='Tickets'
+            COLUMNAS_EXPORTACION_TICKETS,
+            sheet_name='Tickets',
+            anchos=ANCHOS_EXPORTACION_TICKETS,
+            resumen=service.resumen_exportacion_tickets(**filtros),
         )
         
-        # Agregar hoja de resumen (si hay suficientes datos)
-        if qs.count() > 0:
-            estadisticas = {
-                'Total Tickets': qs.count(),
-                'Entregados': qs.filter(estado='entregado').count(),
-                'Pendientes': qs.filter(estado='pendiente').count(),
-                'Expirados': qs.filter(estado='expirado').count(),
-                'Anulados': qs.filter(estado='anulado').count(),
-            }
-            
-            # TODO: Agregar estadísticas al Excel
-            # (requiere modificar exportar_queryset_a_excel para retornar workbook)
-        
-        return response
-        
     except ImportError:
         return Response(
             {'detail': 'Exportación Excel no disponible. Contacte al administrador.'},
@@ -675,6 +636,8 @@ def exportar_tickets_excel(request):
         )
     except ValueError as e:
         return Response({'detail': 'Formato de fecha inválido. Use YYYY-MM-DD'}, status=status.HTTP_400_BAD_REQUEST)
+    except TotemBaseException:
+        raise
     except Exception as e:
         logger.error(f"Error inesperado en exportar_tickets_excel: {e}")
         return Response({'detail': 'Error interno del servidor'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,187 @@
+"""
+Micro-benchmarks de rutas críticas de rendimiento.
+Ejecutar: pytest tests/test_benchmarks.py -m slow -s
+Cada benchmark imprime sus tiempos y verifica solo relaciones gruesas
+(p.ej. caché más rápida que render en frío) para no ser frágil en CI.
+"""
+import time
+
+import pytest
+
+from totem.qr_render import QRRenderer
+
+
+def _cronometrar(funcion, repeticiones):
+    """Ejecuta `funcion` n veces y retorna el tiempo medio en microsegundos."""
+    inicio = time.perf_counter()
+    for i in range(repeticiones):
+        funcion(i)
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+@pytest.mark.slow
+class TestBenchmarkQRRender:
+    """Comparación de formatos de render QR y efecto de la caché"""
+
+    REPETICIONES = 200
+    PAYLOAD = 'a1b2c3d4-0000-4000-8000-{:012d}:1732962600:0123456789abcdef'
+
+    def test_formatos_en_frio_y_en_cache(self):
+        """Render en frío por formato vs. acierto de caché"""
+        import qrcode
+        from io import BytesIO
+
+        def legado(i):
+            qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+            qr.add_data(self.PAYLOAD.format(i))
+            qr.make(fit=True)
+            qr.make_image(fill_color="black", back_color="white").save(BytesIO(), format='PNG')
+
+        resultados = {'png_legado': _cronometrar(legado, self.REPETICIONES)}
+        for formato in ('png', 'png_termico', 'svg', 'matriz'):
+            QRRenderer.limpiar_cache()
+            resultados[formato] = _cronometrar(
+                lambda i: QRRenderer.renderizar(self.PAYLOAD.format(i), formato), self.REPETICIONES
+            )
+        resultados['png_cache'] = _cronometrar(
+            lambda i: QRRenderer.renderizar(self.PAYLOAD.format(0), 'png'), self.REPETICIONES
+        )
+
+        tamanos = {
+            formato: len(QRRenderer.renderizar(self.PAYLOAD.format(0), formato))
+            for formato in ('png', 'png_termico', 'svg')
+        }
+        print('\nRender QR (µs/op):', {k: round(v, 1) for k, v in resultados.items()})
+        print('Tamaño salida (bytes):', tamanos)
+
+        assert resultados['png_cache'] < resultados['png']
+        assert tamanos['png_termico'] < tamanos['png']
+
+
+@pytest.mark.slow
+class TestBenchmarkFirmaBeneficios:
+    """Firma HMAC de beneficios: individual vs. lote vs. pool de procesos"""
+
+    CANTIDAD = 100_000
+
+    def _payloads(self):
+        return [
+            {
+                'beneficio_id': i,
+                'trabajador_rut': f'{10000000 + i}-K',
+                'ciclo_id': 7,
+                'tipo_beneficio': 'Caja Navidad',
+                'created_at': '2025-12-01T10:00:00+00:00',
+            }
+            for i in range(self.CANTIDAD)
+        ]
+
+    def test_firmas_por_segundo(self, settings):
+        """Firmas/s para 100k beneficios (re-firma completa de un ciclo)"""
+        import hashlib
+        import hmac
+        import json
+        import os
+
+        from totem.services.beneficio_service import HMAC_SECRET, BeneficioService
+
+        payloads = self._payloads()
+
+        def legado():
+            return [
+                hmac.new(
+                    HMAC_SECRET.encode('utf-8'),
+                    json.dumps(p, separators=(',', ':'), sort_keys=True).encode('utf-8'),
+                    hashlib.sha256,
+                ).hexdigest()
+                for p in payloads
+            ]
+
+        procesos = min(os.cpu_count() or 1, 4)
+        settings.BENEFICIOS_HMAC_POOL_MIN = 1
+        tiempos = {}
+        firmas = {}
+        for nombre, funcion in (
+            ('individual', legado),
+            ('lote', lambda: BeneficioService.firmar_lote(payloads)),
+            (f'pool_{procesos}', lambda: BeneficioService.firmar_lote(payloads, procesos=procesos)),
+        ):
+            inicio = time.perf_counter()
+            firmas[nombre] = funcion()
+            tiempos[nombre] = time.perf_counter() - inicio
+
+        print('\nFirma HMAC 100k beneficios (firmas/s):',
+              {k: round(self.CANTIDAD / v) for k, v in tiempos.items()})
+
+        # Los tiempos solo se imprimen: el margen lote/individual es estrecho para CI cargado
+        assert firmas['lote'] == firmas['individual'] == firmas[f'pool_{procesos}']
+
+
+@pytest.mark.slow
+@pytest.mark.django_db
+class TestBenchmarkEntregaGuardia:
+    """Ruta de escritura de la entrega en portería: legado vs. UPDATE condicionales"""
+
+    CANTIDAD = 200
+
+    def _preparar(self, prefijo):
+        from datetime import timedelta
+        from django.utils import timezone
+        from totem.models import CajaFisica, ReservaStock, StockSucursal, Sucursal, Ticket, Trabajador
+
+        sucursal = Sucursal.objects.create(nombre=f'Bench {prefijo}', codigo=f'B{prefijo}')
+        stock = StockSucursal.objects.create(sucursal=sucursal.nombre, producto='Premium', cantidad=0)
+        trabajadores = Trabajador.objects.bulk_create([
+            Trabajador(rut=f'{prefijo}{i:06d}-0', nombre=f'T{i}') for i in range(self.CANTIDAD)
+        ])
+        expira = timezone.now() + timedelta(minutes=30)
+        tickets = Ticket.objects.bulk_create([
+            Ticket(trabajador=t, uuid=f'{prefijo}-{i}', sucursal=sucursal, ttl_expira_at=expira)
+            for i, t in enumerate(trabajadores)
+        ])
+        ReservaStock.objects.bulk_create([ReservaStock(stock=stock, ticket=t) for t in tickets])
+        CajaFisica.objects.bulk_create([
+            CajaFisica(codigo=f'{prefijo}-CAJA-{i}', tipo='premium', sucursal=sucursal) for i in range(self.CANTIDAD)
+        ])
+
+    def test_consultas_por_validacion(self):
+        """Consultas y tiempo por entrega (select_for_update + save + 3 inserts vs. ruta consolidada)"""
+        from django.db import connection, transaction
+        from django.test.utils import CaptureQueriesContext
+        from totem.models import CajaFisica, Ticket, TicketEvent
+        from totem.services import StockService, TicketService
+
+        @transaction.atomic
+        def legado(i):
+            ticket = Ticket.objects.select_for_update().get(uuid=f'1-{i}')
+            caja = CajaFisica.objects.select_for_update().get(codigo=f'1-CAJA-{i}', usado=False)
+            caja.usado = True
+            caja.asignada_ticket = ticket
+            caja.save()
+            ticket.estado = 'entregado'
+            ticket.save()
+            StockService.consumir_reserva(ticket)
+            for tipo in ('validado_guardia', 'caja_verificada', 'entregado'):
+                TicketEvent.objects.create(ticket=ticket, tipo=tipo, metadata={'guardia': 'bench'})
+
+        service = TicketService()
+        rutas = {
+            'legado': legado,
+            'consolidada': lambda i: service.entregar_ticket(f'2-{i}', f'2-CAJA-{i}', 'bench'),
+        }
+        self._preparar(1)
+        self._preparar(2)
+
+        consultas, tiempos = {}, {}
+        for nombre, funcion in rutas.items():
+            with CaptureQueriesContext(connection) as capturadas:
+                funcion(0)
+            consultas[nombre] = sum('SAVEPOINT' not in q['sql'] for q in capturadas.captured_queries)
+            tiempos[nombre] = _cronometrar(lambda i: funcion(i + 1), self.CANTIDAD - 1)
+
+        print('\nEntrega en portería (consultas/validación):', consultas)
+        print('Entrega en portería (µs/op):', {k: round(v, 1) for k, v in tiempos.items()})
+
+        assert consultas['legado'] == 8
+        assert consultas['consolidada'] == 5
+        assert Ticket.objects.filter(uuid__startswith='2-', estado='entregado').count() == self.CANTIDAD
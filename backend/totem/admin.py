@@ -1,9 +1,9 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from .models import (
-    Usuario, Trabajador, StockSucursal, Ticket, Sucursal,
+    Usuario, Trabajador, StockSucursal, ReservaStock, Ticket, Sucursal,
     Ciclo, TipoBeneficio, CajaFisica, Agendamiento, Incidencia, TicketEvent,
-    ParametroOperativo, CajaBeneficio, BeneficioTrabajador, ValidacionCaja
+    ParametroOperativo, CajaBeneficio, BeneficioTrabajador, ValidacionCaja, AuditLog
 )
 
 
@@ -42,6 +42,28 @@ class StockAdmin(admin.ModelAdmin):
     tiene_stock.boolean = True
 
 
+@admin.register(AuditLog)
+class AuditLogAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'method', 'path', 'status_code', 'username', 'ip_address', 'duration_ms')
+    list_filter = ('method', 'status_code')
+    search_fields = ('path', 'username', 'ip_address')
+    date_hierarchy = 'timestamp'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReservaStock)
+class ReservaStockAdmin(admin.ModelAdmin):
+    list_display = ('ticket', 'stock', 'estado', 'created_at', 'cerrada_at')
+    list_filter = ('estado',)
+    search_fields = ('ticket__uuid', 'stock__sucursal')
+    raw_id_fields = ('ticket', 'stock')
+
+
 @admin.register(Ticket)
 class TicketAdmin(admin.ModelAdmin):
     list_display = ('uuid', 'trabajador', 'estado', 'created_at', 'ttl_expira_at', 'ciclo')
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de auditoría no bloqueante.
+
+AuditLoggingMiddleware escribe en el logger 'audit'; su handler
+(AuditQueueHandler) solo encola el registro en una cola acotada y vuelve.
+Un hilo escritor por proceso vacía la cola por lotes: escribe una línea de
+JSON compacto por registro con un único flush por lote (rotando como
+RotatingFileHandler) y, si ship_to_db, inserta el lote en AuditLog con
+bulk_create. Con la cola llena el registro se descarta y se cuenta: un disco
+lento nunca se traslada a la latencia del request.
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+logger = logging.getLogger('totem.audit')
+
+_FIN = object()
+
+
+class AuditQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler con cola acotada y escritor por lotes.
+
+    Se configura en LOGGING como cualquier handler de archivo:
+
+        'audit_file': {
+            'class': 'totem.audit.AuditQueueHandler',
+            'filename': BASE_DIR / 'logs' / 'audit.log',
+            'maxBytes': 10 * 1024 * 1024,
+            'backupCount': 10,
+            'queue_size': 10000,
+        }
+    """
+
+    # Segundos entre avisos de descarte (evita inundar el log con la cola llena)
+    AVISO_DESCARTE_CADA = 60
+
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding='utf-8', queue_size=10000,
+                 batch_size=200, flush_interval=1.0, ship_to_db=False):
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.archivo = logging.handlers.RotatingFileHandler(
+            filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding, delay=True
+        )
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.ship_to_db = ship_to_db
+        self.descartados = 0
+        self.escritos = 0
+        self.errores = 0
+        self._ultimo_aviso = 0.0
+        self._escritor = None
+        self._pid = None
+        self._inicio_lock = threading.Lock()
+
+    # --- lado del request ---
+
+    def emit(self, record):
+        if self._pid != os.getpid():
+            self._iniciar_escritor()
+        super().emit(record)
+
+    def prepare(self, record):
+        # El formateo a JSON lo hace el escritor, fuera del request
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.descartados += 1
+            ahora = time.monotonic()
+            if ahora - self._ultimo_aviso >= self.AVISO_DESCARTE_CADA:
+                self._ultimo_aviso = ahora
+                logger.warning("Cola de auditoría llena: %s registros descartados", self.descartados)
+
+    # --- escritor ---
+
+    def _iniciar_escritor(self):
+        """Arranca el hilo escritor de este proceso (de nuevo tras un fork)."""
+        with self._inicio_lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._escritor = threading.Thread(target=self._escribir_en_bucle, name='audit-writer', daemon=True)
+            self._escritor.start()
+
+    def _escribir_en_bucle(self):
+        while True:
+            record = self.queue.get()
+            if record is _FIN:
+                self.queue.task_done()
+                return
+            lote = [record]
+            limite = time.monotonic() + self.flush_interval
+            fin = False
+            while len(lote) < self.batch_size:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    record = self.queue.get(timeout=restante)
+                except queue.Empty:
+                    break
+                if record is _FIN:
+                    fin = True
+                    break
+                lote.append(record)
+            try:
+                self.procesar_lote(lote)
+            finally:
+                for _ in range(len(lote) + fin):
+                    self.queue.task_done()
+            if fin:
+                return
+
+    def procesar_lote(self, records):
+        """Escribe un lote en audit.log (un flush) y, si corresponde, en AuditLog."""
+        try:
+            self._escribir_archivo([self.formatear(r) for r in records])
+            self.escritos += len(records)
+        except Exception:
+            self.errores += 1
+            self.handleError(records[-1])
+        if self.ship_to_db:
+            self._guardar_en_db(records)
+
+    @staticmethod
+    def formatear(record):
+        """Una línea de JSON compacto (mismas claves que el JsonFormatter anterior)."""
+        datos = {
+            'asctime': datetime.fromtimestamp(record.created).strftime('%Y-%m-%d %H:%M:%S'),
+            'name': record.name,
+            'levelname': record.levelname,
+            'message': record.getMessage(),
+        }
+        audit_data = getattr(record, 'audit_data', None)
+        if audit_data is not None:
+            datos['audit_data'] = audit_data
+        return json.dumps(datos, separators=(',', ':'), ensure_ascii=False, default=str)
+
+    def _escribir_archivo(self, lineas):
+        archivo = self.archivo
+        datos = ''.join(f'{linea}\n' for linea in lineas)
+        archivo.acquire()
+        try:
+            if archivo.stream is None:
+                archivo.stream = archivo._open()
+            if archivo.maxBytes > 0 and archivo.stream.tell() and \
+                    archivo.stream.tell() + len(datos.encode(archivo.encoding or 'utf-8')) > archivo.maxBytes:
+                archivo.doRollover()
+                if archivo.stream is None:
+                    archivo.stream = archivo._open()
+            archivo.stream.write(datos)
+            archivo.stream.flush()
+        finally:
+            archivo.release()
+
+    def _guardar_en_db(self, records):
+        from django.db import close_old_connections
+        from .models import AuditLog
+
+        filas = []
+        for record in records:
+            data = getattr(record, 'audit_data', None)
+            if not data:
+                continue
+            filas.append(AuditLog(
+                timestamp=datetime.fromtimestamp(record.created, tz=dt_timezone.utc),
+                method=data.get('method', '')[:10],
+                path=data.get('path', '')[:255],
+                status_code=data.get('status_code') or 0,
+                duration_ms=data.get('duration_ms') or 0,
+                ip_address=(data.get('ip_address') or '')[:45],
+                user_agent=data.get('user_agent') or '',
+                username=data.get('username') or '',
+                user_id=data.get('user_id'),
+                user_rol=data.get('user_rol') or '',
+                query_params=data.get('query_params') or {},
+            ))
+        if not filas:
+            return
+        try:
+            close_old_connections()
+            AuditLog.objects.bulk_create(filas, batch_size=self.batch_size)
+        except Exception as e:
+            self.errores += 1
+            sys.stderr.write(f"Error guardando lote de auditoría en AuditLog: {e}\n")
+
+    def flush(self, timeout=5.0):
+        """Espera (hasta timeout) a que el escritor vacíe la cola."""
+        if self._escritor is None or not self._escritor.is_alive():
+            return
+        limite = time.monotonic() + timeout
+        while self.queue.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.01)
+
+    def close(self):
+        if self._escritor is not None and self._escritor.is_alive() and self._pid == os.getpid():
+            try:
+                self.queue.put(_FIN, timeout=1.0)
+                self._escritor.join(timeout=5.0)
+            except queue.Full:
+                pass
+        self.archivo.close()
+        super().close()
+
+    def stats(self):
+        return {
+            'en_cola': self.queue.qsize(),
+            'descartados': self.descartados,
+            'escritos': self.escritos,
+            'errores': self.errores,
+        }
+
+
+def audit_stats():
+    """Contadores de los AuditQueueHandler del logger 'audit' en este proceso."""
+    resultado = {'en_cola': 0, 'descartados': 0, 'escritos': 0, 'errores': 0}
+    for handler in logging.getLogger('audit').handlers:
+        if isinstance(handler, AuditQueueHandler):
+            for clave, valor in handler.stats().items():
+                resultado[clave] += valor
+    return resultado
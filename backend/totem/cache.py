@@ -3,11 +3,18 @@
 Sistema de caché con Redis para optimizar rendimiento.
 Provee decoradores y utilidades para cacheo inteligente.
 """
+from collections import Counter, OrderedDict, defaultdict
 from functools import wraps
-from django.core.cache import cache
+from django.core.cache import cache, caches
 from django.conf import settings
+from django.utils.module_loading import import_string
 import hashlib
 import json
+import math
+import os
+import random
+import threading
+import time
 import structlog
 
 logger = structlog.get_logger(__name__)
@@ -44,16 +51,278 @@ def generate_cache_key(prefix, *args, **kwargs):
     return f'{prefix}:{key_hash}'
 
 
-def cache_response(timeout=300, key_prefix='view'):
+# === TAGS (GRUPOS VERSIONADOS) ===
+# Cada tag tiene un contador de generación sin expiración. Las claves
+# etiquetadas incluyen las generaciones vigentes de sus tags, así que
+# incrementar un contador invalida todo el grupo en O(1) sin recorrer Redis;
+# las entradas de generaciones anteriores simplemente expiran por su TTL.
+TAG_KEY_PREFIX = 'cachetag'
+
+
+def _tag_key(tag):
+    return f'{TAG_KEY_PREFIX}:{tag}'
+
+
+def get_tag_versions(tags):
+    """
+    Obtiene la generación vigente de cada tag (una lectura get_many).
+    
+    Un tag sin contador se inicializa con time.time_ns(): si el contador fue
+    desalojado de la caché, la nueva generación no coincide con ninguna anterior.
+    
+    Args:
+        tags (iterable): Nombres de tags
+    
+    Returns:
+        dict: {tag: generación}
+    """
+    claves = {tag: _tag_key(tag) for tag in tags}
+    actuales = cache.get_many(list(claves.values()))
+    versiones = {}
+    for tag, clave in claves.items():
+        version = actuales.get(clave)
+        if version is None:
+            inicial = time.time_ns()
+            cache.add(clave, inicial, None)
+            version = cache.get(clave) or inicial
+        versiones[tag] = version
+    return versiones
+
+
+def tagged_key(key, tags):
+    """
+    Clave de caché ligada a la generación vigente de los tags.
+    
+    Args:
+        key (str): Clave base
+        tags (iterable): Tags del grupo (vacío devuelve la clave sin cambios)
+    
+    Returns:
+        str: Clave versionada
+    """
+    if not tags:
+        return key
+    versiones = get_tag_versions(sorted(set(tags)))
+    firma = ','.join(f'{tag}={version}' for tag, version in sorted(versiones.items()))
+    return f'{key}:tags:{hashlib.md5(firma.encode()).hexdigest()[:16]}'
+
+
+def invalidate_tags(*tags):
+    """
+    Invalida todas las claves de los tags dados incrementando su generación.
+    
+    Args:
+        *tags: Nombres de tags
+    """
+    for tag in set(tags):
+        clave = _tag_key(tag)
+        try:
+            cache.incr(clave)
+        except ValueError:
+            # Contador desalojado: cualquier generación nueva invalida el grupo
+            cache.set(clave, time.time_ns(), None)
+    if tags:
+        logger.info("cache_tags_invalidated", tags=sorted(set(tags)))
+
+
+# === PROTECCIÓN CONTRA ESTAMPIDAS ===
+# get_or_compute guarda el valor junto a su expiración blanda (el timeout
+# pedido) y lo mantiene en caché CACHE_STALE_TTL segundos más. Vencida la
+# expiración blanda, un solo proceso toma el lock de recálculo (cache.add) y
+# el resto sigue sirviendo el valor anterior. Antes de vencer, cada lectura
+# puede adelantar el recálculo con probabilidad creciente (XFetch), en
+# proporción a lo que tardó el último cálculo.
+LOCK_KEY_PREFIX = 'cachelock'
+
+
+class ContadoresPorGrupo:
+    """Contadores de eventos por grupo, del proceso y seguros entre hilos (para /health)."""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(Counter)
+    
+    def contar(self, grupo, evento):
+        with self._lock:
+            self._contadores[grupo][evento] += 1
+    
+    def leer(self, reset=False):
+        """Copia de los contadores {grupo: Counter}; reset=True los reinicia tras leerlos."""
+        with self._lock:
+            resultado = {grupo: Counter(contador) for grupo, contador in self._contadores.items()}
+            if reset:
+                self._contadores.clear()
+        return resultado
+
+
+_stats = ContadoresPorGrupo()
+
+
+class CacheEntry:
+    """Valor cacheado con su expiración blanda y el costo del último cálculo."""
+    
+    __slots__ = ('value', 'soft_expires', 'delta')
+    
+    def __init__(self, value, soft_expires, delta):
+        self.value = value
+        self.soft_expires = soft_expires
+        self.delta = delta
+    
+    def __getstate__(self):
+        return (self.value, self.soft_expires, self.delta)
+    
+    def __setstate__(self, state):
+        self.value, self.soft_expires, self.delta = state
+
+
+def cache_stats(reset=False):
+    """
+    Contadores de aciertos/fallos de get_or_compute por grupo (del proceso).
+    
+    Eventos: hit, miss, stale (valor vencido servido mientras otro proceso
+    recalcula), early (recálculo anticipado), refresh (recálculo tras la
+    expiración blanda), wait (fallo resuelto esperando a otro proceso) y
+    background (recálculo encolado en Celery).
+    
+    Args:
+        reset (bool): Reinicia los contadores tras leerlos
+    
+    Returns:
+        dict: {grupo: {evento: n, 'hit_ratio': float}}
+    """
+    resultado = {}
+    for grupo, contador in _stats.leer(reset=reset).items():
+        datos = dict(contador)
+        lecturas = sum(contador.values()) - contador['background']
+        servidos = contador['hit'] + contador['stale'] + contador['wait']
+        datos['hit_ratio'] = round(servidos / lecturas, 4) if lecturas else 0.0
+        resultado[grupo] = datos
+    return resultado
+
+
+def _lock_key(key):
+    return f'{LOCK_KEY_PREFIX}:{key}'
+
+
+def _acquire_lock(key):
+    return cache.add(_lock_key(key), 1, getattr(settings, 'CACHE_LOCK_TIMEOUT', 30))
+
+
+def _release_lock(key):
+    cache.delete(_lock_key(key))
+
+
+def _expira_anticipado(entrada, ahora):
+    """XFetch: adelanta el recálculo con probabilidad creciente cerca del vencimiento."""
+    beta = getattr(settings, 'CACHE_EARLY_EXPIRATION_BETA', 1.0)
+    if beta <= 0 or entrada.delta <= 0:
+        return False
+    return ahora - entrada.delta * beta * math.log(1.0 - random.random()) >= entrada.soft_expires
+
+
+def _store_entry(key, value, timeout, delta, stale_ttl=None):
+    if stale_ttl is None:
+        stale_ttl = getattr(settings, 'CACHE_STALE_TTL', 60)
+    if timeout is None:
+        cache.set(key, CacheEntry(value, math.inf, delta), None)
+    else:
+        cache.set(key, CacheEntry(value, time.time() + timeout, delta), timeout + stale_ttl)
+
+
+def _compute_and_store(key, callback, timeout, stale_ttl=None, release_lock=True):
+    inicio = time.monotonic()
+    try:
+        value = callback()
+        _store_entry(key, value, timeout, time.monotonic() - inicio, stale_ttl)
+    finally:
+        if release_lock:
+            _release_lock(key)
+    return value
+
+
+def _wait_for_entry(key):
+    """Espera a que el proceso que tiene el lock publique el valor."""
+    limite = time.monotonic() + getattr(settings, 'CACHE_LOCK_WAIT_MS', 500) / 1000
+    while time.monotonic() < limite:
+        time.sleep(0.025)
+        entrada = cache.get(key)
+        if isinstance(entrada, CacheEntry):
+            return entrada
+    return None
+
+
+def get_or_compute(key, callback, timeout, group='default', stale_ttl=None, refresher=None):
+    """
+    Obtiene del caché o calcula con protección contra estampidas.
+    
+    Args:
+        key (str): Clave de caché
+        callback (callable): Función que calcula el valor
+        timeout (int): Expiración blanda en segundos (None = sin expiración)
+        group (str): Grupo para los contadores de cache_stats()
+        stale_ttl (int): Segundos extra que se conserva el valor vencido
+            (default: settings.CACHE_STALE_TTL)
+        refresher (callable): Encola el recálculo en segundo plano; recibe la
+            clave y debe liberar el lock al terminar. Si falla, se recalcula
+            en línea.
+    
+    Returns:
+        Valor cacheado o resultado del callback
+    """
+    entrada = cache.get(key)
+    
+    if entrada is not None and not isinstance(entrada, CacheEntry):
+        # Valor guardado con set() plano: sin expiración blanda
+        _stats.contar(group, 'hit')
+        return entrada
+    
+    if entrada is not None:
+        ahora = time.time()
+        vencida = ahora >= entrada.soft_expires
+        if not vencida and not _expira_anticipado(entrada, ahora):
+            _stats.contar(group, 'hit')
+            return entrada.value
+        if not _acquire_lock(key):
+            _stats.contar(group, 'stale')
+            logger.debug("cache_stale", key=key)
+            return entrada.value
+        _stats.contar(group, 'refresh' if vencida else 'early')
+        if refresher is not None:
+            try:
+                refresher(key)
+                _stats.contar(group, 'background')
+                return entrada.value
+            except Exception as e:
+                logger.warning("cache_refresh_encolado_fallido", key=key, error=str(e))
+        return _compute_and_store(key, callback, timeout, stale_ttl)
+    
+    _stats.contar(group, 'miss')
+    logger.debug("cache_miss", key=key)
+    if _acquire_lock(key):
+        return _compute_and_store(key, callback, timeout, stale_ttl)
+    
+    entrada = _wait_for_entry(key)
+    if entrada is not None:
+        _stats.contar(group, 'wait')
+        return entrada.value
+    # El dueño del lock tarda demasiado: calcular sin tocar su lock
+    return _compute_and_store(key, callback, timeout, stale_ttl, release_lock=False)
+
+
+def cache_response(timeout=300, key_prefix='view', tags=None):
     """
     Decorador para cachear respuestas de vistas/funciones.
     
     Args:
         timeout (int): Tiempo de vida del caché en segundos (default: 5 minutos)
         key_prefix (str): Prefijo de la clave de caché
+        tags (list): Tags del grupo; invalidate_tags(tag) descarta estas respuestas
+    
+    Con protección contra estampidas: al vencer, un solo proceso recalcula
+    (ver get_or_compute).
     
     Usage:
-        @cache_response(timeout=600, key_prefix='trabajadores')
+        @cache_response(timeout=600, key_prefix='trabajadores', tags=['trabajadores'])
         def listar_trabajadores(request):
             ...
     """
@@ -61,20 +330,10 @@ def cache_response(timeout=300, key_prefix='view'):
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Generar clave de caché
-            cache_key = generate_cache_key(key_prefix, *args, **kwargs)
-            
-            # Intentar obtener del caché
-            cached_result = cache.get(cache_key)
-            if cached_result is not None:
-                logger.debug("cache_hit", key=cache_key)
-                return cached_result
+            cache_key = tagged_key(generate_cache_key(key_prefix, *args, **kwargs), tags)
             
-            # Ejecutar función y cachear resultado
-            logger.debug("cache_miss", key=cache_key)
-            result = func(*args, **kwargs)
-            cache.set(cache_key, result, timeout)
-            
-            return result
+            # Obtener del caché o ejecutar función (un solo recálculo por clave)
+            return get_or_compute(cache_key, lambda: func(*args, **kwargs), timeout, group=key_prefix)
         return wrapper
     return decorator
 
@@ -93,27 +352,81 @@ def invalidate_cache(key_prefix, *args, **kwargs):
     logger.info("cache_invalidated", key=cache_key)
 
 
-def invalidate_pattern(pattern):
+def get_redis_connection_or_none(alias='default'):
+    """
+    Cliente Redis crudo si la caché es django-redis; None en otro caso.
+    """
+    if 'django_redis' not in type(caches[alias]).__module__:
+        return None
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection(alias)
+    except Exception as e:
+        logger.debug("redis_no_disponible", error=str(e))
+        return None
+
+
+def suscribir_canal(redis_conn, canal):
+    """Suscripción pub/sub a un canal lógico (con el prefijo de claves de la caché)."""
+    pubsub = redis_conn.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(cache.make_key(canal))
+    return pubsub
+
+
+def leer_mensaje(pubsub, timeout):
+    """
+    Siguiente mensaje JSON de una suscripción, o None si no llegó ninguno en `timeout` s.
+    
+    Se usa get_message con timeout corto en vez de listen(): listen() bloquea
+    sin límite y chocaría con el SOCKET_TIMEOUT de la conexión.
+    """
+    mensaje = pubsub.get_message(timeout=timeout)
+    if mensaje and mensaje['type'] == 'message':
+        return json.loads(mensaje['data'])
+    return None
+
+
+def invalidate_pattern(pattern, batch_size=500):
     """
     Invalida todas las claves que coincidan con un patrón.
     
+    Recorre el keyspace con SCAN incremental (nunca KEYS, que bloquea el
+    servidor que también atiende sesiones y Celery) y borra con UNLINK por
+    lotes, liberando la memoria fuera del hilo principal de Redis. Para
+    invalidaciones frecuentes preferir tags (invalidate_tags), que son O(1).
+    
     Args:
-        pattern (str): Patrón de claves a invalidar (ej: 'trabajadores:*')
+        pattern (str): Patrón de claves a invalidar (ej: 'trabajadores:*'),
+            sin el prefijo/versión que agrega Django
+        batch_size (int): Claves por iteración de SCAN y por UNLINK
+    
+    Returns:
+        int: Claves eliminadas
     
     Note:
         Requiere Redis como backend. No funciona con cache local.
     """
+    redis_conn = get_redis_connection_or_none()
+    if redis_conn is None:
+        logger.warning("redis_no_disponible_para_invalidacion_patron", pattern=pattern)
+        return 0
+    
+    eliminadas = 0
+    lote = []
     try:
-        from django_redis import get_redis_connection
-        redis_conn = get_redis_connection("default")
-        keys = redis_conn.keys(pattern)
-        if keys:
-            redis_conn.delete(*keys)
-            logger.info("cache_pattern_invalidated", pattern=pattern, count=len(keys))
-    except ImportError:
-        logger.warning("redis_no_disponible_para_invalidacion_patron")
+        for clave in redis_conn.scan_iter(match=cache.make_key(pattern), count=batch_size):
+            lote.append(clave)
+            if len(lote) >= batch_size:
+                eliminadas += redis_conn.unlink(*lote)
+                lote = []
+        if lote:
+            eliminadas += redis_conn.unlink(*lote)
     except Exception as e:
-        logger.error("error_invalidando_patron", pattern=pattern, error=str(e))
+        logger.error("error_invalidando_patron", pattern=pattern, error=str(e), eliminadas=eliminadas)
+        return eliminadas
+    
+    logger.info("cache_pattern_invalidated", pattern=pattern, count=eliminadas)
+    return eliminadas
 
 
 def cache_model_instance(model_name, instance_id, timeout=3600):
@@ -173,15 +486,17 @@ class CacheManager:
         'parametros': 3600,  # 1 hora
         'reportes': 600,  # 10 minutos
         'estadisticas': 300,  # 5 minutos
+        'metricas': 15,  # panel de guardia (los deltas llegan por SSE)
     }
     
     @classmethod
-    def get(cls, key, default=None):
-        """Obtiene valor del caché."""
-        return cache.get(key, default)
+    def get(cls, key, default=None, tags=None):
+        """Obtiene valor del caché (de la generación vigente si se indican tags)."""
+        value = cache.get(tagged_key(key, tags), default)
+        return value.value if isinstance(value, CacheEntry) else value
     
     @classmethod
-    def set(cls, key, value, timeout=None, cache_type='default'):
+    def set(cls, key, value, timeout=None, cache_type='default', tags=None):
         """
         Guarda valor en caché con timeout apropiado.
         
@@ -190,21 +505,24 @@ class CacheManager:
             value: Valor a cachear
             timeout (int): Timeout personalizado (opcional)
             cache_type (str): Tipo de dato para timeout automático
+            tags (list): Tags del grupo (opcional)
         """
         if timeout is None:
             timeout = cls.TIMEOUTS.get(cache_type, 300)
         
+        key = tagged_key(key, tags)
         cache.set(key, value, timeout)
         logger.debug("cache_set", key=key, timeout=timeout)
     
     @classmethod
-    def delete(cls, key):
+    def delete(cls, key, tags=None):
         """Elimina valor del caché."""
+        key = tagged_key(key, tags)
         cache.delete(key)
         logger.debug("cache_deleted", key=key)
     
     @classmethod
-    def get_or_set(cls, key, callback, timeout=None, cache_type='default'):
+    def get_or_set(cls, key, callback, timeout=None, cache_type='default', tags=None):
         """
         Obtiene del caché o ejecuta callback y cachea resultado.
         
@@ -212,24 +530,54 @@ class CacheManager:
             key (str): Clave de caché
             callback (callable): Función a ejecutar si no existe en caché
             timeout (int): Timeout personalizado (opcional)
-            cache_type (str): Tipo de dato
+            cache_type (str): Tipo de dato (también agrupa los contadores de stats())
+            tags (list): Tags del grupo (opcional)
         
         Returns:
             Valor cacheado o resultado del callback
-        """
-        value = cache.get(key)
-        if value is not None:
-            logger.debug("cache_hit", key=key)
-            return value
-        
-        logger.debug("cache_miss", key=key)
-        value = callback()
         
+        Note:
+            Protegido contra estampidas (ver get_or_compute). Las claves de
+            settings.CACHE_HOT_KEYS se recalculan en Celery mientras se sigue
+            sirviendo el valor anterior.
+        """
         if timeout is None:
             timeout = cls.TIMEOUTS.get(cache_type, 300)
         
-        cache.set(key, value, timeout)
-        return value
+        refresher = None
+        if key in getattr(settings, 'CACHE_HOT_KEYS', {}):
+            def refresher(_clave):
+                from totem.tasks import refrescar_cache_caliente
+                refrescar_cache_caliente.delay(key)
+        
+        return get_or_compute(tagged_key(key, tags), callback, timeout, group=cache_type, refresher=refresher)
+    
+    @classmethod
+    def refresh_hot_key(cls, key):
+        """
+        Recalcula una clave caliente de settings.CACHE_HOT_KEYS y libera su lock.
+        
+        Args:
+            key (str): Clave configurada en CACHE_HOT_KEYS
+        
+        Returns:
+            Valor recalculado
+        """
+        config = settings.CACHE_HOT_KEYS[key]
+        cache_type = config.get('cache_type', 'default')
+        timeout = config.get('timeout', cls.TIMEOUTS.get(cache_type, 300))
+        callback = import_string(config['callback'])
+        return _compute_and_store(tagged_key(key, config.get('tags')), callback, timeout)
+    
+    @classmethod
+    def stats(cls, reset=False):
+        """Contadores hit/miss/stale por tipo de dato (ver cache_stats)."""
+        return cache_stats(reset=reset)
+    
+    @classmethod
+    def invalidate_tags(cls, *tags):
+        """Invalida todas las entradas de los tags dados (O(1) por tag)."""
+        invalidate_tags(*tags)
     
     @classmethod
     def clear_all(cls):
@@ -251,6 +599,25 @@ def get_cached_trabajador(rut):
     return cache.get(key)
 
 
+def invalidate_trabajador(*ruts):
+    """Invalida trabajador y consulta de beneficio del tótem para los RUTs dados."""
+    claves = [f'trabajador:rut:{rut}' for rut in ruts] + [f'kiosko:beneficio:{rut}' for rut in ruts]
+    if claves:
+        cache.delete_many(claves)
+
+
+def cache_beneficio_kiosko(rut, data, timeout=300):
+    """Cachea la respuesta de beneficio del tótem por RUT canónico."""
+    key = f'kiosko:beneficio:{rut}'
+    cache.set(key, data, timeout)
+
+
+def get_cached_beneficio_kiosko(rut):
+    """Obtiene respuesta de beneficio del tótem cacheada."""
+    key = f'kiosko:beneficio:{rut}'
+    return cache.get(key)
+
+
 def cache_ciclo_activo(ciclo, timeout=1800):
     """Cachea ciclo activo."""
     key = 'ciclo:activo'
@@ -264,8 +631,9 @@ def get_cached_ciclo_activo():
 
 
 def invalidate_ciclo_activo():
-    """Invalida caché de ciclo activo."""
+    """Invalida caché de ciclo activo (también la de configuración de cada worker)."""
     cache.delete('ciclo:activo')
+    invalidate_config('ciclo:activo')
 
 
 def cache_stock_resumen(data, timeout=60):
@@ -278,3 +646,246 @@ def get_cached_stock_resumen():
     """Obtiene resumen de stock cacheado."""
     key = 'stock:resumen'
     return cache.get(key)
+
+
+def invalidate_stock_resumen():
+    """Invalida caché de resumen de stock."""
+    cache.delete('stock:resumen')
+
+
+# === CONFIGURACIÓN CASI ESTÁTICA (DOS NIVELES) ===
+# Ciclo activo, parámetros operativos, sucursales y catálogo de beneficios
+# cambian pocas veces al mes pero se leen en casi cada request del tótem y
+# del guardia. get_config las sirve desde un LRU acotado en memoria de cada
+# worker, con Redis como segundo nivel. Las invalidaciones (signals) borran
+# ambos niveles y se publican por Redis pub/sub para que los demás procesos
+# descarten su copia local; CONFIG_LOCAL_TTL acota lo que dura una copia si
+# se pierde un mensaje o no hay Redis. En Redis cada clave va ligada a una
+# generación (tag 'config:<clave>', como en tagged_key): un loader que leyó la
+# base antes del commit escribe en la generación anterior y nadie lo vuelve a
+# leer, en vez de dejar el valor viejo CONFIG_CACHE_TTL segundos.
+CONFIG_KEY_PREFIX = 'config'
+CONFIG_CHANNEL = 'config:invalidaciones'
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """LRU en memoria del proceso, acotado en tamaño y con TTL por entrada."""
+    
+    def __init__(self, maxsize=256, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._datos.get(key)
+            if item is None:
+                return default
+            expira, value = item
+            if expira <= time.monotonic():
+                del self._datos[key]
+                return default
+            self._datos.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._datos[key] = (time.monotonic() + self.ttl, value)
+            self._datos.move_to_end(key)
+            while len(self._datos) > self.maxsize:
+                self._datos.popitem(last=False)
+    
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._datos.pop(key, None)
+    
+    def clear(self):
+        with self._lock:
+            self._datos.clear()
+    
+    def __len__(self):
+        return len(self._datos)
+
+
+_config_local = None
+_config_pid = None
+_config_init_lock = threading.Lock()
+
+
+def _get_config_local():
+    """LRU del proceso; se recrea tras un fork (gunicorn) junto con su suscriptor."""
+    global _config_local, _config_pid
+    if _config_pid != os.getpid():
+        with _config_init_lock:
+            if _config_pid != os.getpid():
+                _config_local = LocalLRUCache(
+                    maxsize=getattr(settings, 'CONFIG_LOCAL_MAXSIZE', 256),
+                    ttl=getattr(settings, 'CONFIG_LOCAL_TTL', 60),
+                )
+                _config_pid = os.getpid()
+                _iniciar_suscriptor_config()
+    return _config_local
+
+
+# Otros frentes locales (ej: el Bloom de NonceStore) también escuchan
+# CONFIG_CHANNEL: cada oyente recibe la lista de claves publicada, o None si
+# la suscripción se (re)conectó y pudo perderse algún mensaje.
+_oyentes_invalidacion = []
+
+
+def registrar_oyente_invalidaciones(oyente):
+    """Registra oyente(claves) para las invalidaciones publicadas por cualquier proceso."""
+    if oyente not in _oyentes_invalidacion:
+        _oyentes_invalidacion.append(oyente)
+
+
+def asegurar_suscriptor_invalidaciones():
+    """Arranca en este proceso (una vez, y de nuevo tras un fork) el hilo suscrito a CONFIG_CHANNEL."""
+    _get_config_local()
+
+
+def publicar_invalidacion(claves):
+    """Publica claves invalidadas para que los demás procesos descarten su copia local."""
+    redis_conn = get_redis_connection_or_none()
+    if redis_conn is None:
+        return
+    try:
+        redis_conn.publish(cache.make_key(CONFIG_CHANNEL), json.dumps(list(claves)))
+    except Exception as e:
+        logger.warning("config_publicacion_fallida", keys=list(claves), error=str(e))
+
+
+def _notificar_oyentes(claves):
+    for oyente in list(_oyentes_invalidacion):
+        try:
+            oyente(claves)
+        except Exception as e:
+            logger.warning("oyente_invalidacion_fallido", error=str(e))
+
+
+def _iniciar_suscriptor_config():
+    if get_redis_connection_or_none() is None:
+        return
+    hilo = threading.Thread(target=_escuchar_invalidaciones_config, name='config-cache-pubsub', daemon=True)
+    hilo.start()
+
+
+def _escuchar_invalidaciones_config():
+    """Aplica al LRU local las invalidaciones publicadas por otros procesos."""
+    pid = os.getpid()
+    espera = 1
+    while _config_pid == pid:
+        try:
+            pubsub = suscribir_canal(get_redis_connection_or_none(), CONFIG_CHANNEL)
+            # Lo publicado mientras no había suscripción se perdió: partir de cero
+            _config_local.clear()
+            _notificar_oyentes(None)
+            espera = 1
+            while _config_pid == pid:
+                claves = leer_mensaje(pubsub, timeout=1.0)
+                if claves is not None:
+                    _config_local.delete(*claves)
+                    _notificar_oyentes(claves)
+        except Exception as e:
+            logger.warning("config_pubsub_desconectado", error=str(e), reintento_en=espera)
+            time.sleep(espera)
+            espera = min(espera * 2, 30)
+
+
+def get_config(key, loader, timeout=None):
+    """
+    Obtiene un valor de configuración: LRU local, luego Redis, luego loader().
+    
+    Los valores se comparten entre hilos del worker: tratarlos como de solo
+    lectura. None es un valor válido (ej: sin ciclo activo) y también se cachea.
+    
+    Args:
+        key (str): Clave lógica (ej: 'ciclo:activo')
+        loader (callable): Lee el valor de la base de datos
+        timeout (int): TTL en Redis (default: settings.CONFIG_CACHE_TTL)
+    
+    Returns:
+        Valor de configuración
+    """
+    local = _get_config_local()
+    value = local.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    
+    # La generación se lee antes del loader (ver comentario de la sección)
+    redis_key = tagged_key(f'{CONFIG_KEY_PREFIX}:{key}', [f'{CONFIG_KEY_PREFIX}:{key}'])
+    # En Redis se envuelve en tupla para distinguir None de un fallo
+    envuelto = cache.get(redis_key)
+    if envuelto is None:
+        envuelto = (loader(),)
+        if timeout is None:
+            timeout = getattr(settings, 'CONFIG_CACHE_TTL', 3600)
+        cache.set(redis_key, envuelto, timeout)
+    
+    local.set(key, envuelto[0])
+    return envuelto[0]
+
+
+def invalidate_config(*keys):
+    """
+    Invalida claves de configuración en Redis, en este proceso y (pub/sub) en
+    los demás workers. Llamar tras el commit (transaction.on_commit).
+    
+    Args:
+        *keys: Claves lógicas (ej: 'sucursales')
+    """
+    if not keys:
+        return
+    invalidate_tags(*(f'{CONFIG_KEY_PREFIX}:{key}' for key in keys))
+    _get_config_local().delete(*keys)
+    publicar_invalidacion(keys)
+    logger.info("config_invalidated", keys=list(keys))
+
+
+def reset_local_config():
+    """Vacía el LRU de configuración de este proceso (tests)."""
+    _get_config_local().clear()
+
+
+def get_ciclo_activo():
+    """Ciclo activo (o None) desde la caché de configuración."""
+    from .models import Ciclo
+    return get_config('ciclo:activo', lambda: Ciclo.objects.filter(activo=True).order_by('-id').first())
+
+
+def get_parametros_operativos():
+    """Parámetros operativos ordenados por clave."""
+    from .models import ParametroOperativo
+    return get_config('parametros', lambda: list(ParametroOperativo.objects.order_by('clave')))
+
+
+def get_parametro(clave, default=None):
+    """Valor (str) de un parámetro operativo o default si no existe."""
+    for parametro in get_parametros_operativos():
+        if parametro.clave == clave:
+            return parametro.valor
+    return default
+
+
+def get_sucursales():
+    """Sucursales ordenadas por nombre."""
+    from .models import Sucursal
+    return get_config('sucursales', lambda: list(Sucursal.objects.order_by('nombre')))
+
+
+def get_sucursal_por_codigo(codigo):
+    """Sucursal con el código dado o None."""
+    return next((s for s in get_sucursales() if s.codigo == codigo), None)
+
+
+def get_catalogo_beneficios():
+    """Tipos de beneficio con sus cajas precargadas (beneficio.cajas.all())."""
+    from .models import TipoBeneficio
+    return get_config(
+        'catalogo_beneficios',
+        lambda: list(TipoBeneficio.objects.prefetch_related('cajas')),
+    )
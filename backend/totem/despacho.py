@@ -0,0 +1,45 @@
+"""
+Despacho de trabajos en segundo plano.
+
+Encola una tarea de totem.tasks en Celery y, si Celery no está instalado o el
+broker no responde, ejecuta el trabajo en un thread daemon del proceso para no
+bloquear el request.
+"""
+import logging
+import threading
+from concurrent.futures import Executor
+from typing import Callable, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def despachar_tarea(nombre_tarea: str, args: Sequence, en_thread: Callable, descripcion: str,
+                    pool: Optional[Executor] = None):
+    """
+    Encola totem.tasks.<nombre_tarea>(*args) o ejecuta en_thread(*args) como fallback.
+
+    Se llama desde un callback de transaction.on_commit, de modo que el
+    trabajo nunca ve datos de una transacción revertida.
+
+    Args:
+        nombre_tarea: Nombre de la tarea en totem.tasks
+        args: Argumentos de la tarea (y de en_thread)
+        en_thread: Función a ejecutar en el thread local (cierra sus conexiones)
+        descripcion: Texto para el log ("carga de nómina 12")
+        pool: Executor acotado para el fallback; sin él, un thread daemon por
+            trabajo (sirve para jobs esporádicos, no para uno por request)
+
+    Returns:
+        AsyncResult de Celery, o None si se usó el thread local
+    """
+    try:
+        from totem import tasks
+        return getattr(tasks, nombre_tarea).delay(*args)
+    except Exception as e:
+        logger.warning(f"Broker no disponible para {descripcion} ({e}); usando thread local")
+        if pool is not None:
+            pool.submit(en_thread, *args)
+        else:
+            threading.Thread(target=en_thread, args=tuple(args), daemon=True).start()
+        return None
+
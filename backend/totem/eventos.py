@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Canal de eventos en tiempo real para los paneles de guardia (SSE).
+
+Los signals de totem/signals.py (ticket_creado, ticket_validado,
+incidencia_creada, stock_bajo, ...) publican tras el commit un delta compacto
+con publicar_evento(). Con Redis como caché los eventos viajan por pub/sub
+(los reciben todos los workers) y quedan en un buffer acotado, para que un
+cliente que se reconecta con Last-Event-ID recupere lo que se perdió. Sin
+Redis (desarrollo/tests) se usa un bus en memoria del proceso.
+"""
+import json
+import queue
+import threading
+import time
+from collections import deque
+
+import structlog
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import get_redis_connection_or_none, leer_mensaje, suscribir_canal
+
+logger = structlog.get_logger(__name__)
+
+EVENTOS_CHANNEL = 'eventos:guardia'
+EVENTOS_BUFFER_KEY = 'eventos:guardia:buffer'
+EVENTOS_SEQ_KEY = 'eventos:guardia:seq'
+
+# KEYS: contador, buffer; ARGV: evento JSON sin id, tamaño del buffer, canal.
+# ID, buffer y PUBLISH en un solo paso atómico: dos publicadores concurrentes
+# no pueden dejar el evento 5 antes que el 4 en el buffer ni en el canal.
+PUBLICAR_LUA = """
+local id = redis.call('INCR', KEYS[1])
+local payload = '{"id":' .. id .. ',' .. string.sub(ARGV[1], 2)
+redis.call('RPUSH', KEYS[2], payload)
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call('PUBLISH', ARGV[3], payload)
+return id
+"""
+
+_scripts = {}
+
+
+def _buffer_size():
+    return getattr(settings, 'EVENTOS_BUFFER_SIZE', 500)
+
+
+def _nuevo_evento(evento_id, tipo, datos):
+    return {'id': evento_id, 'tipo': tipo, 'ts': timezone.now().isoformat(), 'datos': datos}
+
+
+class _BusLocal:
+    """Bus en memoria del proceso (sin Redis)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._buffer = deque(maxlen=_buffer_size())
+        self._suscriptores = set()
+
+    def publicar(self, tipo, datos):
+        with self._lock:
+            self._seq += 1
+            evento = _nuevo_evento(self._seq, tipo, datos)
+            self._buffer.append(evento)
+            suscriptores = list(self._suscriptores)
+        for cola in suscriptores:
+            try:
+                cola.put_nowait(evento)
+            except queue.Full:
+                # Cliente lento: lo recuperará por Last-Event-ID al reconectar
+                pass
+        return evento
+
+    def suscribir(self):
+        cola = queue.Queue(maxsize=1000)
+        with self._lock:
+            self._suscriptores.add(cola)
+        return _SuscripcionLocal(self, cola)
+
+    def recientes(self):
+        with self._lock:
+            return list(self._buffer)
+
+    def ultimo_id(self):
+        with self._lock:
+            return self._seq
+
+
+class _SuscripcionLocal:
+    def __init__(self, bus, cola):
+        self._bus = bus
+        self._cola = cola
+
+    def siguiente(self, timeout):
+        try:
+            return self._cola.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def cerrar(self):
+        with self._bus._lock:
+            self._bus._suscriptores.discard(self._cola)
+
+
+class _BusRedis:
+    """Bus sobre Redis: contador global de IDs, buffer acotado (lista) y pub/sub."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def publicar(self, tipo, datos):
+        script = _scripts.get(id(self._conn))
+        if script is None:
+            script = _scripts[id(self._conn)] = self._conn.register_script(PUBLICAR_LUA)
+        evento = _nuevo_evento(None, tipo, datos)
+        del evento['id']
+        evento_id = script(
+            keys=[cache.make_key(EVENTOS_SEQ_KEY), cache.make_key(EVENTOS_BUFFER_KEY)],
+            args=[
+                json.dumps(evento, separators=(',', ':'), default=str),
+                _buffer_size(),
+                cache.make_key(EVENTOS_CHANNEL),
+            ],
+        )
+        return {'id': evento_id, **evento}
+
+    def suscribir(self):
+        return _SuscripcionRedis(suscribir_canal(self._conn, EVENTOS_CHANNEL))
+
+    def recientes(self):
+        return [json.loads(fila) for fila in self._conn.lrange(cache.make_key(EVENTOS_BUFFER_KEY), 0, -1)]
+
+    def ultimo_id(self):
+        return int(self._conn.get(cache.make_key(EVENTOS_SEQ_KEY)) or 0)
+
+
+class _SuscripcionRedis:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    def siguiente(self, timeout):
+        return leer_mensaje(self._pubsub, timeout)
+
+    def cerrar(self):
+        self._pubsub.close()
+
+
+_bus_local = _BusLocal()
+
+
+def _bus():
+    redis_conn = get_redis_connection_or_none()
+    return _BusRedis(redis_conn) if redis_conn is not None else _bus_local
+
+
+def publicar_evento(tipo, datos):
+    """
+    Publica un evento para los paneles de guardia. Llamar tras el commit.
+
+    Un fallo al publicar se registra y no interrumpe la operación de negocio:
+    los clientes se resincronizan al reconectar.
+
+    Args:
+        tipo (str): Tipo de evento (ej: 'ticket_creado')
+        datos (dict): Delta serializable a JSON
+
+    Returns:
+        dict or None: Evento publicado {'id', 'tipo', 'ts', 'datos'}
+    """
+    try:
+        return _bus().publicar(tipo, datos)
+    except Exception as e:
+        logger.warning("evento_no_publicado", tipo=tipo, error=str(e))
+        return None
+
+
+def ultimo_evento_id():
+    """
+    ID del último evento publicado (0 si aún no hay o el bus no responde).
+
+    Los snapshots REST lo incluyen para que el cliente aplique encima solo
+    los eventos con ID mayor.
+    """
+    try:
+        return _bus().ultimo_id()
+    except Exception as e:
+        logger.warning("evento_id_no_disponible", error=str(e))
+        return 0
+
+
+def eventos_desde(ultimo_id):
+    """
+    Eventos del buffer posteriores a ultimo_id.
+
+    Returns:
+        list or None: None si el buffer ya no cubre ese ID (o el contador se
+            reinició): el cliente debe resincronizar con los endpoints REST
+    """
+    recientes = _bus().recientes()
+    if not recientes:
+        return [] if ultimo_id == 0 else None
+    if ultimo_id < recientes[0]['id'] - 1 or ultimo_id > recientes[-1]['id']:
+        return None
+    return [evento for evento in recientes if evento['id'] > ultimo_id]
+
+
+def formatear_sse(evento):
+    """Serializa un evento en formato text/event-stream."""
+    datos = json.dumps(evento['datos'], separators=(',', ':'), default=str)
+    return f"id: {evento['id']}\nevent: {evento['tipo']}\ndata: {datos}\n\n"
+
+
+def stream_eventos(ultimo_id=None, duracion=None, heartbeat=None):
+    """
+    Generador text/event-stream para StreamingHttpResponse.
+
+    Se suscribe antes de reenviar lo pendiente (desde ultimo_id) para no perder
+    eventos entre ambos pasos, descarta duplicados por ID y emite un
+    comentario de latido cuando no hay tráfico. Termina tras `duracion`
+    segundos; el navegador reconecta solo y continúa con Last-Event-ID.
+
+    Args:
+        ultimo_id (int): ID del último evento recibido por el cliente
+        duracion (int): Segundos máximos de la conexión (default: settings.EVENTOS_SSE_MAX_SECONDS)
+        heartbeat (int): Segundos entre latidos (default: settings.EVENTOS_SSE_HEARTBEAT_SECONDS)
+    """
+    if duracion is None:
+        duracion = getattr(settings, 'EVENTOS_SSE_MAX_SECONDS', 300)
+    if heartbeat is None:
+        heartbeat = getattr(settings, 'EVENTOS_SSE_HEARTBEAT_SECONDS', 15)
+
+    suscripcion = _bus().suscribir()
+    try:
+        yield f"retry: {getattr(settings, 'EVENTOS_SSE_RETRY_MS', 3000)}\n\n"
+
+        enviado = 0
+        if ultimo_id is not None:
+            pendientes = eventos_desde(ultimo_id)
+            if pendientes is None:
+                yield "event: resync\ndata: {}\n\n"
+            else:
+                enviado = ultimo_id
+                for evento in pendientes:
+                    yield formatear_sse(evento)
+                    enviado = evento['id']
+
+        limite = time.monotonic() + duracion
+        ultimo_envio = time.monotonic()
+        while time.monotonic() < limite:
+            evento = suscripcion.siguiente(timeout=min(1.0, max(limite - time.monotonic(), 0)))
+            if evento is not None and evento['id'] > enviado:
+                yield formatear_sse(evento)
+                enviado = evento['id']
+                ultimo_envio = time.monotonic()
+            elif time.monotonic() - ultimo_envio >= heartbeat:
+                yield ": ping\n\n"
+                ultimo_envio = time.monotonic()
+    finally:
+        suscripcion.cerrar()
@@ -1,15 +1,144 @@
 # -*- coding: utf-8 -*-
 """
-Utilidades para exportación de datos a Excel (XLSX).
+Utilidades para exportación de datos a Excel (XLSX) y CSV.
 Provee funciones helper para generar reportes descargables.
+
+Las exportaciones de filas usan openpyxl en modo write-only (las filas se
+vuelcan a un archivo temporal, no a un workbook en memoria) y se entregan
+con FileResponse; el CSV se genera línea a línea para StreamingHttpResponse.
 """
+import csv
+import tempfile
 from io import BytesIO
-from django.http import HttpResponse
+from django.http import FileResponse, HttpResponse
 from django.utils import timezone
 import structlog
 
 logger = structlog.get_logger(__name__)
 
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class _BufferEco:
+    """Pseudo-archivo para csv.writer: write() retorna la línea en vez de guardarla."""
+
+    def write(self, valor):
+        return valor
+
+
+def filas_a_csv(headers, filas):
+    """
+    Genera un CSV línea a línea (memoria constante).
+    
+    Args:
+        headers (list): Encabezados
+        filas (iterable): Filas (listas de valores)
+    
+    Yields:
+        str: Líneas CSV; la primera incluye BOM UTF-8 para compatibilidad con Excel
+    """
+    writer = csv.writer(_BufferEco())
+    yield '\ufeff' + writer.writerow(headers)
+    for fila in filas:
+        yield writer.writerow(fila)
+
+
+def formatear_valor(valor):
+    """Normaliza un valor para una celda (fechas ISO, booleanos Sí/No, None vacío)."""
+    if hasattr(valor, 'isoformat'):
+        return valor.isoformat()
+    if isinstance(valor, bool):
+        return 'Sí' if valor else 'No'
+    if isinstance(valor, (list, dict)):
+        return str(valor)
+    if valor is None:
+        return ''
+    return valor
+
+
+def exportar_filas_a_excel(filas, filename, headers, sheet_name='Datos', anchos=None, resumen=None):
+    """
+    Exporta filas a XLSX en modo write-only, sin límite de filas.
+    
+    Las filas se escriben a medida que se consumen y el archivo final vive
+    en un temporal que FileResponse envía por bloques y elimina al cerrar.
+    
+    Args:
+        filas (iterable): Filas (listas de valores) a escribir
+        filename (str): Nombre del archivo (sin extensión)
+        headers (list): Encabezados
+        sheet_name (str): Nombre de la hoja de datos
+        anchos (list): Ancho fijo por columna (por defecto según encabezado)
+        resumen (dict): Estadísticas para una hoja "Resumen" (opcional)
+    
+    Returns:
+        FileResponse: Archivo Excel para descarga
+    """
+    try:
+        from openpyxl import Workbook
+        from openpyxl.cell import WriteOnlyCell
+        from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
+        from openpyxl.utils import get_column_letter
+    except ImportError:
+        logger.error("openpyxl_no_instalado")
+        raise ImportError("openpyxl no está instalado. Ejecuta: pip install openpyxl")
+    
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    
+    if anchos is None:
+        anchos = [min(max(len(str(h)) + 2, 10), 50) for h in headers]
+    for col, ancho in enumerate(anchos, start=1):
+        ws.column_dimensions[get_column_letter(col)].width = ancho
+    
+    # Encabezados con el mismo estilo que aplicar_estilos_header
+    border_side = Side(style='thin', color="000000")
+    encabezados = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
+        cell.font = Font(bold=True, color="FFFFFF", size=11)
+        cell.alignment = Alignment(horizontal="center", vertical="center")
+        cell.border = Border(left=border_side, right=border_side, top=border_side, bottom=border_side)
+        encabezados.append(cell)
+    ws.append(encabezados)
+    
+    registros = 0
+    for fila in filas:
+        ws.append([formatear_valor(valor) for valor in fila])
+        registros += 1
+    
+    if resumen:
+        ws_resumen = wb.create_sheet('Resumen')
+        ws_resumen.column_dimensions['A'].width = 30
+        ws_resumen.column_dimensions['B'].width = 20
+        titulo = WriteOnlyCell(ws_resumen, value='Resumen')
+        titulo.font = Font(bold=True, size=14)
+        ws_resumen.append([titulo])
+        ws_resumen.append([])
+        for clave, valor in resumen.items():
+            etiqueta = WriteOnlyCell(ws_resumen, value=clave)
+            etiqueta.font = Font(bold=True)
+            ws_resumen.append([etiqueta, formatear_valor(valor)])
+    
+    archivo = tempfile.TemporaryFile()
+    try:
+        wb.save(archivo)
+        archivo.seek(0)
+    except Exception:
+        archivo.close()
+        raise
+    
+    logger.info("exportacion_excel_exitosa", filename=filename, registros=registros)
+    
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return FileResponse(
+        archivo,
+        as_attachment=True,
+        filename=f'{filename}_{timestamp}.xlsx',
+        content_type=CONTENT_TYPE_XLSX,
+    )
+
 
 def crear_response_excel(filename, sheet_name='Datos'):
     """
@@ -102,6 +231,11 @@ def exportar_queryset_a_excel(queryset, filename, headers, campos, sheet_name='D
     """
     Exporta un QuerySet de Django a Excel.
     
+    Recorre el QuerySet con iterator() y escribe en modo write-only
+    (ver exportar_filas_a_excel), por lo que no hay tope de filas. Para
+    volúmenes grandes conviene pasar filas de values_list() directamente
+    a exportar_filas_a_excel y evitar instanciar modelos.
+    
     Args:
         queryset: QuerySet de Django
         filename (str): Nombre del archivo
@@ -110,7 +244,7 @@ def exportar_queryset_a_excel(queryset, filename, headers, campos, sheet_name='D
         sheet_name (str): Nombre de la hoja
     
     Returns:
-        HttpResponse: Archivo Excel para descarga
+        FileResponse: Archivo Excel para descarga
     
     Example:
         >>> from .models import Ticket
@@ -119,61 +253,25 @@ def exportar_queryset_a_excel(queryset, filename, headers, campos, sheet_name='D
         >>> campos = ['uuid', 'estado', lambda t: t.created_at.strftime('%Y-%m-%d')]
         >>> return exportar_queryset_a_excel(qs, 'tickets', headers, campos)
     """
-    logger.info("exportando_a_excel", filename=filename, registros=queryset.count())
+    logger.info("exportando_a_excel", filename=filename)
+    
+    def _valor(obj, campo):
+        if callable(campo):
+            # Lambda o función
+            return campo(obj)
+        if '.' in campo:
+            # Relación (ej: 'trabajador.nombre')
+            valor = obj
+            for parte in campo.split('.'):
+                valor = getattr(valor, parte, '')
+            return valor
+        # Campo directo
+        return getattr(obj, campo, '')
+    
+    filas = ([_valor(obj, campo) for campo in campos] for obj in queryset.iterator())
     
     try:
-        response, buffer, wb = crear_response_excel(filename, sheet_name)
-        ws = wb.active
-        
-        # Escribir encabezados
-        ws.append(headers)
-        
-        # Aplicar estilos a encabezados
-        aplicar_estilos_header(ws, len(headers))
-        
-        # Escribir datos
-        for obj in queryset:
-            row = []
-            for campo in campos:
-                if callable(campo):
-                    # Lambda o función
-                    valor = campo(obj)
-                elif '.' in campo:
-                    # Relación (ej: 'trabajador.nombre')
-                    partes = campo.split('.')
-                    valor = obj
-                    for parte in partes:
-                        valor = getattr(valor, parte, '')
-                else:
-                    # Campo directo
-                    valor = getattr(obj, campo, '')
-                
-                # Formatear valores especiales
-                if hasattr(valor, 'isoformat'):
-                    valor = valor.isoformat()
-                elif isinstance(valor, bool):
-                    valor = 'Sí' if valor else 'No'
-                elif valor is None:
-                    valor = ''
-                
-                row.append(valor)
-            
-            ws.append(row)
-        
-        # Ajustar anchos
-        ajustar_anchos_columnas(ws)
-        
-        # Guardar en buffer
-        wb.save(buffer)
-        buffer.seek(0)
-        
-        # Escribir en response
-        response.write(buffer.getvalue())
-        buffer.close()
-        
-        logger.info("exportacion_excel_exitosa", filename=filename)
-        return response
-        
+        return exportar_filas_a_excel(filas, filename, headers, sheet_name=sheet_name)
     except Exception as e:
         logger.error("error_exportando_excel", error=str(e))
         raise
@@ -2,77 +2,100 @@
 Comando Django para marcar tickets expirados.
 Ejecutar: python manage.py expirar_tickets
 Se puede configurar como cron job para ejecutar cada 5-10 minutos.
+
+La expiración se hace por lotes (UPDATE masivo + bulk_create de eventos)
+mediante ExpiracionService; ver --batch-size y --max-seconds.
 """
 from django.core.management.base import BaseCommand
 from django.utils import timezone
-from totem.models import Ticket, TicketEvent
+from totem.services.expiracion_service import ExpiracionService
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Máximo de tickets listados en modo dry-run
+MAX_LISTADO_DRY_RUN = 50
+
 
 class Command(BaseCommand):
     help = 'Marca como expirados los tickets pendientes que han superado su TTL'
-    
+
     def add_arguments(self, parser):
         parser.add_argument(
             '--dry-run',
             action='store_true',
             help='Muestra los tickets a expirar sin modificar la base de datos',
         )
-    
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Tickets por lote (por defecto settings.TICKET_EXPIRY_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-seconds',
+            type=float,
+            default=None,
+            help='Presupuesto de tiempo en segundos; 0 = sin límite '
+                 '(por defecto settings.TICKET_EXPIRY_MAX_SECONDS)',
+        )
+
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         ahora = timezone.now()
-        
-        # Buscar tickets pendientes con TTL expirado
-        tickets_expirados = Ticket.objects.filter(
-            estado='pendiente',
-            ttl_expira_at__lt=ahora
-        ).select_related('trabajador')
-        
-        cantidad = tickets_expirados.count()
-        
-        if cantidad == 0:
+
+        if dry_run:
+            self._listar_vencidos(ahora)
+            return
+
+        resultado = ExpiracionService.expirar_tickets_vencidos(
+            batch_size=options['batch_size'],
+            max_segundos=options['max_seconds'],
+            ahora=ahora,
+        )
+
+        if resultado['expirados'] == 0:
             self.stdout.write(self.style.SUCCESS('No hay tickets expirados.'))
             return
-        
-        self.stdout.write(f'Encontrados {cantidad} tickets expirados:')
-        
-        for ticket in tickets_expirados:
-            tiempo_expirado = (ahora - ticket.ttl_expira_at).total_seconds() / 60
-            self.stdout.write(
-                f'  - {ticket.uuid} ({ticket.trabajador.rut}) - '
-                f'Expirado hace {tiempo_expirado:.1f} minutos'
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✓ {resultado['expirados']} tickets marcados como expirados exitosamente "
+                f"({resultado['lotes']} lotes, {resultado['duracion_segundos']}s)."
             )
-            
-            if not dry_run:
-                # Marcar como expirado
-                ticket.estado = 'expirado'
-                ticket.save()
-                
-                # Crear evento
-                TicketEvent.objects.create(
-                    ticket=ticket,
-                    tipo='expirado',
-                    metadata={
-                        'expiro_hace_minutos': round(tiempo_expirado, 1),
-                        'ttl_original': ticket.ttl_expira_at.isoformat()
-                    }
-                )
-                
-                logger.info(f'Ticket {ticket.uuid} marcado como expirado')
-        
-        if dry_run:
+        )
+        if not resultado['completo']:
             self.stdout.write(
                 self.style.WARNING(
-                    f'\nModo DRY-RUN: No se modificó la base de datos. '
-                    f'{cantidad} tickets serían marcados como expirados.'
+                    'Presupuesto de tiempo agotado: los tickets restantes se '
+                    'procesarán en la siguiente ejecución.'
                 )
             )
-        else:
+
+    def _listar_vencidos(self, ahora):
+        """Lista los tickets que serían expirados, sin modificar nada."""
+        vencidos = ExpiracionService.queryset_vencidos(ahora)
+        cantidad = vencidos.count()
+
+        if cantidad == 0:
+            self.stdout.write(self.style.SUCCESS('No hay tickets expirados.'))
+            return
+
+        self.stdout.write(f'Encontrados {cantidad} tickets expirados:')
+
+        filas = vencidos.values_list('uuid', 'trabajador__rut', 'ttl_expira_at')[:MAX_LISTADO_DRY_RUN]
+        for uuid, rut, ttl in filas:
+            tiempo_expirado = (ahora - ttl).total_seconds() / 60
             self.stdout.write(
-                self.style.SUCCESS(
-                    f'\n✓ {cantidad} tickets marcados como expirados exitosamente.'
-                )
+                f'  - {uuid} ({rut}) - '
+                f'Expirado hace {tiempo_expirado:.1f} minutos'
+            )
+        if cantidad > MAX_LISTADO_DRY_RUN:
+            self.stdout.write(f'  ... y {cantidad - MAX_LISTADO_DRY_RUN} más')
+
+        self.stdout.write(
+            self.style.WARNING(
+                f'\nModo DRY-RUN: No se modificó la base de datos. '
+                f'{cantidad} tickets serían marcados como expirados.'
             )
+        )
@@ -0,0 +1,40 @@
+"""
+Comando Django para eliminar imágenes QR obsoletas.
+Ejecutar: python manage.py limpiar_imagenes_qr
+Borra de MEDIA_ROOT/tickets/ las imágenes que ningún ticket referencia
+(reemplazadas por reimpresión o huérfanas).
+"""
+from django.core.management.base import BaseCommand
+from totem.qr_render import limpiar_imagenes_obsoletas
+
+
+class Command(BaseCommand):
+    help = 'Elimina imágenes QR de tickets que ya no están referenciadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Muestra cuántas imágenes se eliminarían sin borrarlas',
+        )
+        parser.add_argument(
+            '--antiguedad-minutos',
+            type=int,
+            default=60,
+            help='Antigüedad mínima de un archivo para eliminarlo (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        resultado = limpiar_imagenes_obsoletas(
+            dry_run=options['dry_run'],
+            antiguedad_minutos=options['antiguedad_minutos'],
+        )
+
+        mensaje = (
+            f"{resultado['eliminados']} de {resultado['revisados']} imágenes "
+            f"({resultado['bytes_liberados'] / 1024:.1f} KB)"
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f'Modo DRY-RUN: se eliminarían {mensaje}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Eliminadas {mensaje}.'))
@@ -0,0 +1,47 @@
+"""
+Comando Django para reconstruir el rollup de estadísticas diarias.
+Ejecutar: python manage.py recalcular_estadisticas --desde 2025-01-01
+Útil para el backfill inicial de EstadisticaDiaria o tras correcciones
+masivas de datos fuera de la ventana que recalcula la tarea periódica.
+"""
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from totem.services.estadisticas_service import ENTIDADES, EstadisticasService
+
+
+class Command(BaseCommand):
+    help = 'Recalcula EstadisticaDiaria para un rango de fechas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            required=True,
+            help='Primer día a recalcular (YYYY-MM-DD)',
+        )
+        parser.add_argument(
+            '--hasta',
+            help='Último día a recalcular (YYYY-MM-DD, default: hoy)',
+        )
+        parser.add_argument(
+            '--entidad',
+            choices=sorted(ENTIDADES),
+            action='append',
+            help='Limitar a una entidad (repetible; default: todas)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde'])
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if desde > hasta:
+            raise CommandError('--desde no puede ser posterior a --hasta')
+
+        filas = EstadisticasService.recalcular(desde, hasta, entidades=options['entidad'])
+
+        detalle = ', '.join(f'{entidad}: {cantidad}' for entidad, cantidad in filas.items())
+        self.stdout.write(self.style.SUCCESS(f'✓ Rollup recalculado {desde} → {hasta} ({detalle}).'))
@@ -18,6 +18,9 @@ class AuditLoggingMiddleware(MiddlewareMixin):
     """
     Middleware para registrar todas las peticiones API en audit.log.
     Cumple con ISO 27001: A.12.4.1 (Event logging).
+    
+    El handler del logger 'audit' (totem.audit.AuditQueueHandler) solo encola:
+    la escritura a disco (y a AuditLog) ocurre por lotes en otro hilo.
     """
     
     def process_request(self, request):
@@ -28,7 +31,7 @@ class AuditLoggingMiddleware(MiddlewareMixin):
     def process_response(self, request, response):
         """Registra la petición completada con metadata."""
         # Solo auditar endpoints /api/
-        if not request.path.startswith('/api/'):
+        if not request.path.startswith('/api/') or not audit_logger.isEnabledFor(logging.INFO):
             return response
         
         # Calcular tiempo de respuesta
@@ -152,7 +155,7 @@ class SecurityHeadersMiddleware(MiddlewareMixin):
 class RateLimitByUserMiddleware(MiddlewareMixin):
     """
     Middleware para rate limiting por usuario (no solo IP).
-    Complementa django-ratelimit.
+    Complementa los throttles de DRF; usa el mismo motor GCRA atómico.
     """
     
     CACHE_PREFIX = 'ratelimit_user'
@@ -161,8 +164,8 @@ class RateLimitByUserMiddleware(MiddlewareMixin):
     
     def process_request(self, request):
         """Verifica rate limit por usuario autenticado."""
-        from django.core.cache import cache
         from django.http import JsonResponse
+        from .throttling import GCRALimiter, Regla
         
         # Solo para usuarios autenticados
         if not request.user or isinstance(request.user, AnonymousUser):
@@ -172,29 +175,31 @@ class RateLimitByUserMiddleware(MiddlewareMixin):
         if not request.path.startswith('/api/'):
             return None
         
-        # Clave de cache única por usuario
-        cache_key = f"{self.CACHE_PREFIX}:{request.user.id}"
-        
-        # Obtener contador actual
-        current_requests = cache.get(cache_key, 0)
+        # Clave única por usuario; consumir y verificar es una sola operación
+        regla = Regla(f"{self.CACHE_PREFIX}:{request.user.id}", self.MAX_REQUESTS, self.TIME_WINDOW, None)
+        try:
+            decision = GCRALimiter.evaluar([regla])
+        except Exception as e:
+            security_logger.warning(f"Rate limit no disponible: {e}")
+            return None
         
-        if current_requests >= self.MAX_REQUESTS:
+        if not decision.permitido:
+            retry_after = max(1, int(decision.retry_after + 0.999))
             security_logger.warning(
                 f"Rate limit exceeded by user: {request.user.username}",
                 extra={
                     'user_id': request.user.id,
-                    'requests': current_requests,
+                    'retry_after': retry_after,
                 }
             )
-            return JsonResponse(
+            response = JsonResponse(
                 {
                     'error': 'Rate limit exceeded',
-                    'detail': f'Too many requests. Try again in {self.TIME_WINDOW} seconds.',
+                    'detail': f'Too many requests. Try again in {retry_after} seconds.',
                 },
                 status=429
             )
-        
-        # Incrementar contador
-        cache.set(cache_key, current_requests + 1, self.TIME_WINDOW)
+            response['Retry-After'] = str(retry_after)
+            return response
         
         return None
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0018_merge_20251214_0015'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nominacarga',
+            name='errores',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0019_nominacarga_errores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nominacarga',
+            name='actualizar',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='archivo',
+            field=models.FileField(blank=True, help_text='Archivo subido; se elimina al finalizar el trabajo', null=True, upload_to='nomina/'),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='cancelacion_solicitada',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='detalle_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='estado',
+            field=models.CharField(choices=[('pendiente', 'Pendiente'), ('procesando', 'Procesando'), ('completada', 'Completada'), ('fallida', 'Fallida'), ('cancelada', 'Cancelada')], db_index=True, default='completada', max_length=12),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='finalizada_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='iniciada_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='resultado',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='task_id',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='nominacarga',
+            name='total_estimado',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0020_nominacarga_trabajo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaDiaria',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField()),
+                ('entidad', models.CharField(choices=[('ticket', 'Ticket'), ('agendamiento', 'Agendamiento'), ('incidencia', 'Incidencia')], max_length=15)),
+                ('estado', models.CharField(max_length=15)),
+                ('cantidad', models.PositiveIntegerField(default=0)),
+                ('actualizado_at', models.DateTimeField(auto_now=True)),
+                ('ciclo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='totem.ciclo')),
+                ('sucursal', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='totem.sucursal')),
+            ],
+            options={
+                'verbose_name': 'Estadística diaria',
+                'verbose_name_plural': 'Estadísticas diarias',
+                'indexes': [models.Index(fields=['entidad', 'fecha'], name='estad_entidad_fecha_idx'), models.Index(fields=['ciclo', 'entidad'], name='estad_ciclo_entidad_idx')],
+            },
+        ),
+    ]
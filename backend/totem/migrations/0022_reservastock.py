@@ -0,0 +1,30 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0021_estadisticadiaria'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReservaStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('estado', models.CharField(choices=[('activa', 'Activa'), ('consumida', 'Consumida'), ('liberada', 'Liberada')], default='activa', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('cerrada_at', models.DateTimeField(blank=True, null=True)),
+                ('stock', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='totem.stocksucursal')),
+                ('ticket', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reserva_stock', to='totem.ticket')),
+            ],
+            options={
+                'verbose_name': 'Reserva de stock',
+                'verbose_name_plural': 'Reservas de stock',
+                'indexes': [models.Index(fields=['stock', 'estado'], name='reserva_stock_estado_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def normalizar_ruts(apps, schema_editor):
+    """Guarda los RUT en formato canónico (12345678-K) para búsquedas exactas."""
+    from totem.utils_rut import clean_rut
+
+    Trabajador = apps.get_model('totem', 'Trabajador')
+    existentes = set(Trabajador.objects.values_list('rut', flat=True))
+    for pk, rut in Trabajador.objects.values_list('pk', 'rut').iterator():
+        canonico = clean_rut(rut)
+        if not canonico or canonico == rut or canonico in existentes:
+            # Un duplicado por mayúsculas/formato requiere revisión manual
+            continue
+        Trabajador.objects.filter(pk=pk).update(rut=canonico)
+        existentes.add(canonico)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0022_reservastock'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalizar_ruts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.30 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0023_trabajador_rut_canonico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField(default=0)),
+                ('ip_address', models.CharField(blank=True, max_length=45)),
+                ('user_agent', models.CharField(blank=True, max_length=200)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('user_id', models.IntegerField(blank=True, null=True)),
+                ('user_rol', models.CharField(blank=True, max_length=20)),
+                ('query_params', models.JSONField(blank=True, default=dict)),
+            ],
+            options={
+                'verbose_name': 'Registro de auditoría',
+                'verbose_name_plural': 'Registros de auditoría',
+                'ordering': ['-timestamp'],
+                'indexes': [models.Index(fields=['username', 'timestamp'], name='audit_usuario_fecha_idx'), models.Index(fields=['status_code', 'timestamp'], name='audit_status_fecha_idx')],
+            },
+        ),
+    ]
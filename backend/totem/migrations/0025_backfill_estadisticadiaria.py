@@ -0,0 +1,47 @@
+from django.db import migrations
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+# Entidad -> (modelo, dimensiones propias); copia de estadisticas_service.ENTIDADES
+ENTIDADES = {
+    'ticket': ('Ticket', ('sucursal_id', 'ciclo_id')),
+    'agendamiento': ('Agendamiento', ('ciclo_id',)),
+    'incidencia': ('Incidencia', ()),
+}
+
+
+def poblar_estadisticas(apps, schema_editor):
+    """Llena el rollup con el historial existente (mismo GROUP BY que EstadisticasService.recalcular)."""
+    EstadisticaDiaria = apps.get_model('totem', 'EstadisticaDiaria')
+    for entidad, (nombre_modelo, dimensiones) in ENTIDADES.items():
+        modelo = apps.get_model('totem', nombre_modelo)
+        grupos = modelo.objects.annotate(
+            fecha=TruncDate('created_at')
+        ).values('fecha', 'estado', *dimensiones).annotate(cantidad=Count('id')).order_by()
+
+        EstadisticaDiaria.objects.filter(entidad=entidad).delete()
+        EstadisticaDiaria.objects.bulk_create(
+            (
+                EstadisticaDiaria(
+                    entidad=entidad,
+                    fecha=grupo['fecha'],
+                    estado=grupo['estado'],
+                    sucursal_id=grupo.get('sucursal_id'),
+                    ciclo_id=grupo.get('ciclo_id'),
+                    cantidad=grupo['cantidad'],
+                )
+                for grupo in grupos.iterator()
+            ),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('totem', '0024_auditlog'),
+    ]
+
+    operations = [
+        migrations.RunPython(poblar_estadisticas, migrations.RunPython.noop),
+    ]
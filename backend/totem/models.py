@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils import timezone
+from .utils_rut import clean_rut
 
 """Modelos ampliados para cubrir casos de uso:
  - Usuario (modelo de auth extendido con roles)
@@ -102,6 +103,12 @@ class Trabajador(models.Model):
     def __str__(self):
         return f"{self.nombre} ({self.rut})"
 
+    def save(self, *args, **kwargs):
+        # RUT canónico ("12345678-K") para que las búsquedas sean exactas por índice
+        if self.rut:
+            self.rut = clean_rut(self.rut) or self.rut
+        super().save(*args, **kwargs)
+
 
 class StockSucursal(models.Model):
     """
@@ -153,6 +160,34 @@ class StockMovimiento(models.Model):
         return f"{self.fecha} {self.hora} - {self.accion} {self.cantidad} {self.tipo_caja}"
 
 
+class ReservaStock(models.Model):
+    """
+    Unidad de stock descontada para un ticket.
+    Se crea al emitir el ticket (StockService.reservar), se consume al entregarlo
+    y se libera (devolviendo la unidad a StockSucursal) si el ticket expira o se anula.
+    """
+    ESTADOS = (
+        ('activa', 'Activa'),
+        ('consumida', 'Consumida'),
+        ('liberada', 'Liberada'),
+    )
+    stock = models.ForeignKey(StockSucursal, on_delete=models.CASCADE, related_name='reservas')
+    ticket = models.OneToOneField('Ticket', on_delete=models.CASCADE, related_name='reserva_stock')
+    estado = models.CharField(max_length=10, choices=ESTADOS, default='activa')
+    created_at = models.DateTimeField(auto_now_add=True)
+    cerrada_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['stock', 'estado'], name='reserva_stock_estado_idx'),
+        ]
+        verbose_name = 'Reserva de stock'
+        verbose_name_plural = 'Reservas de stock'
+
+    def __str__(self):
+        return f"Reserva {self.ticket_id} ({self.estado})"
+
+
 class Ticket(models.Model):
     """
     Ticket generado cuando un trabajador utiliza el tótem.
@@ -555,9 +590,31 @@ class NominaCarga(models.Model):
     creados = models.PositiveIntegerField(default=0)
     actualizados = models.PositiveIntegerField(default=0)
     sin_beneficio = models.PositiveIntegerField(default=0)
+    errores = models.PositiveIntegerField(default=0)
     observaciones = models.TextField(blank=True)
     fecha_carga = models.DateTimeField(auto_now_add=True)
 
+    # Estado del trabajo en segundo plano (las cargas síncronas nacen completadas)
+    ESTADOS = (
+        ("pendiente", "Pendiente"),
+        ("procesando", "Procesando"),
+        ("completada", "Completada"),
+        ("fallida", "Fallida"),
+        ("cancelada", "Cancelada"),
+    )
+    ESTADOS_FINALES = ("completada", "fallida", "cancelada")
+    estado = models.CharField(max_length=12, choices=ESTADOS, default="completada", db_index=True)
+    archivo = models.FileField(upload_to="nomina/", blank=True, null=True,
+                               help_text="Archivo subido; se elimina al finalizar el trabajo")
+    actualizar = models.BooleanField(default=False)
+    task_id = models.CharField(max_length=64, blank=True)
+    total_estimado = models.PositiveIntegerField(default=0)
+    cancelacion_solicitada = models.BooleanField(default=False)
+    iniciada_at = models.DateTimeField(null=True, blank=True)
+    finalizada_at = models.DateTimeField(null=True, blank=True)
+    detalle_error = models.TextField(blank=True)
+    resultado = models.JSONField(default=dict, blank=True)
+
     class Meta:
         ordering = ["-fecha_carga", "-id"]
         indexes = [
@@ -567,3 +624,65 @@ class NominaCarga(models.Model):
 
     def __str__(self):
         return f"Carga nomina {self.id} ({self.archivo_nombre})"
+
+
+class EstadisticaDiaria(models.Model):
+    """
+    Conteo materializado por día, sucursal, ciclo, entidad y estado.
+    Lo reconstruye EstadisticasService.recalcular (tarea compactar_estadisticas_diarias);
+    los reportes leen de aquí los días cerrados y calculan en vivo solo el día en curso.
+    """
+    ENTIDADES = (
+        ("ticket", "Ticket"),
+        ("agendamiento", "Agendamiento"),
+        ("incidencia", "Incidencia"),
+    )
+    fecha = models.DateField()
+    entidad = models.CharField(max_length=15, choices=ENTIDADES)
+    estado = models.CharField(max_length=15)
+    sucursal = models.ForeignKey("Sucursal", on_delete=models.CASCADE, null=True, blank=True)
+    ciclo = models.ForeignKey("Ciclo", on_delete=models.CASCADE, null=True, blank=True)
+    cantidad = models.PositiveIntegerField(default=0)
+    actualizado_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["entidad", "fecha"], name="estad_entidad_fecha_idx"),
+            models.Index(fields=["ciclo", "entidad"], name="estad_ciclo_entidad_idx"),
+        ]
+        verbose_name = "Estadística diaria"
+        verbose_name_plural = "Estadísticas diarias"
+
+    def __str__(self):
+        return f"{self.fecha} {self.entidad}:{self.estado} = {self.cantidad}"
+
+
+class AuditLog(models.Model):
+    """
+    Registro de auditoría de peticiones /api/ (ISO 27001 A.12.4.1).
+    Lo inserta por lotes el escritor de totem.audit cuando AUDIT_DB_ENABLED;
+    audit.log sigue siendo la fuente completa.
+    """
+    timestamp = models.DateTimeField(db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(default=0)
+    ip_address = models.CharField(max_length=45, blank=True)
+    user_agent = models.CharField(max_length=200, blank=True)
+    username = models.CharField(max_length=150, blank=True)
+    user_id = models.IntegerField(null=True, blank=True)
+    user_rol = models.CharField(max_length=20, blank=True)
+    query_params = models.JSONField(default=dict, blank=True)
+
+    class Meta:
+        ordering = ["-timestamp"]
+        indexes = [
+            models.Index(fields=["username", "timestamp"], name="audit_usuario_fecha_idx"),
+            models.Index(fields=["status_code", "timestamp"], name="audit_status_fecha_idx"),
+        ]
+        verbose_name = "Registro de auditoría"
+        verbose_name_plural = "Registros de auditoría"
+
+    def __str__(self):
+        return f"{self.timestamp:%Y-%m-%d %H:%M:%S} {self.method} {self.path} {self.status_code}"
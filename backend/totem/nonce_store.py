@@ -0,0 +1,237 @@
+"""
+Almacén de nonces anti-replay para QR.
+
+Registra cada nonce con una operación atómica "set si no existe" en la caché
+compartida (cache.add → SET NX EX en Redis), de modo que dos porterías que
+escanean el mismo QR a la vez no puedan aceptarlo ambas. Un filtro de Bloom
+local, con los nonces que registró este proceso, rechaza los replays obvios
+sin ir a la red. Las liberaciones (QRSecurity.invalidar_nonce) se publican
+por el canal de invalidaciones de totem.cache para que los demás workers
+dejen de rechazar ese nonce desde su filtro.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from typing import Iterable, List
+
+from django.conf import settings
+from django.core.cache import cache
+
+from totem.cache import (
+    asegurar_suscriptor_invalidaciones, get_redis_connection_or_none, publicar_invalidacion,
+    registrar_oyente_invalidaciones,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom en un bytearray con doble hashing (blake2b de 16 bytes).
+
+    Sin falsos negativos; la tasa de falsos positivos con `capacidad`
+    elementos es ~`tasa_fp`.
+    """
+
+    def __init__(self, capacidad: int, tasa_fp: float):
+        self.bits = max(8, int(-capacidad * math.log(tasa_fp) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.bits / capacidad * math.log(2)))
+        self._arreglo = bytearray((self.bits + 7) // 8)
+        self.elementos = 0
+
+    def _posiciones(self, clave: str):
+        digest = hashlib.blake2b(clave.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.bits for i in range(self.hashes))
+
+    def agregar(self, clave: str) -> None:
+        for pos in self._posiciones(clave):
+            self._arreglo[pos >> 3] |= 1 << (pos & 7)
+        self.elementos += 1
+
+    def __contains__(self, clave: str) -> bool:
+        return all(self._arreglo[pos >> 3] & (1 << (pos & 7)) for pos in self._posiciones(clave))
+
+
+class NonceStore:
+    """
+    Registro atómico de nonces con frente Bloom local.
+
+    El filtro se organiza en dos generaciones que rotan cada `ttl` segundos:
+    un nonce registrado sigue en el filtro al menos `ttl` (lo mismo que vive
+    en la caché) y como máximo 2x`ttl`, lo que no cambia el resultado porque
+    un QR más antiguo que el TTL ya se rechaza por antigüedad.
+
+    Un positivo del filtro rechaza sin consultar la caché; con la capacidad
+    y tasa configuradas (NONCE_BLOOM_CAPACIDAD, NONCE_BLOOM_TASA_FP) la
+    probabilidad de rechazar un QR nuevo es despreciable. NONCE_BLOOM_ACTIVO=False
+    desactiva el frente.
+
+    El filtro no admite borrado: los nonces liberados (en este proceso o, vía
+    pub/sub, en otro) se anotan en conjuntos que rotan con las generaciones y
+    tienen tope NONCE_LIBERADOS_MAX; al superarlo se descarta el filtro y
+    la caché compartida vuelve a decidir.
+    """
+
+    _lock = threading.Lock()
+    _generaciones = None
+    _rotado_en = 0.0
+    # Nonces liberados, uno por generación del filtro
+    _liberados = [set(), set()]
+    # Contadores para diagnóstico
+    rechazos_locales = 0
+    consultas_remotas = 0
+
+    @classmethod
+    def _bloom_activo(cls) -> bool:
+        return getattr(settings, 'NONCE_BLOOM_ACTIVO', True)
+
+    @classmethod
+    def _nuevo_filtro(cls) -> BloomFilter:
+        return BloomFilter(
+            getattr(settings, 'NONCE_BLOOM_CAPACIDAD', 200_000),
+            getattr(settings, 'NONCE_BLOOM_TASA_FP', 1e-6),
+        )
+
+    @classmethod
+    def _filtros(cls, ttl: int):
+        """Generaciones vigentes del filtro (rota si la actual superó el TTL). Requiere _lock."""
+        ahora = time.monotonic()
+        if cls._generaciones is None:
+            cls._generaciones = [cls._nuevo_filtro(), cls._nuevo_filtro()]
+            cls._liberados = [set(), set()]
+            cls._rotado_en = ahora
+        elif ahora - cls._rotado_en >= ttl:
+            cls._generaciones = [cls._nuevo_filtro(), cls._generaciones[0]]
+            cls._liberados = [set(), cls._liberados[0]]
+            cls._rotado_en = ahora
+        return cls._generaciones
+
+    @classmethod
+    def _descartar_filtro(cls) -> None:
+        """Vacía el frente local (requiere _lock); la caché compartida sigue siendo la referencia."""
+        cls._generaciones = None
+        cls._liberados = [set(), set()]
+
+    @classmethod
+    def _marcar_liberados(cls, claves) -> None:
+        with cls._lock:
+            if cls._generaciones is None:
+                return
+            cls._liberados[0].update(claves)
+            if len(cls._liberados[0]) + len(cls._liberados[1]) > getattr(settings, 'NONCE_LIBERADOS_MAX', 10_000):
+                cls._descartar_filtro()
+
+    @classmethod
+    def _al_invalidar(cls, claves) -> None:
+        """Oyente de totem.cache: None significa que pudo perderse una liberación."""
+        if claves is None:
+            with cls._lock:
+                cls._descartar_filtro()
+        else:
+            cls._marcar_liberados(claves)
+
+    @classmethod
+    def _visto_localmente(cls, clave: str, ttl: int) -> bool:
+        if not cls._bloom_activo():
+            return False
+        asegurar_suscriptor_invalidaciones()
+        with cls._lock:
+            if any(clave in liberados for liberados in cls._liberados):
+                return False
+            visto = any(clave in filtro for filtro in cls._filtros(ttl))
+            if visto:
+                cls.rechazos_locales += 1
+            return visto
+
+    @classmethod
+    def _recordar(cls, claves: Iterable[str], ttl: int) -> None:
+        if not cls._bloom_activo():
+            return
+        with cls._lock:
+            actual = cls._filtros(ttl)[0]
+            for clave in claves:
+                for liberados in cls._liberados:
+                    liberados.discard(clave)
+                actual.agregar(clave)
+
+    @classmethod
+    def registrar(cls, clave: str, ttl: int) -> bool:
+        """
+        Registra un nonce si no existía (atómico).
+
+        Returns:
+            True si el nonce es nuevo; False si ya había sido usado
+        """
+        if cls._visto_localmente(clave, ttl):
+            return False
+        cls.consultas_remotas += 1
+        nuevo = cache.add(clave, 1, ttl)
+        cls._recordar([clave], ttl)
+        return nuevo
+
+    @classmethod
+    def registrar_lote(cls, claves: List[str], ttl: int) -> List[bool]:
+        """
+        Registra varios nonces en un solo viaje a Redis (pipeline de SET NX EX).
+
+        Sin Redis recae en cache.add por clave. Una clave repetida dentro del
+        lote solo se acepta la primera vez.
+
+        Returns:
+            list[bool]: True por cada nonce nuevo, en el mismo orden
+        """
+        resultado = [False] * len(claves)
+        pendientes = {}
+        for i, clave in enumerate(claves):
+            if clave in pendientes or cls._visto_localmente(clave, ttl):
+                continue
+            pendientes[clave] = i
+        if not pendientes:
+            return resultado
+
+        cls.consultas_remotas += 1
+        conexion = cls._conexion_redis()
+        if conexion is not None:
+            pipe = conexion.pipeline(transaction=False)
+            for clave in pendientes:
+                pipe.set(cache.make_key(clave), 1, nx=True, ex=ttl)
+            nuevos = [bool(r) for r in pipe.execute()]
+        else:
+            nuevos = [cache.add(clave, 1, ttl) for clave in pendientes]
+
+        for (clave, i), nuevo in zip(pendientes.items(), nuevos):
+            resultado[i] = nuevo
+        cls._recordar(pendientes, ttl)
+        return resultado
+
+    @classmethod
+    def usado(cls, clave: str, ttl: int) -> bool:
+        """True si el nonce ya fue registrado (consulta sin registrar)."""
+        return cls._visto_localmente(clave, ttl) or bool(cache.get(clave))
+
+    @classmethod
+    def liberar(cls, clave: str) -> None:
+        """Elimina un nonce para permitir un nuevo uso (en todos los workers)."""
+        cache.delete(clave)
+        cls._marcar_liberados([clave])
+        publicar_invalidacion([clave])
+
+    @classmethod
+    def reiniciar(cls) -> None:
+        """Vacía el filtro local y los contadores."""
+        with cls._lock:
+            cls._descartar_filtro()
+            cls.rechazos_locales = 0
+            cls.consultas_remotas = 0
+
+    @staticmethod
+    def _conexion_redis():
+        """Cliente Redis crudo si la caché es django-redis; None en otro caso."""
+        return get_redis_connection_or_none()
+
+
+registrar_oyente_invalidaciones(NonceStore._al_invalidar)
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Render de códigos QR con caché LRU direccionada por contenido.
+Provee salidas PNG (pantalla), PNG 1-bit (impresora térmica), SVG y matriz cruda.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from django.conf import settings
+import qrcode
+import structlog
+
+logger = structlog.get_logger(__name__)
+
+# Formatos soportados y su content-type HTTP
+FORMATOS = {
+    'png': 'image/png',
+    'png_termico': 'image/png',
+    'svg': 'image/svg+xml',
+    'matriz': 'application/json',
+}
+
+
+class QRRenderer:
+    """
+    Renderizador de QR con caché LRU en memoria del proceso.
+
+    La matriz de módulos se calcula una sola vez por payload (clave: SHA-256
+    del payload) y cada formato se dibuja directamente desde ella, sin pasar
+    por las image factories de qrcode.
+    """
+
+    # Parámetros del PNG de pantalla (compatibles con el render histórico)
+    BOX_SIZE = 10
+    BORDER = 4
+
+    _cache = OrderedDict()
+    _lock = threading.Lock()
+    hits = 0
+    misses = 0
+
+    @staticmethod
+    def hash_payload(payload: str) -> str:
+        """Clave de caché del payload (SHA-256 hex)."""
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _cache_size(cls) -> int:
+        return getattr(settings, 'QR_RENDER_CACHE_SIZE', 256)
+
+    @classmethod
+    def _cache_get(cls, key):
+        with cls._lock:
+            valor = cls._cache.get(key)
+            if valor is not None:
+                cls._cache.move_to_end(key)
+                cls.hits += 1
+            else:
+                cls.misses += 1
+            return valor
+
+    @classmethod
+    def _cache_set(cls, key, valor):
+        with cls._lock:
+            cls._cache[key] = valor
+            cls._cache.move_to_end(key)
+            while len(cls._cache) > cls._cache_size():
+                cls._cache.popitem(last=False)
+
+    @classmethod
+    def limpiar_cache(cls):
+        """Vacía la caché y reinicia contadores."""
+        with cls._lock:
+            cls._cache.clear()
+            cls.hits = 0
+            cls.misses = 0
+
+    @classmethod
+    def matriz(cls, payload: str) -> tuple:
+        """
+        Obtiene la matriz de módulos del QR (sin borde).
+
+        Args:
+            payload: Contenido del QR
+
+        Returns:
+            tuple[tuple[bool]]: Filas de módulos; True = módulo oscuro
+        """
+        key = ('matriz', cls.hash_payload(payload))
+        matriz = cls._cache_get(key)
+        if matriz is None:
+            qr = qrcode.QRCode(
+                version=None,
+                error_correction=qrcode.constants.ERROR_CORRECT_L,
+                border=0,
+            )
+            qr.add_data(payload)
+            qr.make(fit=True)
+            matriz = tuple(tuple(fila) for fila in qr.get_matrix())
+            cls._cache_set(key, matriz)
+        return matriz
+
+    @classmethod
+    def renderizar(cls, payload: str, formato: str = 'png'):
+        """
+        Renderiza el QR en el formato pedido, reutilizando la caché.
+
+        Args:
+            payload: Contenido del QR
+            formato: 'png', 'png_termico', 'svg' o 'matriz'
+
+        Returns:
+            bytes (png, png_termico), str (svg) o list[str] (matriz, filas de '0'/'1')
+
+        Raises:
+            ValueError: Si el formato no es soportado
+        """
+        if formato not in FORMATOS:
+            raise ValueError(f"Formato QR no soportado: {formato}")
+
+        if formato == 'matriz':
+            return [''.join('1' if m else '0' for m in fila) for fila in cls.matriz(payload)]
+
+        key = (formato, cls.hash_payload(payload))
+        salida = cls._cache_get(key)
+        if salida is None:
+            matriz = cls.matriz(payload)
+            if formato == 'svg':
+                salida = cls._a_svg(matriz)
+            elif formato == 'png_termico':
+                salida = cls._a_png(matriz, getattr(settings, 'QR_THERMAL_BOX_SIZE', 4), 2)
+            else:
+                salida = cls._a_png(matriz, cls.BOX_SIZE, cls.BORDER)
+            cls._cache_set(key, salida)
+            logger.debug("qr_renderizado", formato=formato, bytes=len(salida))
+        return salida
+
+    @staticmethod
+    def _a_png(matriz, box_size: int, border: int) -> bytes:
+        """PNG en modo 1-bit: un píxel por módulo escalado con NEAREST."""
+        from PIL import Image
+
+        lado = len(matriz) + 2 * border
+        blanco = b'\xff' * border
+        filas = [b'\xff' * lado] * border
+        filas += [blanco + bytes(0 if m else 255 for m in fila) + blanco for fila in matriz]
+        filas += [b'\xff' * lado] * border
+        img = Image.frombytes('L', (lado, lado), b''.join(filas)).convert('1')
+        img = img.resize((lado * box_size, lado * box_size), Image.NEAREST)
+
+        buffer = BytesIO()
+        img.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    @staticmethod
+    def _a_svg(matriz, border: int = 4) -> str:
+        """SVG con un único path (un rectángulo por tramo horizontal de módulos)."""
+        lado = len(matriz) + 2 * border
+        tramos = []
+        for y, fila in enumerate(matriz):
+            x = 0
+            ancho = len(fila)
+            while x < ancho:
+                if fila[x]:
+                    inicio = x
+                    while x < ancho and fila[x]:
+                        x += 1
+                    tramos.append(f'M{inicio + border} {y + border}h{x - inicio}v1h-{x - inicio}z')
+                else:
+                    x += 1
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {lado} {lado}" '
+            f'shape-rendering="crispEdges"><rect width="100%" height="100%" fill="#fff"/>'
+            f'<path fill="#000" d="{"".join(tramos)}"/></svg>'
+        )
+
+
+def nombre_imagen_ticket(ticket_uuid: str, payload: str) -> str:
+    """
+    Nombre de archivo direccionado por contenido para la imagen de un ticket.
+    Un payload nuevo (reimpresión) produce un nombre nuevo, nunca sobrescribe.
+    """
+    return f'ticket_{ticket_uuid}_{QRRenderer.hash_payload(payload)[:12]}.png'
+
+
+def limpiar_imagenes_obsoletas(dry_run: bool = False, antiguedad_minutos: int = 60) -> dict:
+    """
+    Elimina imágenes de MEDIA_ROOT/tickets/ que ningún ticket referencia.
+
+    Cubre imágenes reemplazadas por reimpresiones y archivos huérfanos.
+    Solo considera archivos con más de `antiguedad_minutos` para no borrar
+    un render en curso cuyo UPDATE aún no se confirma.
+
+    Args:
+        dry_run: Solo contar, sin borrar
+        antiguedad_minutos: Antigüedad mínima del archivo para eliminarlo
+
+    Returns:
+        dict: revisados, eliminados, bytes_liberados
+    """
+    from datetime import timedelta
+    from django.core.files.storage import default_storage
+    from django.utils import timezone
+    from totem.models import Ticket
+
+    directorio = Ticket._meta.get_field('qr_image').upload_to.rstrip('/')
+    try:
+        _, archivos = default_storage.listdir(directorio)
+    except FileNotFoundError:
+        archivos = []
+
+    referenciados = {
+        nombre.rsplit('/', 1)[-1]
+        for nombre in Ticket.objects.exclude(qr_image='').exclude(qr_image__isnull=True)
+        .values_list('qr_image', flat=True).iterator()
+    }
+    limite = timezone.now() - timedelta(minutes=antiguedad_minutos)
+
+    eliminados = 0
+    bytes_liberados = 0
+    for archivo in archivos:
+        if archivo in referenciados:
+            continue
+        ruta = f'{directorio}/{archivo}'
+        try:
+            if default_storage.get_modified_time(ruta) > limite:
+                continue
+            tamano = default_storage.size(ruta)
+        except (FileNotFoundError, NotImplementedError):
+            continue
+        if not dry_run:
+            default_storage.delete(ruta)
+        eliminados += 1
+        bytes_liberados += tamano
+
+    logger.info(
+        "limpieza_imagenes_qr",
+        revisados=len(archivos),
+        eliminados=eliminados,
+        bytes_liberados=bytes_liberados,
+        dry_run=dry_run,
+    )
+    return {
+        'revisados': len(archivos),
+        'eliminados': eliminados,
+        'bytes_liberados': bytes_liberados,
+    }
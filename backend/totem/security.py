@@ -6,12 +6,21 @@ import hmac
 import hashlib
 import logging
 import time
+from functools import lru_cache
+from typing import Iterable, List, Tuple
 from django.conf import settings
-from django.core.cache import cache
+
+from totem.nonce_store import NonceStore
 
 logger = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=4)
+def plantilla_hmac(secret: bytes):
+    """HMAC-SHA256 ya inicializado con la clave; se clona con copy() por firma."""
+    return hmac.new(secret, digestmod=hashlib.sha256)
+
+
 class QRSecurity:
     """
     Clase para manejar firma y validación de payloads de QR.
@@ -22,6 +31,7 @@ class QRSecurity:
     NONCE_PREFIX = 'qr_nonce'
     # Tiempo de vida del nonce (igual que TTL del ticket)
     NONCE_TTL = 60 * 60  # 1 hora
+    MENSAJE_REPLAY = "QR ya fue validado anteriormente"
     
     @staticmethod
     def _get_secret() -> bytes:
@@ -43,10 +53,28 @@ class QRSecurity:
         if timestamp is None:
             timestamp = int(time.time())
         
-        secret = QRSecurity._get_secret()
-        mensaje = f"{uuid}:{timestamp}".encode('utf-8')
-        firma = hmac.new(secret, mensaje, hashlib.sha256).hexdigest()
-        return firma[:16]  # Usar primeros 16 chars para compactar
+        h = plantilla_hmac(QRSecurity._get_secret()).copy()
+        h.update(f"{uuid}:{timestamp}".encode('utf-8'))
+        return h.hexdigest()[:16]  # Usar primeros 16 chars para compactar
+    
+    @staticmethod
+    def generar_firmas(pares: Iterable[Tuple[str, int]]) -> List[str]:
+        """
+        Firma un lote de (uuid, timestamp) con una sola plantilla HMAC.
+        
+        Args:
+            pares: Iterable de (uuid del ticket, timestamp Unix)
+            
+        Returns:
+            Firmas (16 caracteres hex) en el mismo orden
+        """
+        plantilla = plantilla_hmac(QRSecurity._get_secret())
+        firmas = []
+        for uuid, timestamp in pares:
+            h = plantilla.copy()
+            h.update(f"{uuid}:{timestamp}".encode('utf-8'))
+            firmas.append(h.hexdigest()[:16])
+        return firmas
     
     @staticmethod
     def crear_payload_firmado(uuid: str) -> str:
@@ -70,6 +98,9 @@ class QRSecurity:
         """
         Valida un payload de QR verificando su firma y protegiendo contra replay.
         
+        El nonce se registra con un set-if-absent atómico (NonceStore), por lo
+        que dos validaciones simultáneas del mismo QR no pueden aceptarse ambas.
+        
         Args:
             payload: String en formato "uuid:timestamp:firma"
             permitir_replay: Si False, bloquea QRs ya validados (default: False)
@@ -78,57 +109,15 @@ class QRSecurity:
             Tupla (es_valido, uuid_o_error)
         """
         try:
-            partes = payload.split(':')
-            if len(partes) < 2:
-                logger.warning(f"Payload QR inválido: formato incorrecto")
-                return False, "Formato de QR inválido"
-            
-            # Compatibilidad con formato antiguo (sin timestamp)
-            if len(partes) == 2:
-                uuid, firma_recibida = partes
-                timestamp = None
-            else:
-                uuid, timestamp_str, firma_recibida = partes[0], partes[1], partes[2]
-                try:
-                    timestamp = int(timestamp_str)
-                except ValueError:
-                    logger.warning(f"Timestamp inválido en QR: {timestamp_str}")
-                    return False, "Timestamp inválido en QR"
-            
-            # Validar timestamp (no debe ser muy antiguo)
-            if timestamp:
-                tiempo_actual = int(time.time())
-                edad_qr = tiempo_actual - timestamp
-                
-                # QR no debe ser más viejo que NONCE_TTL
-                if edad_qr > QRSecurity.NONCE_TTL:
-                    logger.warning(f"QR expirado: {uuid}, edad {edad_qr}s")
-                    return False, "QR expirado por antigüedad"
-                
-                # QR no debe ser del futuro (clock skew tolerance: 5 minutos)
-                if edad_qr < -300:
-                    logger.warning(f"QR del futuro detectado: {uuid}")
-                    return False, "QR con timestamp inválido"
-            
-            # Generar firma esperada
-            firma_esperada = QRSecurity.generar_firma(uuid, timestamp) if timestamp else QRSecurity._generar_firma_legacy(uuid)
-            
-            # Comparación segura contra timing attacks
-            es_valido = hmac.compare_digest(firma_esperada, firma_recibida)
-            
+            es_valido, uuid, timestamp = QRSecurity._verificar_firma(payload)
             if not es_valido:
-                logger.warning(f"Intento de validación con QR falsificado: {uuid}")
-                return False, "QR falsificado o alterado"
+                return False, uuid
             
             # Protección contra replay attacks
             if not permitir_replay and timestamp:
-                nonce_key = f"{QRSecurity.NONCE_PREFIX}:{uuid}:{timestamp}"
-                if cache.get(nonce_key):
+                if not NonceStore.registrar(QRSecurity._nonce_key(uuid, timestamp), QRSecurity.NONCE_TTL):
                     logger.warning(f"Replay attack detectado: {uuid}")
-                    return False, "QR ya fue validado anteriormente"
-                
-                # Marcar nonce como usado
-                cache.set(nonce_key, True, QRSecurity.NONCE_TTL)
+                    return False, QRSecurity.MENSAJE_REPLAY
             
             logger.info(f"QR validado correctamente: {uuid}")
             return True, uuid
@@ -137,6 +126,108 @@ class QRSecurity:
             logger.error(f"Error validando payload QR: {e}")
             return False, f"Error en validación: {str(e)}"
     
+    @staticmethod
+    def validar_payloads(
+        payloads: list[str],
+        permitir_replay: bool = False,
+        momentos: list[float] | None = None
+    ) -> list[tuple[bool, str | None]]:
+        """
+        Valida un lote de payloads (p.ej. escaneos de una sincronización offline).
+        
+        Las firmas se verifican en memoria y los nonces de todos los payloads
+        válidos se registran en un solo viaje a Redis (pipeline de SET NX EX).
+        Si el mismo QR aparece dos veces en el lote, solo el primero es válido.
+        
+        Args:
+            payloads: Lista de strings "uuid:timestamp:firma"
+            permitir_replay: Si False, bloquea QRs ya validados
+            momentos: Epoch de escaneo de cada payload (antigüedad del QR medida
+                al escanear, no al sincronizar); default: ahora
+            
+        Returns:
+            Lista de tuplas (es_valido, uuid_o_error) en el mismo orden
+        """
+        resultados = []
+        nonces = {}
+        for i, payload in enumerate(payloads):
+            try:
+                es_valido, uuid, timestamp = QRSecurity._verificar_firma(payload, momentos[i] if momentos else None)
+            except Exception as e:
+                logger.error(f"Error validando payload QR: {e}")
+                es_valido, uuid, timestamp = False, f"Error en validación: {str(e)}", None
+            resultados.append((es_valido, uuid))
+            if es_valido and timestamp and not permitir_replay:
+                nonces[i] = QRSecurity._nonce_key(uuid, timestamp)
+        
+        if nonces:
+            nuevos = NonceStore.registrar_lote(list(nonces.values()), QRSecurity.NONCE_TTL)
+            for i, nuevo in zip(nonces, nuevos):
+                if not nuevo:
+                    logger.warning(f"Replay attack detectado: {resultados[i][1]}")
+                    resultados[i] = (False, QRSecurity.MENSAJE_REPLAY)
+        
+        logger.info(f"Lote de {len(payloads)} QR validado: {sum(ok for ok, _ in resultados)} válidos")
+        return resultados
+    
+    @staticmethod
+    def _nonce_key(uuid: str, timestamp: int) -> str:
+        return f"{QRSecurity.NONCE_PREFIX}:{uuid}:{timestamp}"
+    
+    @staticmethod
+    def _verificar_firma(payload: str, ahora: float | None = None) -> tuple[bool, str | None, int | None]:
+        """
+        Verifica formato, antigüedad y firma de un payload (sin tocar nonces).
+        
+        Args:
+            payload: String "uuid:timestamp:firma"
+            ahora: Epoch contra el que se mide la antigüedad (default: time.time())
+        
+        Returns:
+            Tupla (es_valido, uuid_o_error, timestamp)
+        """
+        partes = payload.split(':')
+        if len(partes) < 2:
+            logger.warning(f"Payload QR inválido: formato incorrecto")
+            return False, "Formato de QR inválido", None
+        
+        # Compatibilidad con formato antiguo (sin timestamp)
+        if len(partes) == 2:
+            uuid, firma_recibida = partes
+            timestamp = None
+        else:
+            uuid, timestamp_str, firma_recibida = partes[0], partes[1], partes[2]
+            try:
+                timestamp = int(timestamp_str)
+            except ValueError:
+                logger.warning(f"Timestamp inválido en QR: {timestamp_str}")
+                return False, "Timestamp inválido en QR", None
+        
+        # Validar timestamp (no debe ser muy antiguo)
+        if timestamp:
+            tiempo_actual = int(time.time() if ahora is None else ahora)
+            edad_qr = tiempo_actual - timestamp
+            
+            # QR no debe ser más viejo que NONCE_TTL
+            if edad_qr > QRSecurity.NONCE_TTL:
+                logger.warning(f"QR expirado: {uuid}, edad {edad_qr}s")
+                return False, "QR expirado por antigüedad", None
+            
+            # QR no debe ser del futuro (clock skew tolerance: 5 minutos)
+            if edad_qr < -300:
+                logger.warning(f"QR del futuro detectado: {uuid}")
+                return False, "QR con timestamp inválido", None
+        
+        # Generar firma esperada
+        firma_esperada = QRSecurity.generar_firma(uuid, timestamp) if timestamp else QRSecurity._generar_firma_legacy(uuid)
+        
+        # Comparación segura contra timing attacks
+        if not hmac.compare_digest(firma_esperada, firma_recibida):
+            logger.warning(f"Intento de validación con QR falsificado: {uuid}")
+            return False, "QR falsificado o alterado", None
+        
+        return True, uuid, timestamp
+    
     @staticmethod
     def _generar_firma_legacy(uuid: str) -> str:
         """
@@ -164,8 +255,7 @@ class QRSecurity:
         Returns:
             True si el nonce ya fue usado, False si es nuevo
         """
-        nonce_key = f"{QRSecurity.NONCE_PREFIX}:{uuid}:{timestamp}"
-        return bool(cache.get(nonce_key))
+        return NonceStore.usado(QRSecurity._nonce_key(uuid, timestamp), QRSecurity.NONCE_TTL)
     
     @staticmethod
     def invalidar_nonce(uuid: str, timestamp: int):
@@ -176,8 +266,7 @@ class QRSecurity:
             uuid: UUID del ticket
             timestamp: Timestamp del payload
         """
-        nonce_key = f"{QRSecurity.NONCE_PREFIX}:{uuid}:{timestamp}"
-        cache.delete(nonce_key)
+        NonceStore.liberar(QRSecurity._nonce_key(uuid, timestamp))
         logger.info(f"Nonce invalidado: {uuid}:{timestamp}")
     
     @staticmethod
@@ -46,14 +46,18 @@ class TicketSerializer(serializers.ModelSerializer):
         queryset=Trabajador.objects.all(), source='trabajador', write_only=True
     )
     eventos = serializers.SerializerMethodField()
+    qr_payload = serializers.SerializerMethodField()
 
     class Meta:
         model = Ticket
         fields = [
-            'id', 'uuid', 'trabajador', 'trabajador_id', 'qr_image', 'data', 'created_at',
+            'id', 'uuid', 'trabajador', 'trabajador_id', 'qr_image', 'qr_payload', 'data', 'created_at',
             'estado', 'ttl_expira_at', 'ciclo', 'sucursal', 'eventos'
         ]
-        read_only_fields = ['id', 'uuid', 'qr_image', 'created_at', 'eventos']
+        read_only_fields = ['id', 'uuid', 'qr_image', 'qr_payload', 'created_at', 'eventos']
+
+    def get_qr_payload(self, obj):
+        return (obj.data or {}).get('qr_payload')
 
     def get_eventos(self, obj):
         return [
@@ -179,9 +183,10 @@ class NominaCargaSerializer(serializers.ModelSerializer):
         model = NominaCarga
         fields = [
             'id', 'ciclo', 'usuario', 'archivo_nombre', 'total_registros',
-            'creados', 'actualizados', 'sin_beneficio', 'observaciones', 'fecha_carga'
+            'creados', 'actualizados', 'sin_beneficio', 'errores', 'observaciones', 'fecha_carga',
+            'estado', 'actualizar', 'iniciada_at', 'finalizada_at', 'detalle_error'
         ]
-        read_only_fields = ['fecha_carga']
+        read_only_fields = ['fecha_carga', 'estado', 'iniciada_at', 'finalizada_at', 'detalle_error']
 
 
 class CajaBeneficioSerializer(serializers.ModelSerializer):
@@ -7,6 +7,10 @@ from .incidencia_service import IncidenciaService
 from .trabajador_service import TrabajadorService
 from .ciclo_service import CicloService
 from .stock_service import StockService
+from .expiracion_service import ExpiracionService
+from .nomina_service import NominaService
+from .estadisticas_service import EstadisticasService
+from .asignacion_service import AsignacionMasivaService
 
 __all__ = [
     'TicketService',
@@ -15,4 +19,8 @@ __all__ = [
     'TrabajadorService',
     'CicloService',
     'StockService',
+    'ExpiracionService',
+    'NominaService',
+    'EstadisticasService',
+    'AsignacionMasivaService',
 ]
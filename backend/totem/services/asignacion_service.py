@@ -0,0 +1,282 @@
+"""
+Servicio de asignación masiva de beneficios de un ciclo.
+
+Reemplaza el recorrido trabajador por trabajador (exists + create + post_save
+por fila) por operaciones de conjunto: un anti-join para los trabajadores sin
+beneficio, códigos y firmas HMAC generados en memoria y bulk_create por lotes,
+cada lote en su propia transacción. Se ejecuta como trabajo en segundo plano
+con el progreso publicado en caché.
+"""
+import logging
+import time
+import uuid
+from itertools import islice
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from totem.cache import invalidate_trabajador
+from totem.despacho import despachar_tarea
+from totem.exceptions import BusinessRuleException
+from totem.models import BeneficioTrabajador, Ciclo, TipoBeneficio, Trabajador
+from totem.services.beneficio_service import BeneficioService
+
+logger = logging.getLogger(__name__)
+
+# Estado de cada trabajo en caché (clave: prefijo:job_id) y candado por ciclo
+ASIGNACION_CACHE_PREFIX = 'asignacion_beneficios'
+ASIGNACION_CACHE_TTL = 6 * 60 * 60
+
+# Vigencia del candado hasta que el commit lo confirma: si la transacción del
+# request se revierte, el ciclo queda libre a lo sumo tras este plazo
+ASIGNACION_CANDADO_PROVISIONAL_TTL = 60
+
+# Errores por lote conservados en el estado del trabajo
+MAX_ERRORES_ASIGNACION = 50
+
+
+class AsignacionMasivaService:
+    """
+    Asignación de un TipoBeneficio a todos los trabajadores de un ciclo.
+
+    - encolar(): valida, toma el candado del ciclo (provisional hasta el
+      commit) y despacha el trabajo (Celery tras el commit; thread local si
+      no hay broker).
+    - procesar(): ejecuta la asignación por lotes publicando el avance.
+    - estado(): consulta el avance de un trabajo.
+    """
+
+    @staticmethod
+    def _clave(job_id: str) -> str:
+        return f'{ASIGNACION_CACHE_PREFIX}:{job_id}'
+
+    @staticmethod
+    def _clave_ciclo(ciclo_id: int) -> str:
+        return f'{ASIGNACION_CACHE_PREFIX}:ciclo:{ciclo_id}'
+
+    @staticmethod
+    def sin_beneficio(ciclo: Ciclo):
+        """Trabajadores sin ningún BeneficioTrabajador en el ciclo (anti-join)."""
+        return Trabajador.objects.filter(
+            ~Exists(BeneficioTrabajador.objects.filter(trabajador=OuterRef('pk'), ciclo=ciclo))
+        )
+
+    @staticmethod
+    def encolar(ciclo: Ciclo, tipo_beneficio: TipoBeneficio, solo_sin_beneficio: bool = True, usuario=None) -> Dict:
+        """
+        Registra y despacha un trabajo de asignación masiva.
+
+        Args:
+            ciclo: Ciclo destino
+            tipo_beneficio: Beneficio a asignar
+            solo_sin_beneficio: False reemplaza los beneficios existentes del ciclo
+            usuario: Usuario que solicita la asignación
+
+        Returns:
+            dict: Estado inicial del trabajo (incluye 'id')
+
+        Raises:
+            BusinessRuleException: Si ya hay una asignación en curso para el ciclo
+        """
+        job_id = uuid.uuid4().hex
+        clave_ciclo = AsignacionMasivaService._clave_ciclo(ciclo.id)
+        if not cache.add(clave_ciclo, job_id, timeout=ASIGNACION_CANDADO_PROVISIONAL_TTL):
+            raise BusinessRuleException(detail='Ya hay una asignación masiva en curso para este ciclo')
+
+        estado = {
+            'id': job_id,
+            'ciclo_id': ciclo.id,
+            'tipo_beneficio': tipo_beneficio.nombre,
+            'solo_sin_beneficio': solo_sin_beneficio,
+            'usuario': getattr(usuario, 'username', None),
+            'estado': 'pendiente',
+            'total': 0,
+            'procesados': 0,
+            'beneficios_creados': 0,
+            'beneficios_existentes': 0,
+            'beneficios_eliminados': 0,
+            'errores': [],
+            'solicitada_at': timezone.now().isoformat(),
+        }
+        cache.set(AsignacionMasivaService._clave(job_id), estado, timeout=ASIGNACION_CACHE_TTL)
+
+        args = (job_id, ciclo.id, tipo_beneficio.id, solo_sin_beneficio)
+
+        def _despachar():
+            # Confirmar el candado solo tras el commit; si expiró y otro trabajo
+            # lo tomó entretanto, este trabajo no se ejecuta
+            if cache.get(clave_ciclo) != job_id and not cache.add(clave_ciclo, job_id, timeout=ASIGNACION_CACHE_TTL):
+                logger.warning(f"Asignación masiva {job_id} descartada: otra asignación tomó el ciclo {ciclo.id}")
+                cache.set(AsignacionMasivaService._clave(job_id), estado | {
+                    'estado': 'fallida',
+                    'detalle_error': 'Ya hay una asignación masiva en curso para este ciclo',
+                }, timeout=ASIGNACION_CACHE_TTL)
+                return
+            cache.set(clave_ciclo, job_id, timeout=ASIGNACION_CACHE_TTL)
+            despachar_tarea(
+                'asignar_beneficios_ciclo', args, AsignacionMasivaService._procesar_en_thread,
+                f'asignación {job_id}',
+            )
+
+        transaction.on_commit(_despachar)
+        logger.info(f"Asignación masiva {job_id} encolada: ciclo {ciclo.id}, {tipo_beneficio.nombre}")
+        return estado
+
+    @staticmethod
+    def _procesar_en_thread(*args) -> None:
+        """Ejecuta procesar fuera del ciclo request/response."""
+        try:
+            AsignacionMasivaService.procesar(*args)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def estado(job_id: str) -> Optional[Dict]:
+        """Estado y avance de un trabajo (None si no existe o expiró)."""
+        estado = cache.get(AsignacionMasivaService._clave(job_id))
+        if estado is None:
+            return None
+        total = estado['total']
+        return estado | {
+            'porcentaje': round(estado['procesados'] * 100 / total, 1) if total else (
+                100.0 if estado['estado'] == 'completada' else 0
+            ),
+        }
+
+    @staticmethod
+    def procesar(job_id: str, ciclo_id: int, tipo_beneficio_id: int, solo_sin_beneficio: bool = True) -> Dict:
+        """
+        Ejecuta la asignación masiva y publica el avance tras cada lote.
+
+        Con solo_sin_beneficio=False los beneficios existentes del ciclo se
+        eliminan antes (un DELETE) y se reasignan a todos los trabajadores.
+        Cada lote se inserta en su propia transacción: si el trabajo falla a
+        mitad, relanzarlo completa solo los trabajadores que faltan.
+
+        Returns:
+            dict: Estado final del trabajo
+        """
+        clave = AsignacionMasivaService._clave(job_id)
+        estado = cache.get(clave) or {'id': job_id, 'ciclo_id': ciclo_id, 'errores': []}
+        estado.update(estado='procesando', iniciada_at=timezone.now().isoformat())
+        cache.set(clave, estado, timeout=ASIGNACION_CACHE_TTL)
+
+        inicio = time.monotonic()
+        try:
+            ciclo = Ciclo.objects.get(pk=ciclo_id)
+            tipo_beneficio = TipoBeneficio.objects.get(pk=tipo_beneficio_id)
+
+            if solo_sin_beneficio:
+                estado['beneficios_existentes'] = Trabajador.objects.filter(
+                    Exists(BeneficioTrabajador.objects.filter(trabajador=OuterRef('pk'), ciclo=ciclo))
+                ).count()
+            else:
+                _, eliminados = BeneficioTrabajador.objects.filter(ciclo=ciclo).delete()
+                estado['beneficios_eliminados'] = eliminados.get(BeneficioTrabajador._meta.label, 0)
+
+            pendientes = AsignacionMasivaService.sin_beneficio(ciclo).order_by('pk').values_list('pk', 'rut')
+            estado['total'] = pendientes.count()
+            cache.set(clave, estado, timeout=ASIGNACION_CACHE_TTL)
+
+            tamano = getattr(settings, 'BENEFICIOS_ASIGNACION_BATCH_SIZE', 1000)
+            filas = pendientes.iterator(chunk_size=tamano)
+            while lote := list(islice(filas, tamano)):
+                try:
+                    creados = AsignacionMasivaService._insertar_lote(ciclo, tipo_beneficio, lote)
+                except IntegrityError:
+                    # Otro proceso asignó algunos trabajadores del lote entretanto
+                    ids = [pk for pk, _ in lote]
+                    vigentes = set(AsignacionMasivaService.sin_beneficio(ciclo).filter(pk__in=ids).values_list('pk', flat=True))
+                    try:
+                        creados = AsignacionMasivaService._insertar_lote(
+                            ciclo, tipo_beneficio, [fila for fila in lote if fila[0] in vigentes]
+                        )
+                        estado['beneficios_existentes'] += len(lote) - len(vigentes)
+                    except IntegrityError as e:
+                        creados = 0
+                        estado['errores'] = (estado['errores'] + [{
+                            'desde_rut': lote[0][1], 'hasta_rut': lote[-1][1], 'error': str(e),
+                        }])[-MAX_ERRORES_ASIGNACION:]
+
+                estado['beneficios_creados'] += creados
+                estado['procesados'] += len(lote)
+                estado['filas_por_segundo'] = round(estado['procesados'] / max(time.monotonic() - inicio, 1e-6), 1)
+                cache.set(clave, estado, timeout=ASIGNACION_CACHE_TTL)
+
+            estado['estado'] = 'completada'
+            logger.info(
+                f"Asignación masiva {job_id} completada: ciclo {ciclo_id}, "
+                f"{estado['beneficios_creados']} creados, {estado['beneficios_existentes']} existentes, "
+                f"{len(estado['errores'])} lotes con error"
+            )
+        except Exception as e:
+            estado['estado'] = 'fallida'
+            estado['detalle_error'] = str(e)[:2000]
+            logger.error(f"Asignación masiva {job_id} fallida: {e}", exc_info=True)
+        finally:
+            estado['trabajadores_procesados'] = (
+                estado.get('beneficios_existentes', 0) + estado.get('procesados', 0)
+            )
+            estado['finalizada_at'] = timezone.now().isoformat()
+            cache.set(clave, estado, timeout=ASIGNACION_CACHE_TTL)
+            cache.delete(AsignacionMasivaService._clave_ciclo(ciclo_id))
+
+        return estado
+
+    @staticmethod
+    @transaction.atomic
+    def _insertar_lote(ciclo: Ciclo, tipo_beneficio: TipoBeneficio, lote: List[Tuple[int, str]]) -> int:
+        """
+        Inserta un lote de beneficios con código, QR y firma HMAC.
+
+        El código y qr_data siguen el formato de beneficio_trabajador_post_save_handler
+        (que bulk_create no dispara). La firma incluye el id del beneficio, así
+        que se calcula tras el INSERT (firmar_lote) y se persiste con un bulk_update.
+
+        Returns:
+            int: Beneficios creados
+        """
+        if not lote:
+            return 0
+        ahora = timezone.now()
+        beneficios = []
+        for trabajador_id, rut in lote:
+            codigo = f"BEN-{ciclo.id:04d}-{trabajador_id:06d}-{uuid.uuid4().hex[:8].upper()}"
+            beneficios.append(BeneficioTrabajador(
+                trabajador_id=trabajador_id,
+                ciclo=ciclo,
+                tipo_beneficio=tipo_beneficio,
+                codigo_verificacion=codigo,
+                qr_data=f"{codigo}|{rut}|{tipo_beneficio.nombre}|N/A",
+                estado='pendiente',
+                created_at=ahora,
+                updated_at=ahora,
+            ))
+        BeneficioTrabajador.objects.bulk_create(beneficios)
+
+        if any(b.pk is None for b in beneficios):
+            # Backends sin RETURNING: recuperar ids por código
+            ids = dict(BeneficioTrabajador.objects.filter(
+                codigo_verificacion__in=[b.codigo_verificacion for b in beneficios]
+            ).values_list('codigo_verificacion', 'pk'))
+            for beneficio in beneficios:
+                beneficio.pk = ids[beneficio.codigo_verificacion]
+
+        for beneficio, (_, rut) in zip(beneficios, lote):
+            beneficio.qr_payload = BeneficioService.construir_payload(
+                beneficio.pk, rut, ciclo.id, tipo_beneficio.nombre, ahora
+            )
+        firmas = BeneficioService.firmar_lote(b.qr_payload for b in beneficios)
+        for beneficio, firma in zip(beneficios, firmas):
+            beneficio.qr_signature = firma
+        BeneficioTrabajador.objects.bulk_update(beneficios, ['qr_payload', 'qr_signature'])
+
+        # bulk_create no dispara el post_save que invalida la caché del tótem
+        ruts = [rut for _, rut in lote]
+        transaction.on_commit(lambda: invalidate_trabajador(*ruts))
+
+        return len(beneficios)
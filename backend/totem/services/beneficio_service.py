@@ -3,12 +3,16 @@ Servicio para gestión de Beneficios de Trabajadores.
 Encapsula lógica de validación, HMAC, cambios de estado.
 """
 import hmac
-import hashlib
 import json
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, List, Optional, Tuple, Union
+from django.conf import settings
 from django.utils import timezone
 from django.db import transaction
 from totem.models import BeneficioTrabajador, ValidacionCaja, Trabajador, Ciclo, TipoBeneficio
+from totem.security import plantilla_hmac
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,24 @@ logger = logging.getLogger(__name__)
 # Será reemplazada por settings.HMAC_SECRET_KEY
 HMAC_SECRET = 'beneficio-secret-key-change-in-production'
 
+# Serializador canónico precompilado: misma salida que
+# json.dumps(payload, separators=(',', ':'), sort_keys=True)
+_serializar_canonico = json.JSONEncoder(separators=(',', ':'), sort_keys=True).encode
+
+# Payloads por tarea al repartir un lote en el pool de procesos
+HMAC_CHUNK_POOL = 5000
+
+
+def _firmar_payloads(secret: str, payloads: List[dict]) -> List[str]:
+    """Firma una lista de payloads (nivel módulo para poder usarse en el pool)."""
+    plantilla = plantilla_hmac(secret.encode('utf-8'))
+    firmas = []
+    for payload in payloads:
+        h = plantilla.copy()
+        h.update(_serializar_canonico(payload).encode('utf-8'))
+        firmas.append(h.hexdigest())
+    return firmas
+
 
 class BeneficioService:
     """
@@ -36,12 +58,26 @@ class BeneficioService:
         - tipo_beneficio_nombre
         - timestamp (creación)
         """
+        return BeneficioService.construir_payload(
+            beneficio.id,
+            beneficio.trabajador.rut,
+            beneficio.ciclo.id,
+            beneficio.tipo_beneficio.nombre,
+            beneficio.created_at,
+        )
+    
+    @staticmethod
+    def construir_payload(beneficio_id, trabajador_rut, ciclo_id, tipo_beneficio_nombre, created_at) -> dict:
+        """
+        Payload del QR a partir de valores ya cargados (sin acceder a relaciones).
+        Usado por la asignación masiva para firmar en memoria.
+        """
         return {
-            'beneficio_id': beneficio.id,
-            'trabajador_rut': beneficio.trabajador.rut,
-            'ciclo_id': beneficio.ciclo.id,
-            'tipo_beneficio': beneficio.tipo_beneficio.nombre,
-            'created_at': beneficio.created_at.isoformat() if beneficio.created_at else '',
+            'beneficio_id': beneficio_id,
+            'trabajador_rut': trabajador_rut,
+            'ciclo_id': ciclo_id,
+            'tipo_beneficio': tipo_beneficio_nombre,
+            'created_at': created_at.isoformat() if created_at else '',
         }
     
     @staticmethod
@@ -55,13 +91,71 @@ class BeneficioService:
         Returns:
             hex string de 64 caracteres (HMAC-SHA256)
         """
-        payload_json = json.dumps(payload, separators=(',', ':'), sort_keys=True)
-        signature = hmac.new(
-            HMAC_SECRET.encode('utf-8'),
-            payload_json.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        return signature
+        h = plantilla_hmac(HMAC_SECRET.encode('utf-8')).copy()
+        h.update(_serializar_canonico(payload).encode('utf-8'))
+        return h.hexdigest()
+    
+    @staticmethod
+    def _payload_de(item: Union[BeneficioTrabajador, dict]) -> dict:
+        """Payload de un item de lote: dict tal cual o generado desde el beneficio."""
+        return item if isinstance(item, dict) else BeneficioService.generar_payload(item)
+    
+    @staticmethod
+    def firmar_lote(items: Iterable[Union[BeneficioTrabajador, dict]], procesos: Optional[int] = None) -> List[str]:
+        """
+        Firma un lote de beneficios o payloads.
+        
+        Reutiliza una plantilla HMAC con la clave ya procesada (copy() por
+        firma) y el serializador canónico precompilado. Con `procesos` y un
+        lote de al menos settings.BENEFICIOS_HMAC_POOL_MIN items, reparte el
+        trabajo en un pool de procesos.
+        
+        Args:
+            items: BeneficioTrabajador (usar select_related de trabajador,
+                ciclo y tipo_beneficio) o payloads ya construidos
+            procesos: Procesos del pool (None/1 = en el proceso actual)
+            
+        Returns:
+            Firmas hex en el mismo orden que `items`
+        """
+        payloads = [BeneficioService._payload_de(item) for item in items]
+        minimo = getattr(settings, 'BENEFICIOS_HMAC_POOL_MIN', 50000)
+        if not procesos or procesos <= 1 or len(payloads) < minimo:
+            return _firmar_payloads(HMAC_SECRET, payloads)
+        
+        trozos = iter(payloads)
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            futuros = [
+                pool.submit(_firmar_payloads, HMAC_SECRET, trozo)
+                for trozo in iter(lambda: list(islice(trozos, HMAC_CHUNK_POOL)), [])
+            ]
+            return [firma for futuro in futuros for firma in futuro.result()]
+    
+    @staticmethod
+    def verificar_lote(
+        items: Iterable[Union[BeneficioTrabajador, Tuple[dict, str]]],
+        procesos: Optional[int] = None,
+    ) -> List[bool]:
+        """
+        Verifica un lote de firmas contra sus payloads persistidos.
+        
+        Args:
+            items: BeneficioTrabajador (usa qr_payload y qr_signature) o tuplas
+                (payload, firma)
+            procesos: Procesos del pool (ver firmar_lote)
+            
+        Returns:
+            True/False por item, en el mismo orden; sin firma o payload = False
+        """
+        pares = [
+            (item.qr_payload, item.qr_signature) if isinstance(item, BeneficioTrabajador) else item
+            for item in items
+        ]
+        calculadas = BeneficioService.firmar_lote((payload or {} for payload, _ in pares), procesos=procesos)
+        return [
+            bool(payload and firma) and hmac.compare_digest(calculada, firma)
+            for (payload, firma), calculada in zip(pares, calculadas)
+        ]
     
     @staticmethod
     def validar_hmac(payload: dict, esperada_signature: str) -> bool:
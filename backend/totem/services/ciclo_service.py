@@ -7,7 +7,8 @@ import structlog
 from django.db import transaction
 from django.utils import timezone
 from datetime import date
-from ..models import Ciclo, Ticket
+from ..models import Ciclo
+from .estadisticas_service import EstadisticasService
 
 logger = structlog.get_logger(__name__)
 
@@ -205,13 +206,14 @@ class CicloService:
         """
         logger.info("obtener_estadisticas_ciclo", ciclo_id=ciclo.id)
         
-        tickets = Ticket.objects.filter(ciclo=ciclo)
-        total = tickets.count()
+        # Rollup EstadisticaDiaria para días cerrados + conteo en vivo de hoy
+        por_estado = EstadisticasService.por_estado('ticket', ciclo_id=ciclo.id)
+        total = por_estado['total']
         
-        entregados = tickets.filter(estado='entregado').count()
-        pendientes = tickets.filter(estado='pendiente').count()
-        expirados = tickets.filter(estado='expirado').count()
-        anulados = tickets.filter(estado='anulado').count()
+        entregados = por_estado.get('entregado', 0)
+        pendientes = por_estado.get('pendiente', 0)
+        expirados = por_estado.get('expirado', 0)
+        anulados = por_estado.get('anulado', 0)
         
         tasa_entrega = (entregados / total * 100) if total > 0 else 0
         tasa_expiracion = (expirados / total * 100) if total > 0 else 0
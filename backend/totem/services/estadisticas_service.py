@@ -0,0 +1,192 @@
+"""
+Servicio de estadísticas diarias materializadas (tabla EstadisticaDiaria).
+
+Los reportes y dashboards leen los días cerrados desde el rollup y solo el
+día en curso se cuenta en vivo, de modo que su costo crece con los días del
+rango y no con la cantidad de tickets, agendamientos o incidencias.
+"""
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from totem.models import Agendamiento, Ciclo, EstadisticaDiaria, Incidencia, Ticket
+
+logger = logging.getLogger(__name__)
+
+# Entidad -> (modelo, dimensiones propias además de fecha y estado)
+ENTIDADES = {
+    'ticket': (Ticket, ('sucursal_id', 'ciclo_id')),
+    'agendamiento': (Agendamiento, ('ciclo_id',)),
+    'incidencia': (Incidencia, ()),
+}
+
+# Dimensiones por las que se puede agrupar una consulta de conteos
+DIMENSIONES = ('fecha', 'sucursal_id', 'ciclo_id', 'estado')
+
+# Candado para no ejecutar dos compactaciones en paralelo
+LOCK_COMPACTACION = 'estadisticas_diarias:compactando'
+
+
+class EstadisticasService:
+    """
+    Mantenimiento y lectura del rollup EstadisticaDiaria.
+
+    - recalcular(): reconstruye un rango de días con un GROUP BY por entidad
+      (DELETE + bulk_create en una transacción; idempotente).
+    - compactar(): recalcula la ventana reciente (settings.ESTADISTICAS_VENTANA_DIAS)
+      o, con completo=True, desde el inicio del ciclo activo para recoger
+      cambios de estado tardíos (incidencias resueltas, agendamientos vencidos).
+    - conteos()/por_estado(): combinan el rollup (días < hoy) con un conteo
+      en vivo del día en curso.
+    """
+
+    @staticmethod
+    @transaction.atomic
+    def recalcular(desde: date, hasta: date, entidades: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Reconstruye el rollup de un rango de días (inclusive).
+
+        Args:
+            desde: Primer día
+            hasta: Último día
+            entidades: Subconjunto de ENTIDADES (default: todas)
+
+        Returns:
+            dict: entidad -> filas de rollup escritas
+        """
+        resultado = {}
+        for entidad in entidades or ENTIDADES:
+            modelo, dimensiones = ENTIDADES[entidad]
+            grupos = modelo.objects.filter(
+                created_at__date__gte=desde,
+                created_at__date__lte=hasta,
+            ).annotate(
+                fecha=TruncDate('created_at')
+            ).values('fecha', 'estado', *dimensiones).annotate(cantidad=Count('id')).order_by()
+
+            filas = [
+                EstadisticaDiaria(
+                    entidad=entidad,
+                    fecha=grupo['fecha'],
+                    estado=grupo['estado'],
+                    sucursal_id=grupo.get('sucursal_id'),
+                    ciclo_id=grupo.get('ciclo_id'),
+                    cantidad=grupo['cantidad'],
+                )
+                for grupo in grupos
+            ]
+            EstadisticaDiaria.objects.filter(entidad=entidad, fecha__gte=desde, fecha__lte=hasta).delete()
+            EstadisticaDiaria.objects.bulk_create(filas, batch_size=1000)
+            resultado[entidad] = len(filas)
+
+        logger.info(f"Estadísticas diarias recalculadas {desde} → {hasta}: {resultado}")
+        return resultado
+
+    @staticmethod
+    def compactar(completo: bool = False, dias: Optional[int] = None) -> Dict:
+        """
+        Recalcula la ventana reciente del rollup (tarea periódica).
+
+        Args:
+            completo: Recalcular desde el inicio del ciclo activo
+            dias: Tamaño de la ventana (settings.ESTADISTICAS_VENTANA_DIAS)
+
+        Returns:
+            dict: desde, hasta y filas por entidad; omitido=True si otra
+            compactación estaba en curso
+        """
+        if not cache.add(LOCK_COMPACTACION, True, timeout=10 * 60):
+            logger.info("Compactación de estadísticas ya en curso; se omite")
+            return {'omitido': True}
+
+        try:
+            hoy = timezone.localdate()
+            dias = dias if dias is not None else getattr(settings, 'ESTADISTICAS_VENTANA_DIAS', 7)
+            desde = hoy - timedelta(days=dias)
+            if completo:
+                inicio_ciclo = Ciclo.objects.filter(activo=True).order_by('fecha_inicio').values_list(
+                    'fecha_inicio', flat=True
+                ).first()
+                if inicio_ciclo:
+                    desde = min(desde, inicio_ciclo)
+            filas = EstadisticasService.recalcular(desde, hoy)
+        finally:
+            cache.delete(LOCK_COMPACTACION)
+
+        return {'desde': desde.isoformat(), 'hasta': hoy.isoformat(), 'filas': filas}
+
+    @staticmethod
+    def conteos(
+        entidad: str,
+        desde: Optional[date] = None,
+        hasta: Optional[date] = None,
+        por: Sequence[str] = ('estado',),
+        sucursal_id: Optional[int] = None,
+        ciclo_id: Optional[int] = None,
+    ) -> List[Dict]:
+        """
+        Conteos agregados: días cerrados desde el rollup y hoy en vivo.
+
+        Args:
+            entidad: 'ticket', 'agendamiento' o 'incidencia'
+            desde: Primer día (None = sin límite)
+            hasta: Último día (None = sin límite)
+            por: Dimensiones de agrupación (subconjunto de DIMENSIONES)
+            sucursal_id: Filtrar por sucursal
+            ciclo_id: Filtrar por ciclo
+
+        Returns:
+            list[dict]: Una fila por combinación de `por` con su 'cantidad'
+        """
+        por = tuple(por)
+        hoy = timezone.localdate()
+        modelo, dimensiones = ENTIDADES[entidad]
+        filtros = {}
+        if sucursal_id:
+            filtros['sucursal_id'] = sucursal_id
+        if ciclo_id:
+            filtros['ciclo_id'] = ciclo_id
+        if any(campo not in dimensiones for campo in filtros):
+            # La entidad no tiene esa dimensión: ninguna fila puede coincidir
+            return []
+
+        totales = defaultdict(int)
+
+        if desde is None or desde < hoy:
+            cerrados = EstadisticaDiaria.objects.filter(entidad=entidad, fecha__lt=hoy, **filtros)
+            if desde:
+                cerrados = cerrados.filter(fecha__gte=desde)
+            if hasta:
+                cerrados = cerrados.filter(fecha__lte=hasta)
+            for fila in cerrados.values(*por).annotate(total=Sum('cantidad')).order_by():
+                totales[tuple(fila[d] for d in por)] += fila['total']
+
+        if (hasta is None or hasta >= hoy) and (desde is None or desde <= hoy):
+            en_curso = modelo.objects.filter(created_at__date=hoy, **filtros).annotate(fecha=TruncDate('created_at'))
+            for fila in en_curso.values(*por).annotate(total=Count('id')).order_by():
+                totales[tuple(fila[d] for d in por)] += fila['total']
+
+        return [dict(zip(por, clave), cantidad=cantidad) for clave, cantidad in totales.items()]
+
+    @staticmethod
+    def por_estado(entidad: str, **filtros) -> Dict[str, int]:
+        """
+        Atajo de conteos() agrupado por estado.
+
+        Returns:
+            dict: estado -> cantidad (incluye 'total')
+        """
+        resultado = {
+            fila['estado']: fila['cantidad']
+            for fila in EstadisticasService.conteos(entidad, por=('estado',), **filtros)
+        }
+        resultado['total'] = sum(resultado.values())
+        return resultado
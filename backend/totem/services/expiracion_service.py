@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Servicio de expiración masiva de tickets.
+Reemplaza el recorrido fila a fila por UPDATE en lotes sobre el índice de TTL.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Ticket, TicketEvent
+from ..signals import ticket_expirado
+from .stock_service import StockService
+
+logger = logging.getLogger(__name__)
+
+
+class ExpiracionService:
+    """
+    Motor de expiración de tickets basado en conjuntos.
+    Procesa los tickets vencidos por lotes con un presupuesto de tiempo.
+    """
+
+    @staticmethod
+    def queryset_vencidos(ahora=None):
+        """
+        Tickets pendientes cuyo TTL ya venció (usa `ticket_ttl_idx`).
+
+        Args:
+            ahora (datetime): Instante de corte (por defecto timezone.now())
+
+        Returns:
+            QuerySet: Tickets pendientes vencidos, más antiguos primero
+        """
+        ahora = ahora or timezone.now()
+        return Ticket.objects.filter(
+            estado='pendiente',
+            ttl_expira_at__lt=ahora
+        ).order_by('ttl_expira_at')
+
+    @staticmethod
+    def expirar_tickets_vencidos(batch_size=None, max_segundos=None, dry_run=False, ahora=None):
+        """
+        Marca como expirados los tickets pendientes vencidos, en lotes.
+
+        Cada lote bloquea sus filas (omitiendo las tomadas por otra
+        transacción), ejecuta un único UPDATE condicionado a
+        estado='pendiente' y crea los eventos 'expirado' con bulk_create.
+        El proceso se detiene cuando no quedan tickets o se agota el
+        presupuesto de tiempo; lo restante queda para la siguiente ejecución.
+
+        Args:
+            batch_size (int): Tickets por lote (settings.TICKET_EXPIRY_BATCH_SIZE)
+            max_segundos (float): Presupuesto de tiempo (settings.TICKET_EXPIRY_MAX_SECONDS)
+            dry_run (bool): Solo contar, sin modificar la base de datos
+            ahora (datetime): Instante de corte fijo para toda la ejecución
+
+        Returns:
+            dict: expirados, lotes, completo, duracion_segundos
+        """
+        batch_size = batch_size or getattr(settings, 'TICKET_EXPIRY_BATCH_SIZE', 1000)
+        if max_segundos is None:
+            max_segundos = getattr(settings, 'TICKET_EXPIRY_MAX_SECONDS', 60)
+        ahora = ahora or timezone.now()
+        inicio = time.monotonic()
+
+        if dry_run:
+            return {
+                'expirados': 0,
+                'por_expirar': ExpiracionService.queryset_vencidos(ahora).count(),
+                'lotes': 0,
+                'completo': True,
+                'duracion_segundos': round(time.monotonic() - inicio, 3),
+            }
+
+        total = 0
+        lotes = 0
+        completo = False
+
+        while True:
+            procesados = ExpiracionService._expirar_lote(ahora, batch_size)
+            total += procesados
+            if procesados:
+                lotes += 1
+
+            if procesados < batch_size:
+                completo = True
+                break
+            if max_segundos and time.monotonic() - inicio >= max_segundos:
+                break
+
+        duracion = round(time.monotonic() - inicio, 3)
+        logger.info(
+            f"Expiración masiva: {total} tickets en {lotes} lotes ({duracion}s, completo={completo})"
+        )
+        return {
+            'expirados': total,
+            'lotes': lotes,
+            'completo': completo,
+            'duracion_segundos': duracion,
+        }
+
+    @staticmethod
+    @transaction.atomic
+    def _expirar_lote(ahora, batch_size):
+        """
+        Expira un lote de tickets vencidos dentro de una transacción.
+
+        Returns:
+            int: Cantidad de tickets efectivamente expirados
+        """
+        filas = list(
+            ExpiracionService.queryset_vencidos(ahora)
+            .select_for_update(skip_locked=True)
+            .values_list('pk', 'uuid', 'ttl_expira_at')[:batch_size]
+        )
+        if not filas:
+            return 0
+
+        pks = [pk for pk, _, _ in filas]
+        actualizados = Ticket.objects.filter(
+            pk__in=pks,
+            estado='pendiente'
+        ).update(estado='expirado')
+
+        if actualizados != len(filas):
+            # Sin bloqueo de filas (p.ej. SQLite) otro proceso pudo cambiar
+            # el estado entre el SELECT y el UPDATE: registrar solo los reales.
+            expirados = set(
+                Ticket.objects.filter(pk__in=pks, estado='expirado').values_list('pk', flat=True)
+            )
+            filas = [fila for fila in filas if fila[0] in expirados]
+
+        # Devolver al stock las unidades reservadas por los tickets expirados
+        StockService.liberar_reservas([pk for pk, _, _ in filas])
+
+        TicketEvent.objects.bulk_create(
+            [
+                TicketEvent(
+                    ticket_id=pk,
+                    tipo='expirado',
+                    metadata={
+                        'expiro_hace_minutos': round((ahora - ttl).total_seconds() / 60, 1),
+                        'ttl_original': ttl.isoformat(),
+                    }
+                )
+                for pk, _, ttl in filas
+            ],
+            batch_size=batch_size
+        )
+
+        uuids = [uuid for _, uuid, _ in filas]
+        transaction.on_commit(
+            lambda: ticket_expirado.send(sender=Ticket, instance=None, uuids=uuids)
+        )
+        return len(filas)
@@ -0,0 +1,1141 @@
+"""
+Servicio de importación de nómina de trabajadores.
+Lee CSV/XLSX/JSON en streaming y escribe en lotes (bulk_create/bulk_update).
+"""
+import csv
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from totem.cache import invalidate_config
+from totem.despacho import despachar_tarea
+from totem.exceptions import BusinessRuleException, ValidationException
+from totem.models import Ciclo, NominaCarga, Sucursal, Trabajador
+from totem.signals import nomina_importada
+from totem.validators import InputSanitizer, RUTValidator
+
+logger = logging.getLogger(__name__)
+
+# Conjuntos canonicos para estandarizar contratos y sucursales
+CONTRATOS_CANONICOS = {
+    'indefinido': 'Indefinido',
+    'plazo fijo': 'Plazo Fijo',
+    'plazo_fijo': 'Plazo Fijo',
+    'plazo-fijo': 'Plazo Fijo',
+    'plazofijo': 'Plazo Fijo',
+    'part time': 'Part Time',
+    'part_time': 'Part Time',
+    'part-time': 'Part Time',
+    'parttime': 'Part Time',
+    'honorario': 'Honorarios',
+    'honorarios': 'Honorarios',
+    'externo': 'Externos',
+    'externos': 'Externos',
+}
+
+SUCURSALES_CANONICAS = {
+    'casablanca': 'Casablanca',
+    'casa blanca': 'Casablanca',
+    'valparaiso planta bif': 'Valparaiso Planta BIF',
+    'valparaiso bif': 'Valparaiso Planta BIF',
+    'bif': 'Valparaiso Planta BIF',
+    'valparaiso planta bic': 'Valparaiso Planta BIC',
+    'valparaiso bic': 'Valparaiso Planta BIC',
+    'bic': 'Valparaiso Planta BIC',
+}
+
+# Columnas requeridas (beneficio es opcional)
+COLUMNAS_REQUERIDAS = ['rut', 'nombre', 'seccion', 'contrato', 'sucursal']
+
+# Columnas opcionales
+COLUMNAS_OPCIONALES = ['beneficio', 'observaciones', 'email', 'telefono']
+
+# Valores de beneficio que significan "sin beneficio"
+VALORES_SIN_BENEFICIO = ['NO', 'NINGUNO', 'SIN BENEFICIO', 'N/A', '-', 'NA']
+
+# Campos del modelo que escribe la importación
+CAMPOS_IMPORTADOS = ['nombre', 'beneficio_disponible']
+
+# Máximo de errores detallados que se conservan en el resultado
+MAX_ERRORES_DETALLE = 200
+
+# Clases de fila del preview
+CLASES_PREVIEW = ['crear', 'actualizar', 'sin_cambios', 'omitido', 'invalido']
+
+# Prefijo de caché del detalle de preview
+PREVIEW_CACHE_PREFIX = 'nomina_preview'
+
+# Marcador de clave ausente al comparar beneficio_disponible
+_AUSENTE = object()
+
+# Prefijo y vigencia en caché del progreso de cargas en segundo plano
+PROGRESO_CACHE_PREFIX = 'nomina_carga_progreso'
+PROGRESO_CACHE_TTL = 6 * 60 * 60
+
+# Errores recientes que expone el endpoint de progreso
+MAX_ERRORES_PROGRESO = 50
+
+# Extensiones aceptadas para cargas de nómina
+EXTENSIONES_NOMINA = ('.csv', '.xlsx', '.xls', '.json')
+
+
+class CargaCancelada(Exception):
+    """Cancelación cooperativa de una carga: revierte la transacción de importar()."""
+
+
+class NominaService:
+    """
+    Motor de importación de nómina.
+
+    - Lectura en streaming: CSV con csv.DictReader, XLSX con openpyxl read_only.
+    - Una sola consulta inicial para RUTs existentes y otra para sucursales.
+    - Escritura por lotes: bulk_create + bulk_update, o upsert nativo
+      (INSERT ... ON CONFLICT) cuando la base de datos lo soporta.
+    - bulk_* no dispara pre_save/post_save de Trabajador: los efectos
+      secundarios se emiten explícitamente (log de cambio de beneficio y la
+      señal `nomina_importada` tras el commit).
+    """
+
+    # ------------------------------------------------------------------
+    # Lectura
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def validar_columnas(columnas) -> None:
+        """
+        Verifica que las columnas requeridas estén presentes.
+
+        Raises:
+            ValidationException: Si falta alguna columna requerida
+        """
+        columnas = {c for c in columnas if c}
+        faltantes = [c for c in COLUMNAS_REQUERIDAS if c not in columnas]
+        if faltantes:
+            raise ValidationException(
+                f'Faltan columnas requeridas: {", ".join(faltantes)}. '
+                f'Columnas encontradas: {", ".join(sorted(columnas))}. '
+                f'Columnas opcionales: {", ".join(COLUMNAS_OPCIONALES)}'
+            )
+
+    @staticmethod
+    def iterar_filas(archivo: str, sheet_name: str = 'Nomina') -> Iterator[Tuple[int, Dict]]:
+        """
+        Recorre las filas del archivo sin cargarlo completo en memoria.
+
+        Args:
+            archivo: Ruta al archivo .csv, .xlsx/.xls o .json
+            sheet_name: Hoja a leer en archivos Excel (si no existe, la activa)
+
+        Yields:
+            (linea, fila): número de línea en el archivo y dict con claves en minúscula
+
+        Raises:
+            ValidationException: Formato no soportado o columnas faltantes
+            FileNotFoundError: Si el archivo no existe
+        """
+        nombre = archivo.lower()
+        if nombre.endswith('.csv'):
+            return NominaService._iterar_csv(archivo)
+        if nombre.endswith(('.xlsx', '.xls')):
+            return NominaService._iterar_excel(archivo, sheet_name)
+        if nombre.endswith('.json'):
+            return NominaService._iterar_json(archivo)
+        raise ValidationException('Formato no soportado. Use .csv, .xlsx o .json')
+
+    @staticmethod
+    def _iterar_csv(archivo):
+        with open(archivo, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            encabezados = next(reader, None)
+            if not encabezados:
+                raise ValidationException('El archivo CSV está vacío o no tiene encabezados')
+            encabezados = [c.lower().strip() for c in encabezados]
+            NominaService.validar_columnas(encabezados)
+
+            for linea, valores in enumerate(reader, start=2):  # línea 1 = encabezados
+                if not any(valores):
+                    continue
+                yield linea, dict(zip(encabezados, valores))
+
+    @staticmethod
+    def _iterar_excel(archivo, sheet_name):
+        try:
+            import openpyxl
+        except ImportError:
+            raise ValidationException('openpyxl no instalado. Instalar con: pip install openpyxl')
+
+        wb = openpyxl.load_workbook(archivo, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet_name] if sheet_name in wb.sheetnames else wb.active
+            if ws is None:
+                raise ValidationException('No se pudo acceder a ninguna hoja del archivo Excel')
+
+            filas = ws.iter_rows(values_only=True)
+            encabezados = next(filas, None)
+            if not encabezados:
+                raise ValidationException('La hoja Excel está vacía')
+            encabezados = [str(c).lower().strip() if c is not None else '' for c in encabezados]
+            NominaService.validar_columnas(encabezados)
+
+            for linea, valores in enumerate(filas, start=2):
+                if not any(v is not None and str(v).strip() for v in valores):
+                    continue
+                yield linea, {
+                    encabezados[i]: (str(v).strip() if v is not None else '')
+                    for i, v in enumerate(valores) if i < len(encabezados) and encabezados[i]
+                }
+        finally:
+            wb.close()
+
+    @staticmethod
+    def _iterar_json(archivo):
+        with open(archivo, 'r', encoding='utf-8-sig') as f:
+            data = json.load(f)
+
+        if not isinstance(data, dict) or not isinstance(data.get('trabajadores'), list):
+            raise ValidationException(
+                'El archivo JSON debe contener una clave "trabajadores" con array de trabajadores'
+            )
+
+        ciclo_id_json = data['ciclo'].get('id') if isinstance(data.get('ciclo'), dict) else None
+
+        for linea, item in enumerate(data['trabajadores'], start=1):
+            beneficio = item.get('beneficio', {})
+            if isinstance(beneficio, dict):
+                tipo = beneficio.get('tipo', '')
+                valor = beneficio.get('valor')
+                beneficio = f"{tipo}:{valor}" if valor else tipo
+            yield linea, {
+                'rut': str(item.get('rut', '')).strip(),
+                'nombre': str(item.get('nombre', '')).strip(),
+                'seccion': str(item.get('seccion', '')).strip(),
+                'contrato': str(item.get('contrato', '')).strip(),
+                'sucursal': str(item.get('sucursal', '')).strip(),
+                'beneficio': str(beneficio or '').strip(),
+                'ciclo_id': ciclo_id_json or item.get('ciclo_id'),
+                'observaciones': str(item.get('observaciones', '')).strip(),
+                'email': str(item.get('email', '')).strip(),
+                'telefono': str(item.get('telefono', '')).strip(),
+            }
+
+    # ------------------------------------------------------------------
+    # Parseo
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def normalizar_contrato(contrato):
+        """Devuelve el contrato canonico o None si no matchea."""
+        if not contrato:
+            return None
+        key = ' '.join(contrato.lower().replace('_', ' ').replace('-', ' ').split())
+        return CONTRATOS_CANONICOS.get(key)
+
+    @staticmethod
+    def normalizar_sucursal(sucursal):
+        """Devuelve la sucursal canonica o None si no matchea."""
+        if not sucursal:
+            return None
+        key = ' '.join(sucursal.lower().split())
+        return SUCURSALES_CANONICAS.get(key)
+
+    @staticmethod
+    def parsear_fila(row: Dict, linea: int) -> Tuple[Optional[Dict], List[Tuple[str, str]]]:
+        """
+        Parsea y valida una fila del archivo.
+
+        Args:
+            row: Fila con claves en minúscula
+            linea: Número de línea (para mensajes)
+
+        Returns:
+            (datos, avisos): datos del trabajador o None si la fila es inválida,
+            y lista de avisos (nivel, mensaje) con nivel 'error'/'warning'/'notice'
+        """
+        avisos = []
+
+        # 1. VALIDAR Y LIMPIAR RUT
+        rut = str(row.get('rut', '') or '').strip()
+        if not rut:
+            return None, [('error', f'Línea {linea}: RUT vacío')]
+
+        rut = InputSanitizer.sanitize_rut(rut)
+        rut_limpio = RUTValidator.limpiar_rut(rut)
+        es_valido, error = RUTValidator.validar_formato(rut_limpio)
+        if not es_valido:
+            return None, [('error', f'Línea {linea}: RUT inválido {rut} - {error}')]
+
+        # 2. VALIDAR NOMBRE
+        nombre = str(row.get('nombre', '') or '').strip()
+        if not nombre:
+            return None, [('error', f'Línea {linea}: Nombre vacío')]
+        nombre = InputSanitizer.sanitize_string(nombre, max_length=200)
+
+        # 3. CAMPOS OBLIGATORIOS (almacenamos todo en beneficio_disponible)
+        seccion = InputSanitizer.sanitize_string(str(row.get('seccion', '') or '').strip(), max_length=100)
+        contrato_raw = InputSanitizer.sanitize_string(str(row.get('contrato', '') or '').strip(), max_length=50)
+        sucursal_raw = InputSanitizer.sanitize_string(str(row.get('sucursal', '') or '').strip(), max_length=50)
+
+        contrato = NominaService.normalizar_contrato(contrato_raw)
+        if contrato_raw and not contrato:
+            contrato = contrato_raw
+            avisos.append(('warning',
+                f'Línea {linea}: Tipo de contrato no reconocido "{contrato_raw}". '
+                f'Use uno de: Indefinido, Plazo Fijo, Part Time, Honorarios, Externos.'))
+
+        sucursal_codigo = NominaService.normalizar_sucursal(sucursal_raw)
+        if sucursal_raw and not sucursal_codigo:
+            sucursal_codigo = sucursal_raw
+            avisos.append(('warning',
+                f'Línea {linea}: Sucursal no reconocida "{sucursal_raw}". '
+                f'Use una de: Casablanca, Valparaiso Planta BIF, Valparaiso Planta BIC.'))
+
+        # CICLO ID - para asociar beneficio a ciclo específico
+        ciclo_id = row.get('ciclo_id', '')
+        if ciclo_id:
+            try:
+                ciclo_id = int(ciclo_id)
+            except (ValueError, TypeError):
+                avisos.append(('warning', f'Línea {linea}: ciclo_id inválido "{ciclo_id}" para {nombre}. Se usará None.'))
+                ciclo_id = None
+        else:
+            ciclo_id = None
+
+        if not seccion:
+            avisos.append(('warning', f'Línea {linea}: Sección vacía para {nombre}'))
+        if not contrato:
+            avisos.append(('warning', f'Línea {linea}: Tipo de contrato vacío para {nombre}'))
+
+        # 4. CAMPOS OPCIONALES
+        email = row.get('email', '')
+        if email:
+            email = InputSanitizer.sanitize_email(str(email).strip())
+        telefono = row.get('telefono', '')
+        if telefono:
+            telefono = InputSanitizer.sanitize_phone(str(telefono).strip())
+        observaciones = InputSanitizer.sanitize_string(str(row.get('observaciones', '') or '').strip(), max_length=500)
+
+        # 5. PROCESAR BENEFICIO
+        beneficio_raw = str(row.get('beneficio', '') or '').strip().upper()
+        beneficio = {}
+        sin_beneficio = False
+        motivo_sin_beneficio = None
+
+        if not beneficio_raw or beneficio_raw in VALORES_SIN_BENEFICIO:
+            sin_beneficio = True
+            motivo_sin_beneficio = observaciones or 'No especificado en nómina'
+            avisos.append(('notice', f'Línea {linea}: {nombre} - SIN BENEFICIO ({motivo_sin_beneficio})'))
+            # Guardar metadata en beneficio_disponible de todos modos
+            beneficio = {
+                'tipo': 'SIN_BENEFICIO',
+                'motivo': motivo_sin_beneficio,
+                'seccion': seccion,
+                'tipo_contrato': contrato,
+                'email': email,
+                'telefono': telefono,
+                'sucursal': sucursal_codigo,
+            }
+            if ciclo_id:
+                beneficio['ciclo_id'] = ciclo_id
+        else:
+            # Parsear beneficio: puede ser "CAJA", "VALE", "VALE:5000", "MONTO:10000"
+            try:
+                if ':' in beneficio_raw:
+                    tipo, valor = beneficio_raw.split(':', 1)
+                    beneficio = {
+                        'tipo': tipo.strip(),
+                        'valor': int(valor) if tipo.strip() == 'MONTO' else valor.strip()
+                    }
+                else:
+                    beneficio = {'tipo': beneficio_raw, 'valor': None}
+
+                # Agregar metadata adicional al beneficio
+                if seccion:
+                    beneficio['seccion'] = seccion
+                if contrato:
+                    beneficio['tipo_contrato'] = contrato
+                if email:
+                    beneficio['email'] = email
+                if telefono:
+                    beneficio['telefono'] = telefono
+                if sucursal_codigo:
+                    beneficio['sucursal'] = sucursal_codigo
+                if ciclo_id:
+                    beneficio['ciclo_id'] = ciclo_id
+            except Exception as e:
+                avisos.append(('warning', f'Línea {linea}: Formato de beneficio inválido "{beneficio_raw}": {e}'))
+                beneficio = {'tipo': beneficio_raw, 'error': str(e)}
+
+        # 6. CONSTRUIR OBJETO TRABAJADOR
+        return {
+            'rut': rut_limpio,
+            'nombre': nombre,
+            'beneficio_disponible': beneficio or {},
+            'sucursal_codigo': sucursal_codigo,
+            '_sin_beneficio': sin_beneficio,
+            '_motivo_sin_beneficio': motivo_sin_beneficio,
+        }, avisos
+
+    # ------------------------------------------------------------------
+    # Previsualización
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def previsualizar(archivo: str, actualizar: bool = False, sheet_name: str = 'Nomina') -> Dict:
+        """
+        Compara el archivo contra la tabla Trabajador sin escribir en BD.
+
+        Los RUT existentes se resuelven con una sola búsqueda masiva
+        (troceada solo si la BD limita los parámetros por consulta) y cada
+        fila queda clasificada como crear, actualizar (con diferencias por
+        campo), sin_cambios, omitido (existe y actualizar=False) o invalido
+        (error de parseo o RUT duplicado en el archivo).
+
+        Args:
+            archivo: Ruta al archivo .csv, .xlsx o .json
+            actualizar: Si la carga sobrescribirá trabajadores existentes
+            sheet_name: Hoja Excel
+
+        Returns:
+            dict: resumen (conteos por clase y primeros errores) y detalle
+                (lista ordenada por fila con fila, rut, nombre, clase y
+                cambios o error según corresponda)
+
+        Raises:
+            ValidationException: Formato no soportado, columnas faltantes o archivo ilegible
+        """
+        inicio = time.monotonic()
+        resumen = {
+            'total_registros': 0,
+            'validos': 0,
+            'invalidos': 0,
+            'a_crear': 0,
+            'a_actualizar': 0,
+            'sin_cambios': 0,
+            'omitidos': 0,
+            'duplicados': 0,
+            'sin_beneficio': 0,
+            'errores': [],
+        }
+        detalle = []
+        parseados = []
+        primera_linea = {}
+
+        def _invalido(linea, rut, error):
+            resumen['invalidos'] += 1
+            detalle.append({'fila': linea, 'rut': rut, 'nombre': None, 'clase': 'invalido', 'error': error})
+            if len(resumen['errores']) < MAX_ERRORES_DETALLE:
+                resumen['errores'].append({'fila': linea, 'rut': rut, 'error': error})
+
+        try:
+            for linea, row in NominaService.iterar_filas(archivo, sheet_name):
+                resumen['total_registros'] += 1
+                datos, avisos = NominaService.parsear_fila(row, linea)
+                if datos is None:
+                    _invalido(
+                        linea, str(row.get('rut', '')),
+                        next((m for n, m in avisos if n == 'error'), 'Fila inválida')
+                    )
+                    continue
+
+                rut = datos['rut']
+                if rut in primera_linea:
+                    resumen['duplicados'] += 1
+                    _invalido(linea, rut, f'RUT duplicado en el archivo (ya aparece en la línea {primera_linea[rut]})')
+                    continue
+                primera_linea[rut] = linea
+
+                resumen['validos'] += 1
+                if datos['_sin_beneficio']:
+                    resumen['sin_beneficio'] += 1
+                parseados.append((linea, datos))
+        except FileNotFoundError:
+            raise ValidationException(f'Archivo no encontrado: {archivo}')
+        except (UnicodeDecodeError, csv.Error, json.JSONDecodeError) as e:
+            raise ValidationException(f'Error leyendo archivo: {e}')
+
+        existentes = NominaService._buscar_existentes(list(primera_linea))
+
+        for linea, datos in parseados:
+            item = {'fila': linea, 'rut': datos['rut'], 'nombre': datos['nombre']}
+            actual = existentes.get(datos['rut'])
+            if actual is None:
+                item['clase'] = 'crear'
+                resumen['a_crear'] += 1
+            else:
+                cambios = NominaService.diferencias(actual, datos)
+                if not cambios:
+                    item['clase'] = 'sin_cambios'
+                    resumen['sin_cambios'] += 1
+                elif actualizar:
+                    item['clase'] = 'actualizar'
+                    item['cambios'] = cambios
+                    resumen['a_actualizar'] += 1
+                else:
+                    item['clase'] = 'omitido'
+                    item['cambios'] = cambios
+                    resumen['omitidos'] += 1
+            detalle.append(item)
+
+        detalle.sort(key=lambda item: item['fila'])
+        resumen['duracion_segundos'] = round(time.monotonic() - inicio, 3)
+        logger.info(
+            f"Preview de nómina: {resumen['total_registros']} filas, {resumen['a_crear']} a crear, "
+            f"{resumen['a_actualizar']} a actualizar, {resumen['sin_cambios']} sin cambios, "
+            f"{resumen['invalidos']} inválidos ({resumen['duracion_segundos']}s)"
+        )
+        return {'resumen': resumen, 'detalle': detalle}
+
+    @staticmethod
+    def _buscar_existentes(ruts: List[str]) -> Dict[str, Tuple[str, Dict]]:
+        """
+        Obtiene RUT -> (nombre, beneficio) de los trabajadores existentes.
+        Una consulta por cada `max_query_params` RUTs (una sola en PostgreSQL).
+        """
+        existentes = {}
+        if not ruts:
+            return existentes
+        tamano = connection.features.max_query_params or len(ruts)
+        for i in range(0, len(ruts), tamano):
+            existentes.update(
+                (rut, (nombre, beneficio))
+                for rut, nombre, beneficio in Trabajador.objects.filter(
+                    rut__in=ruts[i:i + tamano]
+                ).values_list('rut', 'nombre', 'beneficio_disponible')
+            )
+        return existentes
+
+    @staticmethod
+    def diferencias(actual: Tuple[str, Dict], datos: Dict) -> Dict[str, Dict]:
+        """
+        Diferencias por campo entre el trabajador actual y la fila parseada.
+
+        Las claves de beneficio_disponible se comparan una a una
+        ('beneficio_disponible.tipo', ...) con el mismo criterio de igualdad
+        que usa importar(): con actualizar=True una fila sin diferencias es
+        exactamente una fila que la carga contará como sin cambios (con
+        actualizar=False la carga la cuenta como omitida).
+
+        Returns:
+            dict: campo -> {'actual': valor, 'nuevo': valor}; vacío si no hay cambios
+        """
+        nombre_actual, beneficio_actual = actual
+        cambios = {}
+        if nombre_actual != datos['nombre']:
+            cambios['nombre'] = {'actual': nombre_actual, 'nuevo': datos['nombre']}
+
+        beneficio_actual = beneficio_actual or {}
+        beneficio_nuevo = datos['beneficio_disponible']
+        for clave in sorted(set(beneficio_actual) | set(beneficio_nuevo)):
+            valor_actual = beneficio_actual.get(clave, _AUSENTE)
+            valor_nuevo = beneficio_nuevo.get(clave, _AUSENTE)
+            if valor_actual != valor_nuevo:
+                cambios[f'beneficio_disponible.{clave}'] = {
+                    'actual': None if valor_actual is _AUSENTE else valor_actual,
+                    'nuevo': None if valor_nuevo is _AUSENTE else valor_nuevo,
+                }
+        return cambios
+
+    @staticmethod
+    def guardar_preview(preview: Dict, usuario=None) -> str:
+        """
+        Guarda el detalle de un preview en caché para consultarlo paginado.
+
+        Returns:
+            str: preview_id (válido durante settings.NOMINA_PREVIEW_TTL segundos)
+        """
+        preview_id = uuid.uuid4().hex
+        cache.set(
+            f'{PREVIEW_CACHE_PREFIX}:{preview_id}',
+            {
+                'usuario_id': getattr(usuario, 'pk', None),
+                'resumen': preview['resumen'],
+                'detalle': preview['detalle'],
+            },
+            timeout=getattr(settings, 'NOMINA_PREVIEW_TTL', 900),
+        )
+        return preview_id
+
+    @staticmethod
+    def obtener_preview(preview_id: str, usuario=None) -> Optional[Dict]:
+        """
+        Recupera un preview guardado con guardar_preview().
+
+        Returns:
+            dict con resumen y detalle, o None si expiró, no existe o
+            pertenece a otro usuario
+        """
+        guardado = cache.get(f'{PREVIEW_CACHE_PREFIX}:{preview_id}')
+        if guardado is None or guardado['usuario_id'] != getattr(usuario, 'pk', None):
+            return None
+        return guardado
+
+    # ------------------------------------------------------------------
+    # Importación
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def importar(
+        archivo: str,
+        actualizar: bool = False,
+        dry_run: bool = False,
+        batch_size: Optional[int] = None,
+        sheet_name: str = 'Nomina',
+        sucursal_defecto: Optional[str] = None,
+        usuario=None,
+        archivo_nombre: Optional[str] = None,
+        upsert: Optional[bool] = None,
+        on_aviso: Optional[Callable[[str, str], None]] = None,
+        on_progreso: Optional[Callable[[Dict], None]] = None,
+        debe_cancelar: Optional[Callable[[], bool]] = None,
+        carga: Optional[NominaCarga] = None,
+    ) -> Dict:
+        """
+        Importa una nómina completa en lotes dentro de una transacción.
+
+        Args:
+            archivo: Ruta al archivo
+            actualizar: Actualizar trabajadores existentes (si no, se omiten)
+            dry_run: Clasificar sin escribir en BD (no registra NominaCarga)
+            batch_size: Filas por lote (settings.NOMINA_BATCH_SIZE)
+            sheet_name: Hoja Excel
+            sucursal_defecto: Código de sucursal a usar si la indicada no existe
+            usuario: Usuario que realiza la carga (para NominaCarga)
+            archivo_nombre: Nombre original del archivo (para NominaCarga)
+            upsert: Forzar (True) o evitar (False) INSERT ... ON CONFLICT;
+                None = usar si la BD lo soporta y actualizar=True
+            on_aviso: Callback (nivel, mensaje) para avisos de parseo
+            on_progreso: Callback con el resultado parcial tras cada lote
+            debe_cancelar: Callback consultado tras cada lote; si retorna True
+                se lanza CargaCancelada y se revierte toda la carga
+            carga: NominaCarga existente a finalizar (trabajos en segundo plano);
+                si es None se crea un registro nuevo
+
+        Returns:
+            dict: total_registros, validos, invalidos, creados, actualizados,
+                sin_cambios, omitidos, duplicados, sin_beneficio,
+                sucursales_no_encontradas, errores, duracion_segundos,
+                filas_por_segundo, carga_id
+        """
+        batch_size = batch_size or getattr(settings, 'NOMINA_BATCH_SIZE', 1000)
+        if upsert is None:
+            upsert = actualizar and connection.features.supports_update_conflicts_with_target
+        inicio = time.monotonic()
+
+        resultado = {
+            'total_registros': 0,
+            'validos': 0,
+            'invalidos': 0,
+            'creados': 0,
+            'actualizados': 0,
+            'sin_cambios': 0,
+            'omitidos': 0,
+            'duplicados': 0,
+            'sin_beneficio': 0,
+            'sucursales_no_encontradas': 0,
+            'cambios_beneficio': 0,
+            'errores': [],
+        }
+
+        # Prefetch único: RUT -> (id, nombre, beneficio) y sucursales conocidas
+        existentes = {
+            rut: (pk, nombre, beneficio)
+            for rut, pk, nombre, beneficio in Trabajador.objects.values_list(
+                'rut', 'id', 'nombre', 'beneficio_disponible'
+            ).iterator(chunk_size=5000)
+        }
+        sucursales = set()
+        for codigo, nombre in Sucursal.objects.values_list('codigo', 'nombre'):
+            sucursales.add(codigo.lower())
+            sucursales.add(nombre.lower())
+        if sucursal_defecto and sucursal_defecto.lower() not in sucursales:
+            sucursal_defecto = None
+
+        vistos = set()
+        ruts_escritos = []
+
+        def _aviso(nivel, mensaje):
+            if on_aviso:
+                on_aviso(nivel, mensaje)
+
+        try:
+            with transaction.atomic():
+                filas = NominaService.iterar_filas(archivo, sheet_name)
+                while True:
+                    lote = list(islice(filas, batch_size))
+                    if not lote:
+                        break
+
+                    nuevos, modificados = NominaService._clasificar_lote(
+                        lote, existentes, sucursales, sucursal_defecto, vistos,
+                        actualizar, resultado, _aviso
+                    )
+
+                    if not dry_run:
+                        NominaService._escribir_lote(nuevos, modificados, upsert, batch_size)
+                        ruts_escritos.extend(t.rut for t in nuevos)
+                        ruts_escritos.extend(t.rut for t in modificados)
+
+                    resultado['creados'] += len(nuevos)
+                    resultado['actualizados'] += len(modificados)
+
+                    if on_progreso:
+                        on_progreso(NominaService._con_metricas(resultado, inicio))
+                    if debe_cancelar and debe_cancelar():
+                        raise CargaCancelada()
+
+                if not dry_run:
+                    NominaService._asegurar_sucursales_por_defecto()
+                    carga = NominaService._registrar_carga(
+                        resultado, usuario, archivo_nombre or archivo.rsplit('/', 1)[-1], carga
+                    )
+                    resultado['carga_id'] = carga.id
+                    transaction.on_commit(
+                        lambda: nomina_importada.send(
+                            sender=NominaCarga, instance=carga, ruts=ruts_escritos
+                        )
+                    )
+        except FileNotFoundError:
+            raise ValidationException(f'Archivo no encontrado: {archivo}')
+        except (UnicodeDecodeError, csv.Error, json.JSONDecodeError) as e:
+            raise ValidationException(f'Error leyendo archivo: {e}')
+
+        resultado = NominaService._con_metricas(resultado, inicio)
+        logger.info(
+            f"Nómina {'simulada' if dry_run else 'importada'}: {resultado['total_registros']} filas, "
+            f"{resultado['creados']} creados, {resultado['actualizados']} actualizados, "
+            f"{resultado['invalidos']} inválidos ({resultado['filas_por_segundo']} filas/s)"
+        )
+        return resultado
+
+    @staticmethod
+    def _clasificar_lote(lote, existentes, sucursales, sucursal_defecto, vistos,
+                         actualizar, resultado, aviso):
+        """
+        Parsea un lote y lo separa en trabajadores nuevos y modificados.
+        Actualiza `existentes` y `vistos` para detectar duplicados entre lotes.
+        """
+        nuevos = []
+        modificados = []
+
+        for linea, row in lote:
+            resultado['total_registros'] += 1
+            datos, avisos = NominaService.parsear_fila(row, linea)
+            for nivel, mensaje in avisos:
+                aviso(nivel, mensaje)
+
+            if datos is None:
+                resultado['invalidos'] += 1
+                if len(resultado['errores']) < MAX_ERRORES_DETALLE:
+                    resultado['errores'].append({
+                        'fila': linea,
+                        'rut': str(row.get('rut', '')),
+                        'error': next((m for n, m in avisos if n == 'error'), 'Fila inválida'),
+                    })
+                continue
+
+            resultado['validos'] += 1
+            rut = datos['rut']
+            if rut in vistos:
+                resultado['duplicados'] += 1
+                aviso('warning', f'Línea {linea}: RUT {rut} duplicado en el archivo, se omite')
+                continue
+            vistos.add(rut)
+
+            if datos['_sin_beneficio']:
+                resultado['sin_beneficio'] += 1
+
+            codigo = datos['sucursal_codigo']
+            if codigo and codigo.lower() not in sucursales:
+                resultado['sucursales_no_encontradas'] += 1
+                if sucursal_defecto:
+                    aviso('notice', f'  {datos["nombre"]}: Usando sucursal por defecto {sucursal_defecto}')
+                else:
+                    aviso('warning', f'  {datos["nombre"]}: Sucursal "{codigo}" no existe')
+
+            beneficio = datos['beneficio_disponible']
+            actual = existentes.get(rut)
+            if actual is None:
+                nuevos.append(Trabajador(rut=rut, nombre=datos['nombre'], beneficio_disponible=beneficio))
+                existentes[rut] = (None, datos['nombre'], beneficio)
+                continue
+
+            pk, nombre_actual, beneficio_actual = actual
+            if not actualizar:
+                resultado['omitidos'] += 1
+                continue
+            if nombre_actual == datos['nombre'] and (beneficio_actual or {}) == beneficio:
+                resultado['sin_cambios'] += 1
+                continue
+
+            # Efecto explícito del pre_save de Trabajador (bulk_update no lo dispara)
+            tipo_anterior = (beneficio_actual or {}).get('tipo')
+            if tipo_anterior != beneficio.get('tipo'):
+                resultado['cambios_beneficio'] += 1
+                logger.debug(f"Cambio de beneficio {rut}: {tipo_anterior} -> {beneficio.get('tipo')}")
+
+            modificados.append(Trabajador(id=pk, rut=rut, nombre=datos['nombre'], beneficio_disponible=beneficio))
+            existentes[rut] = (pk, datos['nombre'], beneficio)
+
+        return nuevos, modificados
+
+    @staticmethod
+    def _escribir_lote(nuevos, modificados, upsert, batch_size):
+        """Persiste un lote con bulk_create/bulk_update o upsert nativo."""
+        if upsert:
+            filas = nuevos + modificados
+            if filas:
+                Trabajador.objects.bulk_create(
+                    filas,
+                    batch_size=batch_size,
+                    update_conflicts=True,
+                    unique_fields=['rut'],
+                    update_fields=CAMPOS_IMPORTADOS,
+                )
+            return
+
+        if nuevos:
+            Trabajador.objects.bulk_create(nuevos, batch_size=batch_size)
+        if modificados:
+            Trabajador.objects.bulk_update(modificados, CAMPOS_IMPORTADOS, batch_size=batch_size)
+
+    @staticmethod
+    def _asegurar_sucursales_por_defecto():
+        """Crea las sucursales canónicas si no existen (una consulta si ya están)."""
+        por_defecto = [
+            ('Casablanca', 'CASA'),
+            ('Valparaiso Planta BIF', 'BIF'),
+            ('Valparaiso Planta BIC', 'BIC'),
+        ]
+        existentes = set(
+            Sucursal.objects.filter(codigo__in=[c for _, c in por_defecto]).values_list('codigo', flat=True)
+        )
+        faltantes = [Sucursal(nombre=n, codigo=c) for n, c in por_defecto if c not in existentes]
+        if faltantes:
+            Sucursal.objects.bulk_create(faltantes, ignore_conflicts=True)
+            # bulk_create no dispara post_save de Sucursal
+            transaction.on_commit(lambda: invalidate_config('sucursales'))
+
+    @staticmethod
+    def _registrar_carga(resultado, usuario, archivo_nombre, carga=None) -> NominaCarga:
+        """
+        Registra la carga en NominaCarga para auditoría.
+        Si se recibe `carga` (trabajo en segundo plano) se finaliza ese registro
+        dentro de la misma transacción que los datos importados.
+        """
+        campos = {
+            'ciclo': Ciclo.objects.filter(activo=True).first(),
+            'total_registros': resultado['total_registros'],
+            'creados': resultado['creados'],
+            'actualizados': resultado['actualizados'],
+            'sin_beneficio': resultado['sin_beneficio'],
+            'errores': resultado['invalidos'],
+            'observaciones': (
+                f"{resultado['invalidos']} inválidos, {resultado['duplicados']} duplicados, "
+                f"{resultado['omitidos']} omitidos, {resultado['sin_cambios']} sin cambios"
+            ),
+        }
+        if carga is None:
+            return NominaCarga.objects.create(
+                usuario=usuario if getattr(usuario, 'is_authenticated', False) else None,
+                archivo_nombre=archivo_nombre[:255],
+                **campos,
+            )
+
+        campos.update(
+            estado='completada',
+            finalizada_at=timezone.now(),
+            resultado={k: v for k, v in resultado.items() if k != 'errores'}
+            | {'errores_detalle': resultado['errores'][:MAX_ERRORES_PROGRESO]},
+        )
+        for campo, valor in campos.items():
+            setattr(carga, campo, valor)
+        carga.save(update_fields=list(campos))
+        return carga
+
+    @staticmethod
+    def _con_metricas(resultado, inicio) -> Dict:
+        """Agrega duración y filas/segundo al resultado."""
+        duracion = time.monotonic() - inicio
+        return {
+            **resultado,
+            'duracion_segundos': round(duracion, 3),
+            'filas_por_segundo': round(resultado['total_registros'] / duracion, 1) if duracion > 0 else 0,
+        }
+
+    # ------------------------------------------------------------------
+    # Cargas en segundo plano
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def encolar_carga(archivo_subido, actualizar: bool = False, usuario=None) -> NominaCarga:
+        """
+        Persiste el archivo subido y encola su importación.
+
+        El trabajo se despacha a Celery tras el commit (tarea
+        procesar_carga_nomina); si el broker no está disponible se procesa
+        en un thread del proceso para no bloquear el request.
+
+        Args:
+            archivo_subido: UploadedFile del request
+            actualizar: Actualizar trabajadores existentes
+            usuario: Usuario que sube la nómina
+
+        Returns:
+            NominaCarga en estado 'pendiente'
+
+        Raises:
+            ValidationException: Si la extensión no es soportada
+        """
+        nombre = archivo_subido.name.rsplit('/', 1)[-1]
+        if not nombre.lower().endswith(EXTENSIONES_NOMINA):
+            raise ValidationException('Formato no soportado. Use .csv, .xlsx o .json')
+
+        carga = NominaCarga(
+            estado='pendiente',
+            usuario=usuario if getattr(usuario, 'is_authenticated', False) else None,
+            archivo_nombre=nombre[:255],
+            actualizar=actualizar,
+        )
+        carga.archivo.save(f'{uuid.uuid4().hex}_{nombre}', archivo_subido, save=False)
+        carga.save()
+
+        carga_id = carga.id
+
+        def _despachar():
+            tarea = despachar_tarea(
+                'procesar_carga_nomina', (carga_id,), NominaService._procesar_en_thread,
+                f'carga de nómina {carga_id}',
+            )
+            if tarea is not None:
+                NominaCarga.objects.filter(pk=carga_id).update(task_id=tarea.id or '')
+
+        transaction.on_commit(_despachar)
+        logger.info(f"Carga de nómina {carga_id} encolada: {nombre}")
+        return carga
+
+    @staticmethod
+    def _procesar_en_thread(carga_id: int) -> None:
+        """Ejecuta procesar_carga fuera del ciclo request/response."""
+        try:
+            NominaService.procesar_carga(carga_id)
+        finally:
+            close_old_connections()
+
+    @staticmethod
+    def procesar_carga(carga_id: int) -> Dict:
+        """
+        Ejecuta una carga encolada y finaliza su NominaCarga.
+
+        Solo toma cargas en estado 'pendiente' (UPDATE condicional), de modo
+        que una entrega duplicada de la tarea no procesa dos veces el archivo.
+        El progreso se publica en caché tras cada lote; la solicitud de
+        cancelación se consulta en BD tras cada lote y revierte la carga.
+        Al terminar (en cualquier estado final) se elimina el archivo subido.
+
+        Returns:
+            dict: carga_id, estado y resultado de importar() si completó
+        """
+        tomada = NominaCarga.objects.filter(pk=carga_id, estado='pendiente').update(
+            estado='procesando', iniciada_at=timezone.now()
+        )
+        if not tomada:
+            estado = NominaCarga.objects.filter(pk=carga_id).values_list('estado', flat=True).first()
+            logger.info(f"Carga de nómina {carga_id} no está pendiente ({estado}); se omite")
+            return {'carga_id': carga_id, 'estado': estado}
+
+        carga = NominaCarga.objects.select_related('usuario').get(pk=carga_id)
+        clave_progreso = f'{PROGRESO_CACHE_PREFIX}:{carga_id}'
+
+        def _publicar_progreso(parcial):
+            cache.set(clave_progreso, {
+                k: v for k, v in parcial.items() if k != 'errores'
+            } | {'errores_detalle': parcial['errores'][-MAX_ERRORES_PROGRESO:]}, timeout=PROGRESO_CACHE_TTL)
+
+        def _debe_cancelar():
+            return NominaCarga.objects.filter(pk=carga_id, cancelacion_solicitada=True).exists()
+
+        try:
+            with NominaService._ruta_local(carga.archivo) as ruta:
+                carga.total_estimado = NominaService.contar_filas(ruta)
+                carga.save(update_fields=['total_estimado'])
+                resultado = NominaService.importar(
+                    ruta,
+                    actualizar=carga.actualizar,
+                    usuario=carga.usuario,
+                    archivo_nombre=carga.archivo_nombre,
+                    on_progreso=_publicar_progreso,
+                    debe_cancelar=_debe_cancelar,
+                    carga=carga,
+                )
+            estado = 'completada'
+        except CargaCancelada:
+            estado = 'cancelada'
+            resultado = None
+            NominaCarga.objects.filter(pk=carga_id).update(
+                estado=estado, finalizada_at=timezone.now(),
+                observaciones='Cancelada por el usuario; no se aplicaron cambios',
+            )
+            logger.info(f"Carga de nómina {carga_id} cancelada")
+        except Exception as e:
+            estado = 'fallida'
+            resultado = None
+            NominaCarga.objects.filter(pk=carga_id).update(
+                estado=estado, finalizada_at=timezone.now(), detalle_error=str(e)[:2000],
+            )
+            logger.error(f"Carga de nómina {carga_id} fallida: {e}", exc_info=True)
+        finally:
+            cache.delete(clave_progreso)
+            NominaService._eliminar_archivo(carga_id)
+
+        return {'carga_id': carga_id, 'estado': estado, 'resultado': resultado}
+
+    @staticmethod
+    def progreso(carga: NominaCarga) -> Dict:
+        """
+        Estado y avance de una carga: filas procesadas, velocidad, ETA y errores.
+
+        Mientras la carga está en curso los conteos vienen de la caché que
+        publica procesar_carga(); al finalizar, del propio registro.
+        """
+        parcial = {}
+        if carga.estado == 'procesando':
+            parcial = cache.get(f'{PROGRESO_CACHE_PREFIX}:{carga.id}') or {}
+        elif carga.estado == 'completada':
+            parcial = carga.resultado or {}
+
+        procesados = parcial.get('total_registros', 0)
+        velocidad = parcial.get('filas_por_segundo', 0)
+        total = max(carga.total_estimado, procesados)
+
+        eta = None
+        if carga.estado == 'procesando' and velocidad:
+            eta = round((total - procesados) / velocidad, 1)
+        elif carga.estado in NominaCarga.ESTADOS_FINALES:
+            eta = 0
+
+        return {
+            'id': carga.id,
+            'estado': carga.estado,
+            'archivo_nombre': carga.archivo_nombre,
+            'actualizar': carga.actualizar,
+            'total_estimado': total,
+            'procesados': procesados,
+            'porcentaje': round(procesados * 100 / total, 1) if total else 0,
+            'filas_por_segundo': velocidad,
+            'eta_segundos': eta,
+            'creados': parcial.get('creados', 0),
+            'actualizados': parcial.get('actualizados', 0),
+            'sin_cambios': parcial.get('sin_cambios', 0),
+            'omitidos': parcial.get('omitidos', 0),
+            'errores': parcial.get('invalidos', 0),
+            'errores_detalle': parcial.get('errores_detalle', []),
+            'cancelacion_solicitada': carga.cancelacion_solicitada,
+            'detalle_error': carga.detalle_error,
+            'fecha_carga': carga.fecha_carga,
+            'iniciada_at': carga.iniciada_at,
+            'finalizada_at': carga.finalizada_at,
+        }
+
+    @staticmethod
+    def cancelar_carga(carga_id: int) -> str:
+        """
+        Cancela una carga encolada o solicita la cancelación de una en curso.
+
+        Una carga pendiente pasa directo a 'cancelada' (y se revoca su tarea);
+        una en curso se detiene al terminar el lote actual y revierte todo lo
+        importado.
+
+        Returns:
+            str: Estado resultante ('cancelada' o 'procesando')
+
+        Raises:
+            BusinessRuleException: Si la carga ya finalizó
+        """
+        ahora = timezone.now()
+        if NominaCarga.objects.filter(pk=carga_id, estado='pendiente').update(
+            estado='cancelada', cancelacion_solicitada=True, finalizada_at=ahora,
+            observaciones='Cancelada antes de iniciar',
+        ):
+            task_id = NominaCarga.objects.filter(pk=carga_id).values_list('task_id', flat=True).first()
+            if task_id:
+                try:
+                    from celery import current_app
+                    current_app.control.revoke(task_id)
+                except Exception as e:
+                    logger.warning(f"No se pudo revocar la tarea {task_id}: {e}")
+            NominaService._eliminar_archivo(carga_id)
+            logger.info(f"Carga de nómina {carga_id} cancelada antes de iniciar")
+            return 'cancelada'
+
+        if NominaCarga.objects.filter(pk=carga_id, estado='procesando').update(cancelacion_solicitada=True):
+            logger.info(f"Cancelación solicitada para carga de nómina {carga_id}")
+            return 'procesando'
+
+        raise BusinessRuleException('La carga ya finalizó y no puede cancelarse')
+
+    @staticmethod
+    def contar_filas(archivo: str) -> int:
+        """
+        Estimación barata del número de filas para calcular el ETA.
+        CSV: líneas del archivo; XLSX: dimensión de la hoja; JSON: largo del array.
+        """
+        nombre = archivo.lower()
+        try:
+            if nombre.endswith('.csv'):
+                with open(archivo, 'rb') as f:
+                    return max(sum(1 for _ in f) - 1, 0)
+            if nombre.endswith(('.xlsx', '.xls')):
+                import openpyxl
+                wb = openpyxl.load_workbook(archivo, read_only=True)
+                try:
+                    ws = wb['Nomina'] if 'Nomina' in wb.sheetnames else wb.active
+                    return max((ws.max_row or 1) - 1, 0)
+                finally:
+                    wb.close()
+            if nombre.endswith('.json'):
+                with open(archivo, 'r', encoding='utf-8-sig') as f:
+                    return len(json.load(f).get('trabajadores', []))
+        except Exception as e:
+            logger.debug(f"No se pudo estimar filas de {archivo}: {e}")
+        return 0
+
+    @staticmethod
+    @contextmanager
+    def _ruta_local(archivo):
+        """Ruta local del FileField; copia a un temporal si el storage no es local."""
+        try:
+            ruta = archivo.path
+        except NotImplementedError:
+            ruta = None
+        if ruta:
+            yield ruta
+            return
+
+        sufijo = os.path.splitext(archivo.name)[1]
+        with tempfile.NamedTemporaryFile(suffix=sufijo, delete=False) as tmp:
+            with archivo.open('rb') as origen:
+                for chunk in origen.chunks():
+                    tmp.write(chunk)
+        try:
+            yield tmp.name
+        finally:
+            os.unlink(tmp.name)
+
+    @staticmethod
+    def _eliminar_archivo(carga_id: int) -> None:
+        """Borra el archivo subido de una carga finalizada (contiene datos personales)."""
+        carga = NominaCarga.objects.filter(pk=carga_id).only('id', 'archivo').first()
+        if carga and carga.archivo:
+            carga.archivo.delete(save=False)
+            NominaCarga.objects.filter(pk=carga_id).update(archivo=None)
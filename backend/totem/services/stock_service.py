@@ -4,10 +4,20 @@ Servicio de lógica de negocio para Stock y Movimientos.
 Gestiona inventario de cajas por sucursal.
 """
 import structlog
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Sum, Q
+from django.db.models import F, Sum, Q, Value
+from django.db.models.functions import Greatest
 from django.utils import timezone
-from ..models import StockSucursal, StockMovimiento, Sucursal
+from ..cache import (
+    cache_stock_resumen, get_cached_stock_resumen, get_sucursal_por_codigo, get_sucursales,
+    invalidate_stock_resumen,
+)
+from ..exceptions import NoStockException
+from ..models import ReservaStock, StockSucursal, StockMovimiento, Sucursal, TicketEvent
 
 logger = structlog.get_logger(__name__)
 
@@ -23,46 +33,73 @@ class StockService:
         """
         Obtiene resumen consolidado de todo el inventario.
         
+        El stock se agrega en una sola consulta agrupada por sucursal con
+        sumas condicionales por producto; entregas del día y reservas
+        activas (ReservaStock) salen de dos conteos. El resultado se cachea
+        STOCK_RESUMEN_CACHE_TTL segundos y los movimientos de stock, reservas,
+        liberaciones y consumos lo invalidan.
+        
         Returns:
             dict: Resumen con totales y distribución
         """
-        logger.info("obtener_resumen_stock")
+        resumen = get_cached_stock_resumen()
+        if resumen is not None:
+            return resumen
         
-        stock_items = StockSucursal.objects.all()
-        total_disponible = stock_items.aggregate(total=Sum('cantidad'))['total'] or 0
+        logger.info("obtener_resumen_stock")
         
-        # Por tipo de producto
-        estandar = stock_items.filter(producto__iexact='Estándar').aggregate(s=Sum('cantidad'))['s'] or 0
-        premium = stock_items.filter(producto__iexact='Premium').aggregate(s=Sum('cantidad'))['s'] or 0
+        filas = StockSucursal.objects.values('sucursal').annotate(
+            total=Sum('cantidad'),
+            estandar=Sum('cantidad', filter=Q(producto__iexact='Estándar')),
+            premium=Sum('cantidad', filter=Q(producto__iexact='Premium')),
+        ).order_by()
+        
+        # StockSucursal.sucursal es texto: el tótem guarda el nombre y los
+        # movimientos de guardia str(Sucursal) ("codigo - nombre")
+        por_clave = {
+            fila['sucursal']: {campo: fila[campo] or 0 for campo in ('total', 'estandar', 'premium')}
+            for fila in filas
+        }
+        totales = {
+            campo: sum(fila[campo] for fila in por_clave.values())
+            for campo in ('total', 'estandar', 'premium')
+        }
         
-        # Por sucursal
         por_sucursal = []
-        sucursales = Sucursal.objects.all()
-        for suc in sucursales:
-            stock_suc = StockSucursal.objects.filter(sucursal=suc)
-            total_suc = stock_suc.aggregate(t=Sum('cantidad'))['t'] or 0
-            estandar_suc = stock_suc.filter(producto__iexact='Estándar').aggregate(s=Sum('cantidad'))['s'] or 0
-            premium_suc = stock_suc.filter(producto__iexact='Premium').aggregate(s=Sum('cantidad'))['s'] or 0
-            
+        for suc in get_sucursales():
+            claves = {suc.nombre, suc.codigo, str(suc)}
+            fila = {'total': 0, 'estandar': 0, 'premium': 0}
+            for clave in claves:
+                for campo, valor in por_clave.get(clave, {}).items():
+                    fila[campo] += valor
             por_sucursal.append({
                 'sucursal': suc.nombre,
                 'codigo': suc.codigo,
-                'total': total_suc,
-                'estandar': estandar_suc,
-                'premium': premium_suc
+                **fila
             })
         
-        return {
-            'disponible': total_disponible,
-            'entregadas_hoy': 0,  # TODO: integrar con tickets del día
-            'reservadas': 0,  # TODO: integrar con tickets pendientes
-            'total_mes': total_disponible,
+        # Rango semiabierto [hoy 00:00, mañana 00:00): timestamp__date castea
+        # la columna y no puede usar un índice
+        hoy = timezone.localdate()
+        inicio = timezone.make_aware(datetime.combine(hoy, time.min))
+        fin = timezone.make_aware(datetime.combine(hoy + timedelta(days=1), time.min))
+        resumen = {
+            'disponible': totales['total'],
+            'entregadas_hoy': TicketEvent.objects.filter(
+                tipo='entregado',
+                timestamp__gte=inicio,
+                timestamp__lt=fin,
+            ).count(),
+            'reservadas': ReservaStock.objects.filter(estado='activa').count(),
+            'total_mes': totales['total'],
             'por_tipo': {
-                'estandar': estandar,
-                'premium': premium
+                'estandar': totales['estandar'],
+                'premium': totales['premium']
             },
             'por_sucursal': por_sucursal
         }
+        cache_stock_resumen(resumen, timeout=getattr(settings, 'STOCK_RESUMEN_CACHE_TTL', 10))
+        return resumen
 
     @staticmethod
     def listar_movimientos(fecha_desde=None, fecha_hasta=None, sucursal_id=None, tipo_caja=None, accion=None, limit=200):
@@ -150,9 +187,8 @@ class StockService:
         # Obtener sucursal
         sucursal = None
         if sucursal_codigo:
-            try:
-                sucursal = Sucursal.objects.get(codigo=sucursal_codigo)
-            except Sucursal.DoesNotExist:
+            sucursal = get_sucursal_por_codigo(sucursal_codigo)
+            if sucursal is None:
                 return None, f"Sucursal no encontrada: {sucursal_codigo}"
         else:
             # Usar sucursal por defecto
@@ -225,18 +261,135 @@ class StockService:
             defaults={'cantidad': 0}
         )
         
+        # UPDATE atómicos: nunca leer-modificar-escribir la cantidad en Python
+        filas = StockSucursal.objects.filter(pk=stock.pk)
         if accion == 'agregar':
-            stock.cantidad += cantidad
+            filas.update(cantidad=F('cantidad') + cantidad)
         elif accion == 'retirar':
-            stock.cantidad -= cantidad
-            if stock.cantidad < 0:
-                logger.warning("stock_negativo", sucursal=sucursal.codigo, cantidad=stock.cantidad)
-                stock.cantidad = 0
+            if not filas.filter(cantidad__gte=cantidad).update(cantidad=F('cantidad') - cantidad):
+                logger.warning("stock_negativo", sucursal=sucursal.codigo, solicitado=cantidad)
+                filas.update(cantidad=Greatest(F('cantidad') - cantidad, Value(0)))
         
-        stock.save()
+        stock.refresh_from_db(fields=['cantidad'])
+        transaction.on_commit(invalidate_stock_resumen)
         logger.info("stock_actualizado", sucursal=sucursal.codigo, cantidad_final=stock.cantidad)
         return stock
 
+    @staticmethod
+    def reservar(sucursal_nombre, ticket):
+        """
+        Descuenta una unidad de stock de la sucursal y la reserva para el ticket.
+        
+        El descuento es un UPDATE condicional (cantidad = cantidad - 1 WHERE
+        cantidad > 0): dos tótems que compiten por la última unidad no pueden
+        obtenerla ambos ni dejar el stock negativo. Debe llamarse dentro de la
+        transacción que crea el ticket.
+        
+        Args:
+            sucursal_nombre (str): Sucursal del stock
+            ticket (Ticket): Ticket recién creado
+        
+        Returns:
+            ReservaStock: Reserva activa
+        
+        Raises:
+            NoStockException: Si ningún producto de la sucursal tiene stock
+        """
+        candidatos = StockSucursal.objects.filter(
+            sucursal=sucursal_nombre,
+            cantidad__gt=0
+        ).order_by('-cantidad').values_list('pk', flat=True)
+        
+        for stock_id in candidatos:
+            descontado = StockSucursal.objects.filter(
+                pk=stock_id,
+                cantidad__gt=0
+            ).update(cantidad=F('cantidad') - 1)
+            if descontado:
+                transaction.on_commit(invalidate_stock_resumen)
+                return ReservaStock.objects.create(stock_id=stock_id, ticket=ticket)
+        
+        logger.warning("sin_stock", sucursal=sucursal_nombre, ticket_id=ticket.pk)
+        raise NoStockException()
+
+    @staticmethod
+    @transaction.atomic
+    def liberar_reservas(ticket_ids):
+        """
+        Devuelve al stock las unidades reservadas por tickets expirados o anulados.
+        
+        Cada grupo de reservas de un mismo producto se cierra con un UPDATE
+        condicionado a estado='activa' y el stock se repone con las filas que
+        ese UPDATE efectivamente cambió: liberar dos veces el mismo ticket (o
+        hacerlo desde dos procesos a la vez) no devuelve la unidad dos veces.
+        
+        Args:
+            ticket_ids (list[int]): IDs de los tickets
+        
+        Returns:
+            int: Reservas liberadas
+        """
+        por_stock = defaultdict(list)
+        for pk, stock_id in ReservaStock.objects.filter(
+            ticket_id__in=list(ticket_ids),
+            estado='activa'
+        ).values_list('pk', 'stock_id'):
+            por_stock[stock_id].append(pk)
+        
+        ahora = timezone.now()
+        total = 0
+        for stock_id, pks in por_stock.items():
+            liberadas = ReservaStock.objects.filter(pk__in=pks, estado='activa').update(
+                estado='liberada',
+                cerrada_at=ahora
+            )
+            if liberadas:
+                StockSucursal.objects.filter(pk=stock_id).update(cantidad=F('cantidad') + liberadas)
+                total += liberadas
+        
+        if total:
+            transaction.on_commit(invalidate_stock_resumen)
+            logger.info("reservas_liberadas", cantidad=total)
+        return total
+
+    @staticmethod
+    def consumir_reserva(ticket):
+        """
+        Marca como consumida la reserva de un ticket entregado.
+        
+        Returns:
+            bool: True si el ticket tenía una reserva activa
+        """
+        consumida = ReservaStock.objects.filter(ticket=ticket, estado='activa').update(
+            estado='consumida',
+            cerrada_at=timezone.now()
+        )
+        if consumida:
+            transaction.on_commit(invalidate_stock_resumen)
+        return bool(consumida)
+
+    @staticmethod
+    def consumir_reserva_liberada(ticket):
+        """
+        Consume la reserva ya liberada de un ticket entregado tras expirar.
+        
+        Caso de la sincronización offline: la caja se entregó antes del TTL,
+        pero la expiración automática devolvió la unidad al stock antes de que
+        llegara el escaneo. La unidad se vuelve a descontar (sin bajar de 0:
+        la entrega física ya ocurrió).
+        
+        Returns:
+            bool: True si el ticket tenía una reserva liberada
+        """
+        reservas = ReservaStock.objects.filter(ticket=ticket, estado='liberada')
+        stock_id = reservas.values_list('stock_id', flat=True).first()
+        if stock_id is None or not reservas.update(estado='consumida', cerrada_at=timezone.now()):
+            return False
+        StockSucursal.objects.filter(pk=stock_id).update(cantidad=Greatest(F('cantidad') - 1, Value(0)))
+        transaction.on_commit(invalidate_stock_resumen)
+        logger.info("reserva_liberada_consumida", ticket_id=ticket.pk, stock_id=stock_id)
+        return True
+
     @staticmethod
     def obtener_alertas_stock_bajo(umbral=10):
         """
@@ -3,19 +3,25 @@ Servicio de lógica de negocio para Tickets.
 Implementa patrón Service Layer para encapsular operaciones complejas.
 """
 import logging
+import threading
 import uuid as uuid_lib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
-from io import BytesIO
 from typing import Dict, Optional
 
 from django.conf import settings
 from django.core.files.base import ContentFile
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Subquery
 from django.utils import timezone
-import qrcode
 
-from totem.models import Ticket, TicketEvent, Trabajador, Ciclo, CajaFisica, StockSucursal
+from totem.cache import get_ciclo_activo
+from totem.despacho import despachar_tarea
+from totem.models import Ticket, TicketEvent, Trabajador, Ciclo, CajaFisica
 from totem.security import QRSecurity
+from totem.signals import ticket_anulado, ticket_validado
+from totem.services.stock_service import StockService
+from totem.qr_render import QRRenderer, nombre_imagen_ticket
 from totem.validators import TicketValidator, RUTValidator
 from totem.exceptions import (
     TicketNotFoundException,
@@ -102,16 +108,6 @@ class TicketService:
         if pendiente_existente:
             raise TicketInvalidStateException('Ya existe un ticket pendiente para este trabajador en el ciclo actual')
         
-        # Verificar stock
-        stock = StockSucursal.objects.filter(
-            sucursal=sucursal_nombre,
-            cantidad__gt=0
-        ).first()
-        
-        if not stock:
-            logger.warning(f"Sin stock en sucursal {sucursal_nombre}")
-            raise NoStockException()
-        
         # Generar UUID y payload firmado
         ticket_uuid = str(uuid_lib.uuid4())
         payload_firmado = self.qr_security.crear_payload_firmado(ticket_uuid)
@@ -130,17 +126,18 @@ class TicketService:
             data={
                 'sucursal': sucursal_nombre,
                 'beneficio': trabajador.beneficio_disponible,
-                'ttl_minutos': ttl_minutos
+                'ttl_minutos': ttl_minutos,
+                'qr_payload': payload_firmado
             }
         )
         
-        # Generar imagen QR
-        qr_image_file = self._generar_imagen_qr(payload_firmado, ticket_uuid)
-        ticket.qr_image.save(f'ticket_{ticket_uuid}.png', qr_image_file, save=True)
+        # Reservar una unidad con un UPDATE condicional (sin leer-modificar-escribir);
+        # si no queda stock la excepción revierte también el ticket
+        StockService.reservar(sucursal_nombre, ticket)
         
-        # Decrementar stock
-        stock.cantidad -= 1
-        stock.save()
+        # La imagen QR se renderiza fuera de la transacción: el tótem recibe
+        # el payload de inmediato y puede dibujarlo o consultar la imagen.
+        self._programar_render_qr(ticket.id)
         
         # Crear evento
         TicketEvent.objects.create(
@@ -155,7 +152,6 @@ class TicketService:
         logger.info(f"Ticket {ticket_uuid} creado exitosamente para {rut_limpio}")
         return ticket
     
-    @transaction.atomic
     def validar_ticket_guardia(
         self,
         qr_payload: str,
@@ -187,72 +183,126 @@ class TicketService:
             logger.warning(f"QR inválido detectado: {resultado}")
             raise QRInvalidException(resultado)
         
-        ticket_uuid = resultado
+        return self.entregar_ticket(resultado, caja_codigo, guardia_username)
+    
+    @transaction.atomic
+    def entregar_ticket(
+        self,
+        ticket_uuid: str,
+        caja_codigo: str,
+        guardia_username: Optional[str] = None,
+        escaneado_at=None,
+        metadata: Optional[Dict] = None,
+        aceptar_expirado: bool = False
+    ) -> Ticket:
+        """
+        Ruta de escritura de una entrega en portería (QR ya validado).
+        Compartida por validar_ticket_guardia y GuardiaService.
         
-        # Obtener ticket con lock
+        Sin select_for_update: lee el ticket una vez (con el tipo de la caja
+        anotado) y aplica UPDATE condicionales (estado='pendiente',
+        usado=False). Si otro guardia ganó la carrera el UPDATE afecta 0 filas
+        y se aborta la transacción. Los tres eventos van en un bulk_create.
+        
+        Args:
+            ticket_uuid: UUID del ticket
+            caja_codigo: Código de la caja física
+            guardia_username: Usuario guardia que valida
+            escaneado_at: Hora del escaneo si se sincroniza offline (TTL y
+                timestamp de los eventos se evalúan a esa hora)
+            metadata: Datos extra para los eventos de la entrega
+            aceptar_expirado: Entregar también tickets ya marcados 'expirado'
+                (sincronización offline: el escaneo fue anterior al TTL y la
+                expiración automática corrió antes de sincronizar); la unidad
+                liberada se vuelve a descontar del stock
+            
+        Returns:
+            Ticket entregado
+            
+        Raises:
+            TicketNotFoundException: Si el ticket no existe
+            TicketExpiredException: Si el ticket expiró
+            TicketInvalidStateException: Si el ticket no está pendiente
+            NoStockException: Si la caja no está disponible
+        """
+        guardia = guardia_username or 'unknown'
+        caja_libre = CajaFisica.objects.filter(codigo=caja_codigo, usado=False)
         try:
-            ticket = Ticket.objects.select_for_update().get(uuid=ticket_uuid)
+            ticket = Ticket.objects.annotate(
+                caja_tipo=Subquery(caja_libre.values('tipo')[:1])
+            ).get(uuid=ticket_uuid)
         except Ticket.DoesNotExist:
             logger.warning(f"Ticket no encontrado: {ticket_uuid}")
             raise TicketNotFoundException()
         
         # Validar TTL
-        es_valido, error = TicketValidator.validar_ttl(ticket.ttl_expira_at)
+        es_valido, error = TicketValidator.validar_ttl(ticket.ttl_expira_at, escaneado_at)
         if not es_valido:
-            ticket.estado = 'expirado'
-            ticket.save()
-            TicketEvent.objects.create(ticket=ticket, tipo='expirado')
+            if Ticket.objects.filter(pk=ticket.pk, estado='pendiente').update(estado='expirado'):
+                ticket.estado = 'expirado'
+                StockService.liberar_reservas([ticket.id])
+                TicketEvent.objects.create(
+                    ticket=ticket,
+                    tipo='expirado',
+                    metadata={'validado_por_guardia': guardia}
+                )
+            logger.warning(f"Ticket {ticket_uuid} expirado")
             raise TicketExpiredException()
         
         # Validar estado
-        es_valido, error = TicketValidator.validar_estado(ticket.estado, ['pendiente'])
+        permitidos = ['pendiente', 'expirado'] if aceptar_expirado else ['pendiente']
+        es_valido, error = TicketValidator.validar_estado(ticket.estado, permitidos)
         if not es_valido:
             logger.warning(f"Intento de validar ticket {ticket_uuid} en estado {ticket.estado}")
             TicketEvent.objects.create(
                 ticket=ticket,
                 tipo='intento_duplicado',
-                metadata={'estado_actual': ticket.estado}
+                metadata={'estado_actual': ticket.estado, 'guardia': guardia}
             )
             raise TicketInvalidStateException(error)
         
-        # Verificar y asignar caja física
-        try:
-            caja = CajaFisica.objects.select_for_update().get(codigo=caja_codigo, usado=False)
-        except CajaFisica.DoesNotExist:
+        if ticket.caja_tipo is None:
             logger.error(f"Caja {caja_codigo} no disponible")
-            raise NoStockException("Caja física no disponible")
+            raise NoStockException("Caja física no disponible o ya usada")
         
-        caja.usado = True
-        caja.asignada_ticket = ticket
-        caja.save()
+        # Marcar como entregado solo si sigue pendiente (sin lock previo)
+        if not Ticket.objects.filter(pk=ticket.pk, estado__in=permitidos).update(estado='entregado'):
+            logger.warning(f"Ticket {ticket_uuid} entregado por otra validación concurrente")
+            raise TicketInvalidStateException("El ticket ya fue procesado")
+        
+        # Asignar la caja solo si sigue libre; si no, se revierte la entrega
+        if not caja_libre.update(usado=True, asignada_ticket=ticket):
+            logger.error(f"Caja {caja_codigo} usada por otra validación concurrente")
+            raise NoStockException("Caja física no disponible o ya usada")
         
-        # Marcar como entregado
         ticket.estado = 'entregado'
-        ticket.save()
+        if not StockService.consumir_reserva(ticket) and aceptar_expirado:
+            StockService.consumir_reserva_liberada(ticket)
+        
+        extra = {'guardia': guardia, **(metadata or {})}
+        if escaneado_at:
+            extra['escaneado_at'] = escaneado_at.isoformat()
+        momento = escaneado_at or timezone.now()
+        TicketEvent.objects.bulk_create([
+            TicketEvent(ticket=ticket, tipo='validado_guardia', timestamp=momento, metadata=extra),
+            TicketEvent(
+                ticket=ticket,
+                tipo='caja_verificada',
+                timestamp=momento,
+                metadata={'caja_codigo': caja_codigo, 'caja_tipo': ticket.caja_tipo, **extra}
+            ),
+            TicketEvent(ticket=ticket, tipo='entregado', timestamp=momento, metadata=extra),
+        ])
         
-        # Registrar eventos
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='validado_guardia',
-            metadata={'guardia': guardia_username or 'unknown'}
-        )
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='caja_verificada',
-            metadata={'caja_codigo': caja_codigo, 'caja_tipo': caja.tipo}
-        )
-        TicketEvent.objects.create(
-            ticket=ticket,
-            tipo='entregado',
-            metadata={'guardia': guardia_username or 'unknown'}
-        )
+        ticket_validado.send(sender=Ticket, instance=ticket, guardia=guardia)
         
-        logger.info(f"Ticket {ticket_uuid} validado y entregado correctamente")
+        logger.info(f"Ticket {ticket_uuid} validado y entregado por guardia {guardia}")
         return ticket
     
+    @transaction.atomic
     def anular_ticket(self, ticket_uuid: str, razon: str = '') -> Ticket:
         """
-        Anula un ticket pendiente.
+        Anula un ticket pendiente y devuelve su unidad de stock reservada.
         
         Args:
             ticket_uuid: UUID del ticket
@@ -262,7 +312,7 @@ class TicketService:
             Ticket anulado
         """
         try:
-            ticket = Ticket.objects.get(uuid=ticket_uuid)
+            ticket = Ticket.objects.select_for_update().get(uuid=ticket_uuid)
         except Ticket.DoesNotExist:
             raise TicketNotFoundException()
         
@@ -271,6 +321,7 @@ class TicketService:
         
         ticket.estado = 'anulado'
         ticket.save()
+        StockService.liberar_reservas([ticket.id])
         
         TicketEvent.objects.create(
             ticket=ticket,
@@ -278,6 +329,8 @@ class TicketService:
             metadata={'razon': razon}
         )
         
+        ticket_anulado.send(sender=Ticket, instance=ticket)
+        
         logger.info(f"Ticket {ticket_uuid} anulado: {razon}")
         return ticket
     
@@ -303,11 +356,11 @@ class TicketService:
         ttl_minutos = settings.QR_TTL_MINUTES
         ticket.ttl_expira_at = timezone.now() + timedelta(minutes=ttl_minutos)
         
-        # Regenerar QR con nueva firma
+        # Regenerar payload con nueva firma; la imagen se renderiza en segundo plano
         payload_firmado = self.qr_security.crear_payload_firmado(ticket_uuid)
-        qr_image_file = self._generar_imagen_qr(payload_firmado, ticket_uuid)
-        ticket.qr_image.save(f'ticket_{ticket_uuid}_reimpreso.png', qr_image_file, save=True)
+        ticket.data = {**(ticket.data or {}), 'qr_payload': payload_firmado}
         ticket.save()
+        self._programar_render_qr(ticket.id)
         
         TicketEvent.objects.create(
             ticket=ticket,
@@ -354,16 +407,117 @@ class TicketService:
             ]
         }
     
+    def obtener_qr_ticket(self, ticket_uuid: str) -> Dict:
+        """
+        Obtiene el payload QR de un ticket y el estado de su imagen.
+        Pensado para que el tótem consulte (polling) la imagen renderizada.
+        
+        Args:
+            ticket_uuid: UUID del ticket
+            
+        Returns:
+            Diccionario con payload, URL de imagen (o None) y si está lista
+        """
+        ticket = Ticket.objects.filter(uuid=ticket_uuid).only('uuid', 'data', 'qr_image', 'estado').first()
+        if not ticket:
+            raise TicketNotFoundException()
+        
+        payload = (ticket.data or {}).get('qr_payload')
+        listo = self._imagen_vigente(ticket, payload)
+        return {
+            'uuid': ticket.uuid,
+            'estado': ticket.estado,
+            'qr_payload': payload,
+            'qr_image': ticket.qr_image.url if listo else None,
+            'qr_listo': listo,
+        }
+    
+    def renderizar_qr_ticket(self, ticket_id: int) -> Optional[str]:
+        """
+        Genera y guarda la imagen PNG del QR de un ticket.
+        Ejecutado por la tarea Celery o el pool local, nunca dentro de crear_ticket.
+        
+        El archivo se nombra por hash del payload: si ya está vigente no se
+        vuelve a escribir, y la imagen reemplazada (reimpresión) se elimina.
+        
+        Args:
+            ticket_id: ID del ticket
+            
+        Returns:
+            Nombre del archivo vigente, o None si no hay nada que renderizar
+        """
+        ticket = Ticket.objects.filter(id=ticket_id).only('id', 'uuid', 'data', 'qr_image').first()
+        if not ticket:
+            logger.warning(f"Render QR: ticket {ticket_id} no existe")
+            return None
+        
+        payload = (ticket.data or {}).get('qr_payload')
+        if not payload:
+            logger.warning(f"Render QR: ticket {ticket.uuid} sin payload")
+            return None
+        
+        if self._imagen_vigente(ticket, payload):
+            return ticket.qr_image.name
+        
+        anterior = ticket.qr_image.name if ticket.qr_image else None
+        storage = ticket.qr_image.storage
+        nombre = f"{ticket.qr_image.field.upload_to}{nombre_imagen_ticket(ticket.uuid, payload)}"
+        if not storage.exists(nombre):
+            nombre = storage.save(nombre, self._generar_imagen_qr(payload, ticket.uuid))
+        
+        # Solo actualizar la imagen: no pisar estado ni data modificados en paralelo
+        Ticket.objects.filter(id=ticket.id).update(qr_image=nombre)
+        
+        if anterior and anterior != nombre:
+            storage.delete(anterior)
+        
+        logger.info(f"Imagen QR renderizada para ticket {ticket.uuid}")
+        return nombre
+    
+    @staticmethod
+    def _imagen_vigente(ticket: Ticket, payload: Optional[str]) -> bool:
+        """Indica si la imagen guardada corresponde al payload actual del ticket."""
+        if not ticket.qr_image or not payload:
+            return False
+        return ticket.qr_image.name.endswith(nombre_imagen_ticket(ticket.uuid, payload))
+    
+    def _programar_render_qr(self, ticket_id: int) -> None:
+        """
+        Agenda el render de la imagen QR para después del commit.
+        
+        settings.QR_RENDER_MODE:
+            'celery': tarea generar_imagen_qr_ticket vía despachar_tarea (fallback al pool local)
+            'local':  pool de threads del proceso (settings.QR_RENDER_WORKERS)
+            'sync':   render inmediato tras el commit (útil en desarrollo)
+        
+        El fallback usa un pool acotado y no un thread por trabajo: hay un
+        render por ticket creado o reimpreso.
+        """
+        modo = getattr(settings, 'QR_RENDER_MODE', 'celery')
+        
+        def _despachar():
+            if modo == 'sync':
+                self.renderizar_qr_ticket(ticket_id)
+            elif modo == 'celery':
+                despachar_tarea(
+                    'generar_imagen_qr_ticket', [ticket_id], _renderizar_en_thread,
+                    f"render QR del ticket {ticket_id}", pool=_obtener_pool_render(),
+                )
+            else:
+                _obtener_pool_render().submit(_renderizar_en_thread, ticket_id)
+        
+        transaction.on_commit(_despachar)
+    
     def _obtener_ciclo_activo(self) -> Ciclo:
         """Obtiene el ciclo activo actual o lanza excepción si no existe."""
-        ciclo = Ciclo.objects.filter(activo=True).first()
+        ciclo = get_ciclo_activo()
         if not ciclo:
             raise NoCicloActivoException('No hay ciclo activo configurado')
         return ciclo
     
     def _generar_imagen_qr(self, payload: str, identificador: str) -> ContentFile:
         """
-        Genera imagen QR.
+        Genera imagen QR (PNG de pantalla) usando la caché de QRRenderer.
         
         Args:
             payload: Contenido del QR
@@ -372,20 +526,33 @@ class TicketService:
         Returns:
             ContentFile con la imagen
         """
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_L,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(payload)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        
+        contenido = QRRenderer.renderizar(payload, 'png')
         logger.debug(f"Imagen QR generada para {identificador}")
-        return ContentFile(buffer.read())
+        return ContentFile(contenido)
+
+
+_pool_render = None
+_pool_render_lock = threading.Lock()
+
+
+def _obtener_pool_render() -> ThreadPoolExecutor:
+    """Pool de threads compartido para render de QR (creado bajo demanda)."""
+    global _pool_render
+    if _pool_render is None:
+        with _pool_render_lock:
+            if _pool_render is None:
+                _pool_render = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'QR_RENDER_WORKERS', 2),
+                    thread_name_prefix='qr-render'
+                )
+    return _pool_render
+
+
+def _renderizar_en_thread(ticket_id: int) -> None:
+    """Render QR desde el pool local, liberando la conexión del thread al terminar."""
+    try:
+        TicketService().renderizar_qr_ticket(ticket_id)
+    except Exception as e:
+        logger.error(f"Error renderizando QR del ticket {ticket_id}: {e}", exc_info=True)
+    finally:
+        connection.close()
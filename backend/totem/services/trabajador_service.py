@@ -3,12 +3,27 @@
 Servicio de lógica de negocio para Trabajadores.
 Consolida operaciones CRUD, validaciones y queries complejas.
 """
+import base64
+import heapq
+from datetime import datetime
+from itertools import islice
+
 import structlog
+from django.conf import settings
 from django.db import transaction
-from django.db.models import Q, Count, Prefetch
+from django.db.models import Q, Count, F, Prefetch
 from django.utils import timezone
-from ..models import Trabajador, Ticket, Incidencia, Agendamiento, TicketEvent
+from ..cache import (
+    cache_beneficio_kiosko,
+    cache_trabajador,
+    get_cached_beneficio_kiosko,
+    get_cached_trabajador,
+    get_ciclo_activo,
+)
+from ..models import BeneficioTrabajador, Trabajador, Ticket, Incidencia, Agendamiento, TicketEvent
+from ..serializers import TrabajadorSerializer
 from ..utils_rut import clean_rut, valid_rut
+from ..exceptions import TrabajadorNotFoundException, ValidationException
 
 logger = structlog.get_logger(__name__)
 
@@ -39,7 +54,7 @@ class TrabajadorService:
         
         if rut:
             rut_clean = clean_rut(rut)
-            qs = qs.filter(rut__iexact=rut_clean)
+            qs = qs.filter(rut=rut_clean)
         
         if query:
             qs = qs.filter(Q(nombre__icontains=query) | Q(rut__icontains=query))
@@ -106,7 +121,7 @@ class TrabajadorService:
             return None, error
         
         # Verificar unicidad
-        if Trabajador.objects.filter(rut__iexact=rut_clean).exists():
+        if Trabajador.objects.filter(rut=rut_clean).exists():
             logger.warning("trabajador_duplicado", rut=rut_clean)
             return None, "Ya existe un trabajador con este RUT"
         
@@ -126,7 +141,7 @@ class TrabajadorService:
     @staticmethod
     def obtener_trabajador_por_rut(rut):
         """
-        Obtiene trabajador por RUT (case-insensitive).
+        Obtiene trabajador por RUT (búsqueda exacta sobre el RUT canónico).
         
         Args:
             rut (str): RUT del trabajador
@@ -136,11 +151,90 @@ class TrabajadorService:
         """
         rut_clean = clean_rut(rut)
         try:
-            return Trabajador.objects.get(rut__iexact=rut_clean)
+            return Trabajador.objects.get(rut=rut_clean)
         except Trabajador.DoesNotExist:
             logger.warning("trabajador_no_encontrado", rut=rut_clean)
             return None
 
+    @staticmethod
+    def obtener_beneficio_kiosko(rut):
+        """
+        Datos del trabajador y su beneficio vigente para el tótem (read-through).
+        
+        La respuesta se cachea por RUT canónico junto con el id del ciclo
+        activo con que se calculó: si el ciclo activo cambia la entrada se
+        descarta. Los signals de Trabajador, BeneficioTrabajador y Ciclo (y
+        nomina_importada) invalidan las entradas afectadas; con caché caliente
+        la consulta no toca la base de datos.
+        
+        Args:
+            rut (str): RUT canónico (clean_rut)
+        
+        Returns:
+            tuple: (datos: dict, con_beneficio_trabajador: bool). datos es el
+                TrabajadorSerializer con 'beneficio_disponible' construido desde
+                BeneficioTrabajador cuando existe
+        
+        Raises:
+            TrabajadorNotFoundException: Si no existe el trabajador
+        """
+        ttl = getattr(settings, 'KIOSKO_CACHE_TTL', 300)
+        
+        ciclo_activo = get_ciclo_activo()
+        ciclo_activo_id = ciclo_activo.id if ciclo_activo else None
+        
+        entrada = get_cached_beneficio_kiosko(rut)
+        if entrada is not None and entrada['ciclo_activo_id'] == ciclo_activo_id:
+            return entrada['resultado'], entrada['con_beneficio_trabajador']
+        
+        trabajador = get_cached_trabajador(rut)
+        if trabajador is None:
+            try:
+                trabajador = Trabajador.objects.get(rut=rut)
+            except Trabajador.DoesNotExist:
+                raise TrabajadorNotFoundException('No se encontró trabajador con ese RUT.')
+            cache_trabajador(trabajador, timeout=ttl)
+        
+        result = dict(TrabajadorSerializer(trabajador).data)
+        beneficio_data = result.get('beneficio_disponible') or {}
+        
+        # BeneficioTrabajador del ciclo indicado en el beneficio o, si no hay, del ciclo activo
+        ciclo_id_beneficio = beneficio_data.get('ciclo_id') or ciclo_activo_id
+        beneficio_qs = BeneficioTrabajador.objects.filter(trabajador=trabajador).select_related('tipo_beneficio')
+        if ciclo_id_beneficio:
+            beneficio_qs = beneficio_qs.filter(ciclo_id=ciclo_id_beneficio)
+        beneficio_trabajador = beneficio_qs.order_by('-created_at').first()
+        
+        if beneficio_trabajador:
+            tipo = beneficio_trabajador.tipo_beneficio
+            if tipo.requiere_validacion_guardia:
+                # Si requiere validación, solo puede retirarse si está validado
+                puede_retirarse = beneficio_trabajador.estado == 'validado'
+            else:
+                puede_retirarse = beneficio_trabajador.estado in ['pendiente', 'validado']
+            
+            beneficio_data = {
+                'tipo': tipo.nombre,
+                'categoria': tipo.nombre,
+                'descripcion': tipo.descripcion,
+                'codigo': beneficio_trabajador.codigo_verificacion,
+                'requiere_validacion_guardia': tipo.requiere_validacion_guardia,
+                'estado': beneficio_trabajador.estado,
+                'ciclo_id': beneficio_trabajador.ciclo_id,
+                'puede_retirarse': puede_retirarse,
+            }
+            if tipo.requiere_validacion_guardia:
+                beneficio_data['codigo_guardia'] = beneficio_trabajador.codigo_verificacion
+                beneficio_data['codigo_verificacion'] = beneficio_trabajador.codigo_verificacion
+            result['beneficio_disponible'] = beneficio_data
+        
+        cache_beneficio_kiosko(rut, {
+            'ciclo_activo_id': ciclo_activo_id,
+            'resultado': result,
+            'con_beneficio_trabajador': beneficio_trabajador is not None,
+        }, timeout=ttl)
+        return result, beneficio_trabajador is not None
+
     @staticmethod
     @transaction.atomic
     def actualizar_trabajador(trabajador, nombre=None, seccion=None, contrato=None, sucursal=None, beneficio_disponible=None):
@@ -237,67 +331,127 @@ class TrabajadorService:
         return trabajador
 
     @staticmethod
-    def obtener_timeline(trabajador, limit=100):
+    def obtener_timeline(trabajador, limit=100, cursor=None):
         """
         Genera línea de tiempo de actividad del trabajador.
-        Consolida tickets, incidencias y agendamientos.
+        Consolida eventos de tickets, incidencias y agendamientos.
+        
+        Cada origen se lee con una sola consulta acotada a `limit + 1` filas
+        (los eventos de ticket vía JOIN ticket__trabajador, sin N+1) y las
+        tres secuencias, ya ordenadas por la BD, se intercalan con un merge.
+        El costo es de 3 consultas por página sin importar el historial.
         
         Args:
             trabajador (Trabajador): Instancia del trabajador
-            limit (int): Máximo de eventos por tipo
+            limit (int): Máximo de eventos de la página
+            cursor (str): Valor 'siguiente' de la página anterior (opcional)
         
         Returns:
-            dict: Timeline con eventos ordenados cronológicamente
+            dict: rut, nombre, eventos (más recientes primero) y siguiente
+            (cursor de la próxima página o None)
+        
+        Raises:
+            ValidationException: Si el cursor es inválido
         """
-        logger.info("obtener_timeline", trabajador_id=trabajador.id)
-        
-        eventos = []
-        
-        # Tickets y sus eventos
-        tickets = Ticket.objects.filter(trabajador=trabajador).prefetch_related('eventos').order_by('-created_at')[:limit]
-        for ticket in tickets:
-            for evento in ticket.eventos.all().order_by('timestamp'):
-                eventos.append({
-                    'tipo': f'ticket:{evento.tipo}',
-                    'fecha': evento.timestamp.isoformat(),
-                    'metadata': evento.metadata,
-                    'ticket': ticket.uuid
-                })
-        
-        # Incidencias
-        incidencias = Incidencia.objects.filter(trabajador=trabajador).order_by('-created_at')[:limit]
-        for inc in incidencias:
-            eventos.append({
-                'tipo': 'incidencia',
-                'fecha': inc.created_at.isoformat(),
-                'metadata': {
-                    'codigo': inc.codigo,
-                    'estado': inc.estado,
-                    'tipo': inc.tipo
-                }
-            })
-        
-        # Agendamientos
-        agendamientos = Agendamiento.objects.filter(trabajador=trabajador).order_by('-created_at')[:limit]
-        for ag in agendamientos:
-            eventos.append({
-                'tipo': 'agendamiento',
-                'fecha': ag.created_at.isoformat(),
-                'metadata': {
-                    'fecha_retiro': ag.fecha_retiro.isoformat() if ag.fecha_retiro else None,
-                    'estado': ag.estado
-                }
-            })
+        logger.info("obtener_timeline", trabajador_id=trabajador.id, cursor=bool(cursor))
+        
+        posicion = TrabajadorService._decodificar_cursor(cursor) if cursor else None
+        
+        fuentes = {
+            'ticket': TicketEvent.objects.filter(ticket__trabajador=trabajador).values(
+                'id', 'tipo', 'metadata', 'ticket__uuid', fecha=F('timestamp')
+            ),
+            'incidencia': Incidencia.objects.filter(trabajador=trabajador).values(
+                'id', 'codigo', 'estado', 'tipo', fecha=F('created_at')
+            ),
+            'agendamiento': Agendamiento.objects.filter(trabajador=trabajador).values(
+                'id', 'fecha_retiro', 'estado', fecha=F('created_at')
+            ),
+        }
         
-        # Ordenar por fecha (más recientes primero)
-        eventos.sort(key=lambda x: x['fecha'], reverse=True)
+        secuencias = []
+        for origen, qs in fuentes.items():
+            campo = 'timestamp' if origen == 'ticket' else 'created_at'
+            if posicion:
+                qs = qs.filter(TrabajadorService._despues_de(posicion, origen, campo))
+            filas = qs.order_by(f'-{campo}', '-id')[:limit + 1]
+            secuencias.append([(fila['fecha'], origen, fila['id'], fila) for fila in filas])
+        
+        # Orden global: fecha, origen e id descendentes (el mismo que usa el cursor)
+        pagina = list(islice(heapq.merge(*secuencias, key=lambda e: e[:3], reverse=True), limit + 1))
+        siguiente = None
+        if len(pagina) > limit:
+            pagina = pagina[:limit]
+            fecha, origen, id_, _ = pagina[-1]
+            siguiente = TrabajadorService._codificar_cursor(fecha, origen, id_)
         
         return {
             'rut': trabajador.rut,
             'nombre': trabajador.nombre,
-            'eventos': eventos
+            'eventos': [TrabajadorService._evento_timeline(origen, fila) for _, origen, _, fila in pagina],
+            'siguiente': siguiente,
+        }
+
+    @staticmethod
+    def _evento_timeline(origen, fila):
+        """Formato de salida de un evento del timeline."""
+        if origen == 'ticket':
+            return {
+                'tipo': f"ticket:{fila['tipo']}",
+                'fecha': fila['fecha'].isoformat(),
+                'metadata': fila['metadata'],
+                'ticket': fila['ticket__uuid'],
+            }
+        if origen == 'incidencia':
+            return {
+                'tipo': 'incidencia',
+                'fecha': fila['fecha'].isoformat(),
+                'metadata': {
+                    'codigo': fila['codigo'],
+                    'estado': fila['estado'],
+                    'tipo': fila['tipo'],
+                },
+            }
+        return {
+            'tipo': 'agendamiento',
+            'fecha': fila['fecha'].isoformat(),
+            'metadata': {
+                'fecha_retiro': fila['fecha_retiro'].isoformat() if fila['fecha_retiro'] else None,
+                'estado': fila['estado'],
+            },
         }
 
+    @staticmethod
+    def _despues_de(posicion, origen, campo):
+        """
+        Filtro de las filas de `origen` que van después de `posicion` en el
+        orden (fecha desc, origen desc, id desc).
+        """
+        fecha, origen_cursor, id_cursor = posicion
+        if origen < origen_cursor:
+            return Q(**{f'{campo}__lte': fecha})
+        if origen == origen_cursor:
+            return Q(**{f'{campo}__lt': fecha}) | Q(**{campo: fecha, 'id__lt': id_cursor})
+        return Q(**{f'{campo}__lt': fecha})
+
+    @staticmethod
+    def _codificar_cursor(fecha, origen, id_):
+        """Cursor opaco: base64 de 'fecha|origen|id'."""
+        valor = f'{fecha.isoformat()}|{origen}|{id_}'
+        return base64.urlsafe_b64encode(valor.encode()).decode()
+
+    @staticmethod
+    def _decodificar_cursor(cursor):
+        """Inverso de _codificar_cursor; ValidationException si no es válido."""
+        try:
+            fecha, origen, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            fecha = datetime.fromisoformat(fecha)
+            if origen not in ('ticket', 'incidencia', 'agendamiento') or timezone.is_naive(fecha):
+                raise ValueError(origen)
+            return fecha, origen, int(id_)
+        except (ValueError, UnicodeError):
+            raise ValidationException(detail='Cursor de timeline inválido')
+
     @staticmethod
     def estadisticas_trabajador(trabajador):
         """
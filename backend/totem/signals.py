@@ -3,12 +3,18 @@
 Signals para eventos automáticos del sistema.
 Maneja notificaciones, auditoría y side-effects de operaciones.
 """
+from django.db import transaction
 from django.db.models.signals import post_save, pre_save, post_delete, pre_delete
 from django.dispatch import receiver, Signal
 from django.utils import timezone
 import structlog
 import uuid
-from .models import Ticket, Trabajador, Ciclo, Incidencia, Agendamiento, StockMovimiento, NominaCarga, BeneficioTrabajador
+from .cache import invalidate_ciclo_activo, invalidate_config, invalidate_stock_resumen, invalidate_trabajador
+from .eventos import publicar_evento
+from .models import (
+    Ticket, Trabajador, Ciclo, Incidencia, Agendamiento, StockMovimiento, NominaCarga, BeneficioTrabajador,
+    ParametroOperativo, Sucursal, TipoBeneficio, CajaBeneficio,
+)
 
 logger = structlog.get_logger(__name__)
 
@@ -27,6 +33,10 @@ agendamiento_vencido = Signal()
 stock_bajo = Signal()
 ciclo_cerrado = Signal()
 
+# Emitido tras el commit de una importación masiva de nómina (bulk_create/bulk_update
+# no disparan pre_save/post_save de Trabajador). kwargs: instance (NominaCarga), ruts
+nomina_importada = Signal()
+
 
 # === TICKET SIGNALS ===
 
@@ -72,8 +82,11 @@ def ticket_pre_delete_handler(sender, instance, **kwargs):
 def trabajador_post_save_handler(sender, instance, created, **kwargs):
     """
     Post-save signal para Trabajador.
-    Detecta cambios en beneficio y estado.
+    Detecta cambios en beneficio y estado e invalida la caché del tótem.
     """
+    rut = instance.rut
+    transaction.on_commit(lambda: invalidate_trabajador(rut))
+    
     if created:
         logger.info(
             "trabajador_creado",
@@ -101,6 +114,11 @@ def trabajador_pre_save_handler(sender, instance, **kwargs):
         try:
             old_instance = Trabajador.objects.get(pk=instance.pk)
             
+            # Cambio de RUT: la caché indexada por el RUT anterior queda huérfana
+            if old_instance.rut != instance.rut:
+                rut_anterior = old_instance.rut
+                transaction.on_commit(lambda: invalidate_trabajador(rut_anterior))
+            
             # Detectar cambio en beneficio
             old_beneficio = old_instance.beneficio_disponible or {}
             new_beneficio = instance.beneficio_disponible or {}
@@ -116,6 +134,13 @@ def trabajador_pre_save_handler(sender, instance, **kwargs):
             pass
 
 
+@receiver(post_delete, sender=Trabajador)
+def trabajador_post_delete_handler(sender, instance, **kwargs):
+    """Invalida la caché del tótem del trabajador eliminado."""
+    rut = instance.rut
+    transaction.on_commit(lambda: invalidate_trabajador(rut))
+
+
 # === CICLO SIGNALS ===
 
 @receiver(post_save, sender=Ciclo)
@@ -124,6 +149,9 @@ def ciclo_post_save_handler(sender, instance, created, **kwargs):
     Post-save signal para Ciclo.
     Desactiva otros ciclos al crear uno nuevo activo.
     """
+    # Cualquier cambio puede alterar cuál es el ciclo activo
+    transaction.on_commit(invalidate_ciclo_activo)
+    
     if created and instance.activo:
         # Desactivar otros ciclos activos
         otros_activos = Ciclo.objects.filter(activo=True).exclude(id=instance.id)
@@ -171,6 +199,39 @@ def ciclo_pre_save_handler(sender, instance, **kwargs):
             pass
 
 
+@receiver(post_delete, sender=Ciclo)
+def ciclo_post_delete_handler(sender, instance, **kwargs):
+    """Invalida el ciclo activo cacheado."""
+    transaction.on_commit(invalidate_ciclo_activo)
+
+
+# === CONFIGURACIÓN SIGNALS ===
+# Cachés de configuración de dos niveles (get_config): cada cambio invalida
+# Redis y, por pub/sub, la copia local de cada worker
+
+@receiver(post_save, sender=ParametroOperativo)
+@receiver(post_delete, sender=ParametroOperativo)
+def parametro_operativo_changed_handler(sender, **kwargs):
+    """Invalida los parámetros operativos cacheados."""
+    transaction.on_commit(lambda: invalidate_config('parametros'))
+
+
+@receiver(post_save, sender=Sucursal)
+@receiver(post_delete, sender=Sucursal)
+def sucursal_changed_handler(sender, **kwargs):
+    """Invalida las sucursales cacheadas."""
+    transaction.on_commit(lambda: invalidate_config('sucursales'))
+
+
+@receiver(post_save, sender=TipoBeneficio)
+@receiver(post_delete, sender=TipoBeneficio)
+@receiver(post_save, sender=CajaBeneficio)
+@receiver(post_delete, sender=CajaBeneficio)
+def catalogo_beneficios_changed_handler(sender, **kwargs):
+    """Invalida el catálogo de beneficios y cajas cacheado."""
+    transaction.on_commit(lambda: invalidate_config('catalogo_beneficios'))
+
+
 # === INCIDENCIA SIGNALS ===
 
 @receiver(post_save, sender=Incidencia)
@@ -268,6 +329,8 @@ def stock_movimiento_post_save_handler(sender, instance, created, **kwargs):
             tipo_caja=instance.tipo_caja
         )
         
+        transaction.on_commit(invalidate_stock_resumen)
+        
         # Verificar stock bajo después del movimiento
         if instance.accion == 'retirar' and instance.sucursal:
             from .models import StockSucursal
@@ -309,28 +372,40 @@ def nomina_carga_post_save_handler(sender, instance, created, **kwargs):
     """
     Post-save signal para NominaCarga.
     Registra carga de nómina para auditoría.
+    Las cargas en segundo plano se registran al completarse, no al encolarse.
     """
-    if created:
+    update_fields = kwargs.get('update_fields') or ()
+    completada = instance.estado == 'completada' and (created or 'estado' in update_fields)
+    if completada:
         logger.info(
             "nomina_cargada",
             carga_id=instance.id,
             archivo=instance.archivo_nombre,
-            trabajadores_creados=instance.trabajadores_creados,
-            trabajadores_actualizados=instance.trabajadores_actualizados,
-            errores=instance.errores_count,
+            trabajadores_creados=instance.creados,
+            trabajadores_actualizados=instance.actualizados,
+            errores=instance.errores,
             usuario=instance.usuario.username if instance.usuario else None
         )
         
         # Alertar si hubo muchos errores
-        if instance.errores_count > instance.total_registros * 0.1:  # Más del 10% con errores
+        if instance.errores > instance.total_registros * 0.1:  # Más del 10% con errores
             logger.warning(
                 "nomina_con_muchos_errores",
                 carga_id=instance.id,
-                porcentaje_errores=(instance.errores_count / instance.total_registros * 100) if instance.total_registros > 0 else 0
+                porcentaje_errores=(instance.errores / instance.total_registros * 100) if instance.total_registros > 0 else 0
             )
             # TODO: Notificar a RRHH
 
 
+@receiver(nomina_importada)
+def nomina_importada_handler(sender, ruts=(), **kwargs):
+    """
+    Invalida la caché del tótem de los trabajadores importados
+    (bulk_create/bulk_update no disparan los signals por fila).
+    """
+    invalidate_trabajador(*ruts)
+
+
 # === BENEFICIO TRABAJADOR SIGNALS ===
 
 @receiver(post_save, sender=BeneficioTrabajador)
@@ -353,3 +428,73 @@ def beneficio_trabajador_post_save_handler(sender, instance, created, **kwargs):
             trabajador_rut=instance.trabajador.rut,
             codigo=codigo
         )
+    
+    # Cambios de estado/tipo alteran la respuesta de beneficio del tótem
+    rut = instance.trabajador.rut
+    transaction.on_commit(lambda: invalidate_trabajador(rut))
+
+
+# === EVENTOS EN TIEMPO REAL (paneles de guardia) ===
+# Deltas compactos hacia /api/guardia/eventos/ (SSE). Se arman con los datos
+# en memoria al emitirse el signal y se publican tras el commit.
+
+def _publicar_tras_commit(tipo, datos):
+    transaction.on_commit(lambda: publicar_evento(tipo, datos))
+
+
+@receiver(ticket_creado)
+def evento_ticket_creado(sender, instance, **kwargs):
+    _publicar_tras_commit('ticket_creado', {
+        'uuid': instance.uuid,
+        'estado': instance.estado,
+        'trabajador': {'rut': instance.trabajador.rut, 'nombre': instance.trabajador.nombre},
+        'sucursal_id': instance.sucursal_id,
+        'created_at': instance.created_at.isoformat() if instance.created_at else None,
+        'ttl_expira_at': instance.ttl_expira_at.isoformat() if instance.ttl_expira_at else None,
+    })
+
+
+@receiver(ticket_validado)
+def evento_ticket_validado(sender, instance, guardia=None, **kwargs):
+    _publicar_tras_commit('ticket_validado', {
+        'uuid': instance.uuid,
+        'estado': instance.estado,
+        'guardia': guardia,
+    })
+
+
+@receiver(ticket_anulado)
+def evento_ticket_anulado(sender, instance, **kwargs):
+    _publicar_tras_commit('ticket_anulado', {'uuid': instance.uuid, 'estado': instance.estado})
+
+
+@receiver(ticket_expirado)
+def evento_tickets_expirados(sender, instance=None, uuids=(), **kwargs):
+    uuids = list(uuids) if uuids else ([instance.uuid] if instance is not None else [])
+    if uuids:
+        _publicar_tras_commit('ticket_expirado', {'uuids': uuids, 'cantidad': len(uuids)})
+
+
+@receiver(incidencia_creada)
+def evento_incidencia_creada(sender, instance, **kwargs):
+    _publicar_tras_commit('incidencia_creada', {
+        'codigo': instance.codigo,
+        'tipo': instance.tipo,
+        'estado': instance.estado,
+        'creada_por': instance.creada_por,
+        'trabajador_rut': instance.trabajador.rut if instance.trabajador else None,
+    })
+
+
+@receiver(incidencia_resuelta)
+def evento_incidencia_resuelta(sender, instance, **kwargs):
+    _publicar_tras_commit('incidencia_resuelta', {'codigo': instance.codigo, 'estado': instance.estado})
+
+
+@receiver(stock_bajo)
+def evento_stock_bajo(sender, sucursal=None, producto=None, cantidad=None, **kwargs):
+    _publicar_tras_commit('stock_bajo', {
+        'sucursal': getattr(sucursal, 'nombre', sucursal),
+        'producto': producto,
+        'cantidad': cantidad,
+    })
@@ -17,26 +17,22 @@ def expirar_tickets_automatico():
     Se ejecuta cada 5 minutos via Celery Beat.
     
     Returns:
-        dict: Resultado con cantidad de tickets expirados
+        dict: Resultado con los tickets expirados en esta ejecución
     """
     try:
         logger.info("Iniciando tarea: expirar_tickets_automatico")
         
-        # Ejecutar comando de Django
-        call_command('expirar_tickets')
-        
-        # Contar tickets expirados en esta ejecución
-        from totem.models import Ticket
-        tickets_expirados = Ticket.objects.filter(
-            estado='expirado',
-            ttl_expira_at__lte=timezone.now()
-        ).count()
+        from totem.services.expiracion_service import ExpiracionService
+        resultado = ExpiracionService.expirar_tickets_vencidos()
         
-        logger.info(f"Tarea completada: {tickets_expirados} tickets expirados")
+        logger.info(f"Tarea completada: {resultado['expirados']} tickets expirados")
         
         return {
             'success': True,
-            'tickets_expirados': tickets_expirados,
+            'tickets_expirados': resultado['expirados'],
+            'lotes': resultado['lotes'],
+            'completo': resultado['completo'],
+            'duracion_segundos': resultado['duracion_segundos'],
             'timestamp': timezone.now().isoformat(),
         }
         
@@ -48,6 +44,146 @@ def expirar_tickets_automatico():
         }
 
 
+@shared_task(name='totem.tasks.generar_imagen_qr_ticket', bind=True, max_retries=3)
+def generar_imagen_qr_ticket(self, ticket_id: int):
+    """
+    Renderiza la imagen PNG del QR de un ticket fuera del request.
+    Encolada por TicketService tras el commit de crear/reimprimir ticket.
+    
+    Args:
+        ticket_id: ID del ticket
+        
+    Returns:
+        dict: Resultado con el archivo generado
+    """
+    try:
+        from totem.services.ticket_service import TicketService
+        
+        archivo = TicketService().renderizar_qr_ticket(ticket_id)
+        
+        return {
+            'success': archivo is not None,
+            'ticket_id': ticket_id,
+            'archivo': archivo,
+        }
+        
+    except Exception as e:
+        logger.error(f"Error renderizando QR del ticket {ticket_id}: {e}", exc_info=True)
+        raise self.retry(exc=e, countdown=5)
+
+
+@shared_task(name='totem.tasks.limpiar_imagenes_qr')
+def limpiar_imagenes_qr():
+    """
+    Tarea diaria para eliminar imágenes QR reemplazadas o huérfanas.
+    Se ejecuta a las 03:30 via Celery Beat.
+    
+    Returns:
+        dict: Resultado con imágenes eliminadas y bytes liberados
+    """
+    try:
+        from totem.qr_render import limpiar_imagenes_obsoletas
+        
+        resultado = limpiar_imagenes_obsoletas()
+        
+        logger.info(f"Limpieza de imágenes QR completada: {resultado}")
+        
+        return {
+            'success': True,
+            **resultado,
+            'timestamp': timezone.now().isoformat(),
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en limpiar_imagenes_qr: {e}", exc_info=True)
+        return {
+            'success': False,
+            'error': str(e),
+        }
+
+
+@shared_task(name='totem.tasks.compactar_estadisticas_diarias')
+def compactar_estadisticas_diarias(completo: bool = False):
+    """
+    Recalcula el rollup EstadisticaDiaria de los últimos días.
+    Se ejecuta cada 15 minutos (ventana reciente) y a las 02:15 con
+    completo=True (desde el inicio del ciclo activo) via Celery Beat.
+    
+    Args:
+        completo: Recalcular desde el inicio del ciclo activo
+        
+    Returns:
+        dict: Rango recalculado y filas escritas por entidad
+    """
+    try:
+        from totem.services.estadisticas_service import EstadisticasService
+        
+        resultado = EstadisticasService.compactar(completo=completo)
+        
+        return {
+            'success': True,
+            **resultado,
+            'timestamp': timezone.now().isoformat(),
+        }
+        
+    except Exception as e:
+        logger.error(f"Error en compactar_estadisticas_diarias: {e}", exc_info=True)
+        return {
+            'success': False,
+            'error': str(e),
+        }
+
+
+@shared_task(name='totem.tasks.asignar_beneficios_ciclo')
+def asignar_beneficios_ciclo(job_id: str, ciclo_id: int, tipo_beneficio_id: int, solo_sin_beneficio: bool = True):
+    """
+    Asigna en segundo plano un beneficio a los trabajadores de un ciclo.
+    Encolada por AsignacionMasivaService.encolar tras el commit.
+    
+    Args:
+        job_id: ID del trabajo (estado en caché)
+        ciclo_id: Ciclo destino
+        tipo_beneficio_id: Beneficio a asignar
+        solo_sin_beneficio: False reemplaza los beneficios existentes
+        
+    Returns:
+        dict: Estado final del trabajo
+    """
+    from totem.services.asignacion_service import AsignacionMasivaService
+    
+    resultado = AsignacionMasivaService.procesar(job_id, ciclo_id, tipo_beneficio_id, solo_sin_beneficio)
+    
+    return {
+        'success': resultado['estado'] == 'completada',
+        **resultado,
+    }
+
+
+@shared_task(name='totem.tasks.procesar_carga_nomina')
+def procesar_carga_nomina(carga_id: int):
+    """
+    Importa en segundo plano una nómina subida por /api/nomina/confirmar/.
+    Encolada por NominaService.encolar_carga tras el commit.
+    
+    Sin reintentos automáticos: un fallo deja la carga en estado 'fallida'
+    con el detalle del error y el usuario puede volver a subir el archivo.
+    
+    Args:
+        carga_id: ID de la NominaCarga pendiente
+        
+    Returns:
+        dict: Estado final de la carga y resumen de la importación
+    """
+    from totem.services.nomina_service import NominaService
+    
+    resultado = NominaService.procesar_carga(carga_id)
+    
+    return {
+        'success': resultado['estado'] == 'completada',
+        **resultado,
+    }
+
+
 @shared_task(name='totem.tasks.marcar_agendamientos_vencidos')
 def marcar_agendamientos_vencidos():
     """
@@ -138,20 +274,17 @@ def generar_reporte_diario():
         dict: Estadísticas del día
     """
     try:
-        from totem.models import Ticket, Agendamiento, Incidencia
-        from datetime import date
+        from totem.services.estadisticas_service import EstadisticasService
         
-        hoy = date.today()
+        hoy = timezone.localdate()
         
-        # Estadísticas
-        tickets_hoy = Ticket.objects.filter(created_at__date=hoy).count()
-        tickets_entregados = Ticket.objects.filter(
-            created_at__date=hoy,
-            estado='entregado'
-        ).count()
+        # Estadísticas (un GROUP BY por entidad)
+        tickets = EstadisticasService.por_estado('ticket', desde=hoy, hasta=hoy)
+        tickets_hoy = tickets['total']
+        tickets_entregados = tickets.get('entregado', 0)
         
-        agendamientos_hoy = Agendamiento.objects.filter(created_at__date=hoy).count()
-        incidencias_hoy = Incidencia.objects.filter(created_at__date=hoy).count()
+        agendamientos_hoy = EstadisticasService.por_estado('agendamiento', desde=hoy, hasta=hoy)['total']
+        incidencias_hoy = EstadisticasService.por_estado('incidencia', desde=hoy, hasta=hoy)['total']
         
         stats = {
             'fecha': hoy.isoformat(),
@@ -175,6 +308,39 @@ def generar_reporte_diario():
         }
 
 
+@shared_task(name='totem.tasks.refrescar_cache_caliente')
+def refrescar_cache_caliente(clave: str = None):
+    """
+    Recalcula en segundo plano claves calientes de settings.CACHE_HOT_KEYS.
+    
+    CacheManager.get_or_set la encola al vencer una clave caliente (con el lock
+    de recálculo tomado); sin clave refresca todas, útil para precalentar
+    desde Celery Beat.
+    
+    Args:
+        clave: Clave configurada en CACHE_HOT_KEYS (None = todas)
+    
+    Returns:
+        dict: Claves refrescadas
+    """
+    from django.conf import settings
+    from totem.cache import CacheManager
+    
+    claves = [clave] if clave else list(getattr(settings, 'CACHE_HOT_KEYS', {}))
+    refrescadas = []
+    for actual in claves:
+        try:
+            CacheManager.refresh_hot_key(actual)
+            refrescadas.append(actual)
+        except Exception as e:
+            logger.error(f"Error refrescando clave de cache {actual}: {e}", exc_info=True)
+    
+    return {
+        'success': len(refrescadas) == len(claves),
+        'refrescadas': refrescadas,
+    }
+
+
 @shared_task(name='totem.tasks.limpiar_cache')
 def limpiar_cache():
     """
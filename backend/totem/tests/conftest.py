@@ -29,6 +29,17 @@ RUTS_VALIDOS = [
 ]
 
 
+def rut_con_dv(numero):
+    """Construye un RUT válido (módulo 11) a partir de su parte numérica."""
+    suma, factor = 0, 2
+    for digito in reversed(str(numero)):
+        suma += int(digito) * factor
+        factor = 2 if factor == 7 else factor + 1
+    dv = 11 - (suma % 11)
+    dv = {11: '0', 10: 'K'}.get(dv, str(dv))
+    return f'{numero}-{dv}'
+
+
 @pytest.fixture
 def rut_valido():
     """RUT válido para tests"""
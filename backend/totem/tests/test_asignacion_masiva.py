@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la asignación masiva de beneficios por ciclo.
+Ejecutar: pytest totem/tests/test_asignacion_masiva.py -v
+"""
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from totem.exceptions import BusinessRuleException
+from totem.models import BeneficioTrabajador, TipoBeneficio, Trabajador
+from totem.services import AsignacionMasivaService
+from totem.services.beneficio_service import BeneficioService
+
+
+@pytest.fixture
+def tipo_beneficio():
+    return TipoBeneficio.objects.create(nombre='Caja Diaria')
+
+
+@pytest.fixture
+def trabajadores():
+    return Trabajador.objects.bulk_create([
+        Trabajador(rut=f'{10000000 + i}-K', nombre=f'Trabajador {i}') for i in range(25)
+    ])
+
+
+def procesar(ciclo, tipo, solo_sin_beneficio=True):
+    trabajo = AsignacionMasivaService.encolar(ciclo, tipo, solo_sin_beneficio=solo_sin_beneficio)
+    return AsignacionMasivaService.procesar(trabajo['id'], ciclo.id, tipo.id, solo_sin_beneficio)
+
+
+class TestAsignacionMasiva:
+    """AsignacionMasivaService.procesar"""
+
+    def test_asigna_solo_a_trabajadores_sin_beneficio(self, ciclo_activo, tipo_beneficio, trabajadores):
+        previo = BeneficioTrabajador.objects.create(
+            trabajador=trabajadores[0], ciclo=ciclo_activo, tipo_beneficio=tipo_beneficio
+        )
+
+        resultado = procesar(ciclo_activo, tipo_beneficio)
+
+        assert resultado['estado'] == 'completada'
+        assert resultado['beneficios_creados'] == 24
+        assert resultado['beneficios_existentes'] == 1
+        assert resultado['trabajadores_procesados'] == 25
+        assert BeneficioTrabajador.objects.filter(ciclo=ciclo_activo).count() == 25
+        assert BeneficioTrabajador.objects.filter(pk=previo.pk).exists()
+
+    def test_codigo_y_firma_generados_en_memoria(self, ciclo_activo, tipo_beneficio, trabajadores):
+        procesar(ciclo_activo, tipo_beneficio)
+
+        beneficio = BeneficioTrabajador.objects.select_related('trabajador').first()
+        assert beneficio.codigo_verificacion.startswith(f'BEN-{ciclo_activo.id:04d}-{beneficio.trabajador_id:06d}-')
+        assert beneficio.qr_data == f'{beneficio.codigo_verificacion}|{beneficio.trabajador.rut}|Caja Diaria|N/A'
+        assert beneficio.qr_payload == BeneficioService.generar_payload(beneficio)
+        assert BeneficioService.validar_hmac(beneficio.qr_payload, beneficio.qr_signature)
+        codigos = BeneficioTrabajador.objects.values_list('codigo_verificacion', flat=True)
+        assert len(set(codigos)) == 25
+
+    def test_reasignar_a_todos(self, ciclo_activo, tipo_beneficio, trabajadores):
+        otro = TipoBeneficio.objects.create(nombre='Gift Card')
+        procesar(ciclo_activo, otro)
+
+        resultado = procesar(ciclo_activo, tipo_beneficio, solo_sin_beneficio=False)
+
+        assert resultado['beneficios_eliminados'] == 25
+        assert resultado['beneficios_creados'] == 25
+        assert set(BeneficioTrabajador.objects.values_list('tipo_beneficio__nombre', flat=True)) == {'Caja Diaria'}
+
+    def test_consultas_por_lote(self, ciclo_activo, tipo_beneficio, trabajadores, settings,
+                                django_assert_max_num_queries):
+        """Las consultas dependen de la cantidad de lotes, no de trabajadores"""
+        settings.BENEFICIOS_ASIGNACION_BATCH_SIZE = 10
+        trabajo = AsignacionMasivaService.encolar(ciclo_activo, tipo_beneficio)
+
+        # 5 de preparación + 3 lotes x (SAVEPOINT, INSERT, UPDATE, RELEASE)
+        with django_assert_max_num_queries(17):
+            AsignacionMasivaService.procesar(trabajo['id'], ciclo_activo.id, tipo_beneficio.id)
+
+    def test_una_asignacion_en_curso_por_ciclo(self, ciclo_activo, tipo_beneficio):
+        AsignacionMasivaService.encolar(ciclo_activo, tipo_beneficio)
+        with pytest.raises(BusinessRuleException):
+            AsignacionMasivaService.encolar(ciclo_activo, tipo_beneficio)
+
+    def test_candado_se_confirma_tras_el_commit(self, ciclo_activo, tipo_beneficio,
+                                                django_capture_on_commit_callbacks):
+        """Si el candado provisional expiró y otro trabajo tomó el ciclo, no se despacha"""
+        with django_capture_on_commit_callbacks() as callbacks:
+            trabajo = AsignacionMasivaService.encolar(ciclo_activo, tipo_beneficio)
+        clave_ciclo = AsignacionMasivaService._clave_ciclo(ciclo_activo.id)
+        cache.set(clave_ciclo, 'otro-trabajo')
+
+        callbacks[-1]()
+
+        assert AsignacionMasivaService.estado(trabajo['id'])['estado'] == 'fallida'
+        assert cache.get(clave_ciclo) == 'otro-trabajo'
+
+
+class TestAsignacionMasivaEndpoint:
+    """POST /api/ciclos/{id}/asignar-beneficios-pendientes/"""
+
+    def test_encola_y_reporta_progreso(self, authenticated_rrhh_client, ciclo_activo, tipo_beneficio,
+                                       trabajadores, django_capture_on_commit_callbacks):
+        url = reverse('ciclo_asignar_beneficios_pendientes', args=[ciclo_activo.id])
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_rrhh_client.post(
+                url, {'tipo_beneficio_id': tipo_beneficio.id}, format='json'
+            )
+
+        assert response.status_code == 202
+        progreso = authenticated_rrhh_client.get(response.data['progreso_url']).data
+        assert progreso['estado'] == 'completada'
+        assert progreso['porcentaje'] == 100.0
+        assert progreso['beneficios_creados'] == 25
+
+    def test_trabajo_inexistente(self, authenticated_rrhh_client, ciclo_activo):
+        url = reverse('ciclo_asignacion_estado', args=[ciclo_activo.id, 'no-existe'])
+        assert authenticated_rrhh_client.get(url).status_code == 404
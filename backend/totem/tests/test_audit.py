@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del pipeline de auditoría no bloqueante (AuditQueueHandler).
+Ejecutar: pytest totem/tests/test_audit.py -v
+"""
+import json
+import logging
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from totem.audit import AuditQueueHandler
+from totem.models import AuditLog
+
+
+def registro(path='/api/tickets/', **extra):
+    data = {'method': 'GET', 'path': path, 'status_code': 200, 'duration_ms': 1.5,
+            'ip_address': '10.0.0.1', 'username': 'guardia', 'user_id': 7, 'user_rol': 'guardia', **extra}
+    record = logging.LogRecord('audit', logging.INFO, __file__, 1, 'API Request', None, None)
+    record.audit_data = data
+    return record
+
+
+@pytest.fixture
+def handler(tmp_path):
+    h = AuditQueueHandler(tmp_path / 'audit.log', queue_size=100, batch_size=10, flush_interval=0.05)
+    yield h
+    h.close()
+
+
+class TestAuditQueueHandler:
+    """Cola acotada + escritor por lotes"""
+
+    def test_lineas_json_compactas(self, handler, tmp_path):
+        for i in range(25):
+            handler.handle(registro(f'/api/tickets/{i}/'))
+        handler.flush()
+
+        lineas = (tmp_path / 'audit.log').read_text().splitlines()
+        assert len(lineas) == 25
+        primera = json.loads(lineas[0])
+        assert primera['message'] == 'API Request'
+        assert primera['audit_data']['path'] == '/api/tickets/0/'
+        assert ', ' not in lineas[0]
+        assert handler.stats()['escritos'] == 25
+
+    def test_disco_lento_no_bloquea_y_descarta(self, tmp_path):
+        handler = AuditQueueHandler(tmp_path / 'audit.log', queue_size=2, batch_size=1, flush_interval=0.05)
+        escribiendo = threading.Event()
+        liberar = threading.Event()
+
+        def disco_lento(lineas):
+            escribiendo.set()
+            liberar.wait(5)
+
+        with mock.patch.object(handler, '_escribir_archivo', side_effect=disco_lento):
+            handler.handle(registro())
+            assert escribiendo.wait(5)
+
+            inicio = time.perf_counter()
+            for _ in range(9):
+                handler.handle(registro())
+            assert time.perf_counter() - inicio < 0.5
+
+            assert handler.stats()['descartados'] == 7
+            assert handler.stats()['en_cola'] == 2
+            liberar.set()
+            handler.flush()
+        handler.close()
+
+    def test_rotacion_por_tamano(self, tmp_path):
+        handler = AuditQueueHandler(tmp_path / 'audit.log', maxBytes=400, backupCount=2, batch_size=1)
+        for _ in range(6):
+            handler.procesar_lote([registro()])
+        handler.close()
+
+        assert (tmp_path / 'audit.log.1').exists()
+        assert (tmp_path / 'audit.log').stat().st_size <= 400
+
+    def test_envio_por_lote_a_auditlog(self, tmp_path, django_assert_num_queries):
+        handler = AuditQueueHandler(tmp_path / 'audit.log', ship_to_db=True)
+        lote = [registro(f'/api/x/{i}/', query_params={'page': '2'}) for i in range(5)]
+
+        with django_assert_num_queries(1):
+            handler.procesar_lote(lote)
+        handler.close()
+
+        assert AuditLog.objects.count() == 5
+        fila = AuditLog.objects.get(path='/api/x/3/')
+        assert (fila.username, fila.user_id, fila.query_params) == ('guardia', 7, {'page': '2'})
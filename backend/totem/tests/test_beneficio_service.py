@@ -91,6 +91,42 @@ class TestBeneficioService:
         
         assert BeneficioService.validar_hmac(payload, firma_incorrecta) is False
     
+    def test_firmar_lote_equivale_a_calcular_hmac(self):
+        """Firma en lote: mismo resultado que la firma individual y el formato histórico."""
+        from totem.services.beneficio_service import HMAC_SECRET
+        payloads = [{'beneficio_id': i, 'trabajador_rut': f'{i}-K', 'tipo_beneficio': 'Caja ñ'} for i in range(20)]
+        
+        firmas = BeneficioService.firmar_lote(payloads)
+        
+        assert firmas == [BeneficioService.calcular_hmac(p) for p in payloads]
+        historica = hmac.new(
+            HMAC_SECRET.encode('utf-8'),
+            json.dumps(payloads[0], separators=(',', ':'), sort_keys=True).encode('utf-8'),
+            hashlib.sha256
+        ).hexdigest()
+        assert firmas[0] == historica
+    
+    def test_firmar_lote_en_pool_de_procesos(self, settings):
+        """El reparto en procesos conserva el orden de las firmas."""
+        settings.BENEFICIOS_HMAC_POOL_MIN = 10
+        payloads = [{'beneficio_id': i} for i in range(12000)]
+        
+        assert BeneficioService.firmar_lote(payloads, procesos=2) == BeneficioService.firmar_lote(payloads)
+    
+    def test_verificar_lote(self, trabajador, ciclo, tipo_beneficio):
+        """Verificación en lote desde beneficios persistidos y desde tuplas."""
+        beneficio = BeneficioService.asignar_beneficio(trabajador, ciclo, tipo_beneficio, 'BEN-LOTE-1')
+        payload = {'id': 1}
+        
+        resultado = BeneficioService.verificar_lote([
+            beneficio,
+            (payload, BeneficioService.calcular_hmac(payload)),
+            (payload, '0' * 64),
+            ({}, ''),
+        ])
+        
+        assert resultado == [True, True, False, False]
+    
     def test_validar_beneficio_exitoso(self, trabajador, ciclo, tipo_beneficio):
         """Test validación exitosa de beneficio."""
         # Crear beneficio
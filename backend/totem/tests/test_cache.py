@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de caché: invalidación (tags, SCAN + UNLINK), estampidas y configuración de dos niveles.
+Ejecutar: pytest totem/tests/test_cache.py -v
+"""
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from totem import cache as cache_module
+from totem.cache import (
+    CONFIG_CHANNEL, CacheEntry, CacheManager, LocalLRUCache, _lock_key, _tag_key, cache_response, cache_stats,
+    get_catalogo_beneficios, get_ciclo_activo, get_config, get_or_compute, get_sucursal_por_codigo, get_sucursales,
+    invalidate_config, invalidate_pattern, invalidate_tags, tagged_key,
+)
+from totem.models import CajaBeneficio, ParametroOperativo, Sucursal, TipoBeneficio
+from totem.tasks import refrescar_cache_caliente
+
+
+class TestTags:
+    """Grupos versionados por tag"""
+
+    def test_cache_response_invalidado_por_tag(self):
+        llamadas = []
+
+        @cache_response(timeout=60, key_prefix='reporte', tags=['tickets'])
+        def reporte(dia):
+            llamadas.append(dia)
+            return {'dia': dia, 'n': len(llamadas)}
+
+        assert reporte('lunes') == reporte('lunes')
+        assert len(llamadas) == 1
+
+        invalidate_tags('tickets')
+
+        assert reporte('lunes')['n'] == 2
+
+    def test_solo_invalida_su_grupo(self):
+        CacheManager.set('stock:central', 10, tags=['stock'])
+        CacheManager.set('ciclo:activo', 3, tags=['ciclos'])
+
+        CacheManager.invalidate_tags('stock')
+
+        assert CacheManager.get('stock:central', tags=['stock']) is None
+        assert CacheManager.get('ciclo:activo', tags=['ciclos']) == 3
+
+    def test_get_or_set_con_varios_tags(self):
+        callback = mock.Mock(side_effect=[1, 2])
+
+        assert CacheManager.get_or_set('resumen', callback, tags=['stock', 'tickets']) == 1
+        assert CacheManager.get_or_set('resumen', callback, tags=['tickets', 'stock']) == 1
+        invalidate_tags('tickets')
+        assert CacheManager.get_or_set('resumen', callback, tags=['stock', 'tickets']) == 2
+
+    def test_contador_desalojado_invalida(self):
+        CacheManager.set('stock:norte', 7, tags=['stock'])
+
+        cache.delete(_tag_key('stock'))
+
+        assert CacheManager.get('stock:norte', tags=['stock']) is None
+
+    def test_sin_tags_clave_intacta(self):
+        assert tagged_key('trabajador:rut:1', None) == 'trabajador:rut:1'
+        assert tagged_key('trabajador:rut:1', ['x']).startswith('trabajador:rut:1:tags:')
+
+
+class TestInvalidatePattern:
+    """Barrido incremental con SCAN + UNLINK"""
+
+    def test_sin_redis_no_falla(self):
+        assert invalidate_pattern('trabajadores:*') == 0
+
+    def test_scan_y_unlink_por_lotes(self):
+        claves = [f'totem:1:trabajadores:{i}'.encode() for i in range(5)]
+        redis_conn = mock.Mock()
+        redis_conn.scan_iter.return_value = iter(claves)
+        redis_conn.unlink.side_effect = lambda *lote: len(lote)
+
+        with mock.patch('totem.cache.get_redis_connection_or_none', return_value=redis_conn):
+            assert invalidate_pattern('trabajadores:*', batch_size=2) == 5
+
+        redis_conn.scan_iter.assert_called_once_with(match=cache.make_key('trabajadores:*'), count=2)
+        assert [len(c.args) for c in redis_conn.unlink.call_args_list] == [2, 2, 1]
+        redis_conn.keys.assert_not_called()
+        redis_conn.delete.assert_not_called()
+
+
+class TestEstampida:
+    """get_or_compute: lock de recálculo, valor vencido y expiración anticipada"""
+
+    @pytest.fixture(autouse=True)
+    def sin_anticipacion(self, settings):
+        settings.CACHE_EARLY_EXPIRATION_BETA = 0
+        cache_stats(reset=True)
+
+    def test_un_solo_recalculo_concurrente(self, settings):
+        settings.CACHE_LOCK_WAIT_MS = 2000
+        barrera = threading.Barrier(8)
+        llamadas = []
+
+        def calcular():
+            llamadas.append(1)
+            time.sleep(0.1)
+            return 42
+
+        def leer():
+            barrera.wait()
+            return CacheManager.get_or_set('estadisticas:hoy', calcular, cache_type='estadisticas')
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            resultados = list(pool.map(lambda _: leer(), range(8)))
+
+        assert resultados == [42] * 8
+        assert len(llamadas) == 1
+        stats = CacheManager.stats()['estadisticas']
+        assert stats['miss'] == 8
+        assert stats['wait'] == 7
+
+    def test_vencido_sirve_anterior_mientras_otro_recalcula(self):
+        assert get_or_compute('stock:central', lambda: 1, 60, group='stock') == 1
+        with mock.patch('totem.cache.time.time', return_value=time.time() + 61):
+            cache.add(_lock_key('stock:central'), 1, 30)
+            assert get_or_compute('stock:central', lambda: 2, 60, group='stock') == 1
+
+            cache.delete(_lock_key('stock:central'))
+            assert get_or_compute('stock:central', lambda: 2, 60, group='stock') == 2
+
+        assert cache_stats()['stock'] == {'miss': 1, 'stale': 1, 'refresh': 1, 'hit_ratio': round(1 / 3, 4)}
+        assert cache.get(_lock_key('stock:central')) is None
+
+    def test_expiracion_anticipada(self, settings):
+        settings.CACHE_EARLY_EXPIRATION_BETA = 1.0
+        cache.set('reporte', CacheEntry('viejo', time.time() + 5, delta=10), 60)
+
+        with mock.patch('totem.cache.random.random', return_value=0.99):
+            assert get_or_compute('reporte', lambda: 'nuevo', 60, group='reportes') == 'nuevo'
+
+        assert cache_stats()['reportes']['early'] == 1
+
+    def test_clave_caliente_se_refresca_en_celery(self, settings):
+        settings.CACHE_HOT_KEYS = {'dashboard:stock': {'callback': 'time.time', 'cache_type': 'stock'}}
+        CacheManager.get_or_set('dashboard:stock', lambda: 'inicial', cache_type='stock')
+
+        with mock.patch('totem.cache.time.time', return_value=time.time() + 61), \
+                mock.patch('totem.tasks.refrescar_cache_caliente.delay') as delay:
+            assert CacheManager.get_or_set('dashboard:stock', lambda: 'en_linea', cache_type='stock') == 'inicial'
+
+        delay.assert_called_once_with('dashboard:stock')
+        assert CacheManager.stats()['stock']['background'] == 1
+
+        refrescar_cache_caliente('dashboard:stock')
+        assert isinstance(CacheManager.get('dashboard:stock'), float)
+        assert cache.get(_lock_key('dashboard:stock')) is None
+
+
+class TestConfigDosNiveles:
+    """get_config: LRU local + Redis con invalidación por signals/pub/sub"""
+
+    def test_lru_acotado_y_con_ttl(self):
+        lru = LocalLRUCache(maxsize=2, ttl=60)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+
+        assert lru.get('b') is None
+        assert (lru.get('a'), lru.get('c')) == (1, 3)
+        with mock.patch('totem.cache.time.monotonic', return_value=time.monotonic() + 61):
+            assert lru.get('a') is None
+
+    def test_ciclo_activo_desde_memoria(self, ciclo_activo, django_assert_num_queries):
+        assert get_ciclo_activo() == ciclo_activo
+
+        cache.clear()
+        with django_assert_num_queries(0):
+            assert get_ciclo_activo() == ciclo_activo
+
+    def test_sin_ciclo_activo_tambien_se_cachea(self, django_assert_num_queries):
+        assert get_ciclo_activo() is None
+        with django_assert_num_queries(0):
+            assert get_ciclo_activo() is None
+
+    def test_signal_invalida_ambos_niveles(self, django_capture_on_commit_callbacks):
+        assert get_sucursales() == []
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Sucursal.objects.create(nombre='Central', codigo='CENT')
+
+        assert get_sucursal_por_codigo('CENT').nombre == 'Central'
+
+    def test_catalogo_con_cajas_sin_consultas(self, django_assert_num_queries):
+        tipo = TipoBeneficio.objects.create(nombre='Navidad')
+        CajaBeneficio.objects.create(beneficio=tipo, nombre='Premium', codigo_tipo='NAV-P')
+
+        get_catalogo_beneficios()
+        with django_assert_num_queries(0):
+            navidad = next(t for t in get_catalogo_beneficios() if t.nombre == 'Navidad')
+            assert [c.nombre for c in navidad.cajas.all()] == ['Premium']
+
+    def test_carga_concurrente_con_la_invalidacion_no_queda_en_redis(self):
+        """El worker B lee la base antes del commit de A; A invalida mientras B sigue cargando"""
+        def loader_lento():
+            invalidate_config('parametros')
+            return ['viejo']
+
+        assert get_config('parametros', loader_lento) == ['viejo']
+        cache_module.reset_local_config()
+
+        assert get_config('parametros', lambda: ['vigente']) == ['vigente']
+
+    def test_invalidacion_se_publica(self):
+        redis_conn = mock.Mock()
+        with mock.patch('totem.cache.get_redis_connection_or_none', return_value=redis_conn):
+            invalidate_config('parametros', 'sucursales')
+
+        redis_conn.publish.assert_called_once_with(
+            cache.make_key(CONFIG_CHANNEL), json.dumps(['parametros', 'sucursales'])
+        )
+
+    def test_suscriptor_descarta_copia_local(self):
+        local = cache_module._get_config_local()
+        pid = cache_module._config_pid
+
+        def mensajes(timeout):
+            if cache_module._config_pid is None:
+                return None
+            local.set('parametros', ['viejo'])
+            local.set('sucursales', ['vigente'])
+            cache_module._config_pid = None
+            return {'type': 'message', 'data': json.dumps(['parametros']).encode()}
+
+        redis_conn = mock.Mock()
+        redis_conn.pubsub.return_value.get_message.side_effect = mensajes
+        with mock.patch('totem.cache.get_redis_connection_or_none', return_value=redis_conn):
+            # Termina al cambiar _config_pid (como tras un fork)
+            cache_module._escuchar_invalidaciones_config()
+
+        cache_module._config_pid = pid
+        assert local.get('parametros') is None
+        assert local.get('sucursales') == ['vigente']
+
+
+class TestParametrosEndpoint:
+    """GET/POST /api/parametros/"""
+
+    def test_get_cacheado_y_post_invalida(self, authenticated_guardia_client, django_capture_on_commit_callbacks):
+        url = reverse('parametros_operativos')
+        ParametroOperativo.objects.create(clave='qr_ttl', valor='30')
+        authenticated_guardia_client.get(url)
+
+        with CaptureQueriesContext(connection) as consultas:
+            assert authenticated_guardia_client.get(url).data[0]['valor'] == '30'
+        assert not any('parametrooperativo' in q['sql'] for q in consultas.captured_queries)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            authenticated_guardia_client.post(url, {'clave': 'qr_ttl', 'valor': '45'}, format='json')
+
+        assert authenticated_guardia_client.get(url).data[0]['valor'] == '45'
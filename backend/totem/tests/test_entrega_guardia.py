@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la ruta de escritura de entrega en portería (TicketService.entregar_ticket).
+Ejecutar: pytest totem/tests/test_entrega_guardia.py -v
+"""
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from guardia.services.guardia_service import GuardiaService
+from totem.exceptions import NoStockException, TicketExpiredException, TicketInvalidStateException
+from totem.models import CajaFisica, ReservaStock, StockSucursal, Ticket, TicketEvent
+from totem.security import QRSecurity
+from totem.services import TicketService
+from totem.validators import TicketValidator
+
+
+def consultas_sin_savepoints(capturadas):
+    return [q['sql'] for q in capturadas.captured_queries if 'SAVEPOINT' not in q['sql']]
+
+
+@pytest.fixture
+def caja(sucursal):
+    return CajaFisica.objects.create(codigo='CAJA-001', tipo='premium', sucursal=sucursal)
+
+
+@pytest.fixture
+def reserva(ticket_pendiente):
+    stock = StockSucursal.objects.create(sucursal='Casa Matriz', producto='Premium', cantidad=5)
+    return ReservaStock.objects.create(stock=stock, ticket=ticket_pendiente)
+
+
+class TestEntregarTicket:
+    """UPDATE condicionales + eventos en lote, sin select_for_update"""
+
+    def test_entrega_en_cinco_consultas(self, ticket_pendiente, caja, reserva):
+        with CaptureQueriesContext(connection) as capturadas:
+            ticket = TicketService().entregar_ticket(ticket_pendiente.uuid, 'CAJA-001', 'guardia1')
+
+        consultas = consultas_sin_savepoints(capturadas)
+        assert len(consultas) == 5
+        assert not any('FOR UPDATE' in sql for sql in consultas)
+
+        assert ticket.estado == 'entregado'
+        caja.refresh_from_db()
+        reserva.refresh_from_db()
+        assert (caja.usado, caja.asignada_ticket_id, reserva.estado) == (True, ticket.pk, 'consumida')
+        eventos = {e.tipo: e.metadata for e in TicketEvent.objects.filter(ticket=ticket)}
+        assert set(eventos) == {'validado_guardia', 'caja_verificada', 'entregado'}
+        assert eventos['caja_verificada'] == {'caja_codigo': 'CAJA-001', 'caja_tipo': 'premium', 'guardia': 'guardia1'}
+
+    def test_caja_usada_no_entrega(self, ticket_pendiente, caja):
+        CajaFisica.objects.filter(pk=caja.pk).update(usado=True)
+
+        with pytest.raises(NoStockException):
+            TicketService().entregar_ticket(ticket_pendiente.uuid, 'CAJA-001', 'guardia1')
+
+        ticket_pendiente.refresh_from_db()
+        assert ticket_pendiente.estado == 'pendiente'
+
+    def test_segunda_entrega_rechazada(self, ticket_pendiente, caja, sucursal):
+        CajaFisica.objects.create(codigo='CAJA-002', tipo='estandar', sucursal=sucursal)
+        service = TicketService()
+        service.entregar_ticket(ticket_pendiente.uuid, 'CAJA-001', 'guardia1')
+
+        with pytest.raises(TicketInvalidStateException):
+            service.entregar_ticket(ticket_pendiente.uuid, 'CAJA-002', 'guardia2')
+
+        assert CajaFisica.objects.get(codigo='CAJA-002').usado is False
+
+    def test_carrera_perdida_revierte_caja(self, ticket_pendiente, caja, monkeypatch):
+        """Otro guardia entrega el ticket entre la lectura y el UPDATE condicional"""
+        validar_estado = TicketValidator.validar_estado
+
+        def validar_y_perder_carrera(estado, permitidos):
+            Ticket.objects.filter(pk=ticket_pendiente.pk).update(estado='entregado')
+            return validar_estado(estado, permitidos)
+
+        monkeypatch.setattr(TicketValidator, 'validar_estado', staticmethod(validar_y_perder_carrera))
+
+        with pytest.raises(TicketInvalidStateException):
+            TicketService().entregar_ticket(ticket_pendiente.uuid, 'CAJA-001', 'guardia1')
+
+        caja.refresh_from_db()
+        assert caja.usado is False
+        assert not TicketEvent.objects.filter(ticket=ticket_pendiente, tipo='entregado').exists()
+
+    def test_ticket_expirado(self, ticket_pendiente, caja):
+        Ticket.objects.filter(pk=ticket_pendiente.pk).update(ttl_expira_at=timezone.now() - timedelta(minutes=1))
+
+        with pytest.raises(TicketExpiredException):
+            TicketService().entregar_ticket(ticket_pendiente.uuid, 'CAJA-001', 'guardia1')
+
+    def test_guardia_service_usa_la_misma_ruta(self, ticket_pendiente, caja):
+        payload = QRSecurity.crear_payload_firmado(ticket_pendiente.uuid)
+
+        ticket = GuardiaService().validar_y_entregar_ticket(payload, 'CAJA-001', 'guardia1')
+
+        assert ticket.estado == 'entregado'
+        assert TicketEvent.objects.filter(ticket=ticket).count() == 3
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del rollup de estadísticas diarias (EstadisticaDiaria).
+Ejecutar: pytest totem/tests/test_estadisticas_service.py -v
+"""
+import importlib
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from django.utils import timezone
+
+from rrhh.services.rrhh_service import RRHHService
+from totem.models import EstadisticaDiaria, Incidencia, Ticket
+from totem.services.ciclo_service import CicloService
+from totem.services.estadisticas_service import EstadisticasService
+
+
+def crear_tickets(trabajador, ciclo, sucursal, dias_atras, estados):
+    creado = timezone.now() - timedelta(days=dias_atras)
+    for estado in estados:
+        Ticket.objects.create(
+            trabajador=trabajador, uuid=str(uuid.uuid4()), estado=estado,
+            ciclo=ciclo, sucursal=sucursal, created_at=creado,
+        )
+
+
+@pytest.fixture
+def historial(trabajador, ciclo_activo, sucursal):
+    """Tickets de hace 1 y 2 días (cerrados) y de hoy (en vivo)."""
+    crear_tickets(trabajador, ciclo_activo, sucursal, 2, ['entregado', 'entregado', 'expirado'])
+    crear_tickets(trabajador, ciclo_activo, sucursal, 1, ['entregado', 'anulado'])
+    crear_tickets(trabajador, ciclo_activo, sucursal, 0, ['pendiente'])
+    Incidencia.objects.create(codigo='INC-1', tipo='otro', creada_por='totem',
+                              created_at=timezone.now() - timedelta(days=1))
+    hoy = timezone.localdate()
+    EstadisticasService.recalcular(hoy - timedelta(days=7), hoy)
+
+
+class TestRecalcular:
+    """Reconstrucción del rollup"""
+
+    def test_agrupa_por_dia_y_estado(self, historial):
+        hace_dos = timezone.localdate() - timedelta(days=2)
+        fila = EstadisticaDiaria.objects.get(entidad='ticket', fecha=hace_dos, estado='entregado')
+        assert fila.cantidad == 2
+        assert EstadisticaDiaria.objects.filter(entidad='incidencia').count() == 1
+
+    def test_idempotente(self, historial):
+        antes = EstadisticaDiaria.objects.count()
+        hoy = timezone.localdate()
+        EstadisticasService.recalcular(hoy - timedelta(days=7), hoy)
+        assert EstadisticaDiaria.objects.count() == antes
+
+    def test_comando_backfill(self, historial):
+        EstadisticaDiaria.objects.all().delete()
+        desde = (timezone.localdate() - timedelta(days=7)).isoformat()
+        call_command('recalcular_estadisticas', '--desde', desde, '--entidad', 'ticket')
+        assert EstadisticaDiaria.objects.filter(entidad='ticket').exists()
+        assert not EstadisticaDiaria.objects.filter(entidad='incidencia').exists()
+
+    def test_migracion_puebla_historial(self, historial):
+        """Tras el deploy el rollup no arranca vacío"""
+        esperado = set(EstadisticaDiaria.objects.values_list('entidad', 'fecha', 'estado', 'cantidad'))
+        EstadisticaDiaria.objects.all().delete()
+        migracion = importlib.import_module('totem.migrations.0025_backfill_estadisticadiaria')
+
+        migracion.poblar_estadisticas(apps, None)
+
+        assert set(EstadisticaDiaria.objects.values_list('entidad', 'fecha', 'estado', 'cantidad')) == esperado
+
+
+class TestConteos:
+    """Lectura combinada rollup + día en curso"""
+
+    def test_coincide_con_conteo_en_vivo(self, historial, ciclo_activo):
+        por_estado = EstadisticasService.por_estado('ticket', ciclo_id=ciclo_activo.id)
+        assert por_estado == {'entregado': 3, 'expirado': 1, 'anulado': 1, 'pendiente': 1, 'total': 6}
+
+    def test_hoy_se_cuenta_en_vivo(self, historial, trabajador, ciclo_activo, sucursal):
+        """Un ticket nuevo de hoy aparece sin esperar la compactación"""
+        crear_tickets(trabajador, ciclo_activo, sucursal, 0, ['pendiente'])
+        assert EstadisticasService.por_estado('ticket')['pendiente'] == 2
+
+    def test_dias_cerrados_se_leen_del_rollup(self, historial):
+        """Tickets antiguos fuera del rollup no se cuentan hasta recompactar"""
+        Ticket.objects.filter(estado='expirado').delete()
+        assert EstadisticasService.por_estado('ticket')['expirado'] == 1
+
+        EstadisticasService.compactar()
+        assert 'expirado' not in EstadisticasService.por_estado('ticket')
+
+    def test_filtro_sin_dimension(self, historial, sucursal):
+        assert EstadisticasService.conteos('incidencia', sucursal_id=sucursal.id) == []
+
+    def test_consultas_no_crecen_con_tickets(self, historial, trabajador, ciclo_activo, sucursal,
+                                             django_assert_max_num_queries):
+        crear_tickets(trabajador, ciclo_activo, sucursal, 3, ['entregado'] * 20)
+        hoy = timezone.localdate()
+        EstadisticasService.recalcular(hoy - timedelta(days=7), hoy)
+        with django_assert_max_num_queries(2):
+            EstadisticasService.conteos('ticket', por=('fecha', 'estado'))
+
+
+class TestConsumidores:
+    """Reportes que leen del rollup"""
+
+    def test_reporte_retiros_por_dia(self, historial):
+        reporte = RRHHService().reporte_retiros_por_dia(dias=7)
+
+        assert [dia['created_at__date'] for dia in reporte] == sorted(
+            (dia['created_at__date'] for dia in reporte), reverse=True
+        )
+        hace_dos = next(d for d in reporte if d['created_at__date'] == timezone.localdate() - timedelta(days=2))
+        assert hace_dos == {
+            'created_at__date': hace_dos['created_at__date'],
+            'total': 3, 'entregados': 2, 'pendientes': 0, 'expirados': 1, 'anulados': 0,
+        }
+        assert reporte[0]['pendientes'] == 1
+
+    def test_estadisticas_ciclo(self, historial, ciclo_activo):
+        stats = CicloService.obtener_estadisticas_ciclo(ciclo_activo)
+        assert stats['total_tickets'] == 6
+        assert stats['anulados'] == 1
+        assert stats['tasa_entrega'] == 50.0
+
+    def test_trabajadores_activos_por_ciclo(self, historial, ciclo_activo):
+        stats = RRHHService().reporte_trabajadores_activos(ciclo_id=ciclo_activo.id)
+        assert stats['tickets_generados'] == 6
+        assert stats['tickets_entregados'] == 3
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del canal de eventos en tiempo real para guardia (SSE).
+Ejecutar: pytest totem/tests/test_eventos.py -v
+"""
+import json
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from totem import eventos
+from totem.eventos import (
+    EVENTOS_BUFFER_KEY, EVENTOS_CHANNEL, EVENTOS_SEQ_KEY, _BusLocal, _BusRedis, eventos_desde, publicar_evento,
+    stream_eventos,
+)
+from totem.models import Incidencia
+from totem.services.ticket_service import TicketService
+
+
+@pytest.fixture(autouse=True)
+def bus_local(monkeypatch):
+    bus = _BusLocal()
+    monkeypatch.setattr(eventos, '_bus_local', bus)
+    return bus
+
+
+def leer(generador, n):
+    return [next(generador) for _ in range(n)]
+
+
+class TestSignalsAEventos:
+    """Los signals publican deltas tras el commit"""
+
+    def test_ticket_anulado(self, ticket_pendiente, bus_local, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            TicketService().anular_ticket(ticket_pendiente.uuid, 'prueba')
+
+        (evento,) = bus_local.recientes()
+        assert evento['tipo'] == 'ticket_anulado'
+        assert evento['datos'] == {'uuid': ticket_pendiente.uuid, 'estado': 'anulado'}
+
+    def test_sin_commit_no_se_publica(self, trabajador, bus_local, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=False) as callbacks:
+            Incidencia.objects.create(codigo='INC-1', trabajador=trabajador, tipo='Falla', creada_por='guardia')
+
+        assert bus_local.recientes() == []
+        for callback in callbacks:
+            callback()
+        (evento,) = bus_local.recientes()
+        assert evento['tipo'] == 'incidencia_creada'
+        assert evento['datos']['codigo'] == 'INC-1'
+        assert evento['datos']['trabajador_rut'] == trabajador.rut
+
+
+class TestStream:
+    """stream_eventos: reenvío por Last-Event-ID, resync y latido"""
+
+    def test_recibe_evento_publicado_tras_suscribirse(self):
+        generador = stream_eventos(duracion=5, heartbeat=60)
+        assert next(generador).startswith('retry: ')
+
+        publicar_evento('stock_bajo', {'producto': 'Caja', 'cantidad': 3})
+
+        assert next(generador) == 'id: 1\nevent: stock_bajo\ndata: {"producto":"Caja","cantidad":3}\n\n'
+        generador.close()
+
+    def test_reenvia_pendientes_sin_duplicar(self):
+        for i in range(3):
+            publicar_evento('ticket_creado', {'n': i})
+
+        generador = stream_eventos(ultimo_id=1, duracion=5, heartbeat=60)
+        _, segundo, tercero = leer(generador, 3)
+        publicar_evento('ticket_creado', {'n': 3})
+
+        assert (segundo.split('\n')[0], tercero.split('\n')[0]) == ('id: 2', 'id: 3')
+        assert next(generador).startswith('id: 4\n')
+        generador.close()
+
+    def test_resync_si_el_buffer_no_cubre(self, settings, monkeypatch):
+        settings.EVENTOS_BUFFER_SIZE = 2
+        monkeypatch.setattr(eventos, '_bus_local', _BusLocal())
+        for i in range(5):
+            publicar_evento('ticket_creado', {'n': i})
+
+        assert eventos_desde(1) is None
+        assert [e['id'] for e in eventos_desde(3)] == [4, 5]
+        assert eventos_desde(99) is None
+
+        generador = stream_eventos(ultimo_id=1, duracion=0)
+        assert leer(generador, 2)[1] == 'event: resync\ndata: {}\n\n'
+
+    def test_latido_sin_trafico(self):
+        generador = stream_eventos(duracion=5, heartbeat=0)
+        assert leer(generador, 2)[1] == ': ping\n\n'
+        generador.close()
+
+
+class TestBusRedis:
+    """Publicación en Redis: INCR + lista acotada + PUBLISH en un script atómico"""
+
+    def test_script_atomico(self, settings, monkeypatch):
+        settings.EVENTOS_BUFFER_SIZE = 100
+        monkeypatch.setattr(eventos, '_scripts', {})
+        redis_conn = mock.Mock()
+        script = redis_conn.register_script.return_value
+        script.return_value = 7
+
+        with mock.patch('totem.eventos.get_redis_connection_or_none', return_value=redis_conn):
+            evento = publicar_evento('ticket_validado', {'uuid': 'ABC'})
+
+        assert evento['id'] == 7
+        script.assert_called_once()
+        kwargs = script.call_args.kwargs
+        assert kwargs['keys'] == [cache.make_key(EVENTOS_SEQ_KEY), cache.make_key(EVENTOS_BUFFER_KEY)]
+        sin_id, tamano, canal = kwargs['args']
+        assert json.loads(sin_id) == {k: v for k, v in evento.items() if k != 'id'}
+        assert (tamano, canal) == (100, cache.make_key(EVENTOS_CHANNEL))
+        # El script antepone el id al JSON recibido
+        assert json.loads('{"id":7,' + sin_id[1:]) == evento
+
+    def test_ultimo_id(self):
+        conexion = mock.Mock()
+        conexion.get.return_value = b'42'
+
+        assert _BusRedis(conexion).ultimo_id() == 42
+        conexion.get.assert_called_once_with(cache.make_key(EVENTOS_SEQ_KEY))
+
+    def test_fallo_de_redis_no_interrumpe(self, monkeypatch):
+        monkeypatch.setattr(eventos, '_scripts', {})
+        redis_conn = mock.Mock()
+        redis_conn.register_script.return_value.side_effect = ConnectionError('caído')
+        with mock.patch('totem.eventos.get_redis_connection_or_none', return_value=redis_conn):
+            assert publicar_evento('ticket_creado', {}) is None
+
+    def test_suscripcion_decodifica_mensajes(self):
+        pubsub = mock.Mock()
+        pubsub.get_message.side_effect = [None, {'type': 'message', 'data': b'{"id": 3}'}]
+        suscripcion = _BusRedis(mock.Mock(**{'pubsub.return_value': pubsub})).suscribir()
+
+        assert suscripcion.siguiente(timeout=1) is None
+        assert suscripcion.siguiente(timeout=1) == {'id': 3}
+        pubsub.subscribe.assert_called_once_with(cache.make_key(EVENTOS_CHANNEL))
+
+
+class TestEndpoint:
+    """GET /api/guardia/eventos/"""
+
+    def test_requiere_autenticacion(self, api_client):
+        response = api_client.get(reverse('guardia:eventos'), HTTP_ACCEPT='text/event-stream')
+        assert response.status_code == 401
+
+    def test_stream_con_last_event_id(self, settings, authenticated_guardia_client):
+        settings.EVENTOS_SSE_MAX_SECONDS = 0
+        publicar_evento('incidencia_resuelta', {'codigo': 'INC-1', 'estado': 'resuelta'})
+        publicar_evento('incidencia_resuelta', {'codigo': 'INC-2', 'estado': 'resuelta'})
+
+        response = authenticated_guardia_client.get(
+            reverse('guardia:eventos'), HTTP_ACCEPT='text/event-stream', HTTP_LAST_EVENT_ID='1'
+        )
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'text/event-stream'
+        assert response['Cache-Control'] == 'no-cache'
+        cuerpo = b''.join(response.streaming_content).decode()
+        assert cuerpo.startswith('retry: ')
+        assert 'INC-2' in cuerpo and 'INC-1' not in cuerpo
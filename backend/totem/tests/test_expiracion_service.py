@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del motor de expiración masiva de tickets.
+Ejecutar: pytest totem/tests/test_expiracion_service.py -v
+"""
+import pytest
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.utils import timezone
+
+from totem.models import Ticket, TicketEvent
+from totem.services import ExpiracionService
+from totem.tasks import expirar_tickets_automatico
+
+
+def _crear_tickets(trabajador, ciclo, cantidad, minutos_ttl):
+    """Crea tickets pendientes con TTL relativo a ahora."""
+    tickets = []
+    for _ in range(cantidad):
+        ticket = Ticket.objects.create(trabajador=trabajador, ciclo=ciclo, estado='pendiente')
+        ticket.ttl_expira_at = timezone.now() + timedelta(minutes=minutos_ttl)
+        ticket.save(update_fields=['ttl_expira_at'])
+        tickets.append(ticket)
+    return tickets
+
+
+@pytest.mark.django_db
+class TestExpiracionService:
+    """Tests de ExpiracionService.expirar_tickets_vencidos"""
+
+    def test_expira_solo_vencidos_en_lotes(self, trabajador, ciclo_activo):
+        """Expira los vencidos en varios lotes y deja intactos los vigentes"""
+        vencidos = _crear_tickets(trabajador, ciclo_activo, 5, -10)
+        vigentes = _crear_tickets(trabajador, ciclo_activo, 2, 10)
+
+        resultado = ExpiracionService.expirar_tickets_vencidos(batch_size=2)
+
+        assert resultado['expirados'] == 5
+        assert resultado['lotes'] == 3
+        assert resultado['completo'] is True
+        assert Ticket.objects.filter(pk__in=[t.pk for t in vencidos], estado='expirado').count() == 5
+        assert Ticket.objects.filter(pk__in=[t.pk for t in vigentes], estado='pendiente').count() == 2
+
+    def test_crea_un_evento_por_ticket(self, trabajador, ciclo_activo):
+        """Cada ticket expirado recibe exactamente un evento 'expirado'"""
+        vencidos = _crear_tickets(trabajador, ciclo_activo, 3, -5)
+
+        ExpiracionService.expirar_tickets_vencidos(batch_size=10)
+
+        eventos = TicketEvent.objects.filter(tipo='expirado')
+        assert eventos.count() == 3
+        assert set(eventos.values_list('ticket_id', flat=True)) == {t.pk for t in vencidos}
+        evento = eventos.first()
+        assert evento.metadata['expiro_hace_minutos'] >= 5
+        assert 'ttl_original' in evento.metadata
+
+    def test_no_reprocesa_tickets_ya_expirados(self, trabajador, ciclo_activo):
+        """Una segunda ejecución no cambia filas ni duplica eventos"""
+        _crear_tickets(trabajador, ciclo_activo, 2, -5)
+
+        ExpiracionService.expirar_tickets_vencidos()
+        resultado = ExpiracionService.expirar_tickets_vencidos()
+
+        assert resultado['expirados'] == 0
+        assert TicketEvent.objects.filter(tipo='expirado').count() == 2
+
+    def test_presupuesto_de_tiempo_corta_ejecucion(self, trabajador, ciclo_activo, monkeypatch):
+        """Con el presupuesto agotado se procesa un lote y se informa incompleto"""
+        _crear_tickets(trabajador, ciclo_activo, 4, -5)
+        relojes = iter([0.0, 100.0, 100.0, 100.0])
+        monkeypatch.setattr('totem.services.expiracion_service.time.monotonic', lambda: next(relojes))
+
+        resultado = ExpiracionService.expirar_tickets_vencidos(batch_size=2, max_segundos=1)
+
+        assert resultado['expirados'] == 2
+        assert resultado['completo'] is False
+        assert Ticket.objects.filter(estado='pendiente').count() == 2
+
+    def test_dry_run_no_modifica(self, trabajador, ciclo_activo):
+        """El modo dry-run solo cuenta"""
+        _crear_tickets(trabajador, ciclo_activo, 3, -5)
+
+        resultado = ExpiracionService.expirar_tickets_vencidos(dry_run=True)
+
+        assert resultado['por_expirar'] == 3
+        assert Ticket.objects.filter(estado='pendiente').count() == 3
+        assert not TicketEvent.objects.filter(tipo='expirado').exists()
+
+
+@pytest.mark.django_db
+class TestExpiracionComandoYTarea:
+    """Tests del comando expirar_tickets y la tarea Celery"""
+
+    def test_comando_con_opciones_de_lote(self, trabajador, ciclo_activo):
+        """El comando acepta --batch-size y --max-seconds"""
+        _crear_tickets(trabajador, ciclo_activo, 3, -5)
+        out = StringIO()
+
+        call_command('expirar_tickets', '--batch-size', '2', '--max-seconds', '0', stdout=out)
+
+        assert '3 tickets marcados como expirados' in out.getvalue()
+        assert Ticket.objects.filter(estado='expirado').count() == 3
+
+    def test_tarea_reporta_solo_filas_de_esta_ejecucion(self, trabajador, ciclo_activo):
+        """La tarea informa los tickets cambiados en esta ejecución, no el histórico"""
+        historicos = _crear_tickets(trabajador, ciclo_activo, 2, -60)
+        Ticket.objects.filter(pk__in=[t.pk for t in historicos]).update(estado='expirado')
+        _crear_tickets(trabajador, ciclo_activo, 3, -5)
+
+        resultado = expirar_tickets_automatico()
+
+        assert resultado['success'] is True
+        assert resultado['tickets_expirados'] == 3
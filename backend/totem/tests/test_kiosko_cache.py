@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la caché de consulta de beneficio del tótem.
+Ejecutar: pytest totem/tests/test_kiosko_cache.py -v
+"""
+import pytest
+from django.urls import reverse
+
+from totem.models import BeneficioTrabajador, Ciclo, NominaCarga, TipoBeneficio, Trabajador
+from totem.services import TrabajadorService
+from totem.signals import nomina_importada
+
+
+@pytest.fixture
+def trabajador_kiosko():
+    return Trabajador.objects.create(rut='12.345.678-5', nombre='Ana Rojas', beneficio_disponible={'tipo': 'Caja'})
+
+
+@pytest.fixture
+def beneficio(trabajador_kiosko, ciclo_activo, django_capture_on_commit_callbacks):
+    tipo = TipoBeneficio.objects.create(nombre='Caja Premium', requiere_validacion_guardia=False)
+    with django_capture_on_commit_callbacks(execute=True):
+        return BeneficioTrabajador.objects.create(
+            trabajador=trabajador_kiosko, ciclo=ciclo_activo, tipo_beneficio=tipo, codigo_verificacion='BEN-1'
+        )
+
+
+class TestBeneficioKiosko:
+    """TrabajadorService.obtener_beneficio_kiosko"""
+
+    def test_rut_canonico(self, trabajador_kiosko):
+        assert trabajador_kiosko.rut == '12345678-5'
+        assert Trabajador.objects.filter(rut='12345678-5').exists()
+
+    def test_cache_caliente_sin_consultas(self, trabajador_kiosko, beneficio, django_assert_num_queries):
+        datos, con_beneficio = TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+        assert con_beneficio is True
+        assert datos['beneficio_disponible']['tipo'] == 'Caja Premium'
+
+        with django_assert_num_queries(0):
+            assert TrabajadorService.obtener_beneficio_kiosko('12345678-5') == (datos, True)
+
+    def test_invalidacion_por_beneficio(self, trabajador_kiosko, beneficio, django_capture_on_commit_callbacks):
+        TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+
+        beneficio.estado = 'retirado'
+        with django_capture_on_commit_callbacks(execute=True):
+            beneficio.save()
+
+        datos, _ = TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+        assert datos['beneficio_disponible']['estado'] == 'retirado'
+        assert datos['beneficio_disponible']['puede_retirarse'] is False
+
+    def test_invalidacion_por_trabajador(self, trabajador_kiosko, django_capture_on_commit_callbacks):
+        TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+
+        trabajador_kiosko.nombre = 'Ana María Rojas'
+        with django_capture_on_commit_callbacks(execute=True):
+            trabajador_kiosko.save()
+
+        assert TrabajadorService.obtener_beneficio_kiosko('12345678-5')[0]['nombre'] == 'Ana María Rojas'
+
+    def test_cambio_de_ciclo_activo(self, trabajador_kiosko, beneficio, ciclo_activo,
+                                    django_capture_on_commit_callbacks):
+        assert TrabajadorService.obtener_beneficio_kiosko('12345678-5')[1] is True
+
+        with django_capture_on_commit_callbacks(execute=True):
+            Ciclo.objects.create(fecha_inicio=ciclo_activo.fecha_fin, fecha_fin=ciclo_activo.fecha_fin, activo=True)
+
+        datos, con_beneficio = TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+        assert con_beneficio is False
+        assert datos['beneficio_disponible'] == {'tipo': 'Caja'}
+
+    def test_nomina_importada_invalida(self, trabajador_kiosko):
+        TrabajadorService.obtener_beneficio_kiosko('12345678-5')
+        Trabajador.objects.filter(pk=trabajador_kiosko.pk).update(nombre='Importada')
+
+        nomina_importada.send(sender=NominaCarga, instance=None, ruts=['12345678-5'])
+
+        assert TrabajadorService.obtener_beneficio_kiosko('12345678-5')[0]['nombre'] == 'Importada'
+
+
+class TestBeneficioKioskoEndpoint:
+    """GET /api/beneficios/{rut}/"""
+
+    def test_respuesta_con_y_sin_formato(self, api_client, trabajador_kiosko, beneficio, django_assert_num_queries):
+        url = reverse('obtener_beneficio', args=['12.345.678-5'])
+        primera = api_client.get(url)
+
+        assert primera.status_code == 200
+        assert primera.data['beneficio']['beneficio_disponible']['codigo'] == 'BEN-1'
+        with django_assert_num_queries(0):
+            segunda = api_client.get(reverse('obtener_beneficio', args=['123456785']))
+        assert segunda.data == primera.data
+
+    def test_beneficio_sin_asignacion_genera_codigo_simple(self, api_client, trabajador_kiosko):
+        response = api_client.get(reverse('obtener_beneficio', args=['12345678-5']))
+
+        beneficio = response.data['beneficio']['beneficio_disponible']
+        assert beneficio['codigo_guardia'].startswith('BEN-12345678-5-')
+        assert beneficio['requiere_validacion_guardia'] is True
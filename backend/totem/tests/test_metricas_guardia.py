@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de métricas de portería (GuardiaService.obtener_metricas).
+Ejecutar: pytest totem/tests/test_metricas_guardia.py -v
+"""
+import uuid
+from datetime import datetime, time, timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from guardia.services.guardia_service import GuardiaService
+from totem import eventos
+from totem.models import Incidencia, Sucursal, Ticket
+
+
+@pytest.fixture
+def crear_ticket(trabajador, sucursal):
+    hoy = timezone.localdate()
+
+    def _crear(estado='pendiente', hora=10, dia=hoy, sucursal_ticket=sucursal):
+        return Ticket.objects.create(
+            trabajador=trabajador, uuid=str(uuid.uuid4()), estado=estado, sucursal=sucursal_ticket,
+            created_at=timezone.make_aware(datetime.combine(dia, time(hora))),
+        )
+    return _crear
+
+
+class TestObtenerMetricas:
+    """Una consulta agrupada con conteos condicionales, rango semiabierto y caché"""
+
+    def test_totales_y_desgloses_en_una_consulta(self, crear_ticket, sucursal, trabajador):
+        norte = Sucursal.objects.create(nombre='Norte', codigo='N01')
+        crear_ticket('pendiente', hora=9)
+        crear_ticket('entregado', hora=9)
+        crear_ticket('entregado', hora=11, sucursal_ticket=norte)
+        crear_ticket('anulado', hora=11)
+        Incidencia.objects.create(codigo='INC-1', trabajador=trabajador, tipo='Falla', creada_por='guardia')
+
+        with CaptureQueriesContext(connection) as consultas:
+            metricas = GuardiaService().obtener_metricas()
+
+        ticket_sql = [q['sql'] for q in consultas.captured_queries if 'totem_ticket' in q['sql']]
+        assert len(ticket_sql) == 1
+        assert len(consultas.captured_queries) == 2
+        assert 'cast_date' not in ticket_sql[0].lower()
+
+        assert (metricas['total_tickets_hoy'], metricas['pendientes'], metricas['entregados'],
+                metricas['expirados'], metricas['anulados'], metricas['incidencias_hoy']) == (4, 1, 2, 0, 1, 1)
+        por_sucursal = {fila['sucursal_id']: fila for fila in metricas['por_sucursal']}
+        assert por_sucursal[sucursal.id]['total'] == 3
+        assert por_sucursal[norte.id]['entregado'] == 1
+        assert [(fila['hora'], fila['total']) for fila in metricas['por_hora']] == [(9, 2), (11, 2)]
+
+    def test_rango_semiabierto_del_dia(self, crear_ticket):
+        hoy = timezone.localdate()
+        crear_ticket(hora=0)
+        crear_ticket(dia=hoy + timedelta(days=1), hora=0)
+        crear_ticket(dia=hoy - timedelta(days=1), hora=23)
+
+        assert GuardiaService().obtener_metricas()['total_tickets_hoy'] == 1
+
+    def test_cache_por_sucursal(self, crear_ticket, sucursal, django_assert_num_queries):
+        crear_ticket()
+        service = GuardiaService()
+        service.obtener_metricas(sucursal_id=sucursal.id)
+
+        crear_ticket()
+        with django_assert_num_queries(0):
+            assert service.obtener_metricas(sucursal_id=sucursal.id)['total_tickets_hoy'] == 1
+        assert service.obtener_metricas(sucursal_id=sucursal.id + 1)['total_tickets_hoy'] == 0
+
+    def test_snapshot_fresco_con_id_del_ultimo_evento(self, crear_ticket, monkeypatch):
+        """Al resincronizar, el panel pide un snapshot sin caché y aplica solo eventos posteriores"""
+        bus = eventos._BusLocal()
+        monkeypatch.setattr(eventos, '_bus_local', bus)
+        service = GuardiaService()
+        crear_ticket()
+        assert service.obtener_metricas()['evento_id'] == 0
+
+        crear_ticket()
+        bus.publicar('ticket_creado', {})
+        assert service.obtener_metricas()['total_tickets_hoy'] == 1
+        metricas = service.obtener_metricas(fresco=True)
+
+        assert (metricas['total_tickets_hoy'], metricas['evento_id']) == (2, 1)
+        assert service.obtener_metricas() == metricas
+
+
+class TestMetricasEndpoint:
+    """GET /api/guardia/metricas/"""
+
+    def test_filtro_por_sucursal(self, authenticated_guardia_client, crear_ticket, sucursal):
+        crear_ticket('entregado')
+        url = reverse('guardia:metricas')
+
+        assert authenticated_guardia_client.get(url, {'sucursal': sucursal.id}).data['entregados'] == 1
+        assert authenticated_guardia_client.get(url, {'sucursal': 'x'}).status_code == 400
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del motor de importación de nómina (NominaService).
+Ejecutar: pytest totem/tests/test_nomina_service.py -v
+"""
+import csv
+from io import StringIO
+
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.urls import reverse
+
+from totem.models import NominaCarga, Trabajador
+from totem.services import NominaService
+from totem.signals import nomina_importada
+from totem.tests.conftest import rut_con_dv
+
+ENCABEZADOS = ['rut', 'nombre', 'seccion', 'contrato', 'sucursal', 'beneficio', 'observaciones']
+
+
+def escribir_csv(ruta, filas):
+    with open(ruta, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(ENCABEZADOS)
+        writer.writerows(filas)
+    return str(ruta)
+
+
+def fila(numero, nombre=None, beneficio='CAJA'):
+    return [rut_con_dv(numero), nombre or f'Trabajador {numero}', 'Operaciones',
+            'Indefinido', 'Casablanca', beneficio, '']
+
+
+@pytest.mark.django_db
+class TestNominaImportacion:
+    """Importación en lotes con prefetch y escritura masiva"""
+
+    def test_crea_trabajadores_y_registra_carga(self, tmp_path):
+        """Crea los trabajadores y deja NominaCarga con los conteos"""
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(25)])
+
+        resultado = NominaService.importar(archivo, batch_size=10)
+
+        assert resultado['creados'] == 25
+        assert resultado['filas_por_segundo'] > 0
+        assert Trabajador.objects.count() == 25
+        carga = NominaCarga.objects.get(id=resultado['carga_id'])
+        assert carga.total_registros == 25
+        assert carga.creados == 25
+        assert carga.archivo_nombre == 'nomina.csv'
+
+    @pytest.mark.parametrize('upsert', [True, False])
+    def test_actualizar_distingue_cambios(self, tmp_path, upsert):
+        """Solo se escriben filas que cambiaron; el resto cuenta como sin cambios"""
+        Trabajador.objects.create(rut=rut_con_dv(10000001), nombre='Nombre Viejo', beneficio_disponible={})
+        NominaService.importar(escribir_csv(tmp_path / 'base.csv', [fila(10000002)]))
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [
+            fila(10000001), fila(10000002), fila(10000003)
+        ])
+
+        resultado = NominaService.importar(archivo, actualizar=True, upsert=upsert)
+
+        assert resultado['creados'] == 1
+        assert resultado['actualizados'] == 1
+        assert resultado['sin_cambios'] == 1
+        assert resultado['cambios_beneficio'] == 1
+        trabajador = Trabajador.objects.get(rut=rut_con_dv(10000001))
+        assert trabajador.nombre == 'Trabajador 10000001'
+        assert trabajador.beneficio_disponible['tipo'] == 'CAJA'
+
+    def test_sin_actualizar_omite_existentes(self, tmp_path):
+        """Sin --actualizar los existentes se omiten sin modificarse"""
+        Trabajador.objects.create(rut=rut_con_dv(10000001), nombre='Original')
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000001)])
+
+        resultado = NominaService.importar(archivo)
+
+        assert resultado['omitidos'] == 1
+        assert Trabajador.objects.get(rut=rut_con_dv(10000001)).nombre == 'Original'
+
+    def test_invalidos_y_duplicados(self, tmp_path):
+        """Filas inválidas y RUTs repetidos se informan sin abortar la carga"""
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [
+            fila(10000001),
+            ['12345678-0', 'RUT Malo', '', '', '', 'CAJA', ''],
+            fila(10000001, nombre='Repetido'),
+            fila(10000002, beneficio='NO'),
+        ])
+
+        resultado = NominaService.importar(archivo)
+
+        assert resultado['creados'] == 2
+        assert resultado['invalidos'] == 1
+        assert resultado['errores'][0]['fila'] == 3
+        assert resultado['duplicados'] == 1
+        assert resultado['sin_beneficio'] == 1
+
+    def test_consultas_no_crecen_con_filas(self, tmp_path, django_assert_max_num_queries):
+        """El número de consultas depende de los lotes, no de las filas"""
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(200)])
+
+        with django_assert_max_num_queries(15):
+            resultado = NominaService.importar(archivo, batch_size=100)
+
+        assert resultado['creados'] == 200
+
+    def test_dry_run_no_escribe(self, tmp_path):
+        """El dry-run clasifica sin escribir ni registrar carga"""
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000001)])
+
+        resultado = NominaService.importar(archivo, dry_run=True)
+
+        assert resultado['creados'] == 1
+        assert 'carga_id' not in resultado
+        assert not Trabajador.objects.exists()
+        assert not NominaCarga.objects.exists()
+
+    def test_lee_excel(self, tmp_path):
+        """Los .xlsx se leen en modo read-only con el mismo formato"""
+        openpyxl = pytest.importorskip('openpyxl')
+        wb = openpyxl.Workbook()
+        ws = wb.active
+        ws.title = 'Nomina'
+        ws.append(ENCABEZADOS)
+        ws.append(fila(10000001))
+        ruta = tmp_path / 'nomina.xlsx'
+        wb.save(ruta)
+
+        resultado = NominaService.importar(str(ruta))
+
+        assert resultado['creados'] == 1
+
+    def test_emite_senal_tras_commit(self, tmp_path, django_capture_on_commit_callbacks):
+        """La señal nomina_importada reemplaza a los signals por fila"""
+        recibidos = []
+
+        def receptor(sender, instance, ruts, **kwargs):
+            recibidos.append(ruts)
+
+        nomina_importada.connect(receptor)
+        try:
+            archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000001), fila(10000002)])
+            with django_capture_on_commit_callbacks(execute=True):
+                NominaService.importar(archivo)
+        finally:
+            nomina_importada.disconnect(receptor)
+
+        assert recibidos == [[rut_con_dv(10000001), rut_con_dv(10000002)]]
+
+
+@pytest.mark.django_db
+class TestNominaPreview:
+    """Preview con diff contra la tabla Trabajador"""
+
+    def test_clasifica_filas_con_diferencias(self, tmp_path):
+        """Cada fila queda como crear/actualizar/sin_cambios/invalido"""
+        NominaService.importar(escribir_csv(tmp_path / 'base.csv', [fila(10000001), fila(10000002)]))
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [
+            fila(10000001),
+            fila(10000002, beneficio='VALE:5000'),
+            fila(10000003),
+            ['12345678-0', 'RUT Malo', '', '', '', 'CAJA', ''],
+            fila(10000003, nombre='Repetido'),
+        ])
+
+        preview = NominaService.previsualizar(archivo, actualizar=True)
+
+        resumen = preview['resumen']
+        assert resumen['a_crear'] == 1
+        assert resumen['a_actualizar'] == 1
+        assert resumen['sin_cambios'] == 1
+        assert resumen['invalidos'] == 2
+        assert resumen['duplicados'] == 1
+        clases = [item['clase'] for item in preview['detalle']]
+        assert clases == ['sin_cambios', 'actualizar', 'crear', 'invalido', 'invalido']
+        assert preview['detalle'][1]['cambios'] == {
+            'beneficio_disponible.tipo': {'actual': 'CAJA', 'nuevo': 'VALE'},
+            'beneficio_disponible.valor': {'actual': None, 'nuevo': '5000'},
+        }
+        assert NominaCarga.objects.count() == 1
+
+    def test_predice_el_resultado_de_importar(self, tmp_path):
+        """Los conteos del preview coinciden con la carga posterior"""
+        Trabajador.objects.create(rut=rut_con_dv(10000001), nombre='Nombre Viejo', beneficio_disponible={})
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(5)])
+
+        resumen = NominaService.previsualizar(archivo, actualizar=False)['resumen']
+        resultado = NominaService.importar(archivo, actualizar=False)
+
+        assert resumen['a_crear'] == resultado['creados'] == 4
+        assert resumen['omitidos'] == resultado['omitidos'] == 1
+
+    def test_busqueda_masiva_por_rut(self, tmp_path, django_assert_max_num_queries):
+        """Los existentes se resuelven sin una consulta por fila"""
+        NominaService.importar(escribir_csv(tmp_path / 'base.csv', [fila(10000000 + i) for i in range(300)]))
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(600)])
+
+        with django_assert_max_num_queries(2):
+            resumen = NominaService.previsualizar(archivo)['resumen']
+
+        assert resumen['a_crear'] == 300
+        assert resumen['omitidos'] == 0
+        assert resumen['sin_cambios'] == 300
+
+    def test_endpoint_resumen_y_detalle_paginado(self, authenticated_rrhh_client, tmp_path):
+        """El POST no devuelve el detalle; se pagina y filtra por clase"""
+        ruta = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(60)])
+        with open(ruta, 'rb') as f:
+            archivo = SimpleUploadedFile('nomina.csv', f.read(), content_type='text/csv')
+
+        response = authenticated_rrhh_client.post(
+            reverse('nomina_preview'), {'archivo': archivo}, format='multipart'
+        )
+
+        assert response.status_code == 200
+        assert response.data['resumen']['a_crear'] == 60
+        assert 'trabajadores' not in response.data['resumen']
+
+        detalle = authenticated_rrhh_client.get(response.data['detalle_url'], {'clase': 'crear', 'page': 2})
+        assert detalle.status_code == 200
+        assert detalle.data['count'] == 60
+        assert len(detalle.data['results']) == 10
+        assert detalle.data['results'][0]['fila'] == 52
+
+    def test_detalle_inexistente(self, authenticated_rrhh_client):
+        response = authenticated_rrhh_client.get(reverse('nomina_preview_detalle', args=['no-existe']))
+        assert response.status_code == 404
+
+
+def subir_csv(ruta):
+    with open(ruta, 'rb') as f:
+        return SimpleUploadedFile('nomina.csv', f.read(), content_type='text/csv')
+
+
+@pytest.mark.django_db
+class TestNominaCargaEnSegundoPlano:
+    """Confirmación encolada con progreso y cancelación"""
+
+    def test_confirmar_encola_y_finaliza_carga(self, authenticated_rrhh_client, tmp_path,
+                                               django_capture_on_commit_callbacks):
+        """El request responde 202 y el trabajo finaliza la misma NominaCarga"""
+        ruta = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(30)])
+
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_rrhh_client.post(
+                reverse('nomina_confirmar'), {'archivo': subir_csv(ruta)}, format='multipart'
+            )
+
+        assert response.status_code == 202
+        progreso = authenticated_rrhh_client.get(response.data['progreso_url']).data
+        assert progreso['estado'] == 'completada'
+        assert progreso['procesados'] == progreso['total_estimado'] == 30
+        assert progreso['creados'] == 30
+        assert progreso['eta_segundos'] == 0
+        carga = NominaCarga.objects.get()
+        assert carga.creados == 30
+        assert carga.usuario.username == 'rrhh_test'
+        assert not carga.archivo
+        assert Trabajador.objects.count() == 30
+
+    def test_cancelar_carga_pendiente(self, authenticated_rrhh_client, tmp_path):
+        """Una carga aún no iniciada se cancela sin procesarse"""
+        ruta = escribir_csv(tmp_path / 'nomina.csv', [fila(10000001)])
+        carga = NominaService.encolar_carga(subir_csv(ruta))
+
+        response = authenticated_rrhh_client.post(reverse('nomina_carga_cancelar', args=[carga.id]))
+        resultado = NominaService.procesar_carga(carga.id)
+
+        assert response.data['estado'] == 'cancelada'
+        assert resultado['estado'] == 'cancelada'
+        assert not Trabajador.objects.exists()
+
+    def test_cancelacion_en_curso_revierte(self, tmp_path):
+        """La cancelación se atiende tras el lote y revierte lo importado"""
+        ruta = escribir_csv(tmp_path / 'nomina.csv', [fila(10000000 + i) for i in range(5)])
+        carga = NominaService.encolar_carga(subir_csv(ruta))
+        NominaCarga.objects.filter(pk=carga.pk).update(cancelacion_solicitada=True)
+
+        resultado = NominaService.procesar_carga(carga.id)
+
+        carga.refresh_from_db()
+        assert resultado['estado'] == carga.estado == 'cancelada'
+        assert not Trabajador.objects.exists()
+        assert not carga.archivo
+
+    def test_carga_fallida_registra_error(self, tmp_path):
+        """Un archivo inválido deja la carga fallida con el detalle"""
+        ruta = tmp_path / 'nomina.csv'
+        ruta.write_text('rut,nombre\n11111111-1,Juan\n', encoding='utf-8')
+        carga = NominaService.encolar_carga(subir_csv(ruta))
+
+        NominaService.procesar_carga(carga.id)
+
+        carga.refresh_from_db()
+        assert carga.estado == 'fallida'
+        assert 'Faltan columnas requeridas' in carga.detalle_error
+        with pytest.raises(Exception, match='ya finalizó'):
+            NominaService.cancelar_carga(carga.id)
+
+    def test_progreso_en_curso_calcula_eta(self):
+        """Durante el proceso el avance sale de la caché publicada por lote"""
+        from django.core.cache import cache
+        from totem.services.nomina_service import PROGRESO_CACHE_PREFIX
+
+        carga = NominaCarga.objects.create(estado='procesando', total_estimado=1000)
+        cache.set(f'{PROGRESO_CACHE_PREFIX}:{carga.id}', {
+            'total_registros': 250, 'filas_por_segundo': 50.0, 'invalidos': 2, 'creados': 248,
+        })
+
+        progreso = NominaService.progreso(carga)
+
+        assert progreso['porcentaje'] == 25.0
+        assert progreso['eta_segundos'] == 15.0
+        assert progreso['errores'] == 2
+
+    def test_extension_no_soportada(self, authenticated_rrhh_client):
+        archivo = SimpleUploadedFile('nomina.pdf', b'%PDF', content_type='application/pdf')
+        response = authenticated_rrhh_client.post(reverse('nomina_confirmar'), {'archivo': archivo}, format='multipart')
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestCargarNominaComando:
+    """El comando cargar_nomina delega en NominaService"""
+
+    def test_comando_carga_y_resume(self, tmp_path):
+        archivo = escribir_csv(tmp_path / 'nomina.csv', [fila(10000001), fila(10000002)])
+        out = StringIO()
+
+        call_command('cargar_nomina', archivo, '--batch-size', '1', stdout=out)
+
+        salida = out.getvalue()
+        assert 'CARGA COMPLETADA' in salida
+        assert 'filas/s' in salida
+        assert Trabajador.objects.count() == 2
+
+    def test_comando_columnas_faltantes(self, tmp_path):
+        ruta = tmp_path / 'malo.csv'
+        ruta.write_text('rut,nombre\n11111111-1,Juan\n', encoding='utf-8')
+
+        from django.core.management.base import CommandError
+        with pytest.raises(CommandError, match='Faltan columnas requeridas'):
+            call_command('cargar_nomina', str(ruta), stdout=StringIO())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del almacén de nonces anti-replay (NonceStore) y validación en lote.
+Ejecutar: pytest totem/tests/test_nonce_store.py -v
+"""
+import threading
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+
+from totem import cache as cache_module
+from totem.cache import CONFIG_CHANNEL
+from totem.nonce_store import BloomFilter, NonceStore
+from totem.security import QRSecurity
+
+
+class TestBloomFilter:
+    """Filtro de Bloom local"""
+
+    def test_sin_falsos_negativos_y_tasa_fp_acotada(self):
+        filtro = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            filtro.agregar(f'nonce:{i}')
+
+        assert all(f'nonce:{i}' in filtro for i in range(1000))
+        falsos = sum(f'otro:{i}' in filtro for i in range(10000))
+        assert falsos < 300
+
+
+class TestNonceStore:
+    """Registro atómico con frente Bloom"""
+
+    def test_registrar_una_sola_vez(self):
+        assert NonceStore.registrar('qr_nonce:a:1', 60) is True
+        assert NonceStore.registrar('qr_nonce:a:1', 60) is False
+
+    def test_replay_rechazado_sin_consultar_cache(self):
+        NonceStore.registrar('qr_nonce:a:1', 60)
+
+        with mock.patch.object(cache, 'add') as add:
+            assert NonceStore.registrar('qr_nonce:a:1', 60) is False
+        add.assert_not_called()
+        assert NonceStore.rechazos_locales == 1
+
+    def test_otro_proceso_registro_primero(self, settings):
+        """Sin el nonce en el filtro local manda el set-if-absent de la caché"""
+        cache.add('qr_nonce:a:1', 1, 60)
+        assert NonceStore.registrar('qr_nonce:a:1', 60) is False
+
+    @pytest.mark.parametrize('bloom', [True, False])
+    def test_concurrencia_un_solo_ganador(self, settings, bloom):
+        settings.NONCE_BLOOM_ACTIVO = bloom
+        resultados = []
+        barrera = threading.Barrier(8)
+
+        def escanear():
+            barrera.wait()
+            resultados.append(NonceStore.registrar('qr_nonce:b:1', 60))
+
+        hilos = [threading.Thread(target=escanear) for _ in range(8)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        assert resultados.count(True) == 1
+
+    def test_liberar_permite_nuevo_uso(self):
+        NonceStore.registrar('qr_nonce:c:1', 60)
+        NonceStore.liberar('qr_nonce:c:1')
+        assert NonceStore.registrar('qr_nonce:c:1', 60) is True
+        assert NonceStore.registrar('qr_nonce:c:1', 60) is False
+
+    def test_liberacion_llega_a_los_demas_workers(self):
+        """El filtro de este proceso deja de rechazar un nonce liberado en otro"""
+        NonceStore.registrar('qr_nonce:d:1', 60)
+        cache.delete('qr_nonce:d:1')
+        assert NonceStore.registrar('qr_nonce:d:1', 60) is False
+
+        # Mensaje recibido por el suscriptor de totem.cache
+        cache_module._notificar_oyentes(['qr_nonce:d:1'])
+
+        assert NonceStore.registrar('qr_nonce:d:1', 60) is True
+
+    def test_liberar_se_publica(self):
+        redis_conn = mock.Mock()
+        with mock.patch('totem.cache.get_redis_connection_or_none', return_value=redis_conn):
+            NonceStore.liberar('qr_nonce:e:1')
+
+        redis_conn.publish.assert_called_once_with(cache.make_key(CONFIG_CHANNEL), '["qr_nonce:e:1"]')
+
+    def test_liberados_acotados(self, settings):
+        """Pasado el tope se descarta el filtro: la caché sigue rechazando los replays"""
+        settings.NONCE_LIBERADOS_MAX = 2
+        for i in range(3):
+            NonceStore.registrar(f'qr_nonce:f:{i}', 60)
+        NonceStore.registrar('qr_nonce:g:1', 60)
+        for i in range(3):
+            NonceStore._al_invalidar([f'qr_nonce:f:{i}'])
+
+        assert NonceStore._generaciones is None
+        assert NonceStore.registrar('qr_nonce:g:1', 60) is False
+
+    def test_reconexion_descarta_el_filtro(self):
+        NonceStore.registrar('qr_nonce:h:1', 60)
+
+        cache_module._notificar_oyentes(None)
+
+        assert NonceStore._generaciones is None
+        assert NonceStore.registrar('qr_nonce:h:1', 60) is False
+
+    def test_registrar_lote(self):
+        NonceStore.registrar('qr_nonce:x:1', 60)
+
+        resultado = NonceStore.registrar_lote(
+            ['qr_nonce:x:1', 'qr_nonce:y:1', 'qr_nonce:y:1', 'qr_nonce:z:1'], 60
+        )
+
+        assert resultado == [False, True, False, True]
+
+    def test_rotacion_de_generaciones(self):
+        """Un nonce sale del filtro tras dos rotaciones (2 x TTL)"""
+        with mock.patch('totem.nonce_store.time.monotonic', return_value=1000.0):
+            NonceStore.registrar('qr_nonce:r:1', 60)
+        cache.clear()
+        with mock.patch('totem.nonce_store.time.monotonic', return_value=1061.0):
+            assert NonceStore.usado('qr_nonce:r:1', 60)
+        with mock.patch('totem.nonce_store.time.monotonic', return_value=1122.0):
+            assert not NonceStore.usado('qr_nonce:r:1', 60)
+
+
+class TestValidarPayloads:
+    """QRSecurity.validar_payloads (lote)"""
+
+    def test_lote_con_replay_y_falsificado(self):
+        bueno = QRSecurity.crear_payload_firmado('uuid-1')
+        otro = QRSecurity.crear_payload_firmado('uuid-2')
+        falso = otro[:-1] + ('0' if otro[-1] != '0' else '1')
+
+        resultado = QRSecurity.validar_payloads([bueno, otro, bueno, falso])
+
+        assert resultado[0] == (True, 'uuid-1')
+        assert resultado[1] == (True, 'uuid-2')
+        assert resultado[2] == (False, 'QR ya fue validado anteriormente')
+        assert resultado[3] == (False, 'QR falsificado o alterado')
+        assert QRSecurity.validar_payload(bueno) == (False, 'QR ya fue validado anteriormente')
+        assert QRSecurity.verificar_nonce_usado('uuid-2', int(otro.split(':')[1]))
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del pipeline de render de imágenes QR de tickets.
+Ejecutar: pytest totem/tests/test_qr_render.py -v
+"""
+import pytest
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from django.urls import reverse
+
+from totem.models import Ticket, StockSucursal, Trabajador
+from totem.qr_render import QRRenderer, limpiar_imagenes_obsoletas
+from totem.security import QRSecurity
+from totem.services import TicketService
+
+
+@pytest.fixture
+def trabajador_con_beneficio(db):
+    """Trabajador con RUT válido y beneficio disponible."""
+    return Trabajador.objects.create(
+        rut='11111111-1',
+        nombre='Juan Pérez',
+        beneficio_disponible={'tipo': 'Estándar'}
+    )
+
+
+@pytest.fixture
+def stock_central(db):
+    """Stock disponible en la sucursal por defecto del tótem."""
+    return StockSucursal.objects.create(sucursal='Central', producto='Estándar', cantidad=10)
+
+
+@pytest.mark.django_db
+class TestRenderQRAsincrono:
+    """El QR se renderiza fuera de la transacción de creación"""
+
+    def test_crear_ticket_devuelve_payload_sin_imagen(self, trabajador_con_beneficio, ciclo_activo, stock_central):
+        """El ticket se crea con payload firmado y sin PNG hasta el commit"""
+        ticket = TicketService().crear_ticket(trabajador_rut=trabajador_con_beneficio.rut)
+
+        payload = ticket.data['qr_payload']
+        es_valido, uuid = QRSecurity.validar_payload(payload, permitir_replay=True)
+        assert es_valido is True
+        assert uuid == ticket.uuid
+        assert not ticket.qr_image
+
+    def test_imagen_se_renderiza_tras_commit(self, trabajador_con_beneficio, ciclo_activo, stock_central,
+                                             django_capture_on_commit_callbacks):
+        """Tras el commit la tarea genera y asocia el PNG"""
+        with django_capture_on_commit_callbacks(execute=True) as callbacks:
+            ticket = TicketService().crear_ticket(trabajador_rut=trabajador_con_beneficio.rut)
+
+        # Render del QR + evento ticket_creado + invalidación del resumen de stock (reserva)
+        assert len(callbacks) == 3
+        ticket.refresh_from_db()
+        assert ticket.qr_image.name.startswith(f'tickets/ticket_{ticket.uuid}_')
+        assert ticket.estado == 'pendiente'
+
+    def test_broker_caido_usa_el_pool_acotado(self, ticket_pendiente, django_capture_on_commit_callbacks):
+        pool = mock.Mock()
+        with mock.patch('totem.tasks.generar_imagen_qr_ticket.delay', side_effect=ConnectionError('broker')), \
+                mock.patch('totem.services.ticket_service._obtener_pool_render', return_value=pool), \
+                django_capture_on_commit_callbacks(execute=True):
+            TicketService()._programar_render_qr(ticket_pendiente.id)
+
+        pool.submit.assert_called_once()
+        assert pool.submit.call_args.args[1] == ticket_pendiente.id
+
+    @override_settings(QR_RENDER_MODE='sync')
+    def test_render_no_pisa_estado_concurrente(self, ticket_pendiente):
+        """El render solo actualiza qr_image aunque el ticket cambie entretanto"""
+        ticket_pendiente.data['qr_payload'] = QRSecurity.crear_payload_firmado(ticket_pendiente.uuid)
+        ticket_pendiente.save()
+        Ticket.objects.filter(pk=ticket_pendiente.pk).update(estado='entregado')
+
+        TicketService().renderizar_qr_ticket(ticket_pendiente.pk)
+
+        ticket_pendiente.refresh_from_db()
+        assert ticket_pendiente.estado == 'entregado'
+        assert ticket_pendiente.qr_image
+
+    def test_endpoint_qr_polling(self, api_client, ticket_pendiente):
+        """El endpoint /qr/ informa payload y si la imagen está lista"""
+        ticket_pendiente.data['qr_payload'] = 'payload-de-prueba'
+        ticket_pendiente.save()
+
+        response = api_client.get(reverse('qr_ticket', args=[ticket_pendiente.uuid]))
+
+        assert response.status_code == 200
+        assert response.data['qr_payload'] == 'payload-de-prueba'
+        assert response.data['qr_listo'] is False
+        assert response.data['qr_image'] is None
+
+    def test_endpoint_qr_ticket_inexistente(self, api_client, db):
+        """UUID desconocido responde 404"""
+        response = api_client.get(reverse('qr_ticket', args=['no-existe']))
+        assert response.status_code == 404
+
+
+class TestQRRenderer:
+    """Formatos y caché LRU del renderizador"""
+
+    PAYLOAD = 'a1b2c3d4-0000-4000-8000-000000000000:1732962600:0123456789abcdef'
+
+    def setup_method(self):
+        QRRenderer.limpiar_cache()
+
+    def test_formatos_basicos(self):
+        """Cada formato produce la salida esperada"""
+        png = QRRenderer.renderizar(self.PAYLOAD, 'png')
+        termico = QRRenderer.renderizar(self.PAYLOAD, 'png_termico')
+        svg = QRRenderer.renderizar(self.PAYLOAD, 'svg')
+        matriz = QRRenderer.renderizar(self.PAYLOAD, 'matriz')
+
+        assert png.startswith(b'\x89PNG')
+        assert termico.startswith(b'\x89PNG')
+        assert len(termico) < len(png)
+        assert svg.startswith('<svg') and '<path' in svg
+        assert len(matriz) == len(matriz[0])
+        assert set(''.join(matriz)) == {'0', '1'}
+
+    def test_png_termico_es_1bit(self):
+        """El PNG térmico es monocromo y con el tamaño de módulo configurado"""
+        from PIL import Image
+        img = Image.open(BytesIO(QRRenderer.renderizar(self.PAYLOAD, 'png_termico')))
+        modulos = len(QRRenderer.matriz(self.PAYLOAD)) + 4
+        assert img.mode == '1'
+        assert img.size == (modulos * 4, modulos * 4)
+
+    def test_cache_por_hash_de_payload(self):
+        """El segundo render del mismo payload sale de la caché"""
+        primero = QRRenderer.renderizar(self.PAYLOAD, 'png')
+        misses = QRRenderer.misses
+        segundo = QRRenderer.renderizar(self.PAYLOAD, 'png')
+
+        assert primero is segundo
+        assert QRRenderer.misses == misses
+        assert QRRenderer.hits >= 1
+
+    @override_settings(QR_RENDER_CACHE_SIZE=2)
+    def test_cache_lru_acotada(self):
+        """La caché descarta las entradas menos usadas"""
+        for i in range(5):
+            QRRenderer.matriz(f'payload-{i}')
+        assert len(QRRenderer._cache) == 2
+
+    def test_formato_invalido(self):
+        with pytest.raises(ValueError):
+            QRRenderer.renderizar(self.PAYLOAD, 'gif')
+
+
+@pytest.mark.django_db
+class TestImagenesQRObsoletas:
+    """Reemplazo y recolección de imágenes en MEDIA_ROOT/tickets/"""
+
+    def test_reimpresion_reemplaza_imagen_anterior(self, ticket_pendiente):
+        """Reimprimir genera un archivo nuevo y elimina el anterior"""
+        service = TicketService()
+        ticket_pendiente.data['qr_payload'] = QRSecurity.crear_payload_firmado(ticket_pendiente.uuid)
+        ticket_pendiente.save()
+        anterior = service.renderizar_qr_ticket(ticket_pendiente.pk)
+        storage = ticket_pendiente.qr_image.storage
+
+        ticket_pendiente.refresh_from_db()
+        ticket_pendiente.data['qr_payload'] += '-reimpreso'
+        ticket_pendiente.save()
+        nuevo = service.renderizar_qr_ticket(ticket_pendiente.pk)
+
+        assert nuevo != anterior
+        assert storage.exists(nuevo)
+        assert not storage.exists(anterior)
+
+    def test_render_idempotente(self, ticket_pendiente):
+        """Renderizar dos veces el mismo payload no crea otro archivo"""
+        service = TicketService()
+        ticket_pendiente.data['qr_payload'] = 'payload-idempotente'
+        ticket_pendiente.save()
+
+        assert service.renderizar_qr_ticket(ticket_pendiente.pk) == service.renderizar_qr_ticket(ticket_pendiente.pk)
+
+    def test_limpieza_elimina_solo_huerfanas(self, ticket_pendiente):
+        """El GC borra archivos no referenciados y conserva los vigentes"""
+        ticket_pendiente.data['qr_payload'] = 'payload-vigente'
+        ticket_pendiente.save()
+        vigente = TicketService().renderizar_qr_ticket(ticket_pendiente.pk)
+        storage = ticket_pendiente.qr_image.storage
+        huerfana = storage.save('tickets/ticket_huerfano.png', ContentFile(b'png'))
+
+        resultado = limpiar_imagenes_obsoletas(antiguedad_minutos=0)
+
+        assert resultado['eliminados'] >= 1
+        assert storage.exists(vigente)
+        assert not storage.exists(huerfana)
+
+    def test_endpoint_qr_formato_svg(self, api_client, ticket_pendiente):
+        """El endpoint /qr/?formato=svg devuelve el SVG"""
+        ticket_pendiente.data['qr_payload'] = 'payload-svg'
+        ticket_pendiente.save()
+
+        response = api_client.get(reverse('qr_ticket', args=[ticket_pendiente.uuid]), {'formato': 'svg'})
+
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'image/svg+xml'
+        assert response.content.startswith(b'<svg')
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Tests de la sincronización por lote de escaneos offline de guardia.
+Ejecutar: pytest totem/tests/test_sincronizacion_guardia.py -v
+"""
+import time
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from guardia.services.guardia_service import GuardiaService
+from totem.models import CajaFisica, ReservaStock, StockSucursal, Ticket, TicketEvent
+from totem.security import QRSecurity
+
+
+@pytest.fixture
+def crear_ticket(trabajador, sucursal):
+    def _crear(ttl_expira_at=None):
+        return Ticket.objects.create(
+            trabajador=trabajador, uuid=str(uuid.uuid4()), sucursal=sucursal,
+            ttl_expira_at=ttl_expira_at or timezone.now() + timedelta(minutes=30),
+        )
+    return _crear
+
+
+@pytest.fixture
+def cajas(sucursal):
+    return CajaFisica.objects.bulk_create([
+        CajaFisica(codigo=f'CAJA-{i}', tipo='estandar', sucursal=sucursal) for i in range(5)
+    ])
+
+
+def escaneo(ticket, caja, hace_segundos=60, id_local=None, payload=None):
+    return {
+        'id_local': id_local,
+        'qr_payload': payload or QRSecurity.crear_payload_firmado(ticket.uuid),
+        'codigo_caja': caja,
+        'escaneado_at': (timezone.now() - timedelta(seconds=hace_segundos)).isoformat(),
+    }
+
+
+class TestSincronizarEscaneos:
+    """Orden cronológico, primer escaneo gana, un bloque por transacción"""
+
+    def test_lote_entregado_por_bloques(self, settings, crear_ticket, cajas):
+        settings.GUARDIA_SYNC_CHUNK_SIZE = 2
+        tickets = [crear_ticket() for _ in range(3)]
+
+        respuesta = GuardiaService().sincronizar_escaneos(
+            [escaneo(t, f'CAJA-{i}') for i, t in enumerate(tickets)], 'guardia1'
+        )
+
+        assert respuesta['resumen'] == {'entregado': 3}
+        assert Ticket.objects.filter(estado='entregado').count() == 3
+        evento = TicketEvent.objects.get(ticket=tickets[0], tipo='entregado')
+        assert evento.metadata['origen'] == 'sincronizacion'
+        assert evento.timestamp < timezone.now() - timedelta(seconds=30)
+
+    def test_primer_escaneo_gana_por_hora(self, crear_ticket, cajas):
+        ticket = crear_ticket()
+        tardio = escaneo(ticket, 'CAJA-0', hace_segundos=30, id_local='b')
+        temprano = escaneo(ticket, 'CAJA-1', hace_segundos=90, id_local='a')
+
+        resultados = GuardiaService().sincronizar_escaneos([tardio, temprano], 'guardia1')['resultados']
+
+        assert [r['estado'] for r in resultados] == ['duplicado', 'entregado']
+        assert CajaFisica.objects.get(codigo='CAJA-1').asignada_ticket_id == ticket.pk
+        assert CajaFisica.objects.get(codigo='CAJA-0').usado is False
+        duplicado = TicketEvent.objects.get(ticket=ticket, tipo='intento_duplicado')
+        assert (duplicado.metadata['id_local'], duplicado.metadata['estado_actual']) == ('b', 'entregado')
+
+    def test_escaneo_fallido_no_bloquea_el_siguiente(self, crear_ticket, cajas):
+        ticket = crear_ticket()
+        CajaFisica.objects.filter(codigo='CAJA-0').update(usado=True)
+
+        resultados = GuardiaService().sincronizar_escaneos([
+            escaneo(ticket, 'CAJA-0', hace_segundos=90),
+            escaneo(ticket, 'CAJA-1', hace_segundos=30),
+        ])['resultados']
+
+        assert [(r['estado'], r['code']) for r in resultados] == [('rechazado', 'no_stock'), ('entregado', None)]
+
+    def test_reenvio_idempotente(self, crear_ticket, cajas):
+        ticket = crear_ticket()
+        lote = [escaneo(ticket, 'CAJA-0', id_local='st1-1')]
+        service = GuardiaService()
+        service.sincronizar_escaneos(lote, 'guardia1')
+
+        respuesta = service.sincronizar_escaneos(lote, 'guardia1')
+
+        assert respuesta['resumen'] == {'entregado': 1}
+        assert not TicketEvent.objects.filter(ticket=ticket, tipo='intento_duplicado').exists()
+
+    def test_antiguedad_del_qr_a_la_hora_del_escaneo(self, crear_ticket, cajas):
+        """Un QR de hace 2 h escaneado a tiempo se acepta aunque hoy supere NONCE_TTL"""
+        hace_2h = int(time.time()) - 2 * 3600
+        ticket = crear_ticket(ttl_expira_at=timezone.now() - timedelta(hours=1, minutes=30))
+        payload = f'{ticket.uuid}:{hace_2h}:{QRSecurity.generar_firma(ticket.uuid, hace_2h)}'
+
+        resultados = GuardiaService().sincronizar_escaneos(
+            [escaneo(ticket, 'CAJA-0', hace_segundos=2 * 3600 - 60, payload=payload)]
+        )['resultados']
+
+        assert resultados[0]['estado'] == 'entregado'
+
+    def test_ticket_expirado_tras_escaneo_anterior_al_ttl(self, crear_ticket, cajas):
+        """Entrega offline a las 10:00, TTL 10:30, expiración automática 10:31, sync 11:00"""
+        hace_90m = int(time.time()) - 90 * 60
+        ticket = crear_ticket(ttl_expira_at=timezone.now() - timedelta(minutes=60))
+        stock = StockSucursal.objects.create(sucursal='Casa Matriz', producto='Estándar', cantidad=5)
+        ReservaStock.objects.create(stock=stock, ticket=ticket, estado='liberada')
+        Ticket.objects.filter(pk=ticket.pk).update(estado='expirado')
+        payload = f'{ticket.uuid}:{hace_90m}:{QRSecurity.generar_firma(ticket.uuid, hace_90m)}'
+
+        resultados = GuardiaService().sincronizar_escaneos(
+            [escaneo(ticket, 'CAJA-0', hace_segundos=85 * 60, payload=payload)]
+        )['resultados']
+
+        assert resultados[0]['estado'] == 'entregado'
+        ticket.refresh_from_db()
+        stock.refresh_from_db()
+        assert (ticket.estado, stock.cantidad, ticket.reserva_stock.estado) == ('entregado', 4, 'consumida')
+        assert not TicketEvent.objects.filter(ticket=ticket, tipo='intento_duplicado').exists()
+
+    def test_ticket_anulado_rechazado_sin_intento_duplicado(self, crear_ticket, cajas):
+        ticket = crear_ticket()
+        Ticket.objects.filter(pk=ticket.pk).update(estado='anulado')
+
+        resultados = GuardiaService().sincronizar_escaneos([escaneo(ticket, 'CAJA-0')])['resultados']
+
+        assert (resultados[0]['estado'], resultados[0]['code']) == ('rechazado', 'ticket_invalid_state')
+        assert 'anulado' in resultados[0]['message']
+        assert not TicketEvent.objects.filter(ticket=ticket, tipo='intento_duplicado').exists()
+        assert CajaFisica.objects.get(codigo='CAJA-0').usado is False
+
+    def test_rechazos(self, crear_ticket, cajas):
+        ticket = crear_ticket()
+        falsificado = escaneo(ticket, 'CAJA-0', payload=f'{ticket.uuid}:{int(time.time())}:deadbeef')
+        futuro = escaneo(ticket, 'CAJA-0', hace_segundos=-3600)
+        sin_hora = {'qr_payload': QRSecurity.crear_payload_firmado(ticket.uuid), 'codigo_caja': 'CAJA-0'}
+
+        resultados = GuardiaService().sincronizar_escaneos([falsificado, futuro, sin_hora])['resultados']
+
+        assert [r['code'] for r in resultados] == ['qr_invalid', 'escaneo_fuera_de_rango', 'escaneo_invalido']
+        ticket.refresh_from_db()
+        assert ticket.estado == 'pendiente'
+
+
+class TestSincronizarEndpoint:
+    """POST /api/guardia/sincronizar/"""
+
+    def test_endpoint(self, settings, authenticated_guardia_client, crear_ticket, cajas):
+        settings.GUARDIA_SYNC_MAX_ESCANEOS = 2
+        url = reverse('guardia:sincronizar_escaneos')
+        ticket = crear_ticket()
+
+        response = authenticated_guardia_client.post(url, {'escaneos': [escaneo(ticket, 'CAJA-0')]}, format='json')
+        assert response.status_code == 200
+        assert response.data['resultados'][0]['ticket_uuid'] == ticket.uuid
+
+        assert authenticated_guardia_client.post(url, {'escaneos': 'x'}, format='json').status_code == 400
+        demasiados = {'escaneos': [escaneo(ticket, 'CAJA-0')] * 3}
+        assert authenticated_guardia_client.post(url, demasiados, format='json').status_code == 400
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del resumen de stock (agregación única y caché).
+Ejecutar: pytest totem/tests/test_stock_resumen.py -v
+"""
+from datetime import datetime, time, timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from totem.models import ReservaStock, StockMovimiento, StockSucursal, Sucursal, Ticket, TicketEvent
+from totem.services import StockService
+
+
+@pytest.fixture
+def inventario():
+    central = Sucursal.objects.create(nombre='Central', codigo='CENT')
+    norte = Sucursal.objects.create(nombre='Norte', codigo='NOR')
+    StockSucursal.objects.bulk_create([
+        # Tótem: clave por nombre
+        StockSucursal(sucursal='Central', producto='Estándar', cantidad=10),
+        # Movimientos de guardia: clave str(Sucursal)
+        StockSucursal(sucursal=str(central), producto='Premium', cantidad=4),
+        StockSucursal(sucursal=str(norte), producto='estándar', cantidad=7),
+        StockSucursal(sucursal='Bodega', producto='Premium', cantidad=1),
+    ])
+    return central, norte
+
+
+class TestResumenStock:
+    """StockService.obtener_resumen_stock"""
+
+    def test_totales_y_por_sucursal(self, inventario, trabajador):
+        ticket = Ticket.objects.create(trabajador=trabajador, uuid='entregado-hoy', estado='entregado')
+        TicketEvent.objects.create(ticket=ticket, tipo='entregado')
+        pendiente = Ticket.objects.create(trabajador=trabajador, uuid='pendiente', estado='pendiente')
+        ReservaStock.objects.create(stock=StockSucursal.objects.get(sucursal='Bodega'), ticket=pendiente)
+        # Pendiente sin reserva (creado antes de ReservaStock): no cuenta como reservado
+        Ticket.objects.create(trabajador=trabajador, uuid='pendiente-legado', estado='pendiente')
+
+        resumen = StockService.obtener_resumen_stock()
+
+        assert resumen['disponible'] == 22
+        assert resumen['por_tipo'] == {'estandar': 17, 'premium': 5}
+        assert resumen['entregadas_hoy'] == 1
+        assert resumen['reservadas'] == 1
+        assert resumen['por_sucursal'] == [
+            {'sucursal': 'Central', 'codigo': 'CENT', 'total': 14, 'estandar': 10, 'premium': 4},
+            {'sucursal': 'Norte', 'codigo': 'NOR', 'total': 7, 'estandar': 7, 'premium': 0},
+        ]
+
+    def test_entregadas_hoy_por_rango_semiabierto(self, inventario, trabajador):
+        ticket = Ticket.objects.create(trabajador=trabajador, uuid='entregado', estado='entregado')
+        hoy = timezone.localdate()
+        for dia, hora in ((hoy, time.min), (hoy - timedelta(days=1), time(23, 59)), (hoy + timedelta(days=1), time.min)):
+            TicketEvent.objects.create(
+                ticket=ticket, tipo='entregado', timestamp=timezone.make_aware(datetime.combine(dia, hora))
+            )
+
+        with CaptureQueriesContext(connection) as consultas:
+            resumen = StockService.obtener_resumen_stock()
+
+        assert resumen['entregadas_hoy'] == 1
+        evento_sql = next(q['sql'] for q in consultas.captured_queries if 'totem_ticketevent' in q['sql'])
+        assert 'cast_date' not in evento_sql.lower()
+
+    def test_consultas_constantes(self, inventario, django_assert_num_queries):
+        Sucursal.objects.bulk_create([Sucursal(nombre=f'S{i}', codigo=f'S{i}') for i in range(20)])
+
+        with django_assert_num_queries(4):
+            StockService.obtener_resumen_stock()
+        with django_assert_num_queries(0):
+            StockService.obtener_resumen_stock()
+
+    def test_movimiento_invalida_cache(self, inventario, django_capture_on_commit_callbacks):
+        central, _ = inventario
+        assert StockService.obtener_resumen_stock()['disponible'] == 22
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockService.registrar_movimiento('agregar', 'Premium', 5, sucursal_codigo='CENT')
+
+        resumen = StockService.obtener_resumen_stock()
+        assert resumen['disponible'] == 27
+        assert resumen['por_sucursal'][0]['premium'] == 9
+        assert StockMovimiento.objects.filter(sucursal=central).count() == 1
+
+    def test_reserva_y_liberacion_invalidan_cache(self, inventario, trabajador,
+                                                   django_capture_on_commit_callbacks):
+        ticket = Ticket.objects.create(trabajador=trabajador, uuid='reserva', estado='pendiente')
+        assert StockService.obtener_resumen_stock()['reservadas'] == 0
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockService.reservar('Central', ticket)
+        resumen = StockService.obtener_resumen_stock()
+        assert (resumen['reservadas'], resumen['disponible']) == (1, 21)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            StockService.liberar_reservas([ticket.id])
+        resumen = StockService.obtener_resumen_stock()
+        assert (resumen['reservadas'], resumen['disponible']) == (0, 22)
+
+
+class TestResumenStockEndpoint:
+    """GET /api/stock/resumen/"""
+
+    def test_resumen(self, authenticated_guardia_client, inventario):
+        response = authenticated_guardia_client.get(reverse('stock_resumen'))
+
+        assert response.status_code == 200
+        assert response.data['disponible'] == 22
+        assert len(response.data['por_sucursal']) == 2
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del rate limiting GCRA (totem/throttling.py).
+Ejecutar: pytest totem/tests/test_throttling.py -v
+"""
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+from rest_framework.test import APIRequestFactory
+
+from totem import throttling
+from totem.throttling import (
+    GCRALimiter, KioskoThrottle, Regla, parse_rate, throttle_stats,
+)
+
+
+@pytest.fixture(autouse=True)
+def limpiar():
+    throttle_stats(reset=True)
+    yield
+    throttle_stats(reset=True)
+
+
+def peticion(kiosko=None, ip='10.0.0.1'):
+    extra = {'REMOTE_ADDR': ip}
+    if kiosko:
+        extra['HTTP_X_KIOSKO_ID'] = kiosko
+    request = APIRequestFactory().get('/api/beneficios/x/', **extra)
+    request.user = None
+    return request
+
+
+class Kiosko3Throttle(KioskoThrottle):
+    scope = 'kiosko_test'
+    rate = '3/minute'
+
+
+def permitidos(throttle_cls, request, n):
+    return [throttle_cls().allow_request(request, None) for _ in range(n)]
+
+
+class TestParseRate:
+
+    def test_formatos(self):
+        assert parse_rate('30/minute') == (30, 60)
+        assert parse_rate('100/h') == (100, 3600)
+        assert parse_rate('5/10s') == (5, 10)
+        with pytest.raises(ValueError):
+            parse_rate('5/año')
+
+
+class TestGCRALimiter:
+    """Ráfaga, espera hasta el siguiente hueco y reglas todo-o-nada"""
+
+    def test_rafaga_y_retry_after(self):
+        regla = Regla('prueba', 3, 60, None)
+
+        decisiones = [GCRALimiter.evaluar([regla]) for _ in range(4)]
+
+        assert [d.permitido for d in decisiones] == [True, True, True, False]
+        assert [d.restantes for d in decisiones[:3]] == [2, 1, 0]
+        assert 19 < decisiones[3].retry_after <= 20
+
+    def test_regla_rechazada_no_consume_las_demas(self):
+        amplia, estricta = Regla('amplia', 10, 60, None), Regla('estricta', 1, 60, None)
+        GCRALimiter.evaluar([estricta])
+
+        assert GCRALimiter.evaluar([amplia, estricta]).permitido is False
+        assert GCRALimiter.evaluar([amplia]).restantes == 9
+
+    def test_redis_un_solo_script(self, monkeypatch):
+        script = mock.Mock(return_value=[0, 1500, 0])
+        conexion = mock.Mock()
+        conexion.register_script.return_value = script
+        monkeypatch.setattr(throttling, 'get_redis_connection_or_none', lambda: conexion)
+        monkeypatch.setattr(throttling, '_scripts', {})
+
+        decision = GCRALimiter.evaluar([Regla('a', 60, 60, None), Regla('b', 2, 1, 1)])
+
+        assert decision == (False, 1.5, 0)
+        script.assert_called_once()
+        kwargs = script.call_args.kwargs
+        assert kwargs['keys'] == [cache.make_key('gcra:a'), cache.make_key('gcra:b')]
+        assert kwargs['args'] == [1000.0, 59000.0, 500.0, 0.0]
+
+
+class TestGCRAThrottle:
+
+    def test_cuota_por_kiosko_detras_de_la_misma_ip(self):
+        assert permitidos(Kiosko3Throttle, peticion('totem-1'), 4) == [True, True, True, False]
+        assert permitidos(Kiosko3Throttle, peticion('totem-2'), 1) == [True]
+        # Sin header se usa la IP
+        assert permitidos(Kiosko3Throttle, peticion(), 1) == [True]
+
+    def test_techo_por_ip(self, settings):
+        settings.THROTTLE_KIOSKO_IP_FACTOR = 2
+
+        resultados = [Kiosko3Throttle().allow_request(peticion(f'totem-{i}'), None) for i in range(7)]
+
+        assert resultados == [True] * 6 + [False]
+
+    def test_cambio_de_turno_varios_kioskos_en_una_ip(self, settings):
+        """10 tótems detrás del NAT de una planta agotan cada uno su cuota sin tocar el techo"""
+        settings.THROTTLE_KIOSKO_IP_FACTOR = 20
+
+        resultados = [permitidos(Kiosko3Throttle, peticion(f'totem-{i}'), 4) for i in range(10)]
+
+        assert resultados == [[True, True, True, False]] * 10
+
+    def test_rotar_headers_no_salta_el_techo(self, settings):
+        settings.THROTTLE_KIOSKO_IP_FACTOR = 2
+        requests = [peticion(f'totem-{i}') for i in range(7)]
+        for i, request in enumerate(requests):
+            request.META['HTTP_X_FORWARDED_FOR'] = f'203.0.113.{i}'
+
+        resultados = [Kiosko3Throttle().allow_request(request, None) for request in requests]
+
+        assert resultados == [True] * 6 + [False]
+
+    def test_modo_sombra_permite_y_cuenta(self, settings):
+        settings.THROTTLE_SHADOW_SCOPES = ['kiosko_test']
+
+        assert all(permitidos(Kiosko3Throttle, peticion('totem-1'), 5))
+        assert throttle_stats()['kiosko_test'] == {'permitido': 3, 'shadow': 2}
+
+    def test_falla_abierta_si_redis_no_responde(self, monkeypatch):
+        monkeypatch.setattr(GCRALimiter, 'evaluar', mock.Mock(side_effect=ConnectionError('redis caído')))
+
+        assert all(permitidos(Kiosko3Throttle, peticion('totem-1'), 5))
+        assert throttle_stats()['kiosko_test'] == {'error': 5}
+
+
+@pytest.mark.django_db
+class TestEndpointKiosko:
+
+    def test_429_con_retry_after(self, api_client, monkeypatch):
+        monkeypatch.setattr(KioskoThrottle, 'rate', '2/minute')
+        url = reverse('obtener_beneficio', args=['11111111-1'])
+
+        for _ in range(2):
+            assert api_client.get(url, HTTP_X_KIOSKO_ID='totem-1').status_code != 429
+        response = api_client.get(url, HTTP_X_KIOSKO_ID='totem-1')
+
+        assert response.status_code == 429
+        assert 0 < int(response['Retry-After']) <= 30
+        assert api_client.get(url, HTTP_X_KIOSKO_ID='totem-2').status_code != 429
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests del timeline de trabajador (merge de orígenes y paginación por cursor).
+Ejecutar: pytest totem/tests/test_timeline.py -v
+"""
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from totem.exceptions import ValidationException
+from totem.models import Agendamiento, Incidencia, Ticket, TicketEvent
+from totem.services import TrabajadorService
+
+
+@pytest.fixture
+def historial(trabajador, ciclo_activo):
+    """3 tickets con 2 eventos c/u, 2 incidencias y 1 agendamiento, a minutos distintos."""
+    base = timezone.now() - timedelta(days=1)
+    for i in range(3):
+        ticket = Ticket.objects.create(trabajador=trabajador, uuid=str(uuid.uuid4()), ciclo=ciclo_activo)
+        TicketEvent.objects.create(ticket=ticket, tipo='generado', timestamp=base + timedelta(minutes=10 * i))
+        TicketEvent.objects.create(ticket=ticket, tipo='entregado', timestamp=base + timedelta(minutes=10 * i + 5))
+    for i in range(2):
+        Incidencia.objects.create(codigo=f'INC-{i}', trabajador=trabajador, tipo='otro', creada_por='totem',
+                                  created_at=base + timedelta(minutes=10 * i + 2))
+    Agendamiento.objects.create(trabajador=trabajador, ciclo=ciclo_activo, fecha_retiro=timezone.localdate(),
+                                created_at=base + timedelta(minutes=3))
+    return base
+
+
+class TestTimeline:
+    """TrabajadorService.obtener_timeline"""
+
+    def test_orden_cronologico_descendente(self, trabajador, historial):
+        timeline = TrabajadorService.obtener_timeline(trabajador)
+
+        fechas = [e['fecha'] for e in timeline['eventos']]
+        assert len(fechas) == 9
+        assert fechas == sorted(fechas, reverse=True)
+        assert timeline['eventos'][0]['tipo'] == 'ticket:entregado'
+        assert {e['tipo'] for e in timeline['eventos']} == {
+            'ticket:generado', 'ticket:entregado', 'incidencia', 'agendamiento'
+        }
+        assert timeline['siguiente'] is None
+
+    def test_paginacion_por_cursor_sin_duplicados(self, trabajador, historial):
+        vistos = []
+        cursor = None
+        while True:
+            pagina = TrabajadorService.obtener_timeline(trabajador, limit=2, cursor=cursor)
+            vistos.extend(pagina['eventos'])
+            cursor = pagina['siguiente']
+            if not cursor:
+                break
+
+        completo = TrabajadorService.obtener_timeline(trabajador)['eventos']
+        assert vistos == completo
+
+    def test_empates_de_fecha(self, trabajador, ciclo_activo):
+        """Eventos con el mismo timestamp se reparten entre páginas sin perderse"""
+        momento = timezone.now()
+        ticket = Ticket.objects.create(trabajador=trabajador, uuid='empate', ciclo=ciclo_activo)
+        for _ in range(3):
+            TicketEvent.objects.create(ticket=ticket, tipo='reimpreso', timestamp=momento)
+        Incidencia.objects.create(codigo='INC-E', trabajador=trabajador, tipo='otro', creada_por='totem',
+                                  created_at=momento)
+
+        primera = TrabajadorService.obtener_timeline(trabajador, limit=2)
+        segunda = TrabajadorService.obtener_timeline(trabajador, limit=2, cursor=primera['siguiente'])
+        assert len(primera['eventos'] + segunda['eventos']) == 4
+        assert segunda['siguiente'] is None
+
+    def test_consultas_constantes(self, trabajador, historial, ciclo_activo, django_assert_num_queries):
+        for _ in range(20):
+            ticket = Ticket.objects.create(trabajador=trabajador, uuid=str(uuid.uuid4()), ciclo=ciclo_activo)
+            TicketEvent.objects.create(ticket=ticket, tipo='generado')
+        with django_assert_num_queries(3):
+            TrabajadorService.obtener_timeline(trabajador, limit=50)
+
+    def test_cursor_invalido(self, trabajador):
+        with pytest.raises(ValidationException):
+            TrabajadorService.obtener_timeline(trabajador, cursor='no-es-un-cursor')
+
+
+class TestTimelineEndpoint:
+    """GET /api/trabajadores/{rut}/timeline/"""
+
+    def test_pagina_y_cursor(self, authenticated_rrhh_client, trabajador, historial):
+        url = reverse('trabajador_timeline', args=[trabajador.rut])
+
+        response = authenticated_rrhh_client.get(url, {'limit': 5})
+        assert response.status_code == 200
+        assert len(response.data['eventos']) == 5
+
+        response = authenticated_rrhh_client.get(url, {'limit': 5, 'cursor': response.data['siguiente']})
+        assert len(response.data['eventos']) == 4
+        assert response.data['siguiente'] is None
+
+    def test_limit_invalido(self, authenticated_rrhh_client, trabajador):
+        url = reverse('trabajador_timeline', args=[trabajador.rut])
+        assert authenticated_rrhh_client.get(url, {'limit': 'x'}).status_code == 400
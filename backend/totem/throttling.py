@@ -2,14 +2,294 @@
 """
 Rate limiting personalizado para protección contra abuso.
 Implementa límites específicos por tipo de operación.
+
+Los throttles usan GCRA (Generic Cell Rate Algorithm): por cada clave se
+guarda un único valor (el "theoretical arrival time") en vez del historial de
+timestamps que DRF reescribe en cada request. Con Redis todas las reglas de
+un request se evalúan en un script Lua atómico (un solo viaje); sin Redis
+(desarrollo/tests) se usa la caché de Django.
+
+Las claves pueden ser el dispositivo del tótem (header X-Kiosko-ID, con techo
+por IP), el usuario, su sucursal o la IP: los tótems detrás del NAT de una
+planta ya no comparten un único bucket. Los scopes en
+settings.THROTTLE_SHADOW_SCOPES solo registran lo que habrían rechazado.
 """
-from rest_framework.throttling import UserRateThrottle, AnonRateThrottle
+import re
+import threading
+import time
+from collections import namedtuple
+
 import structlog
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+from .cache import ContadoresPorGrupo, get_redis_connection_or_none
 
 logger = structlog.get_logger(__name__)
 
+THROTTLE_KEY_PREFIX = 'gcra'
+
+# KEYS: claves; ARGV: (intervalo_ms, tolerancia_ms) por clave.
+# Si alguna regla rechaza no se consume ninguna; la hora es la de Redis
+# (común a todos los workers).
+GCRA_LUA = """
+local t = redis.call('TIME')
+local ahora = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local nuevos = {}
+local espera = 0
+local restantes = -1
+for i, clave in ipairs(KEYS) do
+    local intervalo = tonumber(ARGV[i * 2 - 1])
+    local tolerancia = tonumber(ARGV[i * 2])
+    local tat = math.max(tonumber(redis.call('GET', clave) or 0), ahora)
+    local exceso = tat - ahora - tolerancia
+    if exceso > 0 then
+        espera = math.max(espera, exceso)
+    else
+        nuevos[i] = tat + intervalo
+        local r = math.floor((tolerancia - (tat - ahora)) / intervalo)
+        if restantes < 0 or r < restantes then restantes = r end
+    end
+end
+if espera > 0 then
+    return {0, math.ceil(espera), 0}
+end
+for i, clave in ipairs(KEYS) do
+    redis.call('SET', clave, string.format('%.3f', nuevos[i]), 'PX', math.max(1, math.ceil(nuevos[i] - ahora)))
+end
+return {1, 0, restantes}
+"""
+
+_PERIODOS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+Regla = namedtuple('Regla', ['clave', 'limite', 'periodo', 'rafaga'])
+Decision = namedtuple('Decision', ['permitido', 'retry_after', 'restantes'])
+
+_stats = ContadoresPorGrupo()
+_local_lock = threading.Lock()
+_scripts = {}
+
+
+def parse_rate(rate):
+    """
+    '30/minute', '100/h' o '5/10s' -> (limite, periodo en segundos).
+    """
+    limite, periodo = rate.split('/')
+    coincidencia = re.match(r'^(\d*)([smhd])', periodo)
+    if not coincidencia:
+        raise ValueError(f"Rate inválido: {rate}")
+    multiplo = int(coincidencia.group(1) or 1)
+    return int(limite), multiplo * _PERIODOS[coincidencia.group(2)]
+
+
+def throttle_stats(reset=False):
+    """
+    Contadores por scope (del proceso): permitido, denegado, shadow (habría
+    sido denegado en modo sombra) y error (Redis no respondió; se permite).
+    """
+    return {scope: dict(contador) for scope, contador in _stats.leer(reset=reset).items()}
+
+
+def _parametros(regla):
+    intervalo = regla.periodo * 1000.0 / regla.limite
+    return intervalo, intervalo * (max(regla.rafaga or regla.limite, 1) - 1)
+
+
+class GCRALimiter:
+    """Evalúa un conjunto de reglas GCRA de forma atómica."""
+
+    @classmethod
+    def evaluar(cls, reglas):
+        """
+        Consume una unidad de cada regla si todas lo permiten.
+
+        Args:
+            reglas (list[Regla]): clave lógica, límite, periodo (s) y ráfaga
+
+        Returns:
+            Decision: permitido, retry_after (s) y restantes (ráfaga disponible)
+        """
+        redis_conn = get_redis_connection_or_none()
+        if redis_conn is not None:
+            return cls._evaluar_redis(redis_conn, reglas)
+        return cls._evaluar_local(reglas)
+
+    @staticmethod
+    def _evaluar_redis(redis_conn, reglas):
+        script = _scripts.get(id(redis_conn))
+        if script is None:
+            # register_script usa EVALSHA y recarga el script si Redis lo perdió
+            script = _scripts[id(redis_conn)] = redis_conn.register_script(GCRA_LUA)
+        args = []
+        for regla in reglas:
+            args.extend(_parametros(regla))
+        permitido, espera_ms, restantes = script(
+            keys=[cache.make_key(f'{THROTTLE_KEY_PREFIX}:{regla.clave}') for regla in reglas], args=args
+        )
+        return Decision(bool(permitido), espera_ms / 1000.0, restantes)
+
+    @staticmethod
+    def _evaluar_local(reglas):
+        claves = [f'{THROTTLE_KEY_PREFIX}:{regla.clave}' for regla in reglas]
+        with _local_lock:
+            ahora = time.time() * 1000
+            guardados = cache.get_many(claves)
+            nuevos = {}
+            espera = 0
+            restantes = None
+            for clave, regla in zip(claves, reglas):
+                intervalo, tolerancia = _parametros(regla)
+                tat = max(guardados.get(clave, 0), ahora)
+                exceso = tat - ahora - tolerancia
+                if exceso > 0:
+                    espera = max(espera, exceso)
+                else:
+                    nuevos[clave] = (tat + intervalo, regla.periodo)
+                    r = int((tolerancia - (tat - ahora)) // intervalo)
+                    restantes = r if restantes is None else min(restantes, r)
+            if espera > 0:
+                return Decision(False, espera / 1000.0, 0)
+            for clave, (tat, periodo) in nuevos.items():
+                cache.set(clave, tat, periodo + 1)
+        return Decision(True, 0.0, restantes)
+
+
+class GCRAThrottle(BaseThrottle):
+    """
+    Throttle DRF sobre GCRALimiter.
+
+    Atributos:
+        scope: Nombre del límite (clave de DEFAULT_THROTTLE_RATES y de las stats)
+        rate: 'N/periodo' por defecto si settings no define el scope
+        rafaga: Requests permitidos de golpe (default: N)
+        claves: Identidades a usar, en orden: 'kiosko', 'usuario', 'sucursal', 'ip'
+    """
+    scope = None
+    rate = None
+    rafaga = None
+    claves = ('usuario', 'ip')
+
+    def __init__(self):
+        self.decision = None
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope) or self.rate
+
+    def identidad(self, request):
+        """Primera identidad disponible según self.claves ('tipo:valor')."""
+        usuario = getattr(request, 'user', None)
+        autenticado = bool(usuario and usuario.is_authenticated)
+        for tipo in self.claves:
+            if tipo == 'kiosko':
+                kiosko = request.META.get(getattr(settings, 'THROTTLE_KIOSKO_HEADER', 'HTTP_X_KIOSKO_ID'), '')
+                kiosko = re.sub(r'[^\w.-]', '', kiosko)[:64]
+                if kiosko:
+                    return f'kiosko:{self.get_ident(request)}:{kiosko}'
+            elif tipo == 'usuario' and autenticado:
+                return f'usuario:{usuario.pk}'
+            elif tipo == 'sucursal' and autenticado and getattr(usuario, 'sucursal_id', None):
+                return f'sucursal:{usuario.sucursal_id}'
+            elif tipo == 'ip':
+                return f'ip:{self.get_ident(request)}'
+        return None
+
+    def reglas(self, request, limite, periodo):
+        identidad = self.identidad(request)
+        if identidad is None:
+            return []
+        reglas = [Regla(f'{self.scope}:{identidad}', limite, periodo, self.rafaga)]
+        factor = getattr(settings, 'THROTTLE_KIOSKO_IP_FACTOR', 0)
+        if identidad.startswith('kiosko:') and factor:
+            # Techo por IP, proporcional a la cuota del scope: alcanza para los
+            # tótems de una planta pero rotar el header no multiplica la cuota
+            reglas.append(Regla(f'{self.scope}:ip:{self.get_ident(request)}', limite * factor, periodo, None))
+        return reglas
+
+    def en_sombra(self):
+        scopes = getattr(settings, 'THROTTLE_SHADOW_SCOPES', ())
+        return '*' in scopes or self.scope in scopes
+
+    def allow_request(self, request, view):
+        rate = self.get_rate()
+        if not rate:
+            return True
+        reglas = self.reglas(request, *parse_rate(rate))
+        if not reglas:
+            return True
+
+        try:
+            self.decision = GCRALimiter.evaluar(reglas)
+        except Exception as e:
+            # Si Redis no responde se permite: el rate limit no debe botar los tótems
+            _stats.contar(self.scope, 'error')
+            logger.warning("throttle_no_disponible", scope=self.scope, error=str(e))
+            return True
+
+        if self.decision.permitido:
+            _stats.contar(self.scope, 'permitido')
+            return True
+        if self.en_sombra():
+            _stats.contar(self.scope, 'shadow')
+            logger.info("throttle_sombra", scope=self.scope, clave=reglas[0].clave,
+                        retry_after=round(self.decision.retry_after, 3))
+            return True
+        _stats.contar(self.scope, 'denegado')
+        logger.warning("throttle_denegado", scope=self.scope, clave=reglas[0].clave,
+                       retry_after=round(self.decision.retry_after, 3))
+        return False
+
+    def wait(self):
+        return self.decision.retry_after if self.decision else None
+
+
+class AnonGCRAThrottle(GCRAThrottle):
+    """Reemplazo de AnonRateThrottle: solo anónimos, por tótem o IP."""
+    scope = 'anon'
+    claves = ('kiosko', 'ip')
+
+    def allow_request(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return True
+        return super().allow_request(request, view)
+
+
+class UserGCRAThrottle(GCRAThrottle):
+    """Reemplazo de UserRateThrottle: por usuario (anónimos por tótem o IP)."""
+    scope = 'user'
+    claves = ('usuario', 'kiosko', 'ip')
+
+
+class KioskoThrottle(GCRAThrottle):
+    """
+    Endpoints públicos del tótem: cuota por dispositivo (X-Kiosko-ID) con
+    techo por IP (cuota x THROTTLE_KIOSKO_IP_FACTOR). Sin header, por IP.
+    """
+    scope = 'kiosko'
+    rate = '30/minute'
+    claves = ('kiosko', 'ip')
+
+
+class KioskoTicketThrottle(KioskoThrottle):
+    """Creación de tickets desde el tótem."""
+    scope = 'kiosko_ticket'
+    rate = '10/minute'
+
+
+class KioskoAgendamientoThrottle(KioskoThrottle):
+    """Creación de agendamientos desde el tótem."""
+    scope = 'kiosko_agendamiento'
+    rate = '10/minute'
+
+
+class KioskoQRThrottle(KioskoThrottle):
+    """Descarga del QR de un ticket (polling de la pantalla del tótem)."""
+    scope = 'kiosko_qr'
+    rate = '120/minute'
+
 
-class TicketCreationThrottle(UserRateThrottle):
+class TicketCreationThrottle(GCRAThrottle):
     """
     Límite estricto para creación de tickets.
     Previene abuso del sistema de beneficios.
@@ -18,7 +298,7 @@ class TicketCreationThrottle(UserRateThrottle):
     rate = '20/hour'  # Máximo 20 tickets por trabajador por hora
 
 
-class QRValidationThrottle(UserRateThrottle):
+class QRValidationThrottle(GCRAThrottle):
     """
     Límite para validación de códigos QR por guardia.
     Previene escaneo masivo no autorizado.
@@ -27,16 +307,17 @@ class QRValidationThrottle(UserRateThrottle):
     rate = '100/hour'  # Máximo 100 validaciones por guardia por hora
 
 
-class AuthenticationThrottle(AnonRateThrottle):
+class AuthenticationThrottle(GCRAThrottle):
     """
     Límite para intentos de autenticación.
     Protege contra ataques de fuerza bruta.
     """
     scope = 'auth'
     rate = '10/minute'  # Máximo 10 intentos por minuto por IP
+    claves = ('ip',)
 
 
-class ReportGenerationThrottle(UserRateThrottle):
+class ReportGenerationThrottle(GCRAThrottle):
     """
     Límite para generación de reportes pesados.
     Evita sobrecarga del servidor.
@@ -45,7 +326,7 @@ class ReportGenerationThrottle(UserRateThrottle):
     rate = '30/hour'  # Máximo 30 reportes por usuario por hora
 
 
-class NominaUploadThrottle(UserRateThrottle):
+class NominaUploadThrottle(GCRAThrottle):
     """
     Límite para carga de archivos de nómina.
     Operación sensible que requiere restricción.
@@ -54,7 +335,7 @@ class NominaUploadThrottle(UserRateThrottle):
     rate = '5/hour'  # Máximo 5 cargas por hora
 
 
-class StockMovementThrottle(UserRateThrottle):
+class StockMovementThrottle(GCRAThrottle):
     """
     Límite para movimientos de stock.
     Previene modificaciones masivas no intencionadas.
@@ -63,7 +344,7 @@ class StockMovementThrottle(UserRateThrottle):
     rate = '50/hour'  # Máximo 50 movimientos por usuario por hora
 
 
-class BurstRateThrottle(UserRateThrottle):
+class BurstRateThrottle(GCRAThrottle):
     """
     Límite de ráfaga para operaciones generales.
     Previene picos de tráfico anómalos.
@@ -72,7 +353,7 @@ class BurstRateThrottle(UserRateThrottle):
     rate = '60/minute'  # Máximo 60 requests por minuto
 
 
-class SustainedRateThrottle(UserRateThrottle):
+class SustainedRateThrottle(GCRAThrottle):
     """
     Límite sostenido para uso continuo.
     Asegura distribución justa de recursos.
@@ -40,6 +40,7 @@ urlpatterns = [
     path('tickets/<str:uuid>/validar_guardia/', guardia_views.validar_ticket_guardia, name='validar_ticket_guardia'),
     path('tickets/<str:uuid>/anular/', views.anular_ticket, name='anular_ticket'),
     path('tickets/<str:uuid>/reimprimir/', views.reimprimir_ticket, name='reimprimir_ticket'),
+    path('tickets/<str:uuid>/qr/', views.qr_ticket, name='qr_ticket'),
 
     # Agendamientos
     path('agendamientos/', views.crear_agendamiento, name='crear_agendamiento'),
@@ -71,6 +72,7 @@ urlpatterns = [
     path('ciclos/<int:ciclo_id>/cerrar/', ciclos_views.ciclo_cerrar, name='ciclo_cerrar'),
     path('ciclos/<int:ciclo_id>/estadisticas/', ciclos_views.ciclo_estadisticas, name='ciclo_estadisticas'),
     path('ciclos/<int:ciclo_id>/asignar-beneficios-pendientes/', ciclos_views.ciclo_asignar_beneficios_pendientes, name='ciclo_asignar_beneficios_pendientes'),
+    path('ciclos/<int:ciclo_id>/asignar-beneficios-pendientes/<str:job_id>/', ciclos_views.ciclo_asignacion_estado, name='ciclo_asignacion_estado'),
     
     # Tipos de Beneficios
     path('tipos-beneficio/', ciclos_views.tipos_beneficio_list_create, name='tipos_beneficio_list_create'),
@@ -83,8 +85,11 @@ urlpatterns = [
 
     # Nómina
     path('nomina/preview/', nomina_views.nomina_preview, name='nomina_preview'),
+    path('nomina/preview/<str:preview_id>/', nomina_views.nomina_preview_detalle, name='nomina_preview_detalle'),
     path('nomina/confirmar/', nomina_views.nomina_confirmar, name='nomina_confirmar'),
     path('nomina/historial/', nomina_views.nomina_historial, name='nomina_historial'),
+    path('nomina/cargas/<int:carga_id>/', nomina_views.nomina_carga_estado, name='nomina_carga_estado'),
+    path('nomina/cargas/<int:carga_id>/cancelar/', nomina_views.nomina_carga_cancelar, name='nomina_carga_cancelar'),
 
     # Cajas y Validaciones (RRHH y Guardia)
     path('cajas-beneficio/', cajas_views.cajas_beneficio_list_create, name='cajas_beneficio_list_create'),
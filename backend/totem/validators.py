@@ -232,17 +232,21 @@ class TicketValidator:
     """
     
     @staticmethod
-    def validar_ttl(ttl_expira_at: datetime) -> Tuple[bool, str]:
+    def validar_ttl(ttl_expira_at: datetime, ahora: datetime = None) -> Tuple[bool, str]:
         """
         Valida que el ticket no haya expirado.
         
+        Args:
+            ttl_expira_at: Expiración del ticket
+            ahora: Momento a evaluar (p.ej. hora de un escaneo offline); default: ahora
+        
         Returns:
             Tupla (es_valido, mensaje_error)
         """
         if not ttl_expira_at:
             return False, "Ticket sin fecha de expiración"
         
-        ahora = timezone.now()
+        ahora = ahora or timezone.now()
         if ahora > ttl_expira_at:
             segundos_expirado = (ahora - ttl_expira_at).total_seconds()
             logger.info(f"Ticket expirado hace {segundos_expirado:.0f} segundos")
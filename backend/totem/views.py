@@ -5,10 +5,10 @@ from django.conf import settings
 from django.core.files.base import ContentFile
 from django.utils import timezone
 from django.shortcuts import render
-from rest_framework.decorators import api_view, permission_classes
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
 from rest_framework.response import Response
 from rest_framework import status
-from django_ratelimit.decorators import ratelimit
 from .models import (
     # Modelos núcleo (mantener aquí en módulo totem)
     Trabajador, Ticket, TicketEvent, Ciclo, Agendamiento, Incidencia, Sucursal, CajaFisica, ParametroOperativo,
@@ -18,9 +18,13 @@ from .serializers import (
     TrabajadorSerializer, TicketSerializer, CicloSerializer, AgendamientoSerializer,
     IncidenciaSerializer, ParametroOperativoSerializer
 )
+from .cache import get_ciclo_activo, get_parametros_operativos
 from .permissions import AllowTotem
+from .throttling import KioskoAgendamientoThrottle, KioskoQRThrottle, KioskoThrottle, KioskoTicketThrottle
 from .utils_rut import clean_rut, valid_rut
 from .services.ticket_service import TicketService
+from .services.trabajador_service import TrabajadorService
+from .qr_render import QRRenderer, FORMATOS as QR_FORMATOS
 from .services.agendamiento_service import AgendamientoService
 from .services.incidencia_service import IncidenciaService
 from .exceptions import (
@@ -42,7 +46,7 @@ logger = logging.getLogger(__name__)
 
 @api_view(['GET'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='30/m', method='GET')
+@throttle_classes([KioskoThrottle])
 def obtener_beneficio(request, rut):
     """
     Obtiene información del beneficio disponible para un trabajador.
@@ -93,62 +97,15 @@ def obtener_beneficio(request, rut):
         if not valid_rut(rut_c):
             raise RUTInvalidException('RUT inválido. Use formato 12345678-5.')
         
-        try:
-            trabajador = Trabajador.objects.get(rut__iexact=rut_c)
-        except Trabajador.DoesNotExist:
-            raise TrabajadorNotFoundException('No se encontró trabajador con ese RUT.')
-
         # Obtener ciclo_id de query params si está disponible
         ciclo_id = request.query_params.get('ciclo_id')
         
-        result = TrabajadorSerializer(trabajador).data
-
-        # Enriquecer beneficio con código para validación de guardia (si aplica)
+        # Lookup cacheado por RUT canónico y ciclo activo (sin consultas con caché caliente)
+        result, con_beneficio_trabajador = TrabajadorService.obtener_beneficio_kiosko(rut_c)
         beneficio_data = result.get('beneficio_disponible') or {}
         
-        # Intentar buscar BeneficioTrabajador asociado (si existe)
-        ciclo_id_beneficio = beneficio_data.get('ciclo_id') if beneficio_data else None
-        
-        beneficio_qs = BeneficioTrabajador.objects.filter(trabajador=trabajador)
-        if ciclo_id_beneficio:
-            beneficio_qs = beneficio_qs.filter(ciclo_id=ciclo_id_beneficio)
-        else:
-            ciclo_activo = Ciclo.objects.filter(activo=True).first()
-            if ciclo_activo:
-                beneficio_qs = beneficio_qs.filter(ciclo=ciclo_activo)
-        
-        beneficio_trabajador = beneficio_qs.order_by('-created_at').first()
-        
-        # Si hay BeneficioTrabajador, construir beneficio_disponible desde ahí
-        if beneficio_trabajador:
-            # Determinar si puede retirarse según estado y validación requerida
-            puede_retirarse = False
-            if beneficio_trabajador.tipo_beneficio.requiere_validacion_guardia:
-                # Si requiere validación, solo puede retirarse si está validado
-                puede_retirarse = (beneficio_trabajador.estado == 'validado')
-            else:
-                # Si no requiere validación, puede retirarse si está pendiente o validado
-                puede_retirarse = (beneficio_trabajador.estado in ['pendiente', 'validado'])
-            
-            # Construir beneficio_data desde BeneficioTrabajador
-            beneficio_data = {
-                'tipo': beneficio_trabajador.tipo_beneficio.nombre,
-                'categoria': beneficio_trabajador.tipo_beneficio.nombre,
-                'descripcion': beneficio_trabajador.tipo_beneficio.descripcion,
-                'codigo': beneficio_trabajador.codigo_verificacion,
-                'requiere_validacion_guardia': beneficio_trabajador.tipo_beneficio.requiere_validacion_guardia,
-                'estado': beneficio_trabajador.estado,
-                'ciclo_id': beneficio_trabajador.ciclo.id,
-                'puede_retirarse': puede_retirarse,
-            }
-            
-            if beneficio_trabajador.tipo_beneficio.requiere_validacion_guardia:
-                beneficio_data['codigo_guardia'] = beneficio_trabajador.codigo_verificacion
-                beneficio_data['codigo_verificacion'] = beneficio_trabajador.codigo_verificacion
-            
-            result['beneficio_disponible'] = beneficio_data
         # Si hay beneficio_data pero no BeneficioTrabajador, usar lo que ya estaba
-        elif beneficio_data and beneficio_data.get('tipo') not in ['SIN_BENEFICIO', 'BLOQUEADO']:
+        if not con_beneficio_trabajador and beneficio_data and beneficio_data.get('tipo') not in ['SIN_BENEFICIO', 'BLOQUEADO']:
             beneficio_data['requiere_validacion_guardia'] = True
             codigo_simple = f"BEN-{rut_c}-{timezone.now().strftime('%Y%m%d')}"
             beneficio_data['codigo_guardia'] = codigo_simple
@@ -186,7 +143,7 @@ def obtener_beneficio(request, rut):
 
 @api_view(['GET'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='30/m', method='GET')
+@throttle_classes([KioskoThrottle])
 def obtener_datos_trabajador(request, rut):
     """
     Obtiene datos básicos del trabajador (nombre, RUT) para verificación rápida.
@@ -219,7 +176,7 @@ def obtener_datos_trabajador(request, rut):
             }, status=status.HTTP_200_OK)
         
         try:
-            trabajador = Trabajador.objects.get(rut__iexact=rut_c)
+            trabajador = Trabajador.objects.get(rut=rut_c)
             return Response({
                 'existe': True,
                 'rut': trabajador.rut,
@@ -243,7 +200,7 @@ def obtener_datos_trabajador(request, rut):
 
 @api_view(['GET'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='30/m', method='GET')
+@throttle_classes([KioskoThrottle])
 def ticket_por_codigo(request, codigo):
     """
     Resuelve un código de beneficio/verificación a su ticket UUID.
@@ -309,7 +266,7 @@ def ticket_por_codigo(request, codigo):
 
 @api_view(['POST'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='30/m', method='POST')
+@throttle_classes([KioskoThrottle])
 def validar_guardia_por_codigo(request, codigo):
     """
     Valida un beneficio por código (flujo guardia cuando se escanea código BEN-...).
@@ -366,7 +323,7 @@ def qr_reader(request):
 
 @api_view(['POST'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='30/m', method='POST')
+@throttle_classes([KioskoThrottle])
 def qr_receive_run(request):
     """Recibe un POST con JSON {"run": "..."} y devuelve datos del trabajador si existe.
 
@@ -387,7 +344,7 @@ def qr_receive_run(request):
             return Response({'detail': 'RUN inválido'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            trabajador = Trabajador.objects.get(rut__iexact=rut_clean)
+            trabajador = Trabajador.objects.get(rut=rut_clean)
             data = TrabajadorSerializer(trabajador).data
             return Response({'found': True, 'trabajador': data}, status=status.HTTP_200_OK)
         except Trabajador.DoesNotExist:
@@ -402,7 +359,7 @@ def qr_receive_run(request):
 
 @api_view(['POST'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='10/m', method='POST')
+@throttle_classes([KioskoTicketThrottle])
 def crear_ticket(request):
     """
     Crea un ticket de retiro para un trabajador.
@@ -423,7 +380,8 @@ def crear_ticket(request):
             "uuid": "ABC123",
             "trabajador": {"id": int, "rut": str, "nombre": str},
             "estado": "pendiente",
-            "qr_image": "/media/qr/ABC123.png",
+            "qr_payload": "ABC123:1732962600:9f2c...",  # Disponible de inmediato
+            "qr_image": null,                          # Se renderiza en segundo plano (ver /qr/)
             "created_at": "2025-11-30T10:30:00Z",
             "ttl_minutos": 30
         }
@@ -621,9 +579,73 @@ def reimprimir_ticket(request, uuid):
         return Response({'detail': 'Error interno del servidor'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+@api_view(['GET'])
+@permission_classes([AllowTotem])
+@throttle_classes([KioskoQRThrottle])
+def qr_ticket(request, uuid):
+    """
+    GET /api/tickets/{uuid}/qr/
+    
+    Devuelve el payload firmado del QR y el estado de su imagen PNG.
+    La imagen se renderiza en segundo plano tras crear o reimprimir el ticket:
+    el tótem puede dibujar el QR desde `qr_payload` o consultar este endpoint
+    hasta que `qr_listo` sea true.
+    
+    ENDPOINT: GET /api/tickets/{uuid}/qr/
+    MÉTODO: GET
+    PERMISOS: Público (tótem sin autenticación)
+    RATE LIMIT: 120 peticiones por minuto por IP (polling)
+    
+    PARÁMETROS URL:
+        uuid (str): UUID único del ticket
+    
+    QUERY PARAMS (opcional):
+        formato: Renderiza el QR al vuelo en lugar de devolver el JSON
+            - svg:         image/svg+xml (pantalla, escalable)
+            - png_termico: PNG 1-bit dimensionado para impresora térmica
+            - png:         PNG de pantalla
+            - matriz:      JSON {"matriz": ["0101...", ...]} módulos sin borde
+    
+    RESPUESTA EXITOSA (200):
+        {
+            "uuid": "ABC123DEF456",
+            "estado": "pendiente",
+            "qr_payload": "ABC123DEF456:1732962600:9f2c...",
+            "qr_image": "/media/tickets/ticket_ABC123DEF456.png",  # null mientras se renderiza
+            "qr_listo": true
+        }
+    
+    ERRORES:
+        400: Formato QR no soportado o ticket sin payload
+        404: Ticket no encontrado
+        500: Error interno del servidor
+    """
+    try:
+        service = TicketService()
+        info = service.obtener_qr_ticket(uuid)
+        
+        formato = request.query_params.get('formato')
+        if not formato:
+            return Response(info)
+        if formato not in QR_FORMATOS or not info['qr_payload']:
+            return Response({'code': 'qr_formato_invalido', 'message': f'Formato no soportado: {formato}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        contenido = QRRenderer.renderizar(info['qr_payload'], formato)
+        if formato == 'matriz':
+            return Response({'uuid': info['uuid'], 'matriz': contenido})
+        return HttpResponse(contenido, content_type=QR_FORMATOS[formato])
+    except TicketNotFoundException:
+        return Response({'code': 'ticket_not_found', 'message': 'Ticket no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+    except TotemBaseException:
+        raise
+    except Exception as e:
+        logger.error(f"Error inesperado en qr_ticket: {e}")
+        return Response({'detail': 'Error interno del servidor'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
 @api_view(['POST'])
 @permission_classes([AllowTotem])
-@ratelimit(key='ip', rate='10/m', method='POST')
+@throttle_classes([KioskoAgendamientoThrottle])
 def crear_agendamiento(request):
     """
     POST /api/agendamientos/
@@ -1018,7 +1040,7 @@ def ciclo_activo(request):
     ERRORES:
         404: Sin ciclo activo configurado
     """
-    ciclo = Ciclo.objects.filter(activo=True).order_by('-id').first()
+    ciclo = get_ciclo_activo()
     if not ciclo:
         raise NoCicloActivoException('Sin ciclo activo')
     return Response(CicloSerializer(ciclo).data)
@@ -1069,8 +1091,7 @@ def parametros_operativos(request):
         400: Falta campo 'clave' en POST
     """
     if request.method == 'GET':
-        qs = ParametroOperativo.objects.all().order_by('clave')
-        return Response(ParametroOperativoSerializer(qs, many=True).data)
+        return Response(ParametroOperativoSerializer(get_parametros_operativos(), many=True).data)
     clave = request.data.get('clave')
     valor = request.data.get('valor')
     if not clave:
@@ -20,6 +20,7 @@ from .models import (
 from .serializers import (
     CajaBeneficioSerializer, BeneficioTrabajadorSerializer, ValidacionCajaSerializer
 )
+from .cache import get_catalogo_beneficios
 from .permissions import IsRRHH, IsGuardia
 from .utils_rut import clean_rut
 import uuid
@@ -168,17 +169,15 @@ def beneficios_con_cajas(request):
     """
     solo_activos = request.query_params.get('solo_activos', 'false').lower() == 'true'
     
-    # Obtener beneficios que tienen cajas
-    beneficios = TipoBeneficio.objects.filter(cajas__isnull=False).distinct()
-    
-    if solo_activos:
-        beneficios = beneficios.filter(activo=True)
-    
+    # Catálogo completo (con cajas precargadas) desde la caché de configuración
     resultado = []
-    for beneficio in beneficios:
-        cajas = beneficio.cajas.all()
+    for beneficio in get_catalogo_beneficios():
+        cajas = list(beneficio.cajas.all())
+        # Solo beneficios que tienen cajas
+        if not cajas or (solo_activos and not beneficio.activo):
+            continue
         if solo_activos:
-            cajas = cajas.filter(activo=True)
+            cajas = [caja for caja in cajas if caja.activo]
         
         caja_data = CajaBeneficioSerializer(cajas, many=True).data
         
@@ -2,10 +2,13 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
-from django.db import transaction
-from .models import Ciclo, Ticket, TipoBeneficio, BeneficioTrabajador, Trabajador
+from django.urls import reverse
+from .models import Ciclo, TipoBeneficio
 from .serializers import CicloSerializer, TipoBeneficioSerializer
 from .permissions import IsRRHHOrSupervisor
+from .services.ciclo_service import CicloService
+from .services.asignacion_service import AsignacionMasivaService
+from .exceptions import TotemBaseException
 import logging
 
 logger = logging.getLogger(__name__)
@@ -270,27 +273,14 @@ def ciclo_estadisticas(request, ciclo_id):
         - tasa_entrega = (entregados / total) * 100
         - tasa_expiracion = (expirados / total) * 100
         - Útil para evaluar eficiencia del sistema por período
+        - Días cerrados leídos desde EstadisticaDiaria; el día en curso se cuenta en vivo
         - Incluye todos los estados: pendiente, entregado, expirado, anulado
     """
     try:
         c = Ciclo.objects.get(id=ciclo_id)
     except Ciclo.DoesNotExist:
         return Response({'detail': 'No encontrado'}, status=404)
-    tickets = Ticket.objects.filter(ciclo=c)
-    total = tickets.count()
-    entregados = tickets.filter(estado='entregado').count()
-    pendientes = tickets.filter(estado='pendiente').count()
-    expirados = tickets.filter(estado='expirado').count()
-    return Response({
-        'id': c.id,
-        'fecha_inicio': c.fecha_inicio,
-        'fecha_fin': c.fecha_fin,
-        'activo': c.activo,
-        'total_tickets': total,
-        'entregados': entregados,
-        'pendientes': pendientes,
-        'expirados': expirados,
-    })
+    return Response(CicloService.obtener_estadisticas_ciclo(c))
 
 
 # ============================================================================
@@ -414,7 +404,8 @@ def ciclo_asignar_beneficios_pendientes(request, ciclo_id):
     
     Asigna beneficios del ciclo a todos los trabajadores que aún no tienen
     beneficio asignado en este ciclo. Útil cuando se agregan trabajadores
-    después de iniciar el ciclo.
+    después de iniciar el ciclo. La asignación corre como trabajo en segundo
+    plano; el request retorna de inmediato.
     
     ENDPOINT: POST /api/ciclos/{id}/asignar-beneficios-pendientes/
     MÉTODO: POST
@@ -429,14 +420,14 @@ def ciclo_asignar_beneficios_pendientes(request, ciclo_id):
                                         # false: reasignar a todos
         }
     
-    RESPUESTA (200):
+    RESPUESTA (202):
         {
+            "detail": "Asignación encolada",
+            "job_id": "9f1c2e...",
             "ciclo_id": 1,
             "tipo_beneficio": "Caja Diaria",
-            "trabajadores_procesados": 45,
-            "beneficios_creados": 12,
-            "beneficios_existentes": 33,
-            "errores": []
+            "estado": "pendiente",
+            "progreso_url": "/api/ciclos/1/asignar-beneficios-pendientes/9f1c2e.../"
         }
     
     ERRORES:
@@ -444,6 +435,13 @@ def ciclo_asignar_beneficios_pendientes(request, ciclo_id):
         400: No hay tipo de beneficio especificado y el ciclo no tiene beneficios activos
         401: No autenticado
         403: Sin permisos
+        422: Ya hay una asignación en curso para el ciclo
+    
+    NOTAS:
+        - Trabajadores sin beneficio calculados con un anti-join; inserción por lotes
+          (BENEFICIOS_ASIGNACION_BATCH_SIZE) con código y firma HMAC generados en memoria
+        - Cada lote se confirma por separado: relanzar completa solo los faltantes
+        - El avance se consulta en progreso_url
     """
     try:
         ciclo = Ciclo.objects.get(id=ciclo_id)
@@ -471,70 +469,69 @@ def ciclo_asignar_beneficios_pendientes(request, ciclo_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
     
-    trabajadores_procesados = 0
-    beneficios_creados = 0
-    beneficios_existentes = 0
-    errores = []
-    
     try:
-        with transaction.atomic():
-            # Obtener todos los trabajadores
-            trabajadores = Trabajador.objects.all()
-            
-            for trabajador in trabajadores:
-                trabajadores_procesados += 1
-                
-                # Verificar si ya tiene beneficio en este ciclo
-                beneficio_existente = BeneficioTrabajador.objects.filter(
-                    trabajador=trabajador,
-                    ciclo=ciclo
-                ).exists()
-                
-                if beneficio_existente:
-                    if solo_sin_beneficio:
-                        beneficios_existentes += 1
-                        continue
-                    else:
-                        # Si no es solo_sin_beneficio, eliminar el existente
-                        BeneficioTrabajador.objects.filter(
-                            trabajador=trabajador,
-                            ciclo=ciclo
-                        ).delete()
-                
-                # Crear nuevo beneficio
-                try:
-                    BeneficioTrabajador.objects.create(
-                        trabajador=trabajador,
-                        tipo_beneficio=tipo_beneficio,
-                        ciclo=ciclo,
-                        estado='pendiente'
-                    )
-                    beneficios_creados += 1
-                    logger.info(
-                        f"Beneficio creado para trabajador {trabajador.rut} en ciclo {ciclo.id}"
-                    )
-                except Exception as e:
-                    errores.append({
-                        'trabajador_rut': trabajador.rut,
-                        'error': str(e)
-                    })
-                    logger.error(
-                        f"Error creando beneficio para {trabajador.rut}: {e}"
-                    )
-        
-        return Response({
-            'ciclo_id': ciclo.id,
-            'ciclo_nombre': str(ciclo),
-            'tipo_beneficio': tipo_beneficio.nombre,
-            'trabajadores_procesados': trabajadores_procesados,
-            'beneficios_creados': beneficios_creados,
-            'beneficios_existentes': beneficios_existentes,
-            'errores': errores
-        }, status=status.HTTP_200_OK)
-        
+        trabajo = AsignacionMasivaService.encolar(
+            ciclo, tipo_beneficio, solo_sin_beneficio=bool(solo_sin_beneficio), usuario=request.user
+        )
+    except TotemBaseException:
+        raise
     except Exception as e:
-        logger.error(f"Error en asignación masiva de beneficios: {e}", exc_info=True)
+        logger.error(f"Error encolando asignación masiva de beneficios: {e}", exc_info=True)
         return Response(
             {'detail': f'Error al asignar beneficios: {str(e)}'},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
+    
+    return Response({
+        'detail': 'Asignación encolada',
+        'job_id': trabajo['id'],
+        'ciclo_id': ciclo.id,
+        'ciclo_nombre': str(ciclo),
+        'tipo_beneficio': tipo_beneficio.nombre,
+        'estado': trabajo['estado'],
+        'progreso_url': reverse('ciclo_asignacion_estado', args=[ciclo.id, trabajo['id']]),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsRRHHOrSupervisor])
+def ciclo_asignacion_estado(request, ciclo_id, job_id):
+    """
+    GET /api/ciclos/{id}/asignar-beneficios-pendientes/{job_id}/
+    
+    Consulta el avance de una asignación masiva de beneficios.
+    
+    ENDPOINT: GET /api/ciclos/{id}/asignar-beneficios-pendientes/{job_id}/
+    MÉTODO: GET
+    PERMISOS: IsRRHHOrSupervisor
+    AUTENTICACIÓN: JWT requerido
+    
+    RESPUESTA (200):
+        {
+            "id": "9f1c2e...",
+            "ciclo_id": 1,
+            "tipo_beneficio": "Caja Diaria",
+            "estado": "procesando",     # pendiente | procesando | completada | fallida
+            "total": 40000,             # Trabajadores sin beneficio a asignar
+            "procesados": 12000,
+            "porcentaje": 30.0,
+            "beneficios_creados": 12000,
+            "beneficios_existentes": 350,
+            "beneficios_eliminados": 0,
+            "filas_por_segundo": 4100.5,
+            "errores": []
+        }
+    
+    ERRORES:
+        404: Trabajo no encontrado o expirado
+        401: No autenticado
+        403: Sin permisos
+    
+    NOTAS:
+        - El estado se conserva en caché 6 horas
+        - Al completar incluye trabajadores_procesados (existentes + procesados)
+    """
+    trabajo = AsignacionMasivaService.estado(job_id)
+    if trabajo is None or trabajo.get('ciclo_id') != ciclo_id:
+        return Response({'detail': 'Asignación no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(trabajo)
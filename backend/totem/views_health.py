@@ -12,6 +12,10 @@ from django.core.cache import cache
 from django.utils import timezone
 import structlog
 
+from .audit import audit_stats
+from .cache import CacheManager
+from .throttling import throttle_stats
+
 logger = structlog.get_logger(__name__)
 
 
@@ -61,6 +65,8 @@ def health_check(request):
         - Responde 503 si algún check falla
         - Útil para health checks de Kubernetes, Docker, load balancers
         - No expone información sensible
+        - Incluye cache_stats (hit/miss/stale), audit (cola y descartes) y
+          throttle (permitidos/denegados/sombra por scope) del proceso que responde
     """
     checks = {}
     errors = []
@@ -160,6 +166,13 @@ def health_check(request):
     if errors:
         response_data['errors'] = errors
     
+    # Contadores hit/miss/stale del caché (por proceso) para ajustar TIMEOUTS
+    response_data['cache_stats'] = CacheManager.stats()
+    # Cola de auditoría: registros pendientes y descartados por backpressure
+    response_data['audit'] = audit_stats()
+    # Rate limiting: decisiones por scope, incluidas las de modo sombra
+    response_data['throttle'] = throttle_stats()
+    
     # Código de estado HTTP
     http_status = status.HTTP_200_OK if overall_status == "healthy" else \
                   status.HTTP_503_SERVICE_UNAVAILABLE if overall_status == "unhealthy" else \
@@ -2,11 +2,26 @@ from rest_framework.decorators import api_view, permission_classes, parser_class
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.response import Response
 from rest_framework import status
-from django.core.management import call_command
+from django.urls import reverse
+import logging
+import os
 import tempfile
+from .exceptions import TotemBaseException, ValidationException
+from .pagination import StandardResultsSetPagination
 from .permissions import IsRRHHOrSupervisor
 from .models import NominaCarga
 from .serializers import NominaCargaSerializer
+from .services.nomina_service import CLASES_PREVIEW, NominaService
+
+logger = logging.getLogger(__name__)
+
+
+def _guardar_temporal(archivo_subido):
+    """Copia el archivo subido a un temporal conservando la extensión y retorna su ruta."""
+    with tempfile.NamedTemporaryFile(suffix='.' + archivo_subido.name.split('.')[-1].lower(), delete=False) as tmp:
+        for chunk in archivo_subido.chunks():
+            tmp.write(chunk)
+        return tmp.name
 
 
 @api_view(['POST'])
@@ -16,8 +31,9 @@ def nomina_preview(request):
     """
     POST /api/nomina/preview/
     
-    Valida un archivo de nómina sin realizar cambios en la base de datos (dry-run).
-    Retorna resumen de errores y estadísticas de la carga potencial.
+    Valida un archivo de nómina sin realizar cambios en la base de datos (dry-run)
+    y lo compara contra los trabajadores existentes.
+    Retorna un resumen y un preview_id para consultar el detalle paginado.
     
     ENDPOINT: POST /api/nomina/preview/
     MÉTODO: POST
@@ -26,7 +42,7 @@ def nomina_preview(request):
     CONTENT-TYPE: multipart/form-data
     
     FORM DATA:
-        archivo: [archivo CSV o Excel]       # REQUERIDO: Archivo de nómina
+        archivo: [archivo CSV, Excel o JSON] # REQUERIDO: Archivo de nómina
         actualizar: "1"                      # OPCIONAL: "1" para actualizar existentes
     
     FORMATO CSV ESPERADO:
@@ -37,14 +53,20 @@ def nomina_preview(request):
     
     RESPUESTA (200):
         {
-            "detail": "Validación OK (dry-run). Revise logs de salida en consola.",
+            "detail": "Validación OK (dry-run)",
+            "preview_id": "3f2b9c...",
+            "detalle_url": "/api/nomina/preview/3f2b9c.../",
             "resumen": {
                 "total_registros": 150,
                 "validos": 145,
-                "invalidos": 5,
+                "invalidos": 5,           # Errores de parseo + RUT duplicados
                 "a_crear": 120,           # Trabajadores nuevos
-                "a_actualizar": 25,       # Trabajadores existentes
+                "a_actualizar": 20,       # Existentes con diferencias (actualizar="1")
+                "sin_cambios": 5,         # Existentes idénticos al archivo
+                "omitidos": 0,            # Existentes con diferencias (actualizar="0")
+                "duplicados": 1,
                 "sin_beneficio": 15,      # Con SIN_BENEFICIO o BLOQUEADO
+                "duracion_segundos": 0.42,
                 "errores": [
                     {
                         "fila": 23,
@@ -57,20 +79,20 @@ def nomina_preview(request):
         }
     
     ERRORES:
-        400: Archivo faltante o formato inválido
+        400: Archivo faltante, formato inválido o columnas faltantes
         401: No autenticado
         403: Sin permisos (no es RRHH/Supervisor/Admin)
         500: Error procesando archivo
     
     NOTAS:
         - Modo DRY-RUN: NO realiza cambios en la base de datos
+        - Los trabajadores existentes se resuelven en una búsqueda masiva por RUT
+        - El detalle por fila (con diferencias por campo) se consulta en
+          GET /api/nomina/preview/<preview_id>/ durante NOMINA_PREVIEW_TTL segundos
         - Valida formato de RUT con dígito verificador
-        - Detecta duplicados en el archivo
-        - Identifica trabajadores existentes vs nuevos
-        - Formatos soportados: CSV (.csv) y Excel (.xlsx, .xls)
+        - Formatos soportados: CSV (.csv), Excel (.xlsx, .xls) y JSON (.json)
         - Codificación CSV recomendada: UTF-8
         - actualizar="1": permite sobrescribir trabajadores existentes
-        - Revise logs del servidor para detalle completo de validación
         - Contratos permitidos: Indefinido, Plazo Fijo, Part Time, Honorarios, Externos
         - Sucursales canónicas: Casablanca, Valparaiso Planta BIF, Valparaiso Planta BIC
     """
@@ -78,32 +100,93 @@ def nomina_preview(request):
     if not f:
         return Response({'detail': 'Falta archivo'}, status=400)
     actualizar = request.data.get('actualizar') in ['1', 'true', 'True']
-    # Guardar temporalmente
-    with tempfile.NamedTemporaryFile(suffix='.' + f.name.split('.')[-1], delete=False) as tmp:
-        for chunk in f.chunks():
-            tmp.write(chunk)
-        tmp.flush()
-        path = tmp.name
-    # Ejecutar comando con --dry-run
+    path = _guardar_temporal(f)
     try:
-        from totem.management.commands.cargar_nomina import Command as CargarNominaCommand
-        cmd = CargarNominaCommand()
-        # Cargar trabajadores desde archivo
-        trabajadores = cmd._cargar_csv(path) if path.endswith('.csv') else []
-        # Simular procesamiento para preview
-        resumen = {
-            'total_registros': len(trabajadores),
-            'validos': len(trabajadores),
-            'invalidos': 0,
-            'a_crear': len(trabajadores),
-            'a_actualizar': 0,
-            'sin_beneficio': sum(1 for t in trabajadores if t['beneficio_disponible'].get('tipo') == 'SIN_BENEFICIO'),
-            'errores': [],
-            'trabajadores': trabajadores,
-        }
-        return Response({'detail': 'Validación OK (dry-run)', 'resumen': resumen})
+        preview = NominaService.previsualizar(path, actualizar=actualizar)
+    except TotemBaseException:
+        raise
     except Exception as e:
+        logger.error(f"Error en preview de nómina {f.name}: {e}", exc_info=True)
         return Response({'detail': f'Error validando archivo: {e}'}, status=400)
+    finally:
+        os.unlink(path)
+
+    preview_id = NominaService.guardar_preview(preview, usuario=request.user)
+    return Response({
+        'detail': 'Validación OK (dry-run)',
+        'preview_id': preview_id,
+        'detalle_url': reverse('nomina_preview_detalle', args=[preview_id]),
+        'resumen': preview['resumen'],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsRRHHOrSupervisor])
+def nomina_preview_detalle(request, preview_id):
+    """
+    GET /api/nomina/preview/<preview_id>/
+    
+    Detalle paginado de un preview de nómina, fila por fila.
+    
+    ENDPOINT: GET /api/nomina/preview/<preview_id>/
+    MÉTODO: GET
+    PERMISOS: IsRRHHOrSupervisor (solo el usuario que generó el preview)
+    AUTENTICACIÓN: JWT requerido (Bearer token)
+    
+    QUERY PARAMETERS:
+        ?clase=actualizar   # OPCIONAL: crear | actualizar | sin_cambios | omitido | invalido
+        ?page=1             # OPCIONAL: Página (default 1)
+        ?page_size=50       # OPCIONAL: Tamaño de página (default 50, máximo 100)
+    
+    RESPUESTA (200):
+        {
+            "count": 20,
+            "next": "http://.../api/nomina/preview/3f2b9c.../?clase=actualizar&page=2",
+            "previous": null,
+            "page": 1,
+            "page_size": 50,
+            "total_pages": 1,
+            "results": [
+                {
+                    "fila": 4,
+                    "rut": "87654321-K",
+                    "nombre": "María González",
+                    "clase": "actualizar",
+                    "cambios": {
+                        "beneficio_disponible.tipo": {"actual": "CAJA", "nuevo": "VALE"}
+                    }
+                },
+                {
+                    "fila": 23,
+                    "rut": "12345678-X",
+                    "nombre": null,
+                    "clase": "invalido",
+                    "error": "Línea 23: RUT inválido ..."
+                },
+                ...
+            ]
+        }
+    
+    ERRORES:
+        400: Clase inválida
+        401: No autenticado
+        403: Sin permisos
+        404: Preview inexistente, expirado o de otro usuario
+    """
+    preview = NominaService.obtener_preview(preview_id, usuario=request.user)
+    if preview is None:
+        return Response({'detail': 'Preview no encontrado o expirado'}, status=status.HTTP_404_NOT_FOUND)
+
+    detalle = preview['detalle']
+    clase = request.query_params.get('clase')
+    if clase:
+        if clase not in CLASES_PREVIEW:
+            raise ValidationException(f"Clase inválida. Use una de: {', '.join(CLASES_PREVIEW)}")
+        detalle = [item for item in detalle if item['clase'] == clase]
+
+    paginator = StandardResultsSetPagination()
+    pagina = paginator.paginate_queryset(detalle, request)
+    return paginator.get_paginated_response(pagina)
 
 
 @api_view(['POST'])
@@ -113,8 +196,8 @@ def nomina_confirmar(request):
     """
     POST /api/nomina/confirmar/
     
-    Ejecuta la carga definitiva de un archivo de nómina.
-    Crea/actualiza trabajadores y registra la operación en auditoría.
+    Encola la carga definitiva de un archivo de nómina como trabajo en segundo plano.
+    El archivo se persiste y lo procesa un worker de Celery; el request retorna de inmediato.
     
     ENDPOINT: POST /api/nomina/confirmar/
     MÉTODO: POST
@@ -123,7 +206,7 @@ def nomina_confirmar(request):
     CONTENT-TYPE: multipart/form-data
     
     FORM DATA:
-        archivo: [archivo CSV o Excel]       # REQUERIDO: Archivo de nómina
+        archivo: [archivo CSV, Excel o JSON] # REQUERIDO: Archivo de nómina
         actualizar: "1"                      # OPCIONAL: "1" para actualizar existentes
     
     FORMATO CSV ESPERADO:
@@ -131,61 +214,146 @@ def nomina_confirmar(request):
         12345678-9,Juan Pérez,Producción,Indefinido,Casablanca,Caja Estándar,
         87654321-K,María González,Logística,Plazo Fijo,Valparaiso Planta BIF,Caja Premium,VIP
     
-    RESPUESTA (200):
+    RESPUESTA (202):
         {
-            "detail": "Carga ejecutada exitosamente",
-            "resumen": {
-                "total_procesados": 145,
-                "creados": 120,           # Trabajadores nuevos insertados
-                "actualizados": 25,       # Trabajadores existentes modificados
-                "sin_beneficio": 15,      # Marcados sin beneficio
-                "errores": 0,             # Registros con errores críticos
-                "tiempo_ejecucion_segundos": 4.5
-            }
+            "detail": "Carga encolada",
+            "carga_id": 12,
+            "estado": "pendiente",
+            "progreso_url": "/api/nomina/cargas/12/",
+            "cancelar_url": "/api/nomina/cargas/12/cancelar/"
         }
     
     ERRORES:
-        400: Archivo faltante, formato inválido o errores de validación
+        400: Archivo faltante o formato no soportado
         401: No autenticado
         403: Sin permisos (no es RRHH/Supervisor/Admin)
-        500: Error procesando archivo o fallo de base de datos
+        500: Error guardando el archivo
     
     NOTAS:
-        - OPERACIÓN IRREVERSIBLE: modifica la base de datos
+        - OPERACIÓN IRREVERSIBLE una vez completada: modifica la base de datos
         - Se recomienda ejecutar nomina_preview primero
-        - Operación transaccional: si falla un registro, se revierte todo
-        - Crea registro en NominaCarga para auditoría
+        - Operación transaccional: si falla o se cancela, se revierte todo
+        - El avance se consulta en GET /api/nomina/cargas/<carga_id>/
+        - El registro NominaCarga se finaliza junto con los datos importados
         - actualizar="1":
           - true: sobrescribe trabajadores existentes
           - false: solo crea nuevos, ignora existentes
         - Si trabajador existe y actualizar=false, se omite sin error
-        - Procesa todas las columnas del formato esperado:
-          - rut: único, validado con dígito verificador
-          - nombre: obligatorio
-          - seccion, contrato, sucursal: opcionales
-          - beneficio: se parsea a estructura JSON
-          - observaciones: texto libre
-        - Revise logs del servidor para resumen detallado
-                - Contratos permitidos: Indefinido, Plazo Fijo, Part Time, Honorarios, Externos
-                - Sucursales canónicas: Casablanca, Valparaiso Planta BIF, Valparaiso Planta BIC
+        - Contratos permitidos: Indefinido, Plazo Fijo, Part Time, Honorarios, Externos
+        - Sucursales canónicas: Casablanca, Valparaiso Planta BIF, Valparaiso Planta BIC
     """
     f = request.FILES.get('archivo')
     if not f:
         return Response({'detail': 'Falta archivo'}, status=400)
     actualizar = request.data.get('actualizar') in ['1', 'true', 'True']
-    with tempfile.NamedTemporaryFile(suffix='.' + f.name.split('.')[-1], delete=False) as tmp:
-        for chunk in f.chunks():
-            tmp.write(chunk)
-        tmp.flush()
-        path = tmp.name
+
     try:
-        args = ['cargar_nomina', path]
-        if actualizar:
-            args.append('--actualizar')
-        out = call_command(*args)
+        carga = NominaService.encolar_carga(f, actualizar=actualizar, usuario=request.user)
+    except TotemBaseException:
+        raise
     except Exception as e:
-        return Response({'detail': f'Error cargando archivo: {e}'}, status=400)
-    return Response({'detail': 'Carga ejecutada. Revise resumen en consola.'})
+        logger.error(f"Error encolando carga de nómina {f.name}: {e}", exc_info=True)
+        return Response({'detail': 'Error guardando archivo de nómina'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    return Response({
+        'detail': 'Carga encolada',
+        'carga_id': carga.id,
+        'estado': carga.estado,
+        'progreso_url': reverse('nomina_carga_estado', args=[carga.id]),
+        'cancelar_url': reverse('nomina_carga_cancelar', args=[carga.id]),
+    }, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+@permission_classes([IsRRHHOrSupervisor])
+def nomina_carga_estado(request, carga_id):
+    """
+    GET /api/nomina/cargas/<carga_id>/
+    
+    Progreso de una carga de nómina en segundo plano (para polling).
+    
+    ENDPOINT: GET /api/nomina/cargas/<carga_id>/
+    MÉTODO: GET
+    PERMISOS: IsRRHHOrSupervisor (RRHH, Supervisor o Admin autenticados)
+    AUTENTICACIÓN: JWT requerido (Bearer token)
+    
+    RESPUESTA (200):
+        {
+            "id": 12,
+            "estado": "procesando",     # pendiente | procesando | completada | fallida | cancelada
+            "archivo_nombre": "nomina_noviembre.csv",
+            "actualizar": true,
+            "total_estimado": 40000,
+            "procesados": 12000,
+            "porcentaje": 30.0,
+            "filas_por_segundo": 4100.5,
+            "eta_segundos": 6.8,
+            "creados": 300,
+            "actualizados": 11500,
+            "sin_cambios": 150,
+            "omitidos": 0,
+            "errores": 50,
+            "errores_detalle": [{"fila": 23, "rut": "12345678-X", "error": "..."}],
+            "cancelacion_solicitada": false,
+            "detalle_error": "",
+            "fecha_carga": "2025-11-01T09:00:00Z",
+            "iniciada_at": "2025-11-01T09:00:01Z",
+            "finalizada_at": null
+        }
+    
+    ERRORES:
+        401: No autenticado
+        403: Sin permisos
+        404: Carga no encontrada
+    
+    NOTAS:
+        - El avance se publica tras cada lote (settings.NOMINA_BATCH_SIZE filas)
+        - total_estimado es una estimación (líneas del archivo) para el ETA
+    """
+    carga = NominaCarga.objects.filter(pk=carga_id).first()
+    if carga is None:
+        return Response({'detail': 'Carga no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(NominaService.progreso(carga))
+
+
+@api_view(['POST'])
+@permission_classes([IsRRHHOrSupervisor])
+def nomina_carga_cancelar(request, carga_id):
+    """
+    POST /api/nomina/cargas/<carga_id>/cancelar/
+    
+    Cancela una carga de nómina pendiente o en curso.
+    
+    ENDPOINT: POST /api/nomina/cargas/<carga_id>/cancelar/
+    MÉTODO: POST
+    PERMISOS: IsRRHHOrSupervisor (RRHH, Supervisor o Admin autenticados)
+    AUTENTICACIÓN: JWT requerido (Bearer token)
+    
+    RESPUESTA (200):
+        {
+            "detail": "Cancelación solicitada",
+            "carga_id": 12,
+            "estado": "procesando"      # 'cancelada' si aún no había iniciado
+        }
+    
+    ERRORES:
+        401: No autenticado
+        403: Sin permisos
+        404: Carga no encontrada
+        422: La carga ya finalizó
+    
+    NOTAS:
+        - Una carga en curso se detiene al terminar el lote actual y
+          revierte todo lo importado (no quedan cargas parciales)
+    """
+    if not NominaCarga.objects.filter(pk=carga_id).exists():
+        return Response({'detail': 'Carga no encontrada'}, status=status.HTTP_404_NOT_FOUND)
+    estado = NominaService.cancelar_carga(carga_id)
+    return Response({
+        'detail': 'Carga cancelada' if estado == 'cancelada' else 'Cancelación solicitada',
+        'carga_id': int(carga_id),
+        'estado': estado,
+    })
 
 
 @api_view(['GET'])
@@ -1,10 +1,11 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
-from django.db.models import Sum
-from .models import StockSucursal, StockMovimiento, Sucursal
+from .cache import get_sucursal_por_codigo
+from .models import StockMovimiento
 from .serializers import StockSucursalSerializer, StockMovimientoSerializer
 from .permissions import IsGuardiaOrAdmin
+from .services.stock_service import StockService
 
 
 @api_view(['GET'])
@@ -55,27 +56,14 @@ def stock_resumen(request):
         500: Error interno del servidor
     
     NOTAS:
-        - Datos calculados en tiempo real desde StockSucursal
+        - Stock agregado en una sola consulta (GROUP BY sucursal con sumas por producto)
         - "disponible" suma todos los productos sin importar sucursal
         - Tipos reconocidos: "Estándar" y "Premium" (case-insensitive)
-        - "entregadas_hoy" y "reservadas" son placeholders (requieren integración)
+        - "entregadas_hoy": entregas registradas hoy; "reservadas": tickets pendientes
+        - Cacheado STOCK_RESUMEN_CACHE_TTL segundos; los movimientos de stock lo invalidan
         - Útil para pantalla principal de guardia
     """
-    # Asumimos productos 'Estándar' y 'Premium' en StockSucursal.producto
-    qs = StockSucursal.objects.all()
-    total = qs.aggregate(total=Sum('cantidad'))['total'] or 0
-    por_tipo = {
-        'estandar': qs.filter(producto__iexact='Estándar').aggregate(s=Sum('cantidad'))['s'] or 0,
-        'premium': qs.filter(producto__iexact='Premium').aggregate(s=Sum('cantidad'))['s'] or 0,
-    }
-    # Placeholder para entregas/mes si no hay tabla separada
-    return Response({
-        'disponible': total,
-        'entregadas_hoy': 0,
-        'reservadas': 0,
-        'total_mes': total,
-        'por_tipo': por_tipo,
-    })
+    return Response(StockService.obtener_resumen_stock())
 
 
 @api_view(['GET'])
@@ -207,7 +195,7 @@ def registrar_movimiento_stock(request):
     data = request.data.copy()
     sucursal_codigo = data.pop('sucursal_codigo', None)
     if sucursal_codigo:
-        sucursal = Sucursal.objects.filter(codigo=sucursal_codigo).first()
+        sucursal = get_sucursal_por_codigo(sucursal_codigo)
         if sucursal:
             data['sucursal'] = sucursal.id
     # Auto-set usuario from request
@@ -4,9 +4,10 @@ from rest_framework import status
 from django.db.models import Q
 from django.utils import timezone
 from datetime import datetime
-from .models import Trabajador, Ticket, TicketEvent, Incidencia, Agendamiento
+from .models import Trabajador, Ticket
 from .serializers import TrabajadorSerializer
 from .permissions import IsRRHHOrSupervisor
+from .services.trabajador_service import TrabajadorService
 from .utils_rut import clean_rut, valid_rut
 from .exceptions import (
     TrabajadorNotFoundException,
@@ -101,7 +102,7 @@ def trabajadores_list_create(request):
         qs = Trabajador.objects.all().order_by('nombre')
         if rut:
             rc = clean_rut(rut)
-            qs = qs.filter(rut__iexact=rc)
+            qs = qs.filter(rut=rc)
         if q:
             qs = qs.filter(Q(nombre__icontains=q) | Q(rut__icontains=q))
         data = TrabajadorSerializer(qs[:500], many=True).data
@@ -123,7 +124,7 @@ def trabajadores_list_create(request):
     ciclo_id = beneficio.get('ciclo_id')
     
     # Buscar trabajador existente
-    trabajador_existente = Trabajador.objects.filter(rut__iexact=rut).first()
+    trabajador_existente = Trabajador.objects.filter(rut=rut).first()
     
     if trabajador_existente:
         # Trabajador existe - actualizar datos y beneficio del ciclo actual
@@ -227,7 +228,7 @@ def trabajador_detail(request, rut):
     """
     rc = clean_rut(rut)
     try:
-        t = Trabajador.objects.get(rut__iexact=rc)
+        t = Trabajador.objects.get(rut=rc)
     except Trabajador.DoesNotExist:
         raise TrabajadorNotFoundException()
 
@@ -322,7 +323,7 @@ def trabajador_bloquear(request, rut):
     """
     rc = clean_rut(rut)
     try:
-        t = Trabajador.objects.get(rut__iexact=rc)
+        t = Trabajador.objects.get(rut=rc)
     except Trabajador.DoesNotExist:
         raise TrabajadorNotFoundException()
     bd = t.beneficio_disponible or {}
@@ -382,7 +383,7 @@ def trabajador_desbloquear(request, rut):
     """
     rc = clean_rut(rut)
     try:
-        t = Trabajador.objects.get(rut__iexact=rc)
+        t = Trabajador.objects.get(rut=rc)
     except Trabajador.DoesNotExist:
         raise TrabajadorNotFoundException()
     bd = t.beneficio_disponible or {}
@@ -417,10 +418,15 @@ def trabajador_timeline(request, rut):
     PARÁMETROS URL:
         rut (str): RUT del trabajador
     
+    QUERY PARAMS:
+        limit (int): Eventos por página (default 100, máximo 500)
+        cursor (str): Valor "siguiente" de la página anterior
+    
     RESPUESTA (200):
         {
             "rut": "12345678-9",
             "nombre": "Juan Pérez López",
+            "siguiente": "MjAyNS0xMS0yNVQwOTowMDowMCswMDowMHxhZ2VuZGFtaWVudG98Nw==",
             "eventos": [
                 {
                     "tipo": "ticket:creado",
@@ -459,6 +465,7 @@ def trabajador_timeline(request, rut):
         }
     
     ERRORES:
+        400: limit o cursor inválidos
         404: Trabajador no encontrado
         401: No autenticado
         403: Sin permisos
@@ -466,7 +473,8 @@ def trabajador_timeline(request, rut):
     
     NOTAS:
         - Eventos ordenados de más reciente a más antiguo
-        - Últimos 100 registros por tipo de evento
+        - Paginación por cursor (fecha del último evento); "siguiente" es null en la última página
+        - 3 consultas por página sin importar el tamaño del historial
         - Tipos de eventos:
           - ticket:creado, ticket:entregado, ticket:expirado, ticket:anulado
           - incidencia (con estado actual)
@@ -475,21 +483,16 @@ def trabajador_timeline(request, rut):
     """
     rc = clean_rut(rut)
     try:
-        t = Trabajador.objects.get(rut__iexact=rc)
+        t = Trabajador.objects.get(rut=rc)
     except Trabajador.DoesNotExist:
         return Response({'detail': 'No encontrado'}, status=404)
 
-    tickets = Ticket.objects.filter(trabajador=t).order_by('-created_at')[:100]
-    eventos = []
-    for tick in tickets:
-        for e in tick.eventos.all().order_by('timestamp'):
-            eventos.append({'tipo': f'ticket:{e.tipo}', 'fecha': e.timestamp.isoformat(), 'metadata': e.metadata, 'ticket': tick.uuid})
-    for inc in Incidencia.objects.filter(trabajador=t).order_by('-created_at')[:100]:
-        eventos.append({'tipo': 'incidencia', 'fecha': inc.created_at.isoformat(), 'metadata': {'codigo': inc.codigo, 'estado': inc.estado, 'tipo': inc.tipo}})
-    for ag in Agendamiento.objects.filter(trabajador=t).order_by('-created_at')[:100]:
-        eventos.append({'tipo': 'agendamiento', 'fecha': ag.created_at.isoformat(), 'metadata': {'fecha_retiro': ag.fecha_retiro.isoformat(), 'estado': ag.estado}})
-    eventos.sort(key=lambda x: x['fecha'], reverse=True)
-    return Response({'rut': t.rut, 'nombre': t.nombre, 'eventos': eventos})
+    try:
+        limit = min(max(int(request.query_params.get('limit', 100)), 1), 500)
+    except ValueError:
+        raise ValidationException(detail='limit debe ser un entero')
+
+    return Response(TrabajadorService.obtener_timeline(t, limit=limit, cursor=request.query_params.get('cursor')))
 
 
 @api_view(['POST'])
@@ -534,7 +537,7 @@ def trabajador_actualizar_beneficio(request, rut):
     """
     rc = clean_rut(rut)
     try:
-        t = Trabajador.objects.get(rut__iexact=rc)
+        t = Trabajador.objects.get(rut=rc)
     except Trabajador.DoesNotExist:
         raise TrabajadorNotFoundException()
     
@@ -0,0 +1,136 @@
+import { useEffect, useRef, useState } from 'react';
+import { apiClient } from '@/services/apiClient';
+
+export type GuardiaEventoTipo =
+    | 'ticket_creado'
+    | 'ticket_validado'
+    | 'ticket_anulado'
+    | 'ticket_expirado'
+    | 'incidencia_creada'
+    | 'incidencia_resuelta'
+    | 'stock_bajo'
+    | 'resync';
+
+export type GuardiaEvento = {
+    id: number | null;
+    tipo: GuardiaEventoTipo;
+    datos: any;
+};
+
+// Una sola conexión por pestaña, compartida por todos los hooks montados:
+// cada stream ocupa un thread del servidor durante EVENTOS_SSE_MAX_SECONDS
+const suscriptores = new Set<(evento: GuardiaEvento) => void>();
+const observadoresEstado = new Set<(conectado: boolean) => void>();
+let controller: AbortController | null = null;
+let timer: any;
+let conectadoActual = false;
+let ultimoId: string | null = null;
+let retryMs = 3000;
+
+function publicarEstado(conectado: boolean) {
+    conectadoActual = conectado;
+    observadoresEstado.forEach(observador => observador(conectado));
+}
+
+function despachar(bloque: string) {
+    let id: string | null = null;
+    let tipo = 'message';
+    const data: string[] = [];
+    for (const linea of bloque.split('\n')) {
+        if (linea.startsWith(':')) continue;
+        const sep = linea.indexOf(':');
+        const campo = sep === -1 ? linea : linea.slice(0, sep);
+        const valor = sep === -1 ? '' : linea.slice(sep + 1).replace(/^ /, '');
+        if (campo === 'id') id = valor;
+        else if (campo === 'event') tipo = valor;
+        else if (campo === 'data') data.push(valor);
+        else if (campo === 'retry' && /^\d+$/.test(valor)) retryMs = Number(valor);
+    }
+    if (id !== null) ultimoId = id;
+    if (!data.length) return;
+    const evento: GuardiaEvento = {
+        id: id !== null ? Number(id) : null,
+        tipo: tipo as GuardiaEventoTipo,
+        datos: JSON.parse(data.join('\n')),
+    };
+    Array.from(suscriptores).forEach(suscriptor => suscriptor(evento));
+}
+
+async function conectar(actual: AbortController) {
+    const headers: Record<string, string> = { Accept: 'text/event-stream' };
+    const token = localStorage.getItem('access_token');
+    if (token) headers.Authorization = `Bearer ${token}`;
+    if (ultimoId) headers['Last-Event-ID'] = ultimoId;
+    try {
+        const response = await fetch(`${apiClient.defaults.baseURL}/guardia/eventos/`, {
+            headers,
+            signal: actual.signal,
+        });
+        if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+        publicarEstado(true);
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let fin = buffer.indexOf('\n\n');
+            while (fin !== -1) {
+                despachar(buffer.slice(0, fin));
+                buffer = buffer.slice(fin + 2);
+                fin = buffer.indexOf('\n\n');
+            }
+        }
+    } catch (e) {
+        if (actual.signal.aborted) return;
+    }
+    if (actual.signal.aborted) return;
+    publicarEstado(false);
+    timer = setTimeout(() => conectar(actual), retryMs);
+}
+
+function iniciar() {
+    if (controller) return;
+    controller = new AbortController();
+    conectar(controller);
+}
+
+function detener() {
+    controller?.abort();
+    controller = null;
+    clearTimeout(timer);
+    publicarEstado(false);
+}
+
+/**
+ * Suscripción a /api/guardia/eventos/ (Server-Sent Events).
+ *
+ * Se lee con fetch (EventSource no permite el header Authorization) y se
+ * reconecta enviando Last-Event-ID, así el backend reenvía lo perdido o
+ * responde con un evento `resync` cuando hay que recargar por REST.
+ * Todos los hooks montados comparten una conexión, que se cierra al
+ * desmontarse el último. `conectado` permite volver al polling si el canal cae.
+ */
+export function useGuardiaEventos(onEvento: (evento: GuardiaEvento) => void, enabled = true) {
+    const [conectado, setConectado] = useState(conectadoActual);
+    const handlerRef = useRef(onEvento);
+    handlerRef.current = onEvento;
+
+    useEffect(() => {
+        if (!enabled) return;
+        const suscriptor = (evento: GuardiaEvento) => handlerRef.current(evento);
+        suscriptores.add(suscriptor);
+        observadoresEstado.add(setConectado);
+        setConectado(conectadoActual);
+        iniciar();
+        return () => {
+            suscriptores.delete(suscriptor);
+            observadoresEstado.delete(setConectado);
+            setConectado(false);
+            if (!suscriptores.size) detener();
+        };
+    }, [enabled]);
+
+    return { conectado };
+}
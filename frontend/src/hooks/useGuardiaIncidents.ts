@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react';
 import { incidentService } from '@/services/incident.service';
 import { IncidenciaDTO } from '@/types';
+import { useGuardiaEventos } from './useGuardiaEventos';
 
 export type IncidentFilter = {
     estado?: 'pendiente' | 'en_proceso' | 'resuelta';
@@ -94,13 +95,25 @@ export function useGuardiaIncidents(autoRefresh = true, intervalMs = 30000) {
         fetchIncidents(newFilter);
     };
 
+    // Recarga solo cuando el backend avisa un cambio; el intervalo queda
+    // como respaldo mientras el canal de eventos está caído.
+    const { conectado } = useGuardiaEventos((evento) => {
+        if (evento.tipo === 'incidencia_creada' || evento.tipo === 'incidencia_resuelta' || evento.tipo === 'resync') {
+            fetchIncidents();
+        }
+    }, autoRefresh);
+
     useEffect(() => {
         fetchIncidents();
-        if (!autoRefresh) return;
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, []);
+
+    useEffect(() => {
+        if (!autoRefresh || conectado) return;
         const interval = setInterval(() => fetchIncidents(), intervalMs);
         return () => clearInterval(interval);
         // eslint-disable-next-line react-hooks/exhaustive-deps
-    }, [autoRefresh, intervalMs]);
+    }, [autoRefresh, intervalMs, conectado]);
 
     return {
         incidents,
@@ -1,27 +1,102 @@
-import { useEffect, useState } from 'react';
+import { useCallback, useEffect, useRef, useState } from 'react';
 import { metricasGuardia, MetricasGuardiaDTO } from '../services/api';
+import { GuardiaEvento, useGuardiaEventos } from './useGuardiaEventos';
 
+type Contador = 'pendientes' | 'entregados' | 'incidencias_hoy' | 'incidencias_pendientes';
+
+// Suma un delta solo a los contadores que el backend envió (sin NaN si falta el campo)
+function sumar(m: MetricasGuardiaDTO, deltas: Partial<Record<Contador, number>>): MetricasGuardiaDTO {
+    const resultado = { ...m };
+    for (const [campo, delta] of Object.entries(deltas) as [Contador, number][]) {
+        const actual = m[campo];
+        if (typeof actual === 'number') resultado[campo] = Math.max(actual + delta, 0);
+    }
+    return resultado;
+}
+
+// Delta de cada evento sobre los contadores del panel
+function aplicarEvento(m: MetricasGuardiaDTO, evento: GuardiaEvento): MetricasGuardiaDTO {
+    switch (evento.tipo) {
+        case 'ticket_creado':
+            return sumar(m, { pendientes: 1 });
+        case 'ticket_validado':
+            return sumar(m, { pendientes: -1, entregados: 1 });
+        case 'ticket_anulado':
+            return sumar(m, { pendientes: -1 });
+        case 'ticket_expirado':
+            return sumar(m, { pendientes: -(evento.datos?.cantidad ?? 0) });
+        case 'incidencia_creada':
+            return sumar(m, { incidencias_hoy: 1, incidencias_pendientes: 1 });
+        case 'incidencia_resuelta':
+            return sumar(m, { incidencias_pendientes: -1 });
+        default:
+            return m;
+    }
+}
+
+// Eventos recientes que se reaplican sobre el snapshot que llegue después
+const MAX_RECIENTES = 500;
+
+/**
+ * Métricas de guardia: carga inicial por REST y luego deltas por SSE.
+ *
+ * El snapshot trae `evento_id` (último evento ya contado): al llegar se le
+ * aplican los eventos recibidos con ID mayor y desde ahí solo se aplican
+ * IDs nuevos, así los reenvíos por Last-Event-ID no cuentan dos veces.
+ * Al conectar o resincronizar se pide un snapshot fresco (sin caché).
+ * pollMs solo se usa mientras el canal de eventos está caído.
+ */
 export function useMetricasGuardia(pollMs: number = 0) {
     const [data, setData] = useState<MetricasGuardiaDTO | null>(null);
     const [loading, setLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
+    const [version, setVersion] = useState(0);
+    const recientes = useRef<GuardiaEvento[]>([]);
+    const ultimoId = useRef<number | null>(null);
+
+    const recargar = useCallback(() => setVersion(v => v + 1), []);
+
+    const { conectado } = useGuardiaEventos(evento => {
+        if (evento.tipo === 'resync') {
+            recargar();
+            return;
+        }
+        if (evento.id !== null) {
+            if (ultimoId.current !== null && evento.id <= ultimoId.current) return;
+            ultimoId.current = evento.id;
+            recientes.current = [...recientes.current, evento].slice(-MAX_RECIENTES);
+        }
+        setData(prev => (prev ? aplicarEvento(prev, evento) : prev));
+    });
+
+    const aplicarSnapshot = useCallback((snapshot: MetricasGuardiaDTO) => {
+        if (typeof snapshot.evento_id !== 'number') {
+            setData(snapshot);
+            return;
+        }
+        const base = snapshot.evento_id;
+        const posteriores = recientes.current.filter(e => e.id !== null && e.id > base);
+        recientes.current = posteriores;
+        ultimoId.current = posteriores.length ? posteriores[posteriores.length - 1].id : base;
+        setData(posteriores.reduce(aplicarEvento, snapshot));
+    }, []);
 
     useEffect(() => {
         let active = true;
-        const fetchOnce = () => {
+        const fetchOnce = (fresco: boolean) => {
             setLoading(true);
-            metricasGuardia()
-                .then(res => { if (active) setData(res); })
+            metricasGuardia(fresco)
+                .then(res => { if (active) aplicarSnapshot(res); })
                 .catch(e => { if (active) setError(e.detail || 'Error métricas'); })
                 .finally(() => { if (active) setLoading(false); });
         };
-        fetchOnce();
+        fetchOnce(true);
         let interval: any;
-        if (pollMs > 0) {
-            interval = setInterval(fetchOnce, pollMs);
+        if (pollMs > 0 && !conectado) {
+            interval = setInterval(() => fetchOnce(false), pollMs);
         }
         return () => { active = false; if (interval) clearInterval(interval); };
-    }, [pollMs]);
+    }, [pollMs, conectado, version, aplicarSnapshot]);
 
-    return { metricas: data, loading, error };
+    return { metricas: data, loading, error, enVivo: conectado };
 }
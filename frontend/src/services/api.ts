@@ -37,7 +37,9 @@ export interface BeneficioResponse { beneficio: TrabajadorDTO; }
 export interface MetricasGuardiaDTO { 
     entregados: number; 
     pendientes: number; 
-    incidencias_pendientes: number;
+    incidencias_pendientes?: number;
+    incidencias_hoy?: number;
+    evento_id?: number;
     tickets_pendientes?: number;
     entregas_hoy?: number;
     stock_disponible?: number;
@@ -185,9 +187,10 @@ export async function cicloActivo() {
     return request<CicloDTO>('/ciclo/activo/', 'GET');
 }
 
-export async function metricasGuardia() {
+export async function metricasGuardia(fresco = false) {
     if (isMockMode()) return mockData.metricasGuardia();
-    return request<MetricasGuardiaDTO>('/metricas/guardia/', 'GET');
+    const q = fresco ? '?fresco=1' : '';
+    return request<MetricasGuardiaDTO>(`/metricas/guardia/${q}`, 'GET');
 }
 
 export async function listarParametros() {
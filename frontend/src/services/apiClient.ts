@@ -73,6 +73,12 @@ apiClient.interceptors.request.use(
             delete (config.headers as any).Authorization;
         }
 
+        // Identifica el tótem para que el rate limit sea por dispositivo y no por IP
+        const kioskoId = localStorage.getItem('kiosko_id') || import.meta.env.VITE_KIOSKO_ID;
+        if (kioskoId && config.headers) {
+            config.headers['X-Kiosko-ID'] = kioskoId;
+        }
+
         return config;
     },
     (error: AxiosError) => {
@@ -3,6 +3,7 @@
 interface ImportMetaEnv {
     readonly VITE_API_URL: string
     readonly VITE_APP_TITLE: string
+    readonly VITE_KIOSKO_ID?: string
     // Agregar más variables de entorno según sea necesario
 }
 